@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Controle de admissão em duas faixas, aplicado depois do roteamento da pergunta.
+- Faixa rápida: atalhos e páginas por cursor (milissegundos no banco)
+- Faixa da LLM: perguntas que vão para o Ollama, com concorrência própria e fila limitada;
+  uma geração de 30 s não ocupa a vez de um atalho
+- Em cada faixa: fila FIFO por cliente atendida em rodízio (um cliente com muitas perguntas
+  não passa na frente dos outros), limite de pedidos por cliente e tempo máximo na fila
+- Sobrecarga → AdmissionRejected com Retry-After estimado (a API responde 429)
+- Limites por processo (com vários workers, multiplique pela quantidade de workers); exige workers
+  multi-thread (serve.py usa threaded=True / gunicorn gthread): num worker síncrono nada chega a enfileirar
+"""
+from __future__ import annotations
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+
+import metrics
+from config import Config
+
+_ADMISSIONS = metrics.registry.counter(
+    "nl2sql_admission_total",
+    "Decisões de admissão por faixa (admitted, queue_full, client_limit, timeout)",
+    ["lane", "outcome"],
+)
+_WAIT_SECONDS = metrics.registry.histogram(
+    "nl2sql_admission_wait_seconds", "Tempo na fila até a admissão", ["lane"],
+)
+
+
+class AdmissionRejected(Exception):
+    """Pedido recusado por sobrecarga da faixa; retry_after em segundos"""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"Faixa '{lane}' sobrecarregada ({reason}): tente novamente em {retry_after}s")
+
+
+class _Ticket:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class Lane:
+    """Semáforo com fila limitada, rodízio entre clientes e tempo máximo de espera"""
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float, per_client: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.per_client = max(1, per_client)
+        self.active = 0
+        self.queued = 0
+        self._cond = threading.Condition()
+        # Ordem do rodízio: o cliente atendido vai para o fim
+        self._queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._per_client: Dict[str, int] = {}   # ativos + na fila
+        self._service_time = 1.0                # média móvel do tempo de posse (s), para o Retry-After
+        self._outcomes = {outcome: _ADMISSIONS.labels(name, outcome)
+                          for outcome in ("admitted", "queue_full", "client_limit", "timeout")}
+        self._wait = _WAIT_SECONDS.labels(name)
+
+    def retry_after(self) -> int:
+        """Estimativa (s) até a fila atual escoar"""
+        waves = (self.queued + self.active) / self.concurrency
+        return max(1, math.ceil(waves * self._service_time))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self._outcomes[reason].inc()
+        return AdmissionRejected(self.name, reason, self.retry_after())
+
+    def acquire(self, client: str) -> float:
+        """Bloqueia até haver vaga; devolve o tempo de espera ou levanta AdmissionRejected"""
+        started = time.perf_counter()
+        with self._cond:
+            if self._per_client.get(client, 0) >= self.per_client:
+                raise self._reject("client_limit")
+            if self.active < self.concurrency and not self.queued:
+                self._grant(client)
+            else:
+                if self.queued >= self.max_queue:
+                    raise self._reject("queue_full")
+                ticket = _Ticket()
+                self._queues.setdefault(client, deque()).append(ticket)
+                self._per_client[client] = self._per_client.get(client, 0) + 1
+                self.queued += 1
+                deadline = started + self.max_wait
+                while not ticket.granted:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._abandon(client, ticket)
+                        raise self._reject("timeout")
+                    self._cond.wait(remaining)
+        self._outcomes["admitted"].inc()
+        return self._wait.observe_since(started) - started
+
+    def release(self, client: str, held: float):
+        with self._cond:
+            self.active -= 1
+            self._drop(client)
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+            self._dispatch()
+
+    @contextmanager
+    def admit(self, client: Optional[str] = None):
+        client = client or "local"
+        self.acquire(client)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(client, time.perf_counter() - started)
+
+    # -- internos (com self._cond adquirido) ----------------------------------
+
+    def _grant(self, client: str):
+        self.active += 1
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+
+    def _drop(self, client: str):
+        remaining = self._per_client.get(client, 0) - 1
+        if remaining > 0:
+            self._per_client[client] = remaining
+        else:
+            self._per_client.pop(client, None)
+
+    def _abandon(self, client: str, ticket: _Ticket):
+        queue = self._queues.get(client)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[client]
+        self.queued -= 1
+        self._drop(client)
+
+    def _dispatch(self):
+        """Passa as vagas livres aos primeiros de cada cliente, em rodízio"""
+        granted = False
+        while self.active < self.concurrency and self._queues:
+            client, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            self.queued -= 1
+            self.active += 1              # já contado em _per_client ao entrar na fila
+            ticket.granted = True
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+
+class AdmissionController:
+    def __init__(self):
+        self.fast = Lane("fast", Config.FAST_LANE_CONCURRENCY, Config.FAST_LANE_QUEUE,
+                         Config.FAST_LANE_MAX_WAIT, Config.FAST_LANE_PER_CLIENT)
+        self.llm = Lane("llm", Config.LLM_LANE_CONCURRENCY, Config.LLM_LANE_QUEUE,
+                        Config.LLM_LANE_MAX_WAIT, Config.LLM_LANE_PER_CLIENT)
+        self.lanes = {lane.name: lane for lane in (self.fast, self.llm)}
+
+    def depths(self):
+        return [((lane.name, state), value) for lane in self.lanes.values()
+                for state, value in (("active", lane.active), ("queued", lane.queued))]
+
+
+# Instância global
+admission = AdmissionController()
+
+metrics.registry.callback("nl2sql_admission_lane_requests", "Pedidos ativos e na fila por faixa", "gauge",
+                          ["lane", "state"], admission.depths)
+
+
+if __name__ == "__main__":
+    # Simulação: 20 perguntas de LLM (1 s) de um cliente e atalhos (20 ms) de outros, com e sem faixas
+    from concurrent.futures import ThreadPoolExecutor
+
+    def simulate(two_lanes: bool):
+        if two_lanes:
+            fast, slow = Lane("sim-fast", 4, 100, 60, 100), Lane("sim-llm", 2, 100, 60, 100)
+        else:
+            fast = slow = Lane("shared", 4, 100, 60, 100)
+        latencies = {"llm": [], "atalho": []}
+
+        def job(kind: str, client: str, duration: float):
+            start = time.perf_counter()
+            with (slow if kind == "llm" else fast).admit(client):
+                time.sleep(duration)
+            latencies[kind].append(time.perf_counter() - start)
+
+        with ThreadPoolExecutor(64) as pool:
+            for i in range(20):
+                pool.submit(job, "llm", "cliente-pesado", 1.0)
+            time.sleep(0.05)
+            for i in range(40):
+                pool.submit(job, "atalho", f"cliente{i % 5}", 0.02)
+                time.sleep(0.01)
+        for kind, values in latencies.items():
+            values.sort()
+            p95 = values[int(len(values) * 0.95) - 1]
+            print(f"   {kind:<7} p50 {values[len(values) // 2] * 1000:7.0f} ms  p95 {p95 * 1000:7.0f} ms")
+
+    print("⏱️ Um pool compartilhado (4 vagas):")
+    simulate(False)
+    print("⏱️ Duas faixas (rápida 4 vagas, LLM 2 vagas):")
+    simulate(True)
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+Agregados sobre os cubos em memória: contagens, médias, percentis e distribuições por grupo.
+- parse_aggregation() reconhece a intenção na pergunta normalizada: função (média, mediana, percentil N,
+  soma, mínimo, máximo, quantos, distribuição), métrica, agrupamento ("por raça", "por número de partos")
+  e um filtro booleano (com amostra significativa, boa fertilidade...)
+- Reconhecimento conservador: qualquer palavra fora do vocabulário (outro filtro, um ano, um código)
+  devolve None e a pergunta segue para a LLM
+- Com as réplicas carregadas (cube_replica) o plano roda vetorizado em pandas sobre as mesmas colunas
+  NumPy; os DataFrames são montados uma vez por versão da réplica (textos agrupáveis viram category)
+  e a raça das vacas vem da réplica de cubo_genealogia (map pelo código do animal)
+- Sem réplica, a mesma pergunta vira o GROUP BY / PERCENTILE_CONT equivalente no Postgres; agrupamentos
+  que dependem de outro cubo (raça das vacas) só existem pela réplica, porque o validador remove JOINs
+- Nos dois caminhos: NULLs ficam fora das funções (como no SQL), o grupo NULL aparece por último,
+  valores arredondados em 2 casas e no máximo Config.AGGREGATION_MAX_GROUPS grupos
+- pandas é importado só na primeira agregação (ou no warm-up)
+"""
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from config import Config
+from cube_replica import cube_replicas
+from rankings import RANKING_CUBES
+from text_normalizer import normalize_terms, normalize_text
+
+# Por cubo: palavras do sujeito, métricas em ordem de prioridade, métricas discretas (distribuição por
+# valor), dimensões de agrupamento, filtros (frase, valor; negações primeiro) e colunas vindas de outro cubo
+AGGREGATION_CUBES: Dict[str, Dict[str, Any]] = {
+    "cubo_resumo_vaca": {
+        "subject": ["vaca"],
+        "metrics": [
+            ("producao_vitalicia_gordura", ["gordura vitalícia", "produção de gordura"]),
+            ("producao_vitalicia_proteina", ["proteína vitalícia", "produção de proteína"]),
+            ("percentual_gordura", ["percentual de gordura", "gordura"]),
+            ("percentual_proteina", ["percentual de proteína", "proteína"]),
+            ("producao_media_por_lactacao", ["produção por lactação", "leite por lactação"]),
+            ("lactacoes_encerradas", ["lactações encerradas", "lactações"]),
+            ("numero_partos", ["número de partos", "partos"]),
+            ("producao_vitalicia_leite", ["produção vitalícia de leite", "produção vitalícia", "vitalícia",
+                                          "produção de leite", "produção", "leite"]),
+        ],
+        "discrete": ["lactacoes_encerradas", "numero_partos"],
+        "dimensions": [
+            ("animal_raca", ["raça"]),
+            ("categoria_producao_vitalicia", ["categoria de produção", "categoria"]),
+            ("status_reprodutivo", ["status reprodutivo", "status"]),
+            ("classificacao_geral", ["classificação geral", "classificação"]),
+            ("numero_partos", ["número de partos", "partos"]),
+            ("lactacoes_encerradas", ["lactações encerradas", "lactações"]),
+        ],
+        "filters": {
+            "alta_producao_vitalicia": [("sem alta produção", False), ("alta produção", True)],
+            "boa_fertilidade": [("sem boa fertilidade", False), ("boa fertilidade", True)],
+            "multiplas_lactacoes": [("múltiplas lactações", True)],
+        },
+        # coluna → (cubo de origem, chave aqui, chave lá)
+        "joins": {"animal_raca": ("cubo_genealogia", "codigo_bovino", "animal_codigo")},
+    },
+    "cubo_producao_touro_filhas": {
+        "subject": ["touro", "reprodutor"],
+        "metrics": [
+            ("media_gordura_305d", ["gordura"]),
+            ("media_proteina_305d", ["proteína"]),
+            ("media_producao_vitalicia", ["produção vitalícia", "vitalícia"]),
+            ("percentual_filhas_com_producao", ["percentual de filhas", "filhas produtivas"]),
+            ("total_filhas", ["número de filhas", "quantidade de filhas", "total de filhas"]),
+            ("media_leite_305d", ["produção de leite", "leite 305", "305", "produção", "leite"]),
+        ],
+        "discrete": ["total_filhas"],
+        "dimensions": [
+            ("categoria_producao_305d", ["categoria de produção", "categoria"]),
+            ("nivel_representatividade", ["nível de representatividade", "representatividade"]),
+        ],
+        "filters": RANKING_CUBES["cubo_producao_touro_filhas"]["filters"],
+    },
+    "cubo_genealogia": {
+        "subject": ["animal", "bovino"],
+        "metrics": [
+            ("total_filhos", ["número de filhos", "quantidade de filhos", "filhos"]),
+        ],
+        "discrete": ["total_filhos"],
+        "dimensions": [
+            ("animal_raca", ["raça"]),
+            ("animal_sexo", ["sexo"]),
+            ("categoria_reprodutiva", ["categoria reprodutiva", "categoria"]),
+        ],
+        "filters": {
+            "tem_pai": [("sem pai", False), ("com pai", True)],
+            "tem_mae": [("sem mãe", False), ("com mãe", True)],
+        },
+    },
+}
+
+# Funções na ordem de detecção; percentil N ("percentil 90", "p90") é reconhecido à parte
+_FUNCTIONS = (
+    ("distribution", {"distribuicao", "histograma"}),
+    ("median", {"mediana"}),
+    ("mean", {"media", "medio"}),
+    ("sum", {"soma", "somatorio"}),
+    ("min", {"minimo", "minima"}),
+    ("max", {"maximo", "maxima"}),
+    ("count", {"quanto", "quanta", "quantidade", "contagem"}),
+)
+_ALIASES = {"count": "quantidade", "mean": "media", "median": "mediana", "sum": "soma", "min": "minimo",
+            "max": "maximo"}
+# Uma distribuição de métrica contínua vira estes percentis (por grupo)
+DISTRIBUTION_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+_PERCENTILE_RE = re.compile(r"\b(?:percentil|p)\s*(\d{1,2})\b")
+_GROUP_WORDS = {"por", "cada"}
+# Palavras que não mudam a consulta; qualquer outra sobra faz o reconhecimento desistir
+_STOPWORDS = set(normalize_terms(
+    "qual quais o a os as e é de da do das dos em no na nos nas por cada para com entre ao aos um uma "
+    "são há existem existe tem têm possuem possui temos todo toda todos todas geral rebanho valor "
+    "calcule mostre me diga informe quero saber ver respectivo respectiva base considerando"
+))
+_SUBJECTS = {table: set(normalize_terms(" ".join(cube["subject"]))) for table, cube in AGGREGATION_CUBES.items()}
+
+
+def _phrases(entries: Sequence[Tuple[str, Sequence[str]]]) -> List[Tuple[str, Tuple[str, ...]]]:
+    return [(name, tuple(normalize_terms(phrase))) for name, phrases in entries for phrase in phrases]
+
+
+_METRIC_PHRASES = {table: _phrases(cube["metrics"]) for table, cube in AGGREGATION_CUBES.items()}
+_DIMENSION_PHRASES = {table: _phrases(cube["dimensions"]) for table, cube in AGGREGATION_CUBES.items()}
+_FILTER_PHRASES = {
+    table: [(name, tuple(normalize_terms(phrase)), flag)
+            for name, phrases in cube["filters"].items() for phrase, flag in phrases]
+    for table, cube in AGGREGATION_CUBES.items()
+}
+
+
+class AggregationQuery:
+    """Agregado pedido: função sobre uma coluna (ou contagem), agrupado ou não, com filtro opcional"""
+    __slots__ = ("table", "function", "column", "group_by", "where", "flag", "quantiles")
+
+    def __init__(self, table: str, function: str, column: Optional[str] = None, group_by: Optional[str] = None,
+                 where: Optional[str] = None, flag: bool = True, quantiles: Sequence[float] = ()):
+        self.table = table
+        self.function = function      # count, mean, median, sum, min, max ou quantile
+        self.column = column          # None na contagem
+        self.group_by = group_by
+        self.where = where
+        self.flag = flag
+        self.quantiles = tuple(quantiles)
+
+    @property
+    def aggregates(self) -> List[Tuple[str, str, Optional[float]]]:
+        """(nome da coluna no resultado, função, percentil)"""
+        if self.function == "quantile":
+            return [(f"p{round(q * 100)}_{self.column}", "quantile", q) for q in self.quantiles]
+        if self.function == "count":
+            return [("quantidade", "count", None)]
+        return [(f"{_ALIASES[self.function]}_{self.column}", self.function,
+                 0.5 if self.function == "median" else None)]
+
+    @property
+    def fields(self) -> List[str]:
+        return ([self.group_by] if self.group_by else []) + [alias for alias, _, _ in self.aggregates]
+
+    @property
+    def columns(self) -> List[str]:
+        """Colunas lidas do cubo (réplica precisa ter todas)"""
+        return [name for name in (self.column, self.group_by, self.where) if name]
+
+    @property
+    def joined(self) -> bool:
+        """Agrupa por coluna de outro cubo (só pela réplica)"""
+        return self.group_by in AGGREGATION_CUBES[self.table].get("joins", {})
+
+    @property
+    def label(self) -> str:
+        return f"agregação {self.table}"
+
+
+def _match(stems: Sequence[str], phrase: Tuple[str, ...], taken: Set[int]) -> Optional[int]:
+    """Início da primeira ocorrência da frase fora das posições já usadas"""
+    size = len(phrase)
+    for start in range(len(stems) - size + 1):
+        if tuple(stems[start:start + size]) == phrase and not taken.intersection(range(start, start + size)):
+            return start
+    return None
+
+
+def _take(taken: Set[int], start: int, size: int):
+    taken.update(range(start, start + size))
+
+
+def _function(stems: Sequence[str], folded: str, taken: Set[int]) -> Tuple[Optional[str], Tuple[float, ...]]:
+    """(função, percentis) ou (None, ()) se não houver exatamente uma função na pergunta"""
+    found = []
+    match = _PERCENTILE_RE.search(folded)
+    if match is not None:
+        q = int(match.group(1))
+        start = next((i for i in range(len(stems) - 1) if stems[i] in ("percentil", "p")
+                      and stems[i + 1] == match.group(1)), None)
+        if not 0 < q < 100 or start is None:
+            return None, ()
+        _take(taken, start, 2)
+        found.append(("quantile", (q / 100,)))
+    for function, words in _FUNCTIONS:
+        positions = [i for i, stem in enumerate(stems) if stem in words and i not in taken]
+        if positions:
+            taken.update(positions)
+            found.append((function, ()))
+    return found[0] if len(found) == 1 else (None, ())
+
+
+def _parse_cube(table: str, stems: Sequence[str], taken: Set[int], function: str,
+                quantiles: Tuple[float, ...]) -> Optional[AggregationQuery]:
+    cube = AGGREGATION_CUBES[table]
+    taken = set(taken)
+
+    # Agrupamento: "por <dimensão>" (na distribuição a dimensão pode vir sozinha: "distribuição por sexo")
+    group_by = None
+    for name, phrase in _DIMENSION_PHRASES[table]:
+        start = _match(stems, phrase, taken)
+        if start is not None and start > 0 and stems[start - 1] in _GROUP_WORDS:
+            group_by = name
+            _take(taken, start - 1, len(phrase) + 1)
+            break
+
+    matched: Dict[str, bool] = {}
+    for name, phrase, flag in _FILTER_PHRASES[table]:
+        start = _match(stems, phrase, taken)
+        if name not in matched and start is not None:
+            matched[name] = flag
+            _take(taken, start, len(phrase))
+    if len(matched) > 1:
+        return None     # combinação de filtros: fica com a LLM
+    where, flag = next(iter(matched.items())) if matched else (None, True)
+
+    metric = None
+    for name, phrase in _METRIC_PHRASES[table]:
+        start = _match(stems, phrase, taken)
+        if start is not None:
+            metric = name
+            _take(taken, start, len(phrase))
+            break
+    if function == "distribution" and metric is None and group_by is None:
+        for name, phrase in _DIMENSION_PHRASES[table]:
+            start = _match(stems, phrase, taken)
+            if start is not None:
+                metric = name
+                _take(taken, start, len(phrase))
+                break
+
+    leftover = [stem for i, stem in enumerate(stems) if i not in taken and stem not in _STOPWORDS]
+    if leftover:
+        return None     # palavra desconhecida (outro filtro, ano...): fica com a LLM
+
+    if function == "count":
+        return None if metric else AggregationQuery(table, "count", None, group_by, where, flag)
+    if metric is None:
+        return None if function != "distribution" or group_by is None else \
+            AggregationQuery(table, "count", None, group_by, where, flag)
+    if function == "distribution":
+        dimensions = {name for name, _ in cube["dimensions"]}
+        if metric in cube["discrete"] or metric in dimensions:
+            if group_by is not None:
+                return None     # distribuição cruzada (dois agrupamentos): fica com a LLM
+            return AggregationQuery(table, "count", None, metric, where, flag)
+        return AggregationQuery(table, "quantile", metric, group_by, where, flag, DISTRIBUTION_QUANTILES)
+    if metric == group_by:
+        return None
+    return AggregationQuery(table, function, metric, group_by, where, flag, quantiles)
+
+
+def parse_aggregation(query: str, normalized=None) -> Optional[AggregationQuery]:
+    """Intenção de agregado na pergunta (None se não reconhecida por inteiro)"""
+    normalized = normalize_text(normalized if normalized is not None else query)
+    stems = normalized.stems
+    if re.search(r"FSC\d+", query.upper()):
+        return None     # pergunta sobre um animal específico
+    taken: Set[int] = set()
+    function, quantiles = _function(stems, normalized.folded, taken)
+    if function is None:
+        return None
+    if any(stem.isdigit() for i, stem in enumerate(stems) if i not in taken and stem != "305"):
+        return None     # números fora do percentil (anos, códigos, limites): fica com a LLM
+
+    subjects = {table for table, words in _SUBJECTS.items()
+                if any(stem in words for i, stem in enumerate(stems) if i not in taken)}
+    if len(subjects) > 1:
+        return None
+    for table in subjects:
+        taken.update(i for i, stem in enumerate(stems) if stem in _SUBJECTS[table])
+    if function == "count" and not subjects:
+        return None     # "quantos ..." precisa dizer o quê (vacas, touros, animais)
+    for table in (subjects or AGGREGATION_CUBES):
+        aggregation = _parse_cube(table, stems, taken, function, quantiles)
+        if aggregation is not None:
+            return aggregation
+    return None
+
+
+def aggregation_sql(query: AggregationQuery) -> str:
+    """SQL equivalente no Postgres (mesmas colunas, arredondamento e ordem dos grupos)"""
+    def expression(function: str, q: Optional[float]) -> str:
+        if function == "count":
+            return "COUNT(*)"
+        if function in ("median", "quantile"):
+            return (f"ROUND(CAST(PERCENTILE_CONT({q}) WITHIN GROUP (ORDER BY {query.column}) AS numeric), 2)")
+        if function == "mean":
+            return f"ROUND(AVG({query.column}), 2)"
+        if function == "sum":
+            return f"ROUND(SUM({query.column}), 2)"
+        return f"{function.upper()}({query.column})"
+
+    select = ([query.group_by] if query.group_by else []) + [f"{expression(function, q)} AS {alias}"
+                                                             for alias, function, q in query.aggregates]
+    sql = f"SELECT {', '.join(select)} FROM {query.table}"
+    if query.joined:
+        other, key, other_key = AGGREGATION_CUBES[query.table]["joins"][query.group_by]
+        sql += f" LEFT JOIN {other} ON {other}.{other_key} = {query.table}.{key}"
+    if query.where:
+        sql += (f" WHERE {query.where} = true" if query.flag else
+                f" WHERE ({query.where} = false OR {query.where} IS NULL)")
+    if query.group_by:
+        sql += (f" GROUP BY {query.group_by} ORDER BY {query.group_by} NULLS LAST"
+                f" LIMIT {Config.AGGREGATION_MAX_GROUPS}")
+    return sql + ";"
+
+
+# ----------------------------------------------------------------------
+# Execução vetorizada (pandas) sobre as réplicas
+# ----------------------------------------------------------------------
+
+# cubo → (réplicas de origem, DataFrame); remontado quando alguma réplica é trocada
+_frames: Dict[str, Tuple[Tuple[Any, ...], Any]] = {}
+
+
+def _frame(table: str):
+    """DataFrame do cubo sobre as colunas da réplica (None sem réplica)"""
+    cube = AGGREGATION_CUBES[table]
+    joins = cube.get("joins", {})
+    sources = (cube_replicas.get(table),) + tuple(cube_replicas.get(other) for other, _, _ in joins.values())
+    if sources[0] is None:
+        return None
+    cached = _frames.get(table)
+    if cached is not None and all(a is b for a, b in zip(cached[0], sources)):
+        return cached[1]
+
+    import pandas as pd
+    replica = sources[0]
+    dimensions = {name for name, _ in cube["dimensions"]}
+    frame = pd.DataFrame({
+        name: pd.Categorical(column) if name in dimensions and replica.kinds[name] == "object" else column
+        for name, column in replica.columns.items()
+    }, copy=False)
+    for (name, (_, key, other_key)), other in zip(joins.items(), sources[1:]):
+        if other is None or key not in frame:
+            continue
+        mapping = pd.Series(other.columns[name], index=other.columns[other_key])
+        mapping = mapping[~mapping.index.duplicated()]
+        frame[name] = pd.Categorical(frame[key].map(mapping))
+    _frames[table] = (sources, frame)
+    return frame
+
+
+def build_frames() -> str:
+    """Monta os DataFrames dos cubos com réplica (passo do warm-up: paga o import do pandas antes)"""
+    built = [table for table in AGGREGATION_CUBES if _frame(table) is not None]
+    return f"{len(built)}/{len(AGGREGATION_CUBES)} cubos em DataFrames"
+
+
+def aggregation_available(query: AggregationQuery) -> bool:
+    """Réplica pronta para o agregado (agrupamentos de outro cubo não têm caminho pelo Postgres)"""
+    replica = cube_replicas.get(query.table)
+    if replica is None:
+        return False
+    joins = AGGREGATION_CUBES[query.table].get("joins", {})
+    return all(name in replica.columns or (name in joins and cube_replicas.get(joins[name][0]) is not None)
+               for name in query.columns)
+
+
+def _plain(value: Any, function: str) -> Any:
+    """Valor do pandas/NumPy como no JSON do Postgres: NaN → None, inteiros como int, 2 casas"""
+    if value is None or value != value:
+        return None
+    if function == "count":
+        return int(value)
+    if hasattr(value, "item"):
+        value = value.item()
+    if function in ("min", "max") and isinstance(value, int):
+        return value
+    return round(float(value), 2)
+
+
+def _key(value: Any) -> Any:
+    """Chave do grupo: NaN (grupo NULL) → None, escalares NumPy → Python"""
+    if value is None or value != value:
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def _aggregate(values, function: str, q: Optional[float]):
+    """Mesma função para uma Series inteira ou agrupada (NULLs ignorados como no SQL)"""
+    if function == "mean":
+        return values.mean()
+    if function in ("median", "quantile"):
+        return values.quantile(q)
+    if function == "sum":
+        return values.sum(min_count=1)
+    return values.min() if function == "min" else values.max()
+
+
+def aggregation_rows(query: AggregationQuery) -> Optional[List[Dict[str, Any]]]:
+    """Resposta vetorizada pelas réplicas; None sem réplica (o plano vai ao banco)"""
+    frame = _frame(query.table) if aggregation_available(query) else None
+    if frame is None or not all(name in frame for name in query.columns):
+        return None
+    if query.where:
+        selected = frame[query.where].to_numpy() == 1
+        frame = frame[selected if query.flag else ~selected]
+
+    if query.group_by is None:
+        row = {}
+        for alias, function, q in query.aggregates:
+            value = len(frame) if function == "count" else _aggregate(frame[query.column], function, q)
+            row[alias] = _plain(value, function)
+        return [row]
+
+    grouped = frame.groupby(query.group_by, dropna=False, observed=True, sort=True)
+    results = [(alias, function, grouped.size() if function == "count" else
+                _aggregate(grouped[query.column], function, q)) for alias, function, q in query.aggregates]
+    keys = results[0][2].index
+    rows = []
+    for position, key in enumerate(keys[:Config.AGGREGATION_MAX_GROUPS]):
+        row = {query.group_by: _key(key)}
+        for alias, function, values in results:
+            row[alias] = _plain(values.iloc[position], function)
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    # Benchmark: agregados vetorizados na réplica x GROUP BY / PERCENTILE_CONT no Postgres
+    import time
+    from sqlalchemy import text
+    from config import get_engine
+    from database_executor import db_executor
+
+    if not db_executor.connection_status:
+        print("❌ Banco indisponível")
+        raise SystemExit(1)
+    cube_replicas.refresh(tables=list(AGGREGATION_CUBES) + ["cubo_genealogia"])
+    started = time.perf_counter()
+    print(f"📦 {build_frames()} em {(time.perf_counter() - started) * 1000:.0f} ms (inclui o import do pandas)")
+    questions = [
+        "média da produção vitalícia das vacas por raça",
+        "distribuição do número de partos",
+        "quantos touros têm amostra significativa?",
+        "percentil 90 da produção vitalícia por classificação",
+        "mediana do leite 305 dos touros por categoria",
+        "distribuição da produção vitalícia por raça",
+        "quantos animais por sexo",
+        "soma da produção de leite das vacas com boa fertilidade",
+    ]
+    for question in questions:
+        aggregation = parse_aggregation(question)
+        n = 50
+        started = time.perf_counter()
+        for _ in range(n):
+            rows = aggregation_rows(aggregation)
+        replica_ms = (time.perf_counter() - started) / n * 1000
+        with get_engine().connect() as conn:
+            started = time.perf_counter()
+            for _ in range(5):
+                database_rows = conn.execute(text(aggregation_sql(aggregation))).mappings().fetchall()
+            database_ms = (time.perf_counter() - started) / 5 * 1000
+        same = len(rows) == len(database_rows) and all(
+            abs(float(row[name] or 0) - float(database_row[name] or 0)) <= 0.011
+            if name != aggregation.group_by else row[name] == database_row[name]
+            for row, database_row in zip(rows, database_rows) for name in aggregation.fields)
+        print(f"⏱️ {question[:55]:55s} pandas {replica_ms:7.2f} ms  Postgres {database_ms:8.2f} ms"
+              f"  {'✅' if same else '❌'}")
@@ -1,15 +1,29 @@
 from flask import Flask, request, jsonify
 from nl_to_sql import nl_to_sql_pipeline
+from admission import AdmissionRejected
 from schema_mapper import schema_mapper
 from config import Config
-import json
+import http_cache
+import lifecycle
+import metrics
+import serialization
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
+# 🆕 JSON rápido (orjson) e compressão negociada pelo Accept-Encoding
+serialization.init_app(app)
 
 
-
+def create_app(warm_up: bool = True, background: bool = True, threads: bool = True):
+    """
+    🆕 App pronto para servir: importar este módulo não conecta no banco nem carrega o schema;
+    aqui a inicialização começa (em thread, com o /readyz em 503 até terminar, ou bloqueando).
+    threads=False: bloqueia sem criar nenhuma thread (antes do fork; ver lifecycle.start_background)
+    """
+    if warm_up:
+        lifecycle.start(background=background, threads=threads)
+    return app
 
 
 @app.route('/')
@@ -140,20 +154,77 @@ def index():
     </html>
     '''
 
-@app.route('/api/nl-to-sql', methods=['POST'])
-def nl_to_sql():
-    """Endpoint principal com análise de palavras-chave"""
-    data = request.get_json()
-    natural_language_query = data.get('query', '').strip()
+def _client_id():
+    """Cliente para o rodízio/limite das faixas de admissão (atrás de proxy, use o ProxyFix do werkzeug)"""
+    return request.remote_addr or "local"
+
+def _read_query_params():
+    """Pergunta, cursor e page_size do GET (query string) ou do POST (JSON); o 4º item é a resposta de erro"""
+    # 🆕 GET (?query=...&page_size=...&cursor=...) permite cache em navegadores e proxies
+    if request.method == 'GET':
+        data = request.args.to_dict()
+        if 'page_size' in data:
+            data['page_size'] = request.args.get('page_size', type=int) or -1
+    else:
+        data = request.get_json(silent=True) or {}
+    natural_language_query = (data.get('query') or '').strip()
+    # 🆕 Paginação por chave: page_size na primeira página, cursor nas seguintes
+    cursor = data.get('cursor') or None
+    page_size = data.get('page_size')
     
-    if not natural_language_query:
-        return jsonify({
+    if not natural_language_query and not cursor:
+        return None, None, None, jsonify({
             'success': False,
             'error': 'Query vazia'
         })
     
-    # Executa o pipeline inteligente
-    success, sql_query, results = nl_to_sql_pipeline.natural_language_to_sql(natural_language_query)
+    if page_size is not None:
+        if not isinstance(page_size, int) or isinstance(page_size, bool) or not 1 <= page_size <= Config.MAX_PAGE_SIZE:
+            return None, None, None, (jsonify({
+                'success': False,
+                'error': f'page_size deve ser um inteiro entre 1 e {Config.MAX_PAGE_SIZE}'
+            }), 400)
+    return natural_language_query, cursor, page_size, None
+
+@app.route('/api/nl-to-sql', methods=['GET', 'POST'])
+def nl_to_sql():
+    """Endpoint principal com análise de palavras-chave"""
+    natural_language_query, cursor, page_size, error_response = _read_query_params()
+    if error_response is not None:
+        return error_response
+    
+    # 🆕 Respostas determinísticas (atalhos e páginas por cursor): ETag fraca + 304 sem executar nada
+    # (a pergunta é analisada e roteada uma vez só: o mesmo plano vai para a execução)
+    etag = None
+    routed = None if cursor else nl_to_sql_pipeline.route(natural_language_query)
+    answer = nl_to_sql_pipeline.answer_key(natural_language_query, page_size=page_size, cursor=cursor,
+                                           routed=routed)
+    if answer is not None:
+        from database_executor import db_executor
+        answer_key, answer_sql = answer
+        versions = db_executor.data_versions(http_cache.tables_in(answer_sql))
+        etag = http_cache.answer_etag(answer_key, sorted(versions.items()))
+        revalidated = http_cache.etag_matches(request.if_none_match, etag)
+        metrics.cache_event("http_answer", revalidated)
+        if revalidated:
+            return http_cache.not_modified(etag, http_cache.public_cache_control(), weak=True)
+    
+    # Executa o pipeline inteligente (🆕 com admissão na faixa rápida ou na da LLM)
+    try:
+        success, sql_query, results = nl_to_sql_pipeline.natural_language_to_sql(
+            natural_language_query, page_size=page_size, cursor=cursor, client_id=_client_id(), routed=routed
+        )
+    except AdmissionRejected as e:
+        response = jsonify({
+            'success': False,
+            'sql': None,
+            'results': None,
+            'error': str(e),
+            'retry_after': e.retry_after
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return http_cache.apply_validators(response, None, http_cache.NO_STORE)
     
     response_data = {
         'success': success,
@@ -162,17 +233,166 @@ def nl_to_sql():
         'error': None if success else results
     }
     
-    return jsonify(response_data)
+    response = jsonify(response_data)
+    if success and etag:
+        return http_cache.apply_validators(response, etag, http_cache.public_cache_control(), weak=True)
+    return http_cache.apply_validators(response, None, http_cache.NO_STORE)
+
+@app.route('/api/nl-to-sql/stream', methods=['GET', 'POST'])
+def nl_to_sql_stream():
+    """
+    🆕 Mesmo pipeline em Server-Sent Events: análise, rota (atalho/LLM), SQL, início da execução,
+    lotes de linhas e fim, cada um enviado assim que fica pronto.
+    Se o cliente desconecta, a escrita falha, o servidor fecha o gerador e o resto do trabalho é cancelado.
+    """
+    natural_language_query, cursor, page_size, error_response = _read_query_params()
+    if error_response is not None:
+        return error_response
+    
+    events = nl_to_sql_pipeline.stream_events(natural_language_query, page_size=page_size, cursor=cursor,
+                                              client_id=_client_id())
+    
+    def generate():
+        try:
+            for name, payload in events:
+                yield serialization.sse_event(name, payload)
+        except GeneratorExit:
+            print("🛑 Cliente desconectou: cancelando o restante do pipeline")
+            raise
+        except Exception as e:
+            yield serialization.sse_event('error', {'error': f'Erro: {str(e)}'})
+        finally:
+            events.close()
+    
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = http_cache.NO_STORE
+    # Sem buffer em proxies (nginx): cada evento sai na hora
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/export', methods=['GET', 'POST'])
+def export_answer():
+    """
+    🆕 Resposta inteira de uma pergunta (sem o LIMIT) em CSV ou Parquet, em stream direto do COPY do Postgres.
+    Parâmetros: query, format (csv ou parquet, padrão csv) e limit opcional.
+    A vazão (linhas/s) de cada exportação fica em /api/export/stats e nas métricas nl2sql_export_*.
+    """
+    from export import start_export
+
+    data = request.args.to_dict() if request.method == 'GET' else (request.get_json(silent=True) or {})
+    natural_language_query = (data.get('query') or '').strip()
+    fmt = str(data.get('format') or 'csv').lower()
+    limit = data.get('limit')
+    if not natural_language_query:
+        return jsonify({'success': False, 'error': 'Query vazia'}), 400
+    if limit is not None:
+        try:
+            limit = None if isinstance(limit, bool) else int(limit)
+        except (TypeError, ValueError):
+            limit = None
+        if limit is None or limit < 1:
+            return jsonify({'success': False, 'error': 'limit deve ser um inteiro positivo'}), 400
+
+    try:
+        success, export, message = start_export(natural_language_query, fmt, limit, client_id=_client_id())
+    except AdmissionRejected as e:
+        response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return http_cache.apply_validators(response, None, http_cache.NO_STORE)
+    if not success:
+        response = jsonify({'success': False, 'error': message})
+        response.status_code = 400
+        return http_cache.apply_validators(response, None, http_cache.NO_STORE)
+
+    # O corpo é o próprio Export: a resposta fecha-o no fim ou quando o cliente desconecta (aborta o COPY)
+    response = app.response_class(export, content_type=export.mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{export.filename}"'
+    response.headers['Cache-Control'] = http_cache.NO_STORE
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/export/stats')
+def get_export_stats():
+    """🆕 Últimas exportações: linhas, bytes, tempo e vazão (linhas/s)"""
+    from export import recent_exports
+    return http_cache.apply_validators(jsonify({'exports': recent_exports()}), None, http_cache.NO_STORE)
+
+@app.route('/api/query-stats')
+def get_query_stats():
+    """Agregados por fingerprint das queries executadas (formatos que dominam a carga).
+    Atenção: `example` é a última SQL executada de cada formato, com os literais originais (códigos,
+    nomes) — o index_advisor precisa dela para o EXPLAIN; não exponha este endpoint fora da rede interna"""
+    from query_stats import query_stats
+    
+    limit = request.args.get('limit', default=50, type=int)
+    limit = max(1, min(limit, query_stats.max_fingerprints))
+    order_by = request.args.get('order_by', default='total_ms')
+    return http_cache.apply_validators(jsonify({
+        'fingerprints': query_stats.snapshot(limit=limit, order_by=order_by),
+        'tracked': len(query_stats),
+        'capacity': query_stats.max_fingerprints,
+        'evicted': query_stats.evicted
+    }), None, http_cache.NO_STORE)
+
+@app.route('/api/replicas')
+def get_replicas():
+    """🆕 Réplicas em memória dos cubos: linhas, versão, idade e memória por tabela"""
+    from cube_replica import cube_replicas
+    return http_cache.apply_validators(jsonify(cube_replicas.status()), None, http_cache.NO_STORE)
+
+@app.route('/api/matviews')
+def get_matviews():
+    """🆕 Views materializadas do index_advisor: origem, tabelas e versão dos dados no último refresh
+    (REFRESH manual só pela linha de comando: `python index_advisor.py --refresh-views`)"""
+    from materialized_views import materialized_views
+    materialized_views.load()
+    return http_cache.apply_validators(jsonify(materialized_views.status()), None, http_cache.NO_STORE)
+
+_schema_info_cache = {}
+
+@app.route('/healthz')
+def healthz():
+    """🆕 Liveness: o processo responde (não depende do banco nem do schema)"""
+    return http_cache.apply_validators(jsonify({'status': 'ok'}), None, http_cache.NO_STORE)
+
+@app.route('/readyz')
+def readyz():
+    """🆕 Readiness: 200 só com a inicialização concluída e o banco conectado"""
+    status = lifecycle.status()
+    response = jsonify(status)
+    if not status['ready']:
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+    return http_cache.apply_validators(response, None, http_cache.NO_STORE)
+
+@app.route('/metrics')
+def get_metrics():
+    """🆕 Métricas no formato texto do Prometheus (etapas, caminhos, validação, pool, LLM, caches)"""
+    return app.response_class(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/api/schema-info')
 def get_schema_info():
     """Retorna informações do schema carregado"""
-    tables = [table.get("tabela") for table in schema_mapper.schema_data]
-    return jsonify({
-        'tables': tables,
-        'total_tables': len(tables),
-        'keyword_mappings_count': len(schema_mapper.keyword_mappings)
-    })
+    # 🆕 Corpo e ETag calculados uma vez por versão do schema
+    version = schema_mapper.schema_version()
+    cached = _schema_info_cache.get(version)
+    metrics.cache_event("schema_info", cached is not None)
+    if cached is None:
+        tables = schema_mapper.table_names()
+        body = {
+            'tables': tables,
+            'total_tables': len(tables),
+            'keyword_mappings_count': len(schema_mapper.keyword_mappings)
+        }
+        cached = _schema_info_cache[version] = (
+            http_cache.make_etag("schema-info", version, body['keyword_mappings_count']), body
+        )
+    etag, body = cached
+    cache_control = http_cache.public_cache_control(Config.HTTP_CACHE_MAX_AGE * 10)
+    if http_cache.etag_matches(request.if_none_match, etag):
+        return http_cache.not_modified(etag, cache_control)
+    return http_cache.apply_validators(jsonify(body), etag, cache_control)
 
 @app.route('/api/database-status')
 def get_database_status():
@@ -199,4 +419,5 @@ if __name__ == '__main__':
     print("🚀 Iniciando NL to SQL com Mapeamento Inteligente...")
     print("📊 Schema: schema_descriptions.json")
     print("🔗 Acesse: http://localhost:5000")
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Servidor de desenvolvimento (reloader); em produção use: python serve.py --workers 4
+    create_app().run(debug=True, port=5000)
\ No newline at end of file
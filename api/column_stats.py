@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+Estatísticas por coluna para dicas no prompt e estimativa de custo das queries.
+- Fontes: pg_stats do banco ativo ou uma passada em streaming pelos blocos COPY do backup.sql
+- Por coluna: fração de nulos, distintos (HyperLogLog), mín/máx e valores mais frequentes
+- Guardadas no snapshot do schema (chave "column_stats") junto com o número de linhas por tabela
+- ColumnStats estima a cardinalidade de um SELECT (seletividade de WHERE/JOIN/LIMIT via sqlglot)
+"""
+from __future__ import annotations
+import math
+import mmap
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from columnar_store import DEFAULT_PREFIXES, block_columns, column_kind, iter_copy_columns
+
+try:
+    import sqlglot  # type: ignore
+    from sqlglot import exp  # type: ignore
+except Exception:  # sqlglot é opcional; sem ele não há estimativa de custo
+    sqlglot = None
+    exp = None
+
+# Valores frequentes guardados por coluna e candidatos acompanhados durante o streaming
+TOP_VALUES = 10
+_TOP_TRACKED = 256
+# Seletividade padrão do Postgres para predicados sem estatística
+_DEFAULT_SELECTIVITY = 1 / 3
+_NULL = b"\\N"
+
+_PG_STATS_SQL = """
+SELECT s.tablename, s.attname, format_type(a.atttypid, a.atttypmod), c.reltuples,
+       s.null_frac, s.n_distinct, s.most_common_vals::text, s.most_common_freqs::text,
+       s.histogram_bounds::text
+FROM pg_stats s
+JOIN pg_namespace n ON n.nspname = s.schemaname
+JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = s.tablename
+JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname = s.attname
+WHERE s.schemaname = 'public'
+ORDER BY s.tablename, a.attnum
+"""
+
+
+class HyperLogLog:
+    """Contador aproximado de distintos (2^p registradores, erro ~1.04/sqrt(2^p))"""
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        """Adiciona hashes de 64 bits (vetorizado)"""
+        if not len(hashes):
+            return
+        h = hashes.view(np.uint64)
+        index = (h >> np.uint64(64 - self.p)).astype(np.intp)
+        # Bit-guarda garante w > 0; posição do 1º bit = 64 - floor(log2(w))
+        w = (h << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))
+        rank = (64 - np.floor(np.log2(w.astype(np.float64)))).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, values: Iterable[bytes]) -> None:
+        values = list(values)
+        self.add_hashes(np.fromiter(map(hash, values), dtype=np.int64, count=len(values)))
+
+    def estimate(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros:
+            raw = self.m * math.log(self.m / zeros)
+        return int(round(raw))
+
+
+class ColumnStatsCollector:
+    """Acumula estatísticas de uma coluna do COPY lote a lote"""
+
+    def __init__(self, name: str, pg_type: str):
+        self.name = name
+        self.pg_type = pg_type
+        self.kind = column_kind(pg_type)
+        self.rows = 0
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.hll = HyperLogLog()
+        self.top: Counter = Counter()
+        self.top_exact = True  # False depois que candidatos raros foram descartados
+
+    def add(self, fields: List[bytes]) -> None:
+        self.rows += len(fields)
+        null_count = fields.count(_NULL)
+        self.nulls += null_count
+        values = [v for v in fields if v != _NULL] if null_count else fields
+        if not values:
+            return
+
+        self.hll.add(values)
+        if self.kind in ("int", "float"):
+            numbers = np.array(values, dtype=bytes).astype(np.float64)
+            low, high = float(numbers.min()), float(numbers.max())
+        else:
+            low, high = min(values), max(values)
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+        # Heavy hitters: contagem exata do lote + poda dos candidatos globais
+        batch = Counter(values)
+        if self.top_exact and len(self.top) + len(batch) <= _TOP_TRACKED:
+            self.top.update(batch)
+        else:
+            self.top.update(dict(batch.most_common(_TOP_TRACKED)))
+            self.top = Counter(dict(self.top.most_common(_TOP_TRACKED)))
+            self.top_exact = False
+
+    def result(self) -> Dict[str, Any]:
+        non_null = self.rows - self.nulls
+        n_distinct = len(self.top) if self.top_exact else max(self.hll.estimate(), len(self.top))
+        n_distinct = min(n_distinct, non_null)
+        top_values = []
+        if n_distinct and self.rows:
+            # Como no pg_stats: só valores mais frequentes que a média
+            average = non_null / n_distinct
+            top_values = [[_decode(v), round(c / self.rows, 6)] for v, c in self.top.most_common(TOP_VALUES)
+                          if n_distinct <= TOP_VALUES or c > 1.25 * average]
+        return {
+            "type": self.pg_type,
+            "kind": self.kind,
+            "null_frac": round(self.nulls / self.rows, 6) if self.rows else 0.0,
+            "n_distinct": n_distinct,
+            "min": _decode(self.minimum),
+            "max": _decode(self.maximum),
+            "top_values": top_values,
+        }
+
+
+def _decode(value: Any) -> Any:
+    return value.decode("utf-8", errors="replace") if isinstance(value, bytes) else value
+
+
+def stats_from_dump(dump_path: str, schema: Dict[str, Any], tables: Optional[List[str]] = None,
+                    prefixes: Iterable[str] = DEFAULT_PREFIXES) -> Dict[str, Any]:
+    """Estatísticas a partir dos blocos COPY do dump (uma passada, memória limitada)"""
+    started = time.perf_counter()
+    copy_blocks = schema.get("copy_blocks", {})
+    targets = tables or [t for t in copy_blocks if t.startswith(tuple(prefixes))]
+    result: Dict[str, Any] = {"source": "dump", "tables": {}}
+
+    with open(dump_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for table in targets:
+            if table not in copy_blocks:
+                continue
+            collectors = [ColumnStatsCollector(name, pg_type) for name, pg_type in block_columns(schema, table)]
+            for batch in iter_copy_columns(mm, copy_blocks[table], len(collectors), table):
+                for collector, fields in zip(collectors, batch):
+                    collector.add(fields)
+            result["tables"][table] = {
+                "rows": collectors[0].rows if collectors else 0,
+                "columns": {c.name: c.result() for c in collectors},
+            }
+
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    print(f"📈 Estatísticas de {len(result['tables'])} tabelas coletadas do dump em {result['elapsed_s']}s")
+    return result
+
+
+def parse_pg_array(text: Optional[str]) -> List[Optional[str]]:
+    """Converte a representação texto de um array Postgres ('{a,"b c",NULL}') em lista"""
+    if not text or text == "{}":
+        return []
+    items: List[Optional[str]] = []
+    body, i = text[1:-1], 0
+    while i < len(body):
+        if body[i] == '"':
+            i += 1
+            chars = []
+            while body[i] != '"':
+                if body[i] == "\\":
+                    i += 1
+                chars.append(body[i])
+                i += 1
+            items.append("".join(chars))
+            i += 2  # aspas de fechamento + vírgula
+        else:
+            end = body.find(",", i)
+            end = len(body) if end == -1 else end
+            token = body[i:end]
+            items.append(None if token == "NULL" else token)
+            i = end + 1
+    return items
+
+
+def stats_from_pg_stats(engine) -> Dict[str, Any]:
+    """Estatísticas do pg_stats (precisa de ANALYZE/autovacuum recente no banco)"""
+    from sqlalchemy import text
+
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"source": "pg_stats", "tables": {}}
+    with engine.connect() as conn:
+        rows = conn.execute(text(_PG_STATS_SQL)).fetchall()
+
+    for table, column, pg_type, reltuples, null_frac, n_distinct, mcv, mcf, histogram in rows:
+        table_rows = max(int(reltuples or 0), 0)
+        kind = column_kind(pg_type)
+        top = parse_pg_array(mcv)
+        freqs = [float(f) for f in parse_pg_array(mcf)]
+        bounds = [v for v in parse_pg_array(histogram) if v is not None]
+        candidates = [v for v in top + bounds if v is not None]
+        if kind in ("int", "float"):
+            numbers = [float(v) for v in candidates]
+            minimum, maximum = (min(numbers), max(numbers)) if numbers else (None, None)
+        else:
+            minimum, maximum = (min(candidates), max(candidates)) if candidates else (None, None)
+        # n_distinct negativo = fração do número de linhas
+        distinct = int(round(-n_distinct * table_rows)) if n_distinct < 0 else int(n_distinct)
+
+        entry = result["tables"].setdefault(table, {"rows": table_rows, "columns": {}})
+        entry["columns"][column] = {
+            "type": pg_type,
+            "kind": kind,
+            "null_frac": round(float(null_frac), 6),
+            "n_distinct": distinct,
+            "min": minimum,
+            "max": maximum,
+            "top_values": [[v, round(f, 6)] for v, f in list(zip(top, freqs))[:TOP_VALUES]],
+        }
+
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    print(f"📈 Estatísticas de {len(result['tables'])} tabelas lidas do pg_stats em {result['elapsed_s']}s")
+    return result
+
+
+class ColumnStats:
+    """Consulta às estatísticas: dicas para o prompt e estimativa de linhas de um SELECT"""
+
+    def __init__(self, stats: Optional[Dict[str, Any]] = None):
+        self.update(stats)
+
+    def update(self, stats: Optional[Dict[str, Any]]) -> None:
+        self.stats = stats or {"source": None, "tables": {}}
+        self.tables = self.stats.get("tables", {})
+
+    def column(self, table: str, column: str) -> Optional[Dict[str, Any]]:
+        return self.tables.get(table, {}).get("columns", {}).get(column)
+
+    def describe_table(self, table: str, columns: Optional[List[str]] = None, max_columns: int = 6) -> str:
+        """Resumo curto da distribuição dos dados de uma tabela para o prompt"""
+        info = self.tables.get(table)
+        if not info:
+            return ""
+        parts = []
+        for name in columns or list(info["columns"]):
+            col = info["columns"].get(name)
+            if col is None:
+                continue
+            if col["kind"] == "bool" and col["top_values"]:
+                shares = ", ".join(f"{_format_value(v)} {f:.0%}" for v, f in col["top_values"][:2])
+                parts.append(f"{name}: {shares}")
+            elif col["kind"] in ("int", "float") and col["min"] is not None:
+                parts.append(f"{name}: {_format_value(col['min'])}–{_format_value(col['max'])}")
+            elif col["kind"] == "string" and 0 < col["n_distinct"] <= TOP_VALUES and col["top_values"]:
+                parts.append(f"{name}: {' | '.join(str(v) for v, _ in col['top_values'])}")
+            elif col["kind"] == "string" and col["n_distinct"]:
+                parts.append(f"{name}: ~{col['n_distinct']:,} distintos".replace(",", "."))
+            if len(parts) >= max_columns:
+                break
+        return f"{table} ({info['rows']:,} linhas): ".replace(",", ".") + "; ".join(parts) + "\n"
+
+    # ----------------------------------------------------------------- custo
+
+    def selectivity(self, table: str, column: str, value: Any) -> float:
+        """Fração de linhas com column = value (valores frequentes, senão distribuição uniforme)"""
+        col = self.column(table, column)
+        if not col:
+            return _DEFAULT_SELECTIVITY
+        key = _literal_key(value, col["kind"])
+        top_total = 0.0
+        for top_value, freq in col["top_values"]:
+            if _literal_key(top_value, col["kind"]) == key:
+                return freq
+            top_total += freq
+        remaining = max(col["n_distinct"] - len(col["top_values"]), 1)
+        return max(0.0, 1 - col["null_frac"] - top_total) / remaining
+
+    def _range_selectivity(self, table: str, column: str, value: Any, op: str) -> float:
+        col = self.column(table, column)
+        try:
+            low, high, point = float(col["min"]), float(col["max"]), float(value)
+        except (TypeError, ValueError):
+            return _DEFAULT_SELECTIVITY
+        if high <= low:
+            return 1.0
+        below = min(max((point - low) / (high - low), 0.0), 1.0)
+        return (1 - col["null_frac"]) * (below if op in ("lt", "lte") else 1 - below)
+
+    def estimate_rows(self, sql: str) -> Optional[Dict[str, Any]]:
+        """Estimativa de linhas lidas e retornadas por um SELECT; None sem sqlglot/estatísticas"""
+        if sqlglot is None or not self.tables:
+            return None
+        try:
+            tree = sqlglot.parse_one(sql, read="postgres")
+        except Exception:
+            return None
+        select = tree if isinstance(tree, exp.Select) else tree.find(exp.Select)
+        if select is None:
+            return None
+
+        tables = {t.alias_or_name: t.name for t in select.find_all(exp.Table)}
+        if not tables or any(name not in self.tables for name in tables.values()):
+            return None
+        base = {alias: self.tables[name]["rows"] for alias, name in tables.items()}
+        scanned = sum(base.values())
+        rows = float(math.prod(base.values()))
+
+        # JOIN ... ON a.x = b.y: divide pelo maior número de distintos entre as chaves
+        for join in select.args.get("joins") or []:
+            condition = join.args.get("on")
+            for eq in (condition.find_all(exp.EQ) if condition else []):
+                if isinstance(eq.left, exp.Column) and isinstance(eq.right, exp.Column):
+                    distinct = [self._distinct(tables, c) for c in (eq.left, eq.right)]
+                    rows /= max(max(distinct), 1)
+                    break
+
+        where = select.args.get("where")
+        if where is not None:
+            rows *= self._predicate(where.this, tables)
+
+        limit = select.args.get("limit")
+        limited = limit is not None
+        if limited:
+            try:
+                rows = min(rows, int(limit.expression.name))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        return {"rows": int(math.ceil(rows)), "scanned": scanned, "limited": limited,
+                "tables": sorted(set(tables.values()))}
+
+    def _distinct(self, tables: Dict[str, str], column) -> int:
+        table = self._column_table(tables, column)
+        col = self.column(table, column.name) if table else None
+        return col["n_distinct"] if col else 1
+
+    def _column_table(self, tables: Dict[str, str], column) -> Optional[str]:
+        if column.table:
+            return tables.get(column.table)
+        for name in tables.values():
+            if self.column(name, column.name):
+                return name
+        return None
+
+    def _predicate(self, node, tables: Dict[str, str]) -> float:
+        if isinstance(node, exp.Paren):
+            return self._predicate(node.this, tables)
+        if isinstance(node, exp.And):
+            return self._predicate(node.left, tables) * self._predicate(node.right, tables)
+        if isinstance(node, exp.Or):
+            left, right = self._predicate(node.left, tables), self._predicate(node.right, tables)
+            return min(left + right - left * right, 1.0)
+        if isinstance(node, exp.Not):
+            return 1 - self._predicate(node.this, tables)
+
+        column = node.this if isinstance(getattr(node, "this", None), exp.Column) else None
+        table = self._column_table(tables, column) if column is not None else None
+        if table is None:
+            return _DEFAULT_SELECTIVITY
+        if isinstance(node, exp.EQ) and isinstance(node.expression, (exp.Literal, exp.Boolean)):
+            return self.selectivity(table, column.name, _literal_value(node.expression))
+        if isinstance(node, exp.In) and node.expressions:
+            return min(sum(self.selectivity(table, column.name, _literal_value(e)) for e in node.expressions), 1.0)
+        if isinstance(node, exp.Is) and isinstance(node.expression, exp.Null):
+            col = self.column(table, column.name)
+            return col["null_frac"] if col else _DEFAULT_SELECTIVITY
+        for cls, op in ((exp.GT, "gt"), (exp.GTE, "gte"), (exp.LT, "lt"), (exp.LTE, "lte")):
+            if isinstance(node, cls) and isinstance(node.expression, exp.Literal):
+                return self._range_selectivity(table, column.name, node.expression.name, op)
+        return _DEFAULT_SELECTIVITY
+
+
+def _literal_value(node) -> Any:
+    if isinstance(node, exp.Boolean):
+        return node.this
+    return node.name
+
+
+def _literal_key(value: Any, kind: str) -> Any:
+    """Normaliza literais SQL e valores das estatísticas para comparação"""
+    if kind == "bool":
+        return str(value).lower() in ("t", "true", "1")
+    if kind in ("int", "float"):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value
+    return str(value)
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.0f}" if abs(value) >= 100 or value == int(value) else f"{value:.2f}"
+    if value in ("t", "f"):
+        return "true" if value == "t" else "false"
+    return str(value)
+
+
+# Instância global (preenchida pelo SchemaMapper na carga do schema)
+column_stats = ColumnStats()
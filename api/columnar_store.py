@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Armazenamento colunar offline extraído dos blocos COPY do backup.sql.
+- Lê os dados dos cubos (cubo_*) e da filhas_touro direto do dump, sem Postgres
+- Um arquivo NumPy .npy por coluna, tipado a partir do DDL (int64, float64, bool, datas)
+- Textos em layout offsets + bytes UTF-8 (sem objetos Python na gravação)
+- Processa o bloco em lotes alinhados a linhas: memória limitada, independente do tamanho da tabela
+- Reextração incremental: cada tabela guarda um manifesto com o hash do seu bloco COPY
+"""
+from __future__ import annotations
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from backup_analyzer import BackupAnalyzer
+from schema_snapshot import SchemaSnapshotCache
+
+STORE_FORMAT = 1
+MANIFEST_NAME = "_manifest.json"
+# Tabelas extraídas por padrão
+DEFAULT_PREFIXES = ("cubo_", "filhas_touro")
+# Tamanho de cada lote lido do bloco COPY
+BATCH_BYTES = 8 * 1024 * 1024
+_NULL = b"\\N"
+
+_INT_TYPES = ("smallint", "integer", "bigint", "int", "int2", "int4", "int8", "serial", "bigserial", "smallserial")
+_FLOAT_TYPES = ("numeric", "decimal", "real", "double precision", "float", "float4", "float8")
+_ESCAPE_RE = re.compile(rb"\\(?:([0-7]{1,3})|x([0-9a-fA-F]{1,2})|(.))", re.DOTALL)
+_ESCAPES = {b"b": b"\b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v"}
+
+
+def column_kind(pg_type: str) -> str:
+    """Mapeia o tipo Postgres para o tipo de armazenamento colunar"""
+    base = pg_type.lower().split("(")[0].strip()
+    if pg_type.endswith("]"):
+        return "string"
+    if base in _INT_TYPES:
+        return "int"
+    if base in _FLOAT_TYPES:
+        return "float"
+    if base in ("boolean", "bool"):
+        return "bool"
+    if base == "date":
+        return "date"
+    if base.startswith("timestamp") and "with time zone" not in pg_type.lower():
+        return "timestamp"
+    return "string"
+
+
+def _unescape_match(match: "re.Match[bytes]") -> bytes:
+    octal, hexa, char = match.groups()
+    if octal:
+        return bytes([int(octal, 8) & 0xFF])
+    if hexa:
+        return bytes([int(hexa, 16)])
+    return _ESCAPES.get(char, char)
+
+
+def unescape_copy(field: bytes) -> bytes:
+    """Decodifica as sequências de escape do formato texto do COPY"""
+    return _ESCAPE_RE.sub(_unescape_match, field) if b"\\" in field else field
+
+
+def block_hash(mm: mmap.mmap, start: int, end: int, batch_bytes: int = BATCH_BYTES) -> str:
+    """blake2b do bloco COPY inteiro, lido em lotes (qualquer edição, mesmo de mesmo tamanho, muda o hash)"""
+    digest = hashlib.blake2b(f"{end - start}".encode(), digest_size=16)
+    for offset in range(start, end, batch_bytes):
+        digest.update(mm[offset:min(offset + batch_bytes, end)])
+    return digest.hexdigest()
+
+
+def iter_copy_columns(mm: mmap.mmap, block: Dict[str, Any], n_columns: int, table: str = "",
+                      batch_bytes: int = BATCH_BYTES) -> Iterator[List[List[bytes]]]:
+    """Percorre um bloco COPY em lotes alinhados a linhas, produzindo uma lista de campos por coluna"""
+    pos, end = block["data_offset"], block["data_end"]
+    while pos < end:
+        cut = mm.rfind(b"\n", pos, min(pos + batch_bytes, end)) + 1 if pos + batch_bytes < end else end
+        if cut <= pos:  # linha maior que o lote
+            cut = mm.find(b"\n", pos, end) + 1 or end
+        chunk = mm[pos:cut]
+        pos = cut
+        lines = chunk.count(b"\n")
+        if not lines:
+            continue
+        # Lote inteiro achatado em uma lista de campos; coluna i = campos[i::n]
+        if chunk.count(b"\t") != lines * (n_columns - 1):
+            raise ValueError(f"Bloco COPY de '{table}' com linhas de número de campos diferente de {n_columns}")
+        fields = chunk[:-1].replace(b"\n", b"\t").split(b"\t")
+        yield [fields[i::n_columns] for i in range(n_columns)]
+
+
+def block_columns(schema: Dict[str, Any], table: str) -> List[Tuple[str, str]]:
+    """(coluna, tipo Postgres) na ordem do bloco COPY da tabela"""
+    types = {c["name"]: c["type"] for c in schema.get("columns", {}).get(table, [])}
+    columns = schema.get("copy_blocks", {}).get(table, {}).get("columns") or list(types)
+    return [(name, types.get(name, "text")) for name in columns]
+
+
+def _write_npy(raw_path: Path, npy_path: Path, dtype: np.dtype, count: int) -> None:
+    """Converte um arquivo binário cru (gravado com tofile) em .npy sem carregá-lo na memória"""
+    with open(npy_path, "wb") as out, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(out, {"descr": np.lib.format.dtype_to_descr(dtype),
+                                                   "fortran_order": False, "shape": (count,)})
+        shutil.copyfileobj(raw, out, 16 * 1024 * 1024)
+    raw_path.unlink()
+
+
+class _ColumnWriter:
+    """Acumula uma coluna lote a lote em arquivos crus"""
+
+    def __init__(self, directory: Path, name: str, pg_type: str):
+        self.directory = directory
+        self.name = name
+        self.pg_type = pg_type
+        self.kind = column_kind(pg_type)
+        self.rows = 0
+        self.null_count = 0
+        self.data_bytes = 0
+        self._values = open(self._path("values.raw"), "wb")
+        self._nulls = open(self._path("nulls.raw"), "wb") if self.kind in ("int", "string") else None
+        self._data = open(self._path("data.raw"), "wb") if self.kind == "string" else None
+        if self._data is not None:
+            np.zeros(1, dtype=np.int64).tofile(self._values)
+
+    def _path(self, suffix: str) -> Path:
+        return self.directory / f"{self.name}.{suffix}"
+
+    def append(self, fields: Iterable[bytes]) -> None:
+        if self.kind == "string":
+            values = fields if isinstance(fields, list) else list(fields)
+            null_count = values.count(_NULL)
+            nulls = np.zeros(len(values), dtype=np.bool_)
+            blob = b"".join(values)
+            # Caminho lento (máscara de nulos / escapes) só quando o lote realmente tem esses casos
+            if null_count or b"\\" in blob:
+                nulls = np.fromiter((v == _NULL for v in values), dtype=np.bool_, count=len(values))
+                values = [b"" if is_null else unescape_copy(v) for v, is_null in zip(values, nulls)]
+                blob = b"".join(values)
+            lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+            (np.cumsum(lengths) + self.data_bytes).tofile(self._values)
+            self._data.write(blob)
+            self.data_bytes += len(blob)
+        else:
+            raw = np.array(fields, dtype=bytes)
+            nulls = raw == _NULL
+            null_count = int(nulls.sum())
+            if null_count:
+                raw = np.where(nulls, b"0" if self.kind in ("int", "float") else b"", raw)
+            if self.kind == "int":
+                values = raw.astype(np.int64)
+            elif self.kind == "float":
+                values = raw.astype(np.float64)
+                values[nulls] = np.nan
+            elif self.kind == "bool":
+                values = np.where(nulls, -1, raw == b"t").astype(np.int8)
+            else:
+                unit = "D" if self.kind == "date" else "us"
+                text = np.where(nulls, "NaT", raw.astype("U"))
+                values = text.astype(f"datetime64[{unit}]")
+            values.tofile(self._values)
+
+        if self._nulls is not None:
+            nulls.tofile(self._nulls)
+        self.rows += len(nulls)
+        self.null_count += null_count
+
+    def close(self) -> Dict[str, Any]:
+        """Fecha os arquivos crus e grava os .npy finais"""
+        for handle in (self._values, self._nulls, self._data):
+            if handle is not None:
+                handle.close()
+        if self.kind == "string":
+            _write_npy(self._path("values.raw"), self._path("offsets.npy"), np.dtype(np.int64), self.rows + 1)
+            _write_npy(self._path("data.raw"), self._path("data.npy"), np.dtype(np.uint8), self.data_bytes)
+        else:
+            dtype = {"int": np.dtype(np.int64), "float": np.dtype(np.float64), "bool": np.dtype(np.int8),
+                     "date": np.dtype("datetime64[D]"), "timestamp": np.dtype("datetime64[us]")}[self.kind]
+            _write_npy(self._path("values.raw"), self._path("npy"), dtype, self.rows)
+        if self._nulls is not None:
+            if self.null_count:
+                _write_npy(self._path("nulls.raw"), self._path("nulls.npy"), np.dtype(np.bool_), self.rows)
+            else:
+                self._path("nulls.raw").unlink()
+        return {"name": self.name, "type": self.pg_type, "kind": self.kind, "nulls": self.null_count}
+
+
+class StringColumn:
+    """Coluna de texto mapeada em memória (offsets + bytes UTF-8)"""
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray, nulls: Optional[np.ndarray] = None):
+        self.offsets = offsets
+        self.data = data
+        self.nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def to_list(self) -> List[Optional[str]]:
+        blob = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        values = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        if self.nulls is not None:
+            for i in np.flatnonzero(self.nulls):
+                values[i] = None
+        return values
+
+    def to_numpy(self) -> np.ndarray:
+        return np.array(self.to_list(), dtype=object)
+
+
+class ColumnarStore:
+    """Extrai e lê as tabelas do dump em formato colunar"""
+
+    def __init__(self, store_dir: str = "database/columnar", dump_path: str = "database/backup.sql"):
+        self.store_dir = Path(store_dir)
+        self.dump_path = Path(dump_path)
+        self.snapshot = SchemaSnapshotCache(str(dump_path))
+
+    def _load_schema(self) -> Dict[str, Any]:
+        schema = self.snapshot.load()
+        if schema is None:
+            schema = BackupAnalyzer(str(self.dump_path)).analyze_structure()
+            if "error" not in schema:
+                self.snapshot.save(schema)
+        return schema
+
+    def manifest(self, table: str) -> Optional[Dict[str, Any]]:
+        path = self.store_dir / table / MANIFEST_NAME
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            return manifest if manifest.get("format") == STORE_FORMAT else None
+        except Exception:
+            return None
+
+    def tables(self) -> List[str]:
+        """Tabelas disponíveis no armazenamento"""
+        if not self.store_dir.exists():
+            return []
+        return sorted(p.name for p in self.store_dir.iterdir() if (p / MANIFEST_NAME).exists())
+
+    def extract(self, tables: Optional[List[str]] = None, prefixes: Iterable[str] = DEFAULT_PREFIXES,
+                force: bool = False) -> Dict[str, Any]:
+        """Extrai as tabelas cujo bloco COPY mudou desde a última extração"""
+        if not self.dump_path.exists():
+            return {"error": "Backup não encontrado"}
+        schema = self._load_schema()
+        if "error" in schema:
+            return schema
+
+        copy_blocks = schema.get("copy_blocks", {})
+        targets = tables or [t for t in copy_blocks if t.startswith(tuple(prefixes))]
+        report: Dict[str, Any] = {"tables": {}, "rows": 0, "bytes": 0}
+        started = time.perf_counter()
+
+        with open(self.dump_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for table in targets:
+                block = copy_blocks.get(table)
+                if block is None:
+                    report["tables"][table] = "sem bloco COPY"
+                    continue
+                digest = block_hash(mm, block["data_offset"], block["data_end"])
+                current = self.manifest(table)
+                if not force and current and current["block"]["hash"] == digest:
+                    report["tables"][table] = "inalterada"
+                    continue
+                manifest = self._extract_table(mm, table, block, digest, block_columns(schema, table))
+                report["tables"][table] = f"{manifest['rows']} linhas em {manifest['elapsed_s']}s"
+                report["rows"] += manifest["rows"]
+                report["bytes"] += block["data_end"] - block["data_offset"]
+
+        report["elapsed_s"] = round(time.perf_counter() - started, 3)
+        return report
+
+    def _extract_table(self, mm: mmap.mmap, table: str, block: Dict[str, Any], digest: str,
+                       columns: List[Tuple[str, str]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        tmp_dir = self.store_dir / f".{table}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        writers = [_ColumnWriter(tmp_dir, name, pg_type) for name, pg_type in columns]
+        try:
+            for batch in iter_copy_columns(mm, block, len(writers), table):
+                for writer, fields in zip(writers, batch):
+                    writer.append(fields)
+            column_info = [writer.close() for writer in writers]
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        manifest = {
+            "format": STORE_FORMAT,
+            "table": table,
+            "rows": writers[0].rows if writers else 0,
+            "block": {"data_offset": block["data_offset"], "data_end": block["data_end"], "hash": digest},
+            "columns": column_info,
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        }
+        with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # Troca atômica do diretório da tabela
+        final_dir = self.store_dir / table
+        old_dir = self.store_dir / f".{table}.old"
+        if final_dir.exists():
+            os.replace(final_dir, old_dir)
+        os.replace(tmp_dir, final_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        print(f"💾 {table}: {manifest['rows']} linhas extraídas em {manifest['elapsed_s']}s")
+        return manifest
+
+    def load_column(self, table: str, column: str, mmap_mode: Optional[str] = "r"):
+        """Carrega uma coluna (ndarray ou StringColumn) mapeada em memória"""
+        manifest = self.manifest(table)
+        if manifest is None:
+            raise KeyError(f"Tabela '{table}' não extraída")
+        info = next((c for c in manifest["columns"] if c["name"] == column), None)
+        if info is None:
+            raise KeyError(f"Coluna '{column}' não existe em '{table}'")
+        base = self.store_dir / table / column
+        nulls = np.load(f"{base}.nulls.npy", mmap_mode=mmap_mode) if info["nulls"] and info["kind"] in ("int", "string") else None
+        if info["kind"] == "string":
+            return StringColumn(np.load(f"{base}.offsets.npy", mmap_mode=mmap_mode),
+                                np.load(f"{base}.data.npy", mmap_mode=mmap_mode), nulls)
+        return np.load(f"{base}.npy", mmap_mode=mmap_mode)
+
+    def null_mask(self, table: str, column: str) -> Optional[np.ndarray]:
+        """Máscara de nulos de colunas inteiras/texto (floats usam NaN, datas NaT, bool -1)"""
+        path = self.store_dir / table / f"{column}.nulls.npy"
+        return np.load(path, mmap_mode="r") if path.exists() else None
+
+    def load_table(self, table: str, columns: Optional[List[str]] = None,
+                   mmap_mode: Optional[str] = "r") -> Dict[str, Any]:
+        manifest = self.manifest(table)
+        if manifest is None:
+            raise KeyError(f"Tabela '{table}' não extraída")
+        names = columns or [c["name"] for c in manifest["columns"]]
+        return {name: self.load_column(table, name, mmap_mode) for name in names}
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    from sql_dump_parser import generate_synthetic_dump
+
+    parser = argparse.ArgumentParser(description="Extrai os blocos COPY do dump para o armazenamento colunar")
+    parser.add_argument("dump", nargs="?", default=None, help="Caminho do dump (padrão: gera um sintético)")
+    parser.add_argument("--store", default=None, help="Diretório de saída")
+    parser.add_argument("--synthetic-mb", type=int, default=512, help="Tamanho do dump sintético em MB")
+    parser.add_argument("--force", action="store_true", help="Reextrai mesmo sem mudanças")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="columnar_")
+    path = args.dump
+    if path is None:
+        path = os.path.join(workdir, "backup_sintetico.sql")
+        print(f"🧪 Gerando dump sintético de {args.synthetic_mb} MB em {path}...")
+        generate_synthetic_dump(path, args.synthetic_mb)
+
+    store = ColumnarStore(args.store or os.path.join(workdir, "columnar"), path)
+    try:
+        for label, force in (("extração completa", True), ("reextração incremental", args.force)):
+            report = store.extract(force=force)
+            if "error" in report:
+                print(f"❌ {report['error']}")
+                break
+            mb = report["bytes"] / 1024 / 1024
+            rate = f" → {mb / report['elapsed_s']:.1f} MB/s, {report['rows'] / report['elapsed_s']:,.0f} linhas/s" if report["rows"] else ""
+            print(f"⏱️ {label}: {report['rows']} linhas, {mb:.1f} MB em {report['elapsed_s']}s{rate}")
+        for table in store.tables()[:1]:
+            columns = store.load_table(table)
+            first = {name: col[0] for name, col in columns.items()}
+            print(f"🔎 {table}: {len(next(iter(columns.values())))} linhas, primeira: {first}")
+    finally:
+        if args.dump is None:
+            shutil.rmtree(workdir, ignore_errors=True)
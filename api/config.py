@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+import threading
 
 class Config:
     # Ollama
@@ -10,6 +10,111 @@ class Config:
     # Database Schema JSON
     SCHEMA_JSON_PATH = "schema_descriptions.json"
     
+    # Origem do schema: auto (catálogo do banco, senão backup.sql), catalog ou backup
+    SCHEMA_SOURCE = os.getenv("SCHEMA_SOURCE", "auto")
+    
+    # Intervalo (s) entre verificações da impressão digital do catálogo (0 = só na subida)
+    SCHEMA_REFRESH_SECONDS = float(os.getenv("SCHEMA_REFRESH_SECONDS", "60"))
+    
+    # Quantidade de exemplos few-shot recuperados por pergunta
+    FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", "4"))
+    
+    # Estatísticas por coluna: auto (pg_stats, senão dump), pg_stats, dump ou off
+    COLUMN_STATS_SOURCE = os.getenv("COLUMN_STATS_SOURCE", "auto")
+    # Guarda de custo: rejeita SELECTs sem LIMIT estimados acima deste número de linhas
+    MAX_ESTIMATED_ROWS = int(os.getenv("MAX_ESTIMATED_ROWS", "1000000"))
+    
+    # Paginação por chave: tamanho máximo de página e segredo que assina os cursores
+    # (sem CURSOR_SECRET o segredo é aleatório por processo; defina-o com vários workers)
+    MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+    CURSOR_SECRET = os.getenv("CURSOR_SECRET", "")
+    
+    # Quantidade máxima de fingerprints de SQL mantidos em memória (/api/query-stats)
+    QUERY_STATS_MAX_FINGERPRINTS = int(os.getenv("QUERY_STATS_MAX_FINGERPRINTS", "500"))
+
+    # Consultor de índices (index_advisor.py): ganho mínimo de custo estimado para propor um índice e
+    # limites para propor uma view materializada (agregados sem parâmetros)
+    ADVISOR_MIN_GAIN = float(os.getenv("ADVISOR_MIN_GAIN", "0.2"))
+    MATVIEW_MIN_MS = float(os.getenv("MATVIEW_MIN_MS", "50"))
+    MATVIEW_MIN_COUNT = int(os.getenv("MATVIEW_MIN_COUNT", "2"))
+    # Views materializadas: leitura no lugar da SQL de origem, intervalo (s) do refresh por versão
+    # (0 = só manual) e validade (s) do registro lido do catálogo
+    MATVIEW_REWRITE = os.getenv("MATVIEW_REWRITE", "1") not in ("0", "false", "no")
+    MATVIEW_REFRESH_SECONDS = float(os.getenv("MATVIEW_REFRESH_SECONDS", "300"))
+    MATVIEW_REGISTRY_TTL = float(os.getenv("MATVIEW_REGISTRY_TTL", "30"))
+
+    # Respostas menores que isto (bytes) não são comprimidas
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+    
+    # Cache HTTP: max-age das respostas determinísticas e validade (s) da versão dos dados nas ETags
+    HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "30"))
+    DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "5"))
+    
+    # Streaming (SSE): linhas por evento "rows"
+    STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "200"))
+
+    # Exportação (/api/export, COPY TO STDOUT): guarda de custo própria (a resposta inteira, sem LIMIT),
+    # tamanho dos blocos enviados, blocos em espera antes de o COPY aguardar o cliente e exportações simultâneas
+    EXPORT_MAX_ESTIMATED_ROWS = int(os.getenv("EXPORT_MAX_ESTIMATED_ROWS", "10000000"))
+    EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", "65536"))
+    EXPORT_QUEUE_CHUNKS = int(os.getenv("EXPORT_QUEUE_CHUNKS", "16"))
+    EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "2"))
+    # Papel só de leitura, sem superusuário, usado pelo COPY das exportações (crie com `python export.py --create-role`)
+    EXPORT_DB_USER = os.getenv("EXPORT_DB_USER", "llm_export")
+    EXPORT_DB_PASSWORD = os.getenv("EXPORT_DB_PASSWORD", "llm_export")
+    
+    # Admissão em duas faixas (por processo): atalhos/cursores na rápida, perguntas da LLM na lenta
+    # concorrência, tamanho da fila, espera máxima na fila (s) e pedidos simultâneos por cliente
+    FAST_LANE_CONCURRENCY = int(os.getenv("FAST_LANE_CONCURRENCY", "16"))
+    FAST_LANE_QUEUE = int(os.getenv("FAST_LANE_QUEUE", "64"))
+    FAST_LANE_MAX_WAIT = float(os.getenv("FAST_LANE_MAX_WAIT", "2"))
+    FAST_LANE_PER_CLIENT = int(os.getenv("FAST_LANE_PER_CLIENT", "8"))
+    LLM_LANE_CONCURRENCY = int(os.getenv("LLM_LANE_CONCURRENCY", "2"))
+    LLM_LANE_QUEUE = int(os.getenv("LLM_LANE_QUEUE", "16"))
+    LLM_LANE_MAX_WAIT = float(os.getenv("LLM_LANE_MAX_WAIT", "30"))
+    LLM_LANE_PER_CLIENT = int(os.getenv("LLM_LANE_PER_CLIENT", "2"))
+    # Threads por worker (serve.py): as faixas só limitam algo com workers multi-thread; o padrão cabe
+    # os pedidos ativos e na fila das duas faixas
+    WORKER_THREADS = int(os.getenv("WORKER_THREADS", str(
+        FAST_LANE_CONCURRENCY + FAST_LANE_QUEUE + LLM_LANE_CONCURRENCY + LLM_LANE_QUEUE)))
+    # 🆕 Pool de conexões da engine principal: uma conexão por pedido admitido nas duas faixas (os da fila
+    # não seguram conexão), mais uma folga para as threads de fundo (views, réplicas, schema, warm-up)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(FAST_LANE_CONCURRENCY + LLM_LANE_CONCURRENCY)))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "4"))
+    
+    # Warm-up na subida (o /readyz só responde 200 depois dele)
+    # modelo carregado no Ollama com keep_alive, pool de conexões preenchido e perguntas populares repetidas
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "no")
+    WARMUP_MODEL = os.getenv("WARMUP_MODEL", "1") not in ("0", "false", "no")
+    WARMUP_MODEL_TIMEOUT = float(os.getenv("WARMUP_MODEL_TIMEOUT", "120"))
+    OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    WARMUP_POOL_SIZE = int(os.getenv("WARMUP_POOL_SIZE", "5"))
+    # Perguntas separadas por "|" (padrão: uma por atalho)
+    WARMUP_QUESTIONS = [q.strip() for q in os.getenv("WARMUP_QUESTIONS", "|".join([
+        "qual touro com filhas com maior média de produção de leite 305?",
+        "qual touro com descendentes com maior média de produção de leite?",
+        "qual touro tem filhas com maior média na primeira lactação (primeiro parto)?",
+        "Quais são as filhas do touro FSC00611?",
+        "genealogia do FSC00611",
+    ])).split("|") if q.strip()]
+    
+    # Réplicas em memória dos cubos dos atalhos (opcional): tabelas separadas por vírgula e
+    # intervalo (s) entre verificações da versão dos dados (0 = só a carga inicial)
+    REPLICA_ENABLED = os.getenv("REPLICA_ENABLED", "0") not in ("0", "false", "no")
+    REPLICA_TABLES = [t.strip() for t in os.getenv("REPLICA_TABLES", ",".join([
+        "cubo_resumo_vaca",
+        "cubo_producao_touro_filhas",
+        "cubo_producao_touro_descendentes",
+        "cubo_primeiro_parto_filhas",
+        "filhas_touro",
+        "cubo_genealogia",
+    ])).split(",") if t.strip()]
+    REPLICA_REFRESH_SECONDS = float(os.getenv("REPLICA_REFRESH_SECONDS", "60"))
+    # Maior N aceito em "top N touros por <métrica>"
+    RANKING_MAX_N = int(os.getenv("RANKING_MAX_N", "500"))
+    # Máximo de grupos devolvidos por um agregado ("média por raça", "distribuição do número de partos")
+    AGGREGATION_MAX_GROUPS = int(os.getenv("AGGREGATION_MAX_GROUPS", "100"))
+    
     # PostgreSQL Database Configuration
     DB_HOST = 'localhost'
     DB_PORT = '5432'
@@ -27,10 +132,69 @@ class Config:
         # Usa o driver pg8000 (puro Python) para evitar problemas de DLL no Windows
         return f"postgresql+pg8000://{cls.DB_USER}:{cls.DB_PASSWORD}@{cls.DB_HOST}:{cls.DB_PORT}/{cls.DB_NAME}"
 
+    @classmethod
+    def get_export_database_url(cls):
+        """🆕 URL do papel das exportações (EXPORT_DB_USER)"""
+        return (f"postgresql+pg8000://{cls.EXPORT_DB_USER}:{cls.EXPORT_DB_PASSWORD}"
+                f"@{cls.DB_HOST}:{cls.DB_PORT}/{cls.DB_NAME}")
+
 # Configuração do SQLAlchemy para PostgreSQL
-try:
-    engine = create_engine(Config.get_database_url(), echo=False)
-    print(f"✅ Configuração PostgreSQL: {Config.DB_HOST}:{Config.DB_PORT}/{Config.DB_NAME}")
-except Exception as e:
-    print(f"⚠️ Erro na configuração do banco: {e}")
-    engine = None
\ No newline at end of file
+# 🆕 Engine criada no primeiro uso (importar config não importa o SQLAlchemy nem abre conexões)
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Engine compartilhada (pool único para o executor e a carga do schema); None se falhar"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                try:
+                    from sqlalchemy import create_engine
+                    _engine = create_engine(Config.get_database_url(), echo=False,
+                                            pool_size=max(1, Config.DB_POOL_SIZE),
+                                            max_overflow=max(0, Config.DB_MAX_OVERFLOW))
+                    print(f"✅ Configuração PostgreSQL: {Config.DB_HOST}:{Config.DB_PORT}/{Config.DB_NAME}")
+                except Exception as e:
+                    print(f"⚠️ Erro na configuração do banco: {e}")
+                    return None
+    return _engine
+
+
+_export_engine = None
+
+
+def _check_export_role(dbapi_connection, connection_record):
+    """Toda conexão de exportação: recusa superusuário e abre as transações só de leitura"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("SELECT rolsuper FROM pg_roles WHERE rolname = current_user")
+    row = cursor.fetchone()
+    if row is None or row[0]:
+        raise PermissionError(f"Papel de exportação {Config.EXPORT_DB_USER!r} não pode ser superusuário")
+    cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+    dbapi_connection.commit()
+
+
+def get_export_engine():
+    """
+    🆕 Engine das exportações (COPY TO STDOUT), conectada com o papel só de leitura EXPORT_DB_USER:
+    mesmo que uma SQL escapasse da validação, esse papel não escreve nem roda COPY TO PROGRAM/arquivo
+    """
+    global _export_engine
+    if _export_engine is None:
+        with _engine_lock:
+            if _export_engine is None:
+                from sqlalchemy import create_engine, event
+                engine = create_engine(Config.get_export_database_url(), echo=False,
+                                       pool_size=max(1, Config.EXPORT_CONCURRENCY))
+                event.listen(engine, "connect", _check_export_role)
+                _export_engine = engine
+    return _export_engine
+
+
+def __getattr__(name):
+    # Compatibilidade com `from config import engine`
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module 'config' has no attribute {name!r}")
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Réplicas em memória dos cubos usados pelos atalhos (opcional: Config.REPLICA_ENABLED).
+- Cada tabela vira um conjunto de colunas NumPy (só as colunas que os atalhos e agregados leem):
+  números em float64/int64, booleanos em int8 (-1 = NULL) e textos em arrays de objetos
+  (🆕 textos iguais compartilham o mesmo objeto)
+- Índices hash (dict valor → posições) nos códigos e nomes: consultas pontuais sem ir ao Postgres
+- Rankings pré-ordenados por métrica (DESC, NULLs primeiro como no Postgres), inteiros e particionados
+  por filtro booleano (= true / false ou NULL): o top-N são as N primeiras posições do array e a
+  posição de uma linha sai por busca binária (usados pelo módulo rankings)
+- Atualização: refresh() recarrega as tabelas cuja versão (db_executor.data_versions) mudou;
+  uma thread de cada worker repete isso a cada REPLICA_REFRESH_SECONDS.
+  Os dados podem ficar defasados até esse intervalo (+ o atraso das estatísticas do Postgres)
+- Troca atômica: a réplica nova substitui a antiga inteira; leituras em andamento seguem com a velha
+- Contabilidade de memória por tabela (colunas, índices e rankings) no status e no /metrics
+- Sem réplica carregada (ou coluna não indexada) as consultas devolvem None e o atalho vai ao banco
+"""
+from __future__ import annotations
+import bisect
+import sys
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+from config import Config
+
+# Colunas carregadas, colunas com índice hash e rankings (métricas ordenadas × filtros booleanos)
+REPLICA_TABLES: Dict[str, Dict[str, Any]] = {
+    "filhas_touro": {
+        "columns": ["codigo_touro", "codigo_filha", "nome_filha"],
+        "keys": ["codigo_touro"],
+    },
+    "cubo_resumo_vaca": {
+        "columns": ["nome_vaca", "codigo_bovino", "lactacoes_encerradas", "numero_partos", "producao_vitalicia_leite",
+                    "producao_vitalicia_gordura", "producao_vitalicia_proteina", "producao_media_por_lactacao",
+                    "percentual_gordura", "percentual_proteina", "categoria_producao_vitalicia", "status_reprodutivo",
+                    "classificacao_geral", "alta_producao_vitalicia", "boa_fertilidade", "multiplas_lactacoes"],
+        "keys": ["nome_vaca", "codigo_bovino"],
+    },
+    # Só para os agregados (raça por animal e dimensões da genealogia): sem índices nem rankings
+    "cubo_genealogia": {
+        "columns": ["animal_codigo", "animal_raca", "animal_sexo", "categoria_reprodutiva", "total_filhos",
+                    "tem_pai", "tem_mae"],
+    },
+    "cubo_producao_touro_filhas": {
+        "columns": ["codigo_touro", "nome_touro", "total_filhas", "media_leite_305d", "media_producao_vitalicia",
+                    "media_gordura_305d", "media_proteina_305d", "percentual_filhas_com_producao",
+                    "tem_amostra_significativa", "tem_amostra_muito_significativa", "producao_elite",
+                    "categoria_producao_305d", "nivel_representatividade"],
+        "keys": ["codigo_touro", "nome_touro"],
+        "rankings": {
+            "metrics": ["media_leite_305d", "media_producao_vitalicia", "media_gordura_305d", "media_proteina_305d",
+                        "total_filhas", "percentual_filhas_com_producao"],
+            "filters": ["tem_amostra_significativa", "tem_amostra_muito_significativa", "producao_elite"],
+        },
+    },
+    "cubo_producao_touro_descendentes": {
+        "columns": ["codigo_touro", "nome_touro", "total_descendentes", "media_leite_305d", "media_producao_vitalicia",
+                    "media_netas_305d", "percentual_com_producao", "tem_amostra_significativa", "tem_netas",
+                    "producao_elite"],
+        "keys": ["codigo_touro", "nome_touro"],
+        "rankings": {
+            "metrics": ["media_leite_305d", "media_producao_vitalicia", "media_netas_305d", "total_descendentes",
+                        "percentual_com_producao"],
+            "filters": ["tem_amostra_significativa", "tem_netas", "producao_elite"],
+        },
+    },
+    "cubo_primeiro_parto_filhas": {
+        "columns": ["codigo_touro", "nome_touro", "total_filhas_primeiro_parto", "media_producao_primeiro_parto",
+                    "media_gordura_primeiro_parto", "media_proteina_primeiro_parto", "amostra_representativa",
+                    "alta_producao_primeiro_parto"],
+        "keys": ["codigo_touro", "nome_touro"],
+        "rankings": {
+            "metrics": ["media_producao_primeiro_parto", "media_gordura_primeiro_parto",
+                        "media_proteina_primeiro_parto", "total_filhas_primeiro_parto"],
+            "filters": ["amostra_representativa", "alta_producao_primeiro_parto"],
+        },
+    },
+}
+
+
+def _to_column(values: Sequence[Any]):
+    """(array, tipo) a partir dos valores de uma coluna como vieram do banco"""
+    sample = next((v for v in values if v is not None), None)
+    has_nulls = any(v is None for v in values)
+    if isinstance(sample, bool):
+        return np.array([-1 if v is None else int(v) for v in values], dtype=np.int8), "bool"
+    if isinstance(sample, (Decimal, float)):
+        return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64), "float"
+    if isinstance(sample, int) and not has_nulls:
+        return np.array(values, dtype=np.int64), "int"
+    # Textos repetidos (categorias, raça...) passam a compartilhar o mesmo objeto
+    shared: Dict[Any, Any] = {}
+    column = np.empty(len(values), dtype=object)
+    column[:] = [shared.setdefault(v, v) for v in values]
+    return column, "object"
+
+
+def _object_bytes(column: np.ndarray) -> int:
+    if column.dtype != object:
+        return column.nbytes
+    unique = {id(v): v for v in column if v is not None}
+    return column.nbytes + sum(sys.getsizeof(v) for v in unique.values())
+
+
+class TableReplica:
+    """Cópia colunar imutável de uma tabela com índices e rankings prontos"""
+
+    def __init__(self, table: str, spec: Dict[str, Any], names: Sequence[str], rows: Sequence[Sequence[Any]],
+                 version: str = "", load_seconds: float = 0.0):
+        started = time.perf_counter()
+        self.table = table
+        self.version = version
+        self.rows = len(rows)
+        self.columns: Dict[str, np.ndarray] = {}
+        self.kinds: Dict[str, str] = {}
+        values_by_column = list(zip(*rows)) if rows else [()] * len(names)
+        for name, values in zip(names, values_by_column):
+            self.columns[name], self.kinds[name] = _to_column(values)
+
+        # Índices hash: valor → posição (chave única) ou lista de posições na ordem de carga
+        self.indexes: Dict[str, Dict[Any, Any]] = {}
+        for key in spec.get("keys", []):
+            index: Dict[Any, Any] = {}
+            for position, value in enumerate(self.columns[key].tolist()):
+                if value is None:
+                    continue
+                current = index.get(value)
+                if current is None:
+                    index[value] = position
+                elif isinstance(current, list):
+                    current.append(position)
+                else:
+                    index[value] = [current, position]
+            self.indexes[key] = index
+
+        # Rankings por (métrica, filtro, valor do filtro): ordem DESC com NULLs primeiro (padrão do Postgres);
+        # filtro None = todas as linhas, True = filtro true, False = false ou NULL
+        self.rankings: Dict[Tuple[str, Optional[str], bool], np.ndarray] = {}
+        self.ranking_nulls: Dict[Tuple[str, Optional[str], bool], int] = {}
+        ranking = spec.get("rankings", {})
+        for metric in ranking.get("metrics", []):
+            values = self.columns[metric].astype(np.float64)
+            missing = np.isnan(values)
+            order = np.lexsort((-np.nan_to_num(values, nan=0.0), ~missing)).astype(np.int32)
+            partitions = {(metric, None, True): order}
+            for name in ranking.get("filters", []):
+                selected = self.columns[name][order] == 1
+                partitions[(metric, name, True)] = order[selected]
+                partitions[(metric, name, False)] = order[~selected]
+            for key, positions in partitions.items():
+                self.rankings[key] = positions
+                self.ranking_nulls[key] = int(missing[positions].sum())
+
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds + (time.perf_counter() - started)
+        self.nbytes = self._memory()
+
+    def _memory(self) -> Dict[str, int]:
+        columns = sum(_object_bytes(column) for column in self.columns.values())
+        indexes = sum(sys.getsizeof(index) + sum(sys.getsizeof(positions) for positions in index.values()
+                                                 if isinstance(positions, list))
+                      for index in self.indexes.values())
+        rankings = sum(order.nbytes for order in self.rankings.values())
+        return {"columns": columns, "indexes": indexes, "rankings": rankings,
+                "total": columns + indexes + rankings}
+
+    def _value(self, name: str, position: int) -> Any:
+        value = self.columns[name][position]
+        kind = self.kinds[name]
+        if kind == "float":
+            return None if np.isnan(value) else float(value)
+        if kind == "bool":
+            return None if value < 0 else bool(value)
+        if kind == "int":
+            return int(value)
+        return value
+
+    def materialize(self, positions: Sequence[int], fields: Sequence[str]) -> List[Dict[str, Any]]:
+        return [{name: self._value(name, position) for name in fields} for position in positions]
+
+    def ranking(self, metric: str, where: Optional[str] = None,
+                flag: bool = True) -> Optional[Tuple[np.ndarray, int]]:
+        """(posições ordenadas, quantidade de NULLs no início) da partição; None se não pré-calculada"""
+        key = (metric, where, flag if where else True)
+        order = self.rankings.get(key)
+        return None if order is None else (order, self.ranking_nulls[key])
+
+    def in_partition(self, position: int, where: Optional[str] = None, flag: bool = True) -> bool:
+        return where is None or (self.columns[where][position] == 1) == flag
+
+    def rank(self, metric: str, position: int, where: Optional[str] = None, flag: bool = True) -> Optional[int]:
+        """
+        Posição da linha entre as não nulas da partição, como RANK() (empates dividem a posição):
+        1 + linhas com valor maior, por busca binária no array ordenado. None se NULL ou fora da partição.
+        """
+        ranking = self.ranking(metric, where, flag)
+        values = self.columns[metric]
+        value = float(values[position])
+        if ranking is None or np.isnan(value) or not self.in_partition(position, where, flag):
+            return None
+        order, nulls = ranking
+        return bisect.bisect_left(order, -value, lo=nulls, key=lambda i: -values[i]) - nulls + 1
+
+
+class CubeReplicas:
+    """Réplicas das tabelas de Config.REPLICA_TABLES, atualizadas pela versão dos dados"""
+
+    def __init__(self, tables: Optional[Sequence[str]] = None):
+        names = Config.REPLICA_TABLES if tables is None else tables
+        self.specs = {table: REPLICA_TABLES[table] for table in names if table in REPLICA_TABLES}
+        self._replicas: Dict[str, TableReplica] = {}
+        self._refresh_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+
+    def get(self, table: str) -> Optional[TableReplica]:
+        return self._replicas.get(table)
+
+    def install(self, replica: TableReplica):
+        """Publica uma réplica (troca atômica da anterior)"""
+        self._replicas[replica.table] = replica
+
+    def load(self, table: str, version: str = "") -> TableReplica:
+        """Lê as colunas da tabela no Postgres e monta a réplica"""
+        from sqlalchemy import text
+        from config import get_engine
+        spec = self.specs[table]
+        engine = get_engine()
+        if engine is None:
+            raise RuntimeError("engine não configurada")
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            result = conn.execute(text(f"SELECT {', '.join(spec['columns'])} FROM {table}"))
+            names, rows = list(result.keys()), result.fetchall()
+        return TableReplica(table, spec, names, rows, version, time.perf_counter() - started)
+
+    def refresh(self, tables: Optional[Sequence[str]] = None, force: bool = False) -> Dict[str, str]:
+        """Recarrega as tabelas novas ou com versão diferente; devolve o que aconteceu com cada uma"""
+        from database_executor import db_executor
+        targets = [table for table in (tables or self.specs) if table in self.specs]
+        report: Dict[str, str] = {}
+        with self._refresh_lock:
+            versions = db_executor.data_versions(tuple(targets))
+            for table in targets:
+                current = self._replicas.get(table)
+                version = versions.get(table, "")
+                if current is not None and not force and current.version == version:
+                    report[table] = "inalterada"
+                    continue
+                try:
+                    replica = self.load(table, version)
+                except Exception as e:
+                    self.last_error = f"{table}: {type(e).__name__}: {e}"
+                    print(f"⚠️ Réplica {table} não carregada: {e}")
+                    report[table] = f"erro: {e}"
+                    continue
+                self.install(replica)
+                report[table] = (f"{replica.rows} linhas, {replica.nbytes['total'] / 1024 / 1024:.1f} MB "
+                                 f"em {replica.load_seconds:.2f}s")
+                print(f"🧊 Réplica {table}: {report[table]}")
+            self.refreshes += 1
+        return report
+
+    def load_all(self) -> str:
+        """Carga inicial (passo do warm-up); falha se nenhuma tabela carregar"""
+        report = self.refresh()
+        loaded = [table for table, outcome in report.items() if not outcome.startswith("erro")]
+        if self.specs and not loaded:
+            raise RuntimeError(self.last_error or "nenhuma réplica carregada")
+        status = self.status()
+        return f"{len(loaded)}/{len(self.specs)} tabelas, {status['rows']} linhas, {status['bytes'] / 1024 / 1024:.1f} MB"
+
+    def start_refresh(self, interval: Optional[float] = None):
+        """Thread que verifica a versão dos dados periodicamente (uma por processo)"""
+        interval = Config.REPLICA_REFRESH_SECONDS if interval is None else interval
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"⚠️ Atualização das réplicas falhou: {e}")
+
+        self._thread = threading.Thread(target=loop, name="cube-replicas", daemon=True)
+        self._thread.start()
+
+    def stop_refresh(self):
+        self._stop.set()
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # Consultas (None = sem réplica: o chamador vai ao banco)
+    # ------------------------------------------------------------------
+
+    def lookup(self, table: str, column: str, value: Any, fields: Sequence[str],
+               limit: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """WHERE column = value [LIMIT n] pelo índice hash"""
+        replica = self._replicas.get(table)
+        index = replica.indexes.get(column) if replica is not None else None
+        if index is None or not all(name in replica.columns for name in fields):
+            metrics.cache_event("cube_replica", False)
+            return None
+        metrics.cache_event("cube_replica", True)
+        positions = index.get(value, ())
+        if not isinstance(positions, (list, tuple)):
+            positions = (positions,)
+        return replica.materialize(positions[:limit] if limit else positions, fields)
+
+    def top(self, table: str, column: str, fields: Sequence[str], where: Optional[str] = None, flag: bool = True,
+            limit: int = 1) -> Optional[List[Dict[str, Any]]]:
+        """ORDER BY column DESC LIMIT n, em todas as linhas ou só onde `where` = true (flag) / false ou NULL"""
+        replica = self._replicas.get(table)
+        ranking = replica.ranking(column, where, flag) if replica is not None else None
+        if ranking is None or not all(name in replica.columns for name in fields):
+            metrics.cache_event("cube_replica", False)
+            return None
+        metrics.cache_event("cube_replica", True)
+        return replica.materialize(ranking[0][:limit].tolist(), fields)
+
+    def status(self) -> Dict[str, Any]:
+        replicas = dict(self._replicas)
+        now = time.time()
+        tables = {
+            table: {
+                "rows": replica.rows,
+                "version": replica.version,
+                "bytes": replica.nbytes,
+                "load_seconds": round(replica.load_seconds, 3),
+                "age_seconds": round(now - replica.loaded_at, 1),
+            }
+            for table, replica in replicas.items()
+        }
+        return {
+            "enabled": Config.REPLICA_ENABLED,
+            "tables": tables,
+            "missing": [table for table in self.specs if table not in replicas],
+            "rows": sum(replica.rows for replica in replicas.values()),
+            "bytes": sum(replica.nbytes["total"] for replica in replicas.values()),
+            "refreshes": self.refreshes,
+            "refresh_seconds": Config.REPLICA_REFRESH_SECONDS,
+            "last_error": self.last_error,
+        }
+
+
+# Instância global
+cube_replicas = CubeReplicas()
+
+
+def _memory_samples():
+    for table, replica in list(cube_replicas._replicas.items()):
+        for part in ("columns", "indexes", "rankings"):
+            yield (table, part), replica.nbytes[part]
+
+
+def _row_samples():
+    for table, replica in list(cube_replicas._replicas.items()):
+        yield (table,), replica.rows
+
+
+metrics.registry.callback("nl2sql_replica_bytes", "Memória das réplicas em memória por tabela e parte", "gauge",
+                          ["table", "part"], _memory_samples)
+metrics.registry.callback("nl2sql_replica_rows", "Linhas por réplica em memória", "gauge", ["table"],
+                          _row_samples)
+
+
+if __name__ == "__main__":
+    # Benchmark: atalhos pela réplica x Postgres
+    from database_executor import db_executor
+
+    if not db_executor.connection_status:
+        print("❌ Banco indisponível")
+        sys.exit(1)
+    print(f"🧊 Carga: {cube_replicas.load_all()}")
+    cases = [
+        ("filhas_touro (código)", lambda: cube_replicas.lookup(
+            "filhas_touro", "codigo_touro", "FSC00611", ["codigo_filha", "nome_filha"], 10),
+         "SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = 'FSC00611' LIMIT 10"),
+        ("resumo_vaca (nome)", lambda: cube_replicas.lookup(
+            "cubo_resumo_vaca", "nome_vaca", "Vaca00123", REPLICA_TABLES["cubo_resumo_vaca"]["columns"][:5], 1),
+         "SELECT nome_vaca, codigo_bovino, lactacoes_encerradas, numero_partos, producao_vitalicia_leite "
+         "FROM cubo_resumo_vaca WHERE nome_vaca = 'Vaca00123' LIMIT 1"),
+        ("top 1º parto", lambda: cube_replicas.top(
+            "cubo_primeiro_parto_filhas", "media_producao_primeiro_parto",
+            ["codigo_touro", "nome_touro", "media_producao_primeiro_parto"], where="amostra_representativa"),
+         "SELECT codigo_touro, nome_touro, media_producao_primeiro_parto FROM cubo_primeiro_parto_filhas "
+         "WHERE amostra_representativa = true ORDER BY media_producao_primeiro_parto DESC LIMIT 1"),
+    ]
+    from sqlalchemy import text
+    from config import get_engine
+    for label, replica_call, sql in cases:
+        n = 2000
+        started = time.perf_counter()
+        for _ in range(n):
+            replica_call()
+        replica_us = (time.perf_counter() - started) / n * 1e6
+        with get_engine().connect() as conn:
+            started = time.perf_counter()
+            for _ in range(50):
+                conn.execute(text(sql)).fetchall()
+            database_us = (time.perf_counter() - started) / 50 * 1e6
+        print(f"⏱️ {label:24s} réplica {replica_us:8.1f} µs   Postgres {database_us:8.1f} µs")
+    for table, info in cube_replicas.status()["tables"].items():
+        print(f"📦 {table:34s} {info['rows']:7d} linhas  {info['bytes']['total'] / 1024 / 1024:6.2f} MB  "
+              f"carga {info['load_seconds']:.2f}s")
@@ -1,19 +1,172 @@
-import pandas as pd
-from sqlalchemy import create_engine, text
-from typing import Tuple, Dict, Any, List
-from config import Config
+from sqlalchemy import text
+from typing import Tuple, Dict, Any, List, Optional
+from config import Config, get_engine, get_export_engine
+from lazy import LazySingleton
+from column_stats import column_stats
+from query_stats import query_stats
+from materialized_views import materialized_views
+import metrics
+from sql_validator import render_select, rewrite_or_equalities
+import os
+import queue
+import threading
+import time
 import traceback
 
+
+class _CopyCancelled(Exception):
+    """O consumidor do COPY desistiu (cliente desconectou)"""
+
+
+class CopyStream:
+    """
+    🆕 Saída de um COPY (SELECT ...) TO STDOUT em CSV, em blocos de bytes.
+    O driver roda o COPY numa thread e escreve aqui uma linha CSV por mensagem do protocolo; as linhas
+    viram blocos de ~chunk_bytes numa fila limitada (cliente lento = banco esperando, sem acumular em memória).
+    Fechar antes do fim aborta o COPY e descarta a conexão do pool (o protocolo ficou no meio).
+    O COPY só recebe SQL re-renderizada da árvore do sqlglot (render_select): SQL que não é um único SELECT
+    levanta ValueError aqui, antes de qualquer conexão.
+    """
+    _END = object()
+
+    def __init__(self, engine, sql_query: str, source: str = "export",
+                 chunk_bytes: Optional[int] = None, queue_chunks: Optional[int] = None):
+        ok, rendered, message = render_select(sql_query)
+        if not ok:
+            raise ValueError(f"Exportação recusada: {message}")
+        self.sql = rendered
+        self.source = source
+        self.rows = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.error: Optional[str] = None
+        self.cancelled = False
+        self._engine = engine
+        self._chunk_bytes = chunk_bytes or Config.EXPORT_CHUNK_BYTES
+        self._queue = queue.Queue(maxsize=max(1, queue_chunks or Config.EXPORT_QUEUE_CHUNKS))
+        self._stop = threading.Event()
+        self._buffer = bytearray()
+        self._lines = 0
+        self._head: List[bytes] = []
+        self._finished = False
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._produce, name="copy-export", daemon=True)
+        self._thread.start()
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    # Lado do driver (thread do COPY)
+    def write(self, data: bytes):
+        self._lines += 1
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_bytes:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+        raise _CopyCancelled()
+
+    def _produce(self):
+        copy_sql = f"COPY ({self.sql}) TO STDOUT WITH (FORMAT csv, HEADER)"
+        raw = None
+        try:
+            raw = self._engine.raw_connection()
+            cursor = raw.cursor()
+            cursor.execute(copy_sql, stream=self)
+            if self._buffer:
+                self._put(bytes(self._buffer))
+            self.rows = max(cursor.rowcount, 0)
+            raw.rollback()
+            raw.close()
+        except _CopyCancelled:
+            # COPY interrompido no meio: a conexão não volta para o pool
+            raw.invalidate()
+            return
+        except Exception as e:
+            self.error = f"Erro na execução SQL: {str(e)}"
+            print(f"❌ {self.error}")
+            if raw is not None:
+                raw.invalidate()
+        try:
+            self._put(self._END)
+        except _CopyCancelled:
+            pass
+
+    # Lado do consumidor (resposta HTTP)
+    def ready(self) -> bool:
+        """Espera o primeiro bloco (ou o fim): erros da SQL aparecem aqui, antes de a resposta começar"""
+        chunk = self._take()
+        if chunk is not None:
+            self._head.append(chunk)
+        return self.error is None
+
+    def _take(self) -> Optional[bytes]:
+        if self._finished:
+            return None
+        item = self._queue.get()
+        if item is self._END:
+            self._finish()
+            return None
+        self.bytes += len(item)
+        return item
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self._head:
+            return self._head.pop()
+        chunk = self._take()
+        if chunk is not None:
+            return chunk
+        if self.error:
+            # Resposta já começou: só resta interromper a transferência
+            raise RuntimeError(self.error)
+        raise StopIteration
+
+    def close(self):
+        """Fim da resposta: se o COPY ainda não terminou, aborta (cliente desconectou)"""
+        if self._finished:
+            return
+        self._stop.set()
+        self.cancelled = True
+        self.rows = max(self._lines - 1, 0)   # menos o cabeçalho
+        self._finish()
+        print(f"🛑 Exportação cancelada após {self.rows} registros")
+
+    def _finish(self):
+        self._finished = True
+        self.elapsed = time.perf_counter() - self._started
+        query_stats.record(self.sql, self.elapsed, self.rows, self.source, ok=self.error is None)
+        if self.error is None and not self.cancelled:
+            print(f"📦 Exportação: {self.rows} registros, {self.bytes / 1e6:.1f} MB em {self.elapsed:.2f}s "
+                  f"({self.rows_per_second:,.0f} linhas/s)")
+
+
 class DatabaseExecutor:
     def __init__(self):
         self.engine = None
         self.connection_status = False
+        self._data_versions = None
+        self._data_versions_at = 0.0
+        self._connect_attempted_at = 0.0
         self._connect()
     
     def _connect(self):
         """Estabelece conexão com PostgreSQL"""
+        self._connect_attempted_at = time.monotonic()
         try:
-            self.engine = create_engine(Config.get_database_url(), echo=False)
+            self.engine = get_engine()
+            if self.engine is None:
+                raise RuntimeError("engine não configurada")
             
             # Testa a conexão
             with self.engine.connect() as conn:
@@ -27,6 +180,12 @@ class DatabaseExecutor:
             self.connection_status = False
             self.engine = None
     
+    def ensure_connected(self, retry_after: float = 5.0) -> bool:
+        """🆕 Tenta reconectar se o banco estava fora (no máximo a cada retry_after segundos)"""
+        if not self.connection_status and time.monotonic() - self._connect_attempted_at >= retry_after:
+            self._connect()
+        return self.connection_status
+    
     def test_connection(self) -> Tuple[bool, str]:
         """Testa se a conexão está funcionando"""
         if not self.engine:
@@ -40,9 +199,12 @@ class DatabaseExecutor:
         except Exception as e:
             return False, f"Erro de conexão: {str(e)}"
     
-    def execute_query(self, sql_query: str) -> Tuple[bool, Any, str]:
+    def execute_query(self, sql_query: str, params: Optional[Dict[str, Any]] = None,
+                      source: str = "direct") -> Tuple[bool, Any, str]:
         """
         Executa query SQL e retorna resultados
+        params: valores dos parâmetros nomeados (:nome) da query, ex.: a chave da paginação
+        source: origem da SQL (shortcut, llm, direct) registrada nas estatísticas por fingerprint
         
         Returns:
             Tuple[bool, Any, str]: (sucesso, dados/erro, mensagem)
@@ -51,31 +213,27 @@ class DatabaseExecutor:
             return False, None, "Banco de dados não conectado"
         
         try:
-            # Limpa e valida SQL
-            sql_query = sql_query.strip()
-            if not sql_query.upper().startswith('SELECT'):
-                return False, None, "Apenas queries SELECT são permitidas"
-            
-            # 🆕 Validação prévia de campos
-            validation_result = self._validate_fields_in_query(sql_query)
-            if not validation_result[0]:
-                # Se a validação falhou, tenta uma versão simplificada
-                simplified_query = self._simplify_problematic_query(sql_query)
-                if simplified_query:
-                    print(f"⚠️ Query original problemática, usando versão simplificada")
-                    sql_query = simplified_query
-                else:
-                    return False, None, f"Validação de campos falhou: {validation_result[1]}"
+            sql_query, error = self._prepare_query(sql_query)
+            if sql_query is None:
+                return False, None, error
+            # 🆕 Agregado com view materializada em dia: lê a view
+            sql_query = materialized_views.rewrite(sql_query)
             
             # Executa query
             print(f"🔍 Executando: {sql_query}")
             
+            started = time.perf_counter()
             with self.engine.connect() as conn:
-                result = conn.execute(text(sql_query))
-                
-                # Converte para DataFrame para facilitar manipulação
-                columns = result.keys()
-                rows = result.fetchall()
+                try:
+                    result = conn.execute(text(sql_query), params or {})
+                    
+                    # Converte para DataFrame para facilitar manipulação
+                    columns = result.keys()
+                    rows = result.fetchall()
+                except Exception:
+                    query_stats.record(sql_query, time.perf_counter() - started, source=source, ok=False)
+                    raise
+                query_stats.record(sql_query, time.perf_counter() - started, len(rows), source)
                 
                 if not rows:
                     return True, [], "Query executada com sucesso, mas não retornou dados"
@@ -97,6 +255,128 @@ class DatabaseExecutor:
             traceback.print_exc()
             return False, None, error_msg
     
+    def _prepare_query(self, sql_query: str, max_rows: Optional[int] = None) -> Tuple[Optional[str], str]:
+        """Validações, reescritas e guarda de custo antes de executar: (SQL final, erro)
+        max_rows: limite da guarda de custo (padrão Config.MAX_ESTIMATED_ROWS)"""
+        # Limpa e valida SQL
+        sql_query = sql_query.strip()
+        if not sql_query.upper().startswith('SELECT'):
+            metrics.QUERY_GUARD.labels("not_select").inc()
+            return None, "Apenas queries SELECT são permitidas"
+        
+        # 🆕 Validação prévia de campos
+        validation_result = self._validate_fields_in_query(sql_query)
+        if not validation_result[0]:
+            # Se a validação falhou, tenta uma versão simplificada
+            simplified_query = self._simplify_problematic_query(sql_query)
+            if simplified_query:
+                print(f"⚠️ Query original problemática, usando versão simplificada")
+                metrics.QUERY_GUARD.labels("fields_simplified").inc()
+                sql_query = simplified_query
+            else:
+                metrics.QUERY_GUARD.labels("fields_rejected").inc()
+                return None, f"Validação de campos falhou: {validation_result[1]}"
+        
+        # 🆕 OR de igualdades em colunas diferentes → UNION ALL de buscas por índice (mesmas colunas na resposta)
+        rewritten, rewritten_sql = rewrite_or_equalities(sql_query)
+        if rewritten:
+            print("🔀 OR entre colunas reescrito em UNION ALL de buscas por coluna")
+            metrics.QUERY_GUARD.labels("or_rewritten").inc()
+            sql_query = rewritten_sql
+        
+        # 🆕 Guarda de custo: estimativa de linhas a partir das estatísticas das colunas
+        cost_ok, cost_msg = self._check_cost(sql_query, max_rows)
+        if not cost_ok:
+            metrics.QUERY_GUARD.labels("cost_rejected").inc()
+            return None, cost_msg
+        return sql_query, ""
+    
+    def stream_query(self, sql_query: str, params: Optional[Dict[str, Any]] = None, source: str = "direct",
+                     batch_rows: int = 500) -> Tuple[bool, Any, str]:
+        """
+        Como execute_query, mas devolve um iterador de lotes (listas de dicionários) lidos de um
+        cursor no servidor: o primeiro lote sai assim que o banco o produz.
+        Fechar o iterador (cliente desconectou) fecha o cursor e libera a conexão; o resto não é lido.
+        
+        Returns:
+            Tuple[bool, Any, str]: (sucesso, iterador de lotes/None, mensagem)
+        """
+        if not self.connection_status:
+            return False, None, "Banco de dados não conectado"
+        try:
+            sql_query, error = self._prepare_query(sql_query)
+        except Exception as e:
+            return False, None, f"Erro na execução SQL: {str(e)}"
+        if sql_query is None:
+            return False, None, error
+        return True, self._iter_batches(sql_query, params, source, max(1, batch_rows)), "Streaming iniciado"
+    
+    def _iter_batches(self, sql_query: str, params: Optional[Dict[str, Any]], source: str, batch_rows: int):
+        print(f"🔍 Executando (streaming): {sql_query}")
+        started = time.perf_counter()
+        rows, ok = 0, False
+        try:
+            with self.engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, max_row_buffer=batch_rows).execute(
+                    text(sql_query), params or {})
+                columns = list(result.keys())
+                while True:
+                    chunk = result.fetchmany(batch_rows)
+                    if not chunk:
+                        break
+                    rows += len(chunk)
+                    yield [dict(zip(columns, row)) for row in chunk]
+                ok = True
+        except GeneratorExit:
+            # Consumidor abandonou o stream: não é erro da query
+            ok = True
+            print(f"🛑 Streaming cancelado após {rows} registros")
+            raise
+        finally:
+            query_stats.record(sql_query, time.perf_counter() - started, rows, source, ok=ok)
+
+    def copy_query(self, sql_query: str, source: str = "export",
+                   max_rows: Optional[int] = None) -> Tuple[bool, Any, str]:
+        """
+        🆕 Resultado inteiro em CSV via COPY (SELECT ...) TO STDOUT, sem converter linhas no Python.
+        Mesma validação de execute_query (campos, OR → UNION, guarda de custo com max_rows, views materializadas),
+        mas sem LIMIT: o chamador decide o tamanho da resposta. Roda com o papel só de leitura das exportações.
+
+        Returns:
+            Tuple[bool, Any, str]: (sucesso, CopyStream/None, mensagem)
+        """
+        if not self.connection_status:
+            return False, None, "Banco de dados não conectado"
+        try:
+            sql_query, error = self._prepare_query(sql_query, max_rows=max_rows)
+        except Exception as e:
+            return False, None, f"Erro na execução SQL: {str(e)}"
+        if sql_query is None:
+            return False, None, error
+        sql_query = materialized_views.rewrite(sql_query)
+
+        try:
+            stream = CopyStream(get_export_engine(), sql_query, source)
+        except ValueError as e:
+            return False, None, str(e)
+        print(f"📦 Exportando (COPY): {stream.sql}")
+        if not stream.ready():
+            return False, None, stream.error
+        return True, stream, "Exportação iniciada"
+
+    def _check_cost(self, sql_query: str, max_rows: Optional[int] = None) -> Tuple[bool, str]:
+        """🆕 Rejeita SELECTs sem LIMIT cuja estimativa de linhas passa de max_rows (Config.MAX_ESTIMATED_ROWS)"""
+        max_rows = Config.MAX_ESTIMATED_ROWS if max_rows is None else max_rows
+        estimate = column_stats.estimate_rows(sql_query)
+        if estimate is None:
+            return True, "Sem estimativa"
+        
+        print(f"📐 Estimativa: ~{estimate['rows']} linhas retornadas, {estimate['scanned']} lidas ({', '.join(estimate['tables'])})")
+        if not estimate["limited"] and estimate["rows"] > max_rows:
+            return False, (f"Query muito custosa: ~{estimate['rows']} linhas estimadas "
+                           f"(máximo {max_rows}). Adicione filtros ou LIMIT")
+        return True, "Custo OK"
+    
     def _validate_fields_in_query(self, sql_query: str) -> Tuple[bool, str]:
         """🆕 Valida se os campos existem nas tabelas referenciadas"""
         try:
@@ -107,8 +387,8 @@ class DatabaseExecutor:
             table_matches = re.findall(table_pattern, sql_query, re.IGNORECASE)
             tables = [t[0] or t[1] for t in table_matches]
             
-            # Extrai campos com alias (c1.campo, c2.campo)
-            field_pattern = r'(\w+)\.(\w+)'
+            # Extrai campos com alias (c1.campo, c2.campo); 🆕 números (0.9) não são alias.campo
+            field_pattern = r'\b([A-Za-z_]\w*)\.(\w+)'
             field_matches = re.findall(field_pattern, sql_query)
             
             for alias, field_name in field_matches:
@@ -210,6 +490,42 @@ class DatabaseExecutor:
         except:
             return None
     
+    def data_versions(self, tables: Tuple[str, ...] = ()) -> Dict[str, str]:
+        """
+        🆕 Versão dos dados por tabela (ETags das respostas): relfilenode (muda com TRUNCATE/reload)
+        + contadores de escrita do pg_stat_user_tables (publicados pelo Postgres com até ~10 s de atraso).
+        Cache de DATA_VERSION_TTL segundos.
+        Sem banco, a versão é a do backup.sql (tamanho + mtime).
+        """
+        now = time.monotonic()
+        expired = self._data_versions is None or now - self._data_versions_at > Config.DATA_VERSION_TTL
+        metrics.cache_event("data_versions", not expired)
+        if expired:
+            versions: Dict[str, str] = {}
+            try:
+                if not self.connection_status:
+                    raise RuntimeError("banco não conectado")
+                with self.engine.connect() as conn:
+                    rows = conn.execute(text("""
+                        SELECT c.relname, c.relfilenode,
+                               COALESCE(s.n_tup_ins, 0) + COALESCE(s.n_tup_upd, 0) + COALESCE(s.n_tup_del, 0)
+                        FROM pg_class c
+                        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'm', 'p')
+                    """)).fetchall()
+                versions = {name: f"{filenode}:{writes}" for name, filenode, writes in rows}
+            except Exception:
+                try:
+                    stat = os.stat("database/backup.sql")
+                    versions = {"*": f"{stat.st_size}:{stat.st_mtime_ns}"}
+                except OSError:
+                    versions = {}
+            self._data_versions, self._data_versions_at = versions, now
+        if not tables:
+            return dict(self._data_versions)
+        fallback = self._data_versions.get("*", "")
+        return {table: self._data_versions.get(table, fallback) for table in tables}
+    
     def get_table_info(self, table_name: str = "cubo_genealogia") -> Dict[str, Any]:
         """Obtém informações sobre uma tabela específica"""
         if not self.connection_status:
@@ -259,4 +575,4 @@ class DatabaseExecutor:
         return self.execute_query(sample_query)
 
 # Instância global
-db_executor = DatabaseExecutor()
\ No newline at end of file
+db_executor = LazySingleton("db_executor", DatabaseExecutor)
\ No newline at end of file
@@ -1,25 +1,255 @@
+import json
+import os
 import re
+import time
 from pathlib import Path
-from typing import Dict, List, Set, Optional
+from typing import Any, Dict, List, Set, Optional
 from backup_analyzer import BackupAnalyzer
+from schema_snapshot import SchemaSnapshotCache
+from text_normalizer import normalize_terms
+from column_stats import stats_from_dump, stats_from_pg_stats
+
+# Impressão digital barata do catálogo: muda com qualquer DDL em relações (inclusive RENAME e a
+# definição das views), colunas ou índices
+_CATALOG_FINGERPRINT_SQL = """
+SELECT md5(coalesce(string_agg(
+           c.oid::text || ':' || c.relname || ':' || c.relkind::text || ':' || c.relnatts || ':' || a.attname
+           || ':' || a.atttypid::text || ':' || a.atttypmod || ':' || a.attnotnull, ',' ORDER BY c.oid, a.attnum), '')
+       || (SELECT coalesce(string_agg(ix.indexrelid::text || ':' || ix.indrelid, ',' ORDER BY ix.indexrelid), '')
+           FROM pg_index ix JOIN pg_class t ON t.oid = ix.indrelid
+           WHERE t.relnamespace = 'public'::regnamespace)
+       -- CREATE OR REPLACE VIEW mantém oid e colunas: entra a definição
+       || (SELECT coalesce(string_agg(v.oid::text || ':' || pg_get_viewdef(v.oid), ',' ORDER BY v.oid), '')
+           FROM pg_class v
+           WHERE v.relnamespace = 'public'::regnamespace AND v.relkind IN ('v', 'm')))
+FROM pg_class c
+JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+"""
+
+# Relações (tabelas, views, views materializadas) com estimativa de linhas e definição das views
+_CATALOG_RELATIONS_SQL = """
+SELECT c.relname, c.relkind, c.reltuples::bigint,
+       CASE WHEN c.relkind IN ('v', 'm') THEN pg_get_viewdef(c.oid, true) END,
+       obj_description(c.oid, 'pg_class')
+FROM pg_class c
+WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+ORDER BY c.relname
+"""
+
+# Colunas de todas as relações de uma vez
+_CATALOG_COLUMNS_SQL = """
+SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod), NOT a.attnotnull,
+       pg_get_expr(d.adbin, d.adrelid), col_description(c.oid, a.attnum)
+FROM pg_class c
+JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+ORDER BY c.relname, a.attnum
+"""
+
+# Índices e constraints
+_CATALOG_INDEXES_SQL = """
+SELECT t.relname, i.relname, ix.indisunique, am.amname, pg_get_indexdef(ix.indexrelid),
+       ARRAY(SELECT pg_get_indexdef(ix.indexrelid, k, true) FROM generate_series(1, ix.indnkeyatts) k)
+FROM pg_index ix
+JOIN pg_class i ON i.oid = ix.indexrelid
+JOIN pg_class t ON t.oid = ix.indrelid
+JOIN pg_am am ON am.oid = i.relam
+WHERE t.relnamespace = 'public'::regnamespace
+ORDER BY t.relname, i.relname
+"""
+_CATALOG_CONSTRAINTS_SQL = """
+SELECT t.relname, pg_get_constraintdef(k.oid, true)
+FROM pg_constraint k
+JOIN pg_class t ON t.oid = k.conrelid
+WHERE t.relnamespace = 'public'::regnamespace
+ORDER BY t.relname, k.conname
+"""
 
 class DatabaseSchemaLoader:
-    """Carrega schema automaticamente do backup.sql"""
+    """Carrega schema automaticamente do catálogo do banco ou do backup.sql"""
     
-    def __init__(self, backup_path: str = "database/backup.sql"):
+    def __init__(self, backup_path: str = "database/backup.sql", catalog_cache_path: str = "database/catalog_schema.json"):
         self.backup_path = Path(backup_path)
         self.analyzer = BackupAnalyzer(str(backup_path))
+        self.snapshot = SchemaSnapshotCache(str(backup_path))
+        self.catalog_cache_path = Path(catalog_cache_path)
         self.schema_info = None
-        
-    def load_schema(self) -> bool:
-        """Carrega e analisa o schema do backup"""
+        self.source = None  # "catalog" ou "backup"
+        self._engine = None
+    
+    def load_catalog(self, engine) -> bool:
+        """Carrega o schema do pg_catalog (poucas queries em lote), usando o cache se o catálogo não mudou"""
+        if engine is None:
+            return False
         try:
-            self.schema_info = self.analyzer.analyze_structure()
+            started = time.perf_counter()
+            with engine.connect() as conn:
+                fingerprint = self._catalog_fingerprint(conn)
+                schema = self._load_catalog_cache(fingerprint)
+                if schema is None:
+                    schema = self._introspect_catalog(conn)
+                    schema["catalog_fingerprint"] = fingerprint
+                    self._save_catalog_cache(schema)
             
-            if "error" in self.schema_info:
-                print(f"❌ Erro ao carregar schema: {self.schema_info['error']}")
+            if not schema["tables"] and not schema["views"]:
+                print("⚠️ Catálogo sem tabelas no schema public")
                 return False
             
+            self.schema_info = schema
+            self.source = "catalog"
+            self._engine = engine
+            print(f"✅ Schema carregado do catálogo em {(time.perf_counter() - started) * 1000:.1f} ms:")
+            print(f"   📊 {schema['tables_count']} tabelas")
+            print(f"   👁️ {schema['views_count']} views")
+            return True
+            
+        except Exception as e:
+            print(f"⚠️ Catálogo do banco indisponível: {e}")
+            return False
+    
+    def refresh(self) -> bool:
+        """Recarrega o catálogo só se a impressão digital mudou (uma query barata quando não mudou)"""
+        if self.source != "catalog" or self._engine is None:
+            return False
+        try:
+            with self._engine.connect() as conn:
+                fingerprint = self._catalog_fingerprint(conn)
+                if fingerprint == self.schema_info.get("catalog_fingerprint"):
+                    return False
+                print("♻️ Catálogo do banco mudou - recarregando schema")
+                schema = self._introspect_catalog(conn)
+            schema["catalog_fingerprint"] = fingerprint
+            schema["descriptions"] = self._merge_comments(schema, self.schema_info.get("dict_descriptions", {}))
+            schema["dict_descriptions"] = self.schema_info.get("dict_descriptions", {})
+            self._save_catalog_cache(schema)
+            self.schema_info = schema
+            return True
+        except Exception as e:
+            print(f"⚠️ Falha ao atualizar o catálogo: {e}")
+            return False
+    
+    def _catalog_fingerprint(self, conn) -> str:
+        from sqlalchemy import text
+        return conn.execute(text(_CATALOG_FINGERPRINT_SQL)).scalar() or ""
+    
+    def _introspect_catalog(self, conn) -> Dict[str, Any]:
+        """Monta o schema no mesmo formato do BackupAnalyzer a partir do pg_catalog"""
+        from sqlalchemy import text
+        
+        relations = conn.execute(text(_CATALOG_RELATIONS_SQL)).fetchall()
+        columns_rows = conn.execute(text(_CATALOG_COLUMNS_SQL)).fetchall()
+        index_rows = conn.execute(text(_CATALOG_INDEXES_SQL)).fetchall()
+        constraint_rows = conn.execute(text(_CATALOG_CONSTRAINTS_SQL)).fetchall()
+        
+        tables = sorted(r[0] for r in relations if r[1] in ("r", "p", "f"))
+        views = sorted(r[0] for r in relations if r[1] in ("v", "m"))
+        columns: Dict[str, List[Dict[str, Any]]] = {r[0]: [] for r in relations}
+        comments: Dict[str, Dict[str, Any]] = {}
+        for table, column, col_type, nullable, default, comment in columns_rows:
+            columns[table].append({"name": column, "type": col_type, "nullable": nullable,
+                                   "default": default, "constraints": []})
+            if comment:
+                comments.setdefault(table, {"table": "", "columns": {}})["columns"][column] = comment
+        for name, _, _, _, comment in relations:
+            if comment:
+                comments.setdefault(name, {"table": "", "columns": {}})["table"] = comment
+        
+        constraints: Dict[str, List[str]] = {table: [] for table in tables}
+        for table, definition in constraint_rows:
+            constraints.setdefault(table, []).append(definition)
+        
+        return {
+            "source": "catalog",
+            "tables_count": len(tables),
+            "views_count": len(views),
+            "tables": tables,
+            "views": views,
+            "materialized_views": sorted(r[0] for r in relations if r[1] == "m"),
+            "tables_with_columns": {
+                table: [f"{c['name']} ({c['type']})" for c in columns[table]] for table in tables
+            },
+            "columns": {table: columns[table] for table in tables},
+            "view_columns": {view: columns[view] for view in views},
+            "constraints": constraints,
+            "view_definitions": {r[0]: r[3] for r in relations if r[1] in ("v", "m")},
+            "indexes": {
+                name: {"table": table, "unique": unique, "method": method, "columns": list(keys), "definition": definition}
+                for table, name, unique, method, definition, keys in index_rows
+            },
+            "row_estimates": {r[0]: max(int(r[2] or 0), 0) for r in relations if r[1] in ("r", "p", "m")},
+            "comments": comments,
+            "copy_blocks": {},
+        }
+    
+    def _load_catalog_cache(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        if not self.catalog_cache_path.exists():
+            return None
+        try:
+            with open(self.catalog_cache_path, "r", encoding="utf-8") as f:
+                schema = json.load(f)
+            if schema.get("catalog_fingerprint") != fingerprint:
+                return None
+            print("⚡ Schema do catálogo carregado do cache")
+            return schema
+        except Exception:
+            return None
+    
+    def _save_catalog_cache(self, schema: Dict[str, Any]) -> None:
+        try:
+            self.catalog_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Um temporário por processo: vários workers podem atualizar o cache ao mesmo tempo
+            tmp_path = self.catalog_cache_path.with_name(f"{self.catalog_cache_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(schema, f, ensure_ascii=False)
+            os.replace(tmp_path, self.catalog_cache_path)
+        except Exception as e:
+            print(f"⚠️ Não foi possível salvar o cache do catálogo: {e}")
+    
+    def merge_descriptions(self, dicts_data: Dict[str, Dict]) -> None:
+        """Junta as descrições dos dicionários (prioridade) aos comentários do catálogo"""
+        if not self.schema_info:
+            return
+        dict_descriptions: Dict[str, Dict[str, Any]] = {}
+        for table, dict_data in dicts_data.items():
+            fields = dict(dict_data.get("campos") or {})
+            for group in (dict_data.get("campos_principais") or {}).values():
+                if isinstance(group, dict):
+                    fields.update(group)
+            dict_descriptions[table] = {
+                "table": dict_data.get("descricao", ""),
+                "columns": {name: info.get("descricao", "") for name, info in fields.items()
+                            if isinstance(info, dict) and info.get("descricao")},
+            }
+        self.schema_info["dict_descriptions"] = dict_descriptions
+        self.schema_info["descriptions"] = self._merge_comments(self.schema_info, dict_descriptions)
+    
+    def _merge_comments(self, schema: Dict[str, Any], dict_descriptions: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        merged: Dict[str, Dict[str, Any]] = {}
+        for table in schema.get("tables", []) + schema.get("views", []):
+            comment = schema.get("comments", {}).get(table, {"table": "", "columns": {}})
+            described = dict_descriptions.get(table, {"table": "", "columns": {}})
+            merged[table] = {
+                "table": described["table"] or comment["table"],
+                "columns": {**comment["columns"], **described["columns"]},
+            }
+        return merged
+        
+    def load_schema(self) -> bool:
+        """Carrega o schema do snapshot ou, se o dump mudou, reanalisa o backup"""
+        try:
+            self.schema_info = self.snapshot.load()
+            if self.schema_info is None:
+                self.schema_info = self.analyzer.analyze_structure()
+                
+                if "error" in self.schema_info:
+                    print(f"❌ Erro ao carregar schema: {self.schema_info['error']}")
+                    return False
+                
+                self.snapshot.save(self.schema_info)
+            
+            self.source = "backup"
             print(f"✅ Schema carregado do backup:")
             print(f"   📊 {self.schema_info['tables_count']} tabelas")
             print(f"   👁️ {self.schema_info['views_count']} views")
@@ -30,6 +260,33 @@ class DatabaseSchemaLoader:
             print(f"❌ Erro ao carregar schema: {e}")
             return False
     
+    def load_column_stats(self, engine=None, source: str = "auto") -> Optional[Dict]:
+        """Estatísticas por coluna: do snapshot, do pg_stats ou de uma passada pelos blocos COPY"""
+        if source == "off":
+            return None
+        if self.source == "backup" and self.schema_info.get("column_stats"):
+            return self.schema_info["column_stats"]
+        
+        stats = None
+        if engine is not None and source in ("auto", "pg_stats"):
+            try:
+                stats = stats_from_pg_stats(engine)
+            except Exception as e:
+                print(f"⚠️ pg_stats indisponível: {e}")
+        if not (stats and stats["tables"]) and source in ("auto", "dump") and self.source == "backup" and self.backup_path.exists():
+            try:
+                stats = stats_from_dump(str(self.backup_path), self.schema_info)
+            except Exception as e:
+                print(f"⚠️ Estatísticas do dump indisponíveis: {e}")
+        if not (stats and stats["tables"]):
+            return None
+        
+        # Persiste junto com o snapshot do schema (quando o schema veio do dump)
+        if self.schema_info and self.source == "backup":
+            self.schema_info["column_stats"] = stats
+            self.snapshot.save(self.schema_info)
+        return stats
+    
     def get_all_tables(self) -> List[str]:
         """Retorna lista de todas as tabelas"""
         if not self.schema_info:
@@ -55,12 +312,17 @@ class DatabaseSchemaLoader:
         if not self.schema_info:
             return "❌ Schema não carregado"
         
-        description = "ESQUEMA DO BANCO DE DADOS (DO BACKUP.SQL):\n\n"
+        origin = "DO CATÁLOGO" if self.source == "catalog" else "DO BACKUP.SQL"
+        description = f"ESQUEMA DO BANCO DE DADOS ({origin}):\n\n"
+        descriptions = self.schema_info.get("descriptions", {})
         
         # Tabelas principais
         description += "📊 TABELAS PRINCIPAIS:\n"
         for table in self.get_all_tables()[:10]:  # Primeiras 10
             description += f"   - {table}"
+            table_desc = descriptions.get(table, {}).get("table")
+            if table_desc:
+                description += f" — {table_desc}"
             
             columns = self.get_table_columns(table)
             if columns:
@@ -86,7 +348,11 @@ class DatabaseSchemaLoader:
         # Estatísticas
         description += f"\n📈 ESTATÍSTICAS:\n"
         description += f"   Total de objetos: {self.schema_info['tables_count'] + self.schema_info['views_count']}\n"
-        description += f"   Tamanho do backup: {self.schema_info['file_size_mb']} MB\n"
+        if "file_size_mb" in self.schema_info:
+            description += f"   Tamanho do backup: {self.schema_info['file_size_mb']} MB\n"
+        row_estimates = self.schema_info.get("row_estimates", {})
+        if row_estimates:
+            description += f"   Linhas (estimativa do catálogo): {sum(row_estimates.values())}\n"
         
         return description
     
@@ -97,7 +363,7 @@ class DatabaseSchemaLoader:
         # Mapeia nomes de tabelas
         for table in self.get_all_tables():
             # Palavras do nome da tabela
-            words = re.findall(r'\w+', table.lower())
+            words = normalize_terms(table)
             for word in words:
                 if len(word) >= 3:  # Palavras com 3+ caracteres
                     if word not in keyword_mappings:
@@ -111,7 +377,7 @@ class DatabaseSchemaLoader:
         
         # Mapeia nomes de views
         for view in self.get_all_views():
-            words = re.findall(r'\w+', view.lower())
+            words = normalize_terms(view)
             for word in words:
                 if len(word) >= 3:
                     if word not in keyword_mappings:
@@ -128,7 +394,7 @@ class DatabaseSchemaLoader:
             for column in columns:
                 # Extrai nome da coluna (remove tipo)
                 col_name = column.split(' ')[0] if ' ' in column else column
-                words = re.findall(r'\w+', col_name.lower())
+                words = normalize_terms(col_name)
                 
                 for word in words:
                     if len(word) >= 3:
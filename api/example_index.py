@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de exemplos few-shot (pergunta -> SQL) para o prompt do LLM.
+- Construído na carga a partir dos dicionários (dicts/) e do schema_descriptions.json
+- Fontes: queries_exemplo, exemplos_analise, exemplos_consultas_rapidas e casos_uso_comuns
+- Recupera apenas os top-k exemplos mais próximos da pergunta (TF-IDF sobre termos normalizados);
+  sem termos em comum o suficiente, completa com os exemplos curados (que antes iam sempre no prompt)
+"""
+from __future__ import annotations
+import json
+import math
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from text_normalizer import normalize_terms, normalize_text
+
+# Exemplos curados que antes ficavam fixos no prompt
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("filhas FSC00370", "SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = 'FSC00370';"),
+    ("genealogia FSC78202", "SELECT animal_codigo, animal_nome, pai_codigo, mae_codigo FROM cubo_genealogia WHERE animal_codigo = 'FSC78202';"),
+    ("resumo vaca Vaca33614", "SELECT nome_vaca, codigo_bovino, lactacoes_encerradas, numero_partos, producao_vitalicia_leite FROM cubo_resumo_vaca WHERE nome_vaca = 'Vaca33614';"),
+    ("resumo vaca FSC33614", "SELECT nome_vaca, codigo_bovino, lactacoes_encerradas, numero_partos, producao_vitalicia_leite FROM cubo_resumo_vaca WHERE codigo_bovino = 'FSC33614';"),
+    ("genealogia terceira geração FSC173798", "SELECT animal_codigo, animal_nome, pai_nome, mae_nome, avo_paterno_nome, avo_paterna_nome, avo_materno_nome, avo_materna_nome FROM cubo_genealogia WHERE animal_codigo = 'FSC173798';"),
+    ("touro com maior média de produção das filhas", "SELECT codigo_touro, nome_touro, media_leite_305d, total_filhas FROM cubo_producao_touro_filhas WHERE tem_amostra_significativa = true ORDER BY media_leite_305d DESC LIMIT 1;"),
+    ("touro com maior média de produção dos descendentes", "SELECT codigo_touro, nome_touro, media_leite_305d, total_descendentes FROM cubo_producao_touro_descendentes WHERE tem_amostra_significativa = true ORDER BY media_leite_305d DESC LIMIT 1;"),
+    ("maior média de lactação ao primeiro parto (filhas)", "SELECT codigo_touro, nome_touro, media_producao_primeiro_parto, total_filhas_primeiro_parto FROM cubo_primeiro_parto_filhas WHERE amostra_representativa = true ORDER BY media_producao_primeiro_parto DESC LIMIT 1;"),
+    ("média da produção vitalícia das filhas do Touro04078", "SELECT nome_touro, codigo_touro, media_producao_vitalicia, total_filhas FROM cubo_producao_touro_filhas WHERE nome_touro = 'Touro04078' LIMIT 1;"),
+    ("média da produção vitalícia das filhas do FSC04078", "SELECT nome_touro, codigo_touro, media_producao_vitalicia, total_filhas FROM cubo_producao_touro_filhas WHERE codigo_touro = 'FSC04078' LIMIT 1;"),
+    ("o que é a raça01?", "SELECT 'raça01' AS raca_codigo, 'Holandesa' AS raca_nome, 'Raça Holandesa' AS descricao;"),
+]
+
+
+class FewShotExample:
+    """Par pergunta/SQL (ou dica de uso, quando sql é None)"""
+
+    __slots__ = ("question", "sql", "table", "source", "hint")
+
+    def __init__(self, question: str, sql: Optional[str], table: str = "", source: str = "", hint: str = ""):
+        self.question = question
+        self.sql = sql
+        self.table = table
+        self.source = source
+        self.hint = hint
+
+    def format(self) -> str:
+        if self.sql:
+            sql = self.sql.strip()
+            if not sql.endswith(";"):
+                sql += ";"
+            return f'- "{self.question}": {sql}'
+        return f"- dica ({self.table}): {self.hint}"
+
+
+class ExampleIndex:
+    """Índice invertido TF-IDF sobre as perguntas de exemplo"""
+
+    def __init__(self, examples: Iterable[FewShotExample] = ()):
+        self.examples: List[FewShotExample] = []
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        self._norms: List[float] = []
+        self._idf: Dict[str, float] = {}
+        self._seed_ids: List[int] = []
+        self.retrievals = 0
+        self.total_retrieval_ms = 0.0
+        self.max_retrieval_ms = 0.0
+        self._build(list(examples))
+
+    @classmethod
+    def from_sources(cls, dicts_data: Dict[str, Dict], schema_json_path: Optional[Path] = None) -> "ExampleIndex":
+        """Reúne exemplos dos dicionários, do schema JSON e os exemplos curados"""
+        examples = [FewShotExample(q, sql, source="curado") for q, sql in SEED_EXAMPLES]
+
+        for table_name, dict_data in dicts_data.items():
+            examples.extend(_examples_from_table(table_name, dict_data))
+
+        if schema_json_path and Path(schema_json_path).exists():
+            try:
+                with open(schema_json_path, "r", encoding="utf-8") as f:
+                    for table_info in json.load(f):
+                        examples.extend(_examples_from_table(table_info.get("tabela", ""), table_info))
+            except Exception as e:
+                print(f"⚠️ Exemplos do schema JSON ignorados: {e}")
+
+        index = cls(examples)
+        print(f"📚 Índice de exemplos: {len(index.examples)} exemplos, {len(index._postings)} termos")
+        return index
+
+    def _build(self, examples: List[FewShotExample]) -> None:
+        # Deduplica pelo SQL/dica (o mesmo exemplo aparece no dicionário e no JSON)
+        seen = set()
+        term_freqs: List[Dict[str, int]] = []
+        for example in examples:
+            key = (example.sql or example.hint).strip().rstrip(";").lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            freqs: Dict[str, int] = {}
+            for term in normalize_terms(f"{example.question} {example.table}"):
+                freqs[term] = freqs.get(term, 0) + 1
+            if not freqs:
+                continue
+            if example.source == "curado":
+                self._seed_ids.append(len(self.examples))
+            self.examples.append(example)
+            term_freqs.append(freqs)
+
+        total = len(self.examples)
+        doc_freq: Dict[str, int] = {}
+        for freqs in term_freqs:
+            for term in freqs:
+                doc_freq[term] = doc_freq.get(term, 0) + 1
+        self._idf = {term: math.log(1 + total / df) for term, df in doc_freq.items()}
+
+        for doc_id, freqs in enumerate(term_freqs):
+            weights = {term: (1 + math.log(tf)) * self._idf[term] for term, tf in freqs.items()}
+            self._norms.append(math.sqrt(sum(w * w for w in weights.values())) or 1.0)
+            for term, weight in weights.items():
+                self._postings.setdefault(term, []).append((doc_id, weight))
+
+    def retrieve(self, question, k: int = 4) -> List[FewShotExample]:
+        """Top-k exemplos mais próximos (cosseno TF-IDF) da pergunta normalizada, completados com os curados"""
+        start = time.perf_counter()
+        query_weights: Dict[str, float] = {}
+        for term in normalize_text(question).stems:
+            if term in self._idf:
+                query_weights[term] = query_weights.get(term, 0.0) + self._idf[term]
+
+        scores: Dict[int, float] = {}
+        for term, q_weight in query_weights.items():
+            for doc_id, d_weight in self._postings[term]:
+                scores[doc_id] = scores.get(doc_id, 0.0) + q_weight * d_weight
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1] / self._norms[item[0]], item[0]))
+        doc_ids = [doc_id for doc_id, _ in ranked[:k]]
+        # 🆕 Pergunta sem termos em comum (ou com poucos): exemplos curados na ordem original
+        for doc_id in self._seed_ids:
+            if len(doc_ids) >= k:
+                break
+            if doc_id not in scores:
+                doc_ids.append(doc_id)
+        result = [self.examples[doc_id] for doc_id in doc_ids]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.retrievals += 1
+        self.total_retrieval_ms += elapsed_ms
+        self.max_retrieval_ms = max(self.max_retrieval_ms, elapsed_ms)
+        return result
+
+    def latency_stats(self) -> Dict[str, Any]:
+        return {
+            "retrievals": self.retrievals,
+            "mean_ms": round(self.total_retrieval_ms / self.retrievals, 4) if self.retrievals else 0.0,
+            "max_ms": round(self.max_retrieval_ms, 4),
+            "examples": len(self.examples),
+        }
+
+
+def _examples_from_table(table_name: str, table_data: Dict) -> List[FewShotExample]:
+    """Extrai pares pergunta/SQL das diferentes seções de um dicionário"""
+    examples = []
+
+    for name, entry in (table_data.get("queries_exemplo") or {}).items():
+        if isinstance(entry, dict):
+            question = f"{name.replace('_', ' ')} {entry.get('descricao', '')}".strip()
+            sql = entry.get("sql")
+        else:
+            question, sql = name.replace("_", " "), entry
+        if sql:
+            examples.append(FewShotExample(question, sql, table_name, "queries_exemplo"))
+
+    for name, entry in (table_data.get("exemplos_analise") or {}).items():
+        if isinstance(entry, dict) and entry.get("query"):
+            question = f"{name.replace('_', ' ')} {entry.get('descricao', '')}".strip()
+            examples.append(FewShotExample(question, entry["query"], table_name, "exemplos_analise"))
+
+    for name, entry in (table_data.get("exemplos_consultas_rapidas") or {}).items():
+        if isinstance(entry, dict) and entry.get("query"):
+            question = entry.get("pergunta") or name.replace("_", " ")
+            examples.append(FewShotExample(question, entry["query"], table_name, "exemplos_consultas_rapidas"))
+
+    for name, hint in (table_data.get("casos_uso_comuns") or {}).items():
+        if isinstance(hint, str) and hint:
+            examples.append(FewShotExample(name.replace("_", " "), None, table_name, "casos_uso_comuns", hint))
+
+    return examples
+
+
+if __name__ == "__main__":
+    from schema_mapper import schema_mapper
+
+    questions = [
+        "quais as filhas do touro FSC00370?",
+        "genealogia até a terceira geração do animal FSC78202",
+        "touro com filhas de maior média de produção",
+        "vacas elite com alta produção vitalícia",
+        "touros precoces no primeiro parto",
+        "média de gordura e proteína das filhas",
+    ]
+    index = schema_mapper.example_index
+    for _ in range(200):
+        for q in questions:
+            index.retrieve(q)
+    for q in questions[:3]:
+        print(f"\n🎯 {q}")
+        for example in index.retrieve(q):
+            print(f"   {example.format()}")
+    print(f"\n⏱️ Latência de recuperação: {index.latency_stats()}")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Verificação com EXPLAIN da reescrita OR → UNION ALL (sql_validator.rewrite_or_equalities).
+- Cria uma genealogia sintética de milhões de linhas numa tabela TEMP cubo_genealogia
+  (pg_temp vem antes de public no search_path: a tabela real não é tocada)
+- Índices btree por coluna de código, como em produção
+- Compara EXPLAIN (ANALYZE, BUFFERS) da consulta simplificada do executor com a versão reescrita
+
+Uso: python explain_or_rewrite.py [--rows 2000000] [--code FSC00002000] [--plans]
+"""
+from __future__ import annotations
+import argparse
+import re
+import time
+
+from sqlalchemy import text
+
+from config import engine
+from sql_validator import rewrite_or_equalities
+
+# Pai = touro (código par) com ~50 crias; mãe = vaca (código ímpar) com ~3 crias; avós seguem a mesma regra
+_PEDIGREE_SQL = """
+CREATE TEMP TABLE cubo_genealogia AS
+SELECT
+    'FSC' || lpad(g::text, 8, '0') AS animal_codigo,
+    'Animal' || g AS animal_nome,
+    CASE WHEN mod(g, 2) = 0 THEN 'M' ELSE 'F' END AS animal_sexo,
+    'FSC' || lpad((g / 50 * 2)::text, 8, '0') AS pai_codigo,
+    'Animal' || (g / 50 * 2) AS pai_nome,
+    'FSC' || lpad((g / 3 * 2 + 1)::text, 8, '0') AS mae_codigo,
+    'Animal' || (g / 3 * 2 + 1) AS mae_nome,
+    'FSC' || lpad((g / 50 * 2 / 50 * 2)::text, 8, '0') AS avo_paterno_codigo,
+    'Animal' || (g / 50 * 2 / 50 * 2) AS avo_paterno_nome,
+    'FSC' || lpad(((g / 3 * 2 + 1) / 50 * 2)::text, 8, '0') AS avo_materno_codigo,
+    'Animal' || ((g / 3 * 2 + 1) / 50 * 2) AS avo_materno_nome
+FROM generate_series(1, :rows) AS g
+"""
+_CODE_COLUMNS = ("animal_codigo", "pai_codigo", "mae_codigo", "avo_paterno_codigo", "avo_materno_codigo")
+
+
+def _original_sql(code: str) -> str:
+    """Mesma forma da consulta gerada por DatabaseExecutor._simplify_problematic_query"""
+    from database_executor import db_executor
+    return db_executor._simplify_problematic_query(f"genealogia {code}")
+
+
+def _explain(conn, sql: str):
+    rows = conn.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + sql.rstrip().rstrip(";"))).fetchall()
+    plan = [row[0] for row in rows]
+    nodes = sorted({m.group(1).strip() for line in plan
+                    for m in [re.search(r"->\s+([A-Za-z ]+?)(?: using| on|\s+\(|$)", line)] if m})
+    elapsed = next((float(m.group(1)) for line in plan
+                    for m in [re.search(r"Execution Time: ([\d.]+) ms", line)] if m), None)
+    buffers = next((line.strip() for line in plan if "Buffers:" in line), "")
+    return plan, nodes, elapsed, buffers
+
+
+def main(rows: int, code: str, show_plans: bool):
+    original = _original_sql(code)
+    rewritten, union_sql = rewrite_or_equalities(original)
+    assert rewritten, "a consulta de genealogia deveria ser reescrita"
+
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        conn.execute(text(_PEDIGREE_SQL), {"rows": rows})
+        for column in _CODE_COLUMNS:
+            conn.execute(text(f"CREATE INDEX ON cubo_genealogia ({column})"))
+        conn.execute(text("ANALYZE cubo_genealogia"))
+        print(f"🧬 Genealogia sintética: {rows:,} linhas + {len(_CODE_COLUMNS)} índices em {time.perf_counter() - start:.1f}s")
+
+        results = {}
+        for label, sql in (("OR + CASE", original), ("UNION ALL", union_sql)):
+            _explain(conn, sql)  # aquece o cache de páginas
+            plan, nodes, elapsed, buffers = _explain(conn, sql)
+            got = conn.execute(text(sql)).fetchall()
+            # Rank do CASE original: 1 = o próprio animal, 2 = pai/mãe, 3 = avô
+            results[label] = sorted(1 if row[0] == code else 2 if code in (row[3], row[5]) else 3 for row in got)
+            print(f"\n📐 {label}: {elapsed:.2f} ms, {len(got)} linhas")
+            print(f"   nós: {', '.join(nodes)}")
+            print(f"   {buffers}")
+            if show_plans:
+                print("\n".join("   " + line for line in plan))
+
+        # Mesma distribuição de ranks (qual linha entra dentro de um mesmo rank é livre nas duas versões)
+        same = results["OR + CASE"] == results["UNION ALL"]
+        print(f"\n{'✅' if same else '⚠️'} Resultados {'idênticos' if same else 'diferentes'} nas duas versões")
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN da reescrita OR → UNION ALL na genealogia")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--code", default=None, help="código do animal (padrão: um touro com ~2.600 crias e netos)")
+    parser.add_argument("--plans", action="store_true", help="imprime os planos completos")
+    args = parser.parse_args()
+    main(args.rows, args.code or f"FSC{args.rows // 2000 * 2:08d}", args.plans)
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação em massa de respostas inteiras (/api/export): todas as filhas de um touro, o ranking completo.
+- A pergunta passa pelo mesmo roteamento e pela mesma validação da resposta JSON
+  (nl_to_sql_pipeline.export_plan → db_executor.copy_query); SQL que o validate_and_fix recusa não é exportada
+- A SQL que entra no COPY é sempre re-renderizada da árvore do sqlglot (sql_validator.render_select): o LIMIT
+  final sai da árvore (ou vira o `limit` pedido) e nenhum texto original vai direto para o comando
+- O COPY roda com o papel só de leitura e sem superusuário EXPORT_DB_USER (`python export.py --create-role`)
+- COPY (SELECT ...) TO STDOUT: o Postgres entrega o CSV pronto, que segue em blocos para a resposta HTTP
+  sem virar tuplas ou dicionários no Python
+- Parquet (opcional, com pyarrow): o CSV do COPY vira row groups à medida que chega, com os tipos
+  das colunas lidos do próprio SELECT (LIMIT 0)
+- Vazão (linhas/s) no log, nas métricas nl2sql_export_* e nas últimas exportações (/api/export/stats)
+- No máximo EXPORT_CONCURRENCY exportações por processo (cada uma segura uma conexão até terminar)
+"""
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+from admission import AdmissionRejected
+from config import Config, get_export_engine
+from sql_validator import render_select
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+    pa_csv = None
+    pq = None
+
+# formato → (mimetype, extensão do arquivo)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+_slots = threading.BoundedSemaphore(max(1, Config.EXPORT_CONCURRENCY))
+_recent: deque = deque(maxlen=20)
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def export_sql(sql: str, limit: Optional[int] = None) -> Tuple[bool, str, str]:
+    """SQL validada sem o LIMIT final (o do atalho ou o injetado pelo validador); com `limit`, esse no lugar.
+    Retorna (ok, SQL, mensagem)."""
+    ok, rendered, message = render_select(sql, limit=limit)
+    return ok, rendered + ";" if ok else rendered, message
+
+
+def column_types(sql: str) -> List[Tuple[str, int]]:
+    """(nome, OID do tipo) das colunas do SELECT, sem ler linhas (papel das exportações)"""
+    ok, rendered, message = render_select(sql, limit=0)
+    if not ok:
+        raise ValueError(f"Exportação recusada: {message}")
+    raw = get_export_engine().raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(rendered)
+        return [(column[0], column[1]) for column in cursor.description]
+    finally:
+        raw.rollback()
+        raw.close()
+
+
+def _arrow_type(oid: int):
+    """Tipo Arrow de um tipo do Postgres (numeric vira float64, como nos agregados; o resto, texto)"""
+    if oid == 16:
+        return pa.bool_()
+    if oid in (20, 21, 23):
+        return pa.int64()
+    if oid in (700, 701, 1700):
+        return pa.float64()
+    if oid == 1082:
+        return pa.date32()
+    if oid == 1114:
+        return pa.timestamp("us")
+    return pa.string()
+
+
+class _ChunkReader:
+    """Arquivo só de leitura sobre os blocos do COPY (entrada do leitor CSV do pyarrow)"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        size = len(self._buffer) if size < 0 else min(size, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._position += size
+        return data
+
+    def tell(self) -> int:
+        return self._position
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def close(self):
+        self.closed = True
+
+
+class _ChunkSink:
+    """Arquivo só de escrita que guarda o que o ParquetWriter grava até ser repassado à resposta"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+    def tell(self) -> int:
+        return self._position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def parquet_chunks(chunks: Iterable[bytes], columns: List[Tuple[str, int]]) -> Iterator[bytes]:
+    """CSV do COPY (com cabeçalho) → Parquet, um row group por bloco lido"""
+    convert = pa_csv.ConvertOptions(
+        column_types={name: _arrow_type(oid) for name, oid in columns},
+        true_values=["t"], false_values=["f"],
+        # NULL do COPY é o campo vazio sem aspas; "" entre aspas é texto vazio
+        null_values=[""], strings_can_be_null=True, quoted_strings_can_be_null=False,
+    )
+    reader = pa_csv.open_csv(
+        pa.PythonFile(_ChunkReader(chunks), mode="r"),
+        read_options=pa_csv.ReadOptions(block_size=Config.EXPORT_CHUNK_BYTES * 16, use_threads=False),
+        convert_options=convert,
+    )
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+class Export:
+    """
+    Uma exportação em andamento: iterável de bytes para a resposta HTTP.
+    close() (fim da resposta ou cliente desconectado) encerra o COPY, libera a vaga e registra a vazão.
+    """
+
+    def __init__(self, sql: str, fmt: str, stream, label: str = "",
+                 columns: Optional[List[Tuple[str, int]]] = None):
+        self.sql = sql
+        self.format = fmt
+        self.stream = stream
+        self.label = label
+        self.columns = columns
+        self.status: Optional[str] = None
+
+    @property
+    def mimetype(self) -> str:
+        return FORMATS[self.format][0]
+
+    @property
+    def filename(self) -> str:
+        return f"export-{time.strftime('%Y%m%d-%H%M%S')}.{FORMATS[self.format][1]}"
+
+    def __iter__(self) -> Iterator[bytes]:
+        chunks = parquet_chunks(self.stream, self.columns) if self.format == "parquet" else self.stream
+        try:
+            yield from chunks
+        except Exception as e:
+            print(f"❌ Exportação interrompida: {e}")
+            self.close("error")
+            raise
+        self.close()
+
+    def close(self, status: Optional[str] = None):
+        if self.status is not None:
+            return
+        stream = self.stream
+        stream.close()
+        self.status = status or ("error" if stream.error else "cancelled" if stream.cancelled else "ok")
+        _slots.release()
+        metrics.EXPORTS.labels(self.format, self.status).inc()
+        metrics.EXPORT_ROWS.labels(self.format).inc(stream.rows)
+        metrics.EXPORT_SECONDS.labels(self.format).inc(stream.elapsed)
+        _recent.append(self.summary())
+
+    def summary(self) -> Dict[str, Any]:
+        stream = self.stream
+        return {
+            "sql": self.sql,
+            "label": self.label,
+            "format": self.format,
+            "status": self.status,
+            "rows": stream.rows,
+            "bytes": stream.bytes,
+            "elapsed_ms": round(stream.elapsed * 1000, 1),
+            "rows_per_second": round(stream.rows_per_second, 1),
+        }
+
+
+def start_export(query: str, fmt: str = "csv", limit: Optional[int] = None,
+                 client_id: Optional[str] = None) -> Tuple[bool, Any, str]:
+    """
+    Roteia e valida a pergunta e inicia o COPY: (sucesso, Export/None, mensagem).
+    Erros da SQL aparecem aqui, antes de a resposta começar.
+    Levanta AdmissionRejected com todas as vagas de exportação ocupadas (ou a faixa da LLM cheia).
+    """
+    if fmt not in FORMATS:
+        return False, None, f"Formato inválido: use {', '.join(FORMATS)}"
+    if fmt == "parquet" and not parquet_available():
+        return False, None, "Exportação em Parquet requer o pyarrow instalado"
+    if not _slots.acquire(blocking=False):
+        metrics.EXPORTS.labels(fmt, "rejected").inc()
+        raise AdmissionRejected("export", f"{Config.EXPORT_CONCURRENCY} exportações em andamento", 5)
+
+    from nl_to_sql import nl_to_sql_pipeline
+    from database_executor import db_executor
+    export = None
+    try:
+        plan, sql_query, error = nl_to_sql_pipeline.export_plan(query, client_id=client_id)
+        if plan is None or error:
+            return False, None, error or "Não foi possível gerar a SQL"
+        ok, sql_query, message = export_sql(sql_query, limit)
+        if not ok:
+            return False, None, f"Exportação recusada: {message}"
+        ok, stream, message = db_executor.copy_query(sql_query, source=plan.source,
+                                                     max_rows=Config.EXPORT_MAX_ESTIMATED_ROWS)
+        if not ok:
+            metrics.EXPORTS.labels(fmt, "error").inc()
+            return False, None, message
+        try:
+            columns = column_types(stream.sql) if fmt == "parquet" else None
+        except Exception as e:
+            stream.close()
+            return False, None, f"Erro ao ler os tipos das colunas: {str(e)}"
+        export = Export(stream.sql, fmt, stream, label=plan.label or plan.source, columns=columns)
+        return True, export, message
+    finally:
+        if export is None:
+            _slots.release()
+
+
+def recent_exports() -> List[Dict[str, Any]]:
+    """Últimas exportações concluídas (mais recente primeiro)"""
+    return list(reversed(_recent))
+
+
+def create_role():
+    """Cria (ou ajusta) o papel das exportações com o usuário principal: login, sem superusuário, só leitura"""
+    from config import get_engine
+    role = '"' + Config.EXPORT_DB_USER.replace('"', '""') + '"'
+    password = "'" + Config.EXPORT_DB_PASSWORD.replace("'", "''") + "'"
+    with get_engine().begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM pg_roles WHERE rolname = %s", (Config.EXPORT_DB_USER,)).fetchone()
+        conn.exec_driver_sql(f"{'ALTER' if exists else 'CREATE'} ROLE {role} "
+                             f"LOGIN NOSUPERUSER NOCREATEDB NOCREATEROLE NOREPLICATION PASSWORD {password}")
+        # Lê todas as tabelas e views (inclusive as mv_advisor_* futuras); COPY TO PROGRAM/arquivo continua proibido
+        conn.exec_driver_sql(f"GRANT pg_read_all_data TO {role}")
+        conn.exec_driver_sql(f"ALTER ROLE {role} SET default_transaction_read_only = on")
+    print(f"✅ Papel de exportação {Config.EXPORT_DB_USER} pronto")
+
+
+if __name__ == "__main__":
+    # Benchmark: COPY em CSV x execute_query (lista de dicionários) na mesma SQL
+    import argparse
+    import sys
+    from database_executor import db_executor
+
+    parser = argparse.ArgumentParser(description="Exportação via COPY: benchmark e papel do banco")
+    parser.add_argument("--create-role", action="store_true",
+                        help="cria/ajusta o papel só de leitura EXPORT_DB_USER e sai")
+    args = parser.parse_args()
+    if not db_executor.connection_status:
+        print("❌ Banco indisponível")
+        sys.exit(1)
+    if args.create_role:
+        create_role()
+        sys.exit(0)
+    sql = "SELECT * FROM filhas_touro;"
+    for fmt in ["csv"] + (["parquet"] if parquet_available() else []):
+        started = time.perf_counter()
+        ok, stream, message = db_executor.copy_query(sql, max_rows=Config.EXPORT_MAX_ESTIMATED_ROWS)
+        if not ok:
+            print(f"❌ {message}")
+            sys.exit(1)
+        chunks = parquet_chunks(stream, column_types(stream.sql)) if fmt == "parquet" else stream
+        size = sum(len(chunk) for chunk in chunks)
+        stream.close()
+        elapsed = time.perf_counter() - started
+        print(f"⏱️ COPY → {fmt}: {stream.rows} linhas, {size / 1e6:.1f} MB em {elapsed * 1000:.0f} ms "
+              f"({stream.rows / elapsed:,.0f} linhas/s)")
+    started = time.perf_counter()
+    ok, data, _ = db_executor.execute_query(sql.rstrip(";") + f" LIMIT {10 ** 9};")
+    elapsed = time.perf_counter() - started
+    print(f"⏱️ execute_query (dicionários): {len(data)} linhas em {elapsed * 1000:.0f} ms "
+          f"({len(data) / elapsed:,.0f} linhas/s)")
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Validação HTTP (ETag / If-None-Match / Cache-Control) para respostas determinísticas.
+- ETag forte do /api/schema-info: versão do snapshot do schema (catálogo ou backup.sql)
+- ETag fraca (W/) das respostas de atalho e das páginas por cursor: (SQL normalizada, versão dos dados
+  das tabelas envolvidas); os mesmos dados, mas o corpo pode variar byte a byte (réplica em memória ou
+  banco, palavras-chave da pergunta); respostas da LLM não são determinísticas e saem com no-store
+- Com If-None-Match batendo, responde 304 sem passar pelo pipeline nem pelo banco
+- A compressão acrescenta o sufixo da codificação à ETag forte (-gzip, -br, -zstd); a comparação o ignora
+"""
+from __future__ import annotations
+import hashlib
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+from config import Config
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # pragma: no cover - sqlglot é opcional
+    sqlglot = None
+    exp = None
+
+ENCODING_SUFFIXES = ("-gzip", "-br", "-zstd")
+NO_STORE = "no-store"
+
+
+def make_etag(*parts: object) -> str:
+    """Valor opaco (sem aspas) de uma ETag forte a partir das partes que definem o conteúdo"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def etag_matches(if_none_match, etag: Optional[str]) -> bool:
+    """If-None-Match (werkzeug ETags) contém a ETag, em qualquer codificação?"""
+    if not etag or if_none_match is None:
+        return False
+    if if_none_match.star_tag:
+        return True
+    for tag in if_none_match.as_set(include_weak=True):
+        for suffix in ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)]
+                break
+        if tag == etag:
+            return True
+    return False
+
+
+def public_cache_control(max_age: Optional[int] = None) -> str:
+    max_age = Config.HTTP_CACHE_MAX_AGE if max_age is None else max_age
+    return f"public, max-age={max_age}, must-revalidate"
+
+
+def apply_validators(response, etag: Optional[str], cache_control: str, weak: bool = False):
+    """Anexa ETag (forte ou fraca) e Cache-Control a uma resposta (200 ou 304)"""
+    if etag:
+        response.set_etag(etag, weak=weak)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified(etag: str, cache_control: str, weak: bool = False):
+    from flask import current_app
+    return apply_validators(current_app.response_class(status=304), etag, cache_control, weak)
+
+
+@lru_cache(maxsize=1024)
+def tables_in(sql: str) -> Tuple[str, ...]:
+    """Tabelas referenciadas pela SQL (vazio se não der para extrair)"""
+    if sqlglot is None:
+        return ()
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except Exception:
+        return ()
+    return tuple(sorted({table.name.lower() for table in tree.find_all(exp.Table) if table.name}))
+
+
+def answer_etag(answer_key: str, data_versions: Iterable[str]) -> str:
+    """ETag (enviada como fraca) de uma resposta determinística: chave da resposta + versão dos dados das tabelas"""
+    return make_etag("answer", answer_key, *data_versions)
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+Consultor de índices e views materializadas a partir dos formatos de query observados (query_stats).
+- Carga de trabalho: fingerprints do /api/query-stats de um servidor (--url), de um arquivo com o mesmo
+  JSON (--file) ou das perguntas dos atalhos repetidas neste processo (padrão; sem LLM nem réplicas)
+- Candidatos por SELECT (inclusive subconsultas e ramos de UNION ALL): colunas de igualdade
+  (=, IN, "x = false OR x IS NULL") e depois a coluna do ORDER BY (ou de uma faixa);
+  OR entre colunas diferentes vira um índice por coluna
+- Descarta candidatos já cobertos por um índice existente (prefixo em pg_indexes) e mostra
+  seq_scan/idx_scan/linhas do pg_stat_user_tables
+- Antes/depois: custo do EXPLAIN de cada query × execuções, sem e com os candidatos; só ficam os
+  índices que o planner usou e que baixam o custo das suas queries em pelo menos ADVISOR_MIN_GAIN
+- 🆕 Os candidatos do "depois" são índices hipotéticos do hypopg quando a extensão está instalada
+  (nada é construído nem travado). Sem hypopg é preciso --what-if: os índices são construídos de verdade
+  (CREATE INDEX comum) numa transação desfeita no final; cada construção lê a tabela inteira e segura
+  um lock SHARE que bloqueia INSERT/UPDATE/DELETE na tabela até o fim da consultoria
+- Agregados sem parâmetros e caros (GROUP BY, percentis; mean_ms ≥ MATVIEW_MIN_MS e ≥ MATVIEW_MIN_COUNT
+  execuções) viram propostas de view materializada (materialized_views), com o mesmo antes/depois;
+  como o hypopg não simula views, elas só são avaliadas com --what-if (a view é criada e desfeita,
+  executando o agregado inteiro)
+- --apply cria os índices (CREATE INDEX CONCURRENTLY) e as views; --refresh-views atualiza as views (cron)
+
+Uso: python index_advisor.py [--url http://localhost:5000/api/query-stats | --file stats.json]
+                             [--what-if] [--apply] [--no-matviews] [--refresh-views] [--json]
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+
+from config import Config, get_engine
+from materialized_views import canonical, materialized_views
+
+# Perguntas repetidas quando não há carga gravada: uma por atalho (códigos e nomes variam)
+REPLAY_QUESTIONS = [
+    "Quais são as filhas do touro FSC00611?",
+    "Quais são as filhas do touro FSC00370?",
+    "genealogia do FSC00611",
+    "genealogia do FSC01234",
+    "qual a produção vitalícia da vaca Vaca00123?",
+    "qual a produção vitalícia média das filhas do touro Touro00611?",
+    "qual touro com filhas com maior média de produção de leite 305?",
+    "qual touro com descendentes com maior média de produção de leite?",
+    "top 10 touros por gordura com amostra significativa",
+    "qual a posição do touro FSC00611 no ranking de proteína",
+    "distribuição do número de partos",
+    "distribuição do número de partos",
+    "percentil 90 da produção vitalícia por classificação",
+    "percentil 90 da produção vitalícia por classificação",
+]
+_PARAM_RE = re.compile(r"(?<!:):\w+")
+_AGGREGATES = (exp.AggFunc, exp.PercentileCont)
+
+
+# ----------------------------------------------------------------------
+# Carga de trabalho
+# ----------------------------------------------------------------------
+
+def load_workload(url: Optional[str] = None, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Fingerprints (mesmo formato do /api/query-stats) de um servidor, de um arquivo ou do replay local"""
+    if url:
+        import requests
+        payload = requests.get(url, params={"limit": Config.QUERY_STATS_MAX_FINGERPRINTS}, timeout=30).json()
+    elif path:
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+    else:
+        from nl_to_sql import nl_to_sql_pipeline
+        from query_stats import query_stats
+        for question in REPLAY_QUESTIONS:
+            nl_to_sql_pipeline.natural_language_to_sql(question, client_id="index-advisor")
+        payload = {"fingerprints": query_stats.snapshot(limit=None)}
+    return payload["fingerprints"] if isinstance(payload, dict) else payload
+
+
+def _explainable(item: Dict[str, Any]) -> bool:
+    example = item.get("example") or ""
+    return example.lstrip().upper().startswith("SELECT") and not _PARAM_RE.search(example)
+
+
+# ----------------------------------------------------------------------
+# Candidatos a índice
+# ----------------------------------------------------------------------
+
+def _conjuncts(node) -> Iterable:
+    node = node.unnest() if isinstance(node, exp.Paren) else node
+    if isinstance(node, exp.And):
+        yield from _conjuncts(node.left)
+        yield from _conjuncts(node.right)
+    else:
+        yield node
+
+
+def _disjuncts(node) -> Iterable:
+    node = node.unnest() if isinstance(node, exp.Paren) else node
+    if isinstance(node, exp.Or):
+        yield from _disjuncts(node.left)
+        yield from _disjuncts(node.right)
+    else:
+        yield node
+
+
+def _filter_column(node) -> Tuple[Optional[str], str]:
+    """(coluna, tipo) de um predicado simples: eq (=, IN, IS NULL), range (<, >, BETWEEN) ou ("", "")"""
+    if isinstance(node, exp.Not):
+        return None, ""     # IS NOT NULL, NOT IN...: não restringe o bastante
+    if isinstance(node, (exp.EQ, exp.In, exp.Is)) and isinstance(node.this, exp.Column):
+        return node.this.name, "eq"
+    if isinstance(node, (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between)) and isinstance(node.this, exp.Column):
+        return node.this.name, "range"
+    return None, ""
+
+
+def index_candidates(sql: str) -> List[Tuple[str, Tuple[str, ...]]]:
+    """(tabela, colunas) de índices que serviriam aos SELECTs da SQL, na ordem de aparição"""
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except Exception:
+        return []
+    candidates: List[Tuple[str, Tuple[str, ...]]] = []
+    for select in tree.find_all(exp.Select):
+        source = select.args.get("from")
+        if source is None or not isinstance(source.this, exp.Table) or select.args.get("joins"):
+            continue
+        table = source.this.name
+        equalities: List[str] = []
+        ranges: List[str] = []
+        where = select.args.get("where")
+        for condition in (_conjuncts(where.this) if where is not None else ()):
+            terms = [_filter_column(term) for term in _disjuncts(condition)]
+            columns = {column for column, _ in terms}
+            if None in columns:
+                continue
+            if len(terms) > 1 and len(columns) > 1:
+                # OR entre colunas: cada ramo precisa do seu índice (ou da reescrita em UNION ALL)
+                candidates += [(table, (column,)) for column, kind in terms if kind == "eq"]
+                continue
+            column, kind = terms[0]
+            target = equalities if kind == "eq" and all(k == "eq" for _, k in terms) else ranges
+            if column not in equalities and column not in target:
+                target.append(column)
+        order = select.args.get("order")
+        tail = None
+        if order is not None and isinstance(order.expressions[0].this, exp.Column) \
+                and not select.args.get("group"):
+            tail = order.expressions[0].this.name
+        elif ranges:
+            tail = ranges[0]
+        columns = tuple(equalities + ([tail] if tail and tail not in equalities else []))
+        if columns and (table, columns) not in candidates:
+            candidates.append((table, columns))
+    return candidates
+
+
+def index_name(table: str, columns: Sequence[str]) -> str:
+    name = f"idx_adv_{table}_{'_'.join(columns)}"
+    if len(name) <= 63:
+        return name
+    return f"idx_adv_{table[:30]}_{hashlib.blake2b(name.encode('utf-8'), digest_size=6).hexdigest()}"
+
+
+def index_sql(table: str, columns: Sequence[str], concurrently: bool = False) -> str:
+    return (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name(table, columns)} "
+            f"ON {table} ({', '.join(columns)})")
+
+
+def _is_aggregate(sql: str) -> bool:
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except Exception:
+        return False
+    return isinstance(tree, exp.Select) and (tree.args.get("group") is not None or
+                                             any(tree.find_all(*_AGGREGATES)))
+
+
+# ----------------------------------------------------------------------
+# Catálogo e EXPLAIN
+# ----------------------------------------------------------------------
+
+_INDEX_COLUMNS_RE = re.compile(r"USING \w+ \((.*)\)")
+
+
+def existing_indexes(conn) -> Dict[str, List[Tuple[str, ...]]]:
+    """Colunas (em ordem) dos índices de cada tabela; índices de expressão ficam de fora"""
+    indexes: Dict[str, List[Tuple[str, ...]]] = {}
+    for table, definition in conn.execute(text(
+            "SELECT tablename, indexdef FROM pg_indexes WHERE schemaname = 'public'")).fetchall():
+        match = _INDEX_COLUMNS_RE.search(definition)
+        if match is None:
+            continue
+        columns = tuple(part.strip().split(" ")[0].strip('"') for part in match.group(1).split(","))
+        if all(re.fullmatch(r"\w+", column) for column in columns):
+            indexes.setdefault(table, []).append(columns)
+    return indexes
+
+
+def table_usage(conn) -> Dict[str, Dict[str, int]]:
+    rows = conn.execute(text(
+        "SELECT relname, seq_scan, seq_tup_read, COALESCE(idx_scan, 0), n_live_tup "
+        "FROM pg_stat_user_tables WHERE schemaname = 'public'")).fetchall()
+    return {name: {"seq_scan": seq, "seq_tup_read": read, "idx_scan": idx, "rows": live}
+            for name, seq, read, idx, live in rows}
+
+
+def _covered(columns: Tuple[str, ...], indexes: Sequence[Tuple[str, ...]]) -> bool:
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+def hypopg_available(conn) -> bool:
+    """Extensão hypopg instalada no banco (índices hipotéticos só para o planner)"""
+    return conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'hypopg'")).first() is not None
+
+
+def explain(conn, sql: str) -> Tuple[float, List[str]]:
+    """(custo total estimado, índices usados) do plano"""
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}")).scalar()
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    used, pending = [], [plan]
+    while pending:
+        node = pending.pop()
+        if "Index Name" in node:
+            used.append(node["Index Name"])
+        pending.extend(node.get("Plans", []))
+    return float(plan["Total Cost"]), used
+
+
+# ----------------------------------------------------------------------
+# Consultoria
+# ----------------------------------------------------------------------
+
+def advise(workload: Sequence[Dict[str, Any]], matviews: bool = True, what_if: bool = False) -> Dict[str, Any]:
+    """
+    Relatório com propostas e custo estimado da carga antes/depois (nada fica no banco).
+    Com hypopg os índices do "depois" são hipotéticos; sem ele, what_if=True autoriza construí-los
+    numa transação desfeita (lock SHARE: escritas nas tabelas ficam bloqueadas durante a consultoria).
+    Views materializadas só são avaliadas com what_if.
+    """
+    queries = [item for item in workload if _explainable(item)]
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("engine não configurada")
+    report: Dict[str, Any] = {"skipped": len(workload) - len(queries)}
+    with engine.connect() as conn:
+        hypothetical = hypopg_available(conn)
+        if not hypothetical and not what_if:
+            raise RuntimeError("hypopg não instalado: use --what-if para construir os índices candidatos numa "
+                               "transação desfeita (bloqueia escritas nas tabelas enquanto roda)")
+        report["mode"] = "hypopg" if hypothetical else "what-if"
+        report["tables"] = table_usage(conn)
+        existing = existing_indexes(conn)
+        report["existing"] = {table: [list(columns) for columns in columns_list]
+                              for table, columns_list in existing.items()}
+
+        candidates: Dict[Tuple[str, Tuple[str, ...]], List[str]] = {}
+        for item in queries:
+            for table, columns in index_candidates(item["example"]):
+                if not _covered(columns, existing.get(table, [])):
+                    candidates.setdefault((table, columns), []).append(item["fingerprint"])
+        views = [item for item in queries
+                 if matviews and what_if and item["count"] >= Config.MATVIEW_MIN_COUNT
+                 and item["mean_ms"] >= Config.MATVIEW_MIN_MS and _is_aggregate(item["example"])]
+
+        before = {}
+        for item in queries:
+            try:
+                before[item["fingerprint"]] = explain(conn, item["example"])
+            except Exception as e:
+                conn.rollback()
+                report["skipped"] += 1
+                print(f"⚠️ EXPLAIN falhou ({item['fingerprint']}): {e}")
+
+        # Cenário "depois": candidatos hipotéticos (hypopg) ou criados, e views, numa transação desfeita
+        after, created_views = {}, {}
+        names: Dict[str, str] = {}  # nome no plano → nome do índice proposto (o hypopg usa "<oid>btree_...")
+        try:
+            for table, columns in candidates:
+                if hypothetical:
+                    row = conn.execute(text("SELECT indexname FROM hypopg_create_index(:sql)"),
+                                       {"sql": index_sql(table, columns)}).first()
+                    names[row[0]] = index_name(table, columns)
+                else:
+                    conn.execute(text(index_sql(table, columns)))
+            for item in views:
+                try:
+                    with conn.begin_nested():
+                        created_views[item["fingerprint"]] = materialized_views.create(conn, item["example"])
+                except ValueError as e:
+                    print(f"⚠️ View não proposta ({item['fingerprint']}): {e}")
+            for item in queries:
+                if item["fingerprint"] not in before:
+                    continue
+                view = created_views.get(item["fingerprint"])
+                sql = view.select_sql(canonical(item["example"])[1]) if view else item["example"]
+                cost, used = explain(conn, sql)
+                after[item["fingerprint"]] = cost, [names.get(name, name) for name in used]
+        finally:
+            if hypothetical:
+                conn.execute(text("SELECT hypopg_reset()"))
+            conn.rollback()
+
+    workload_rows, used_by = [], {}
+    for item in queries:
+        if item["fingerprint"] not in after:
+            continue
+        cost_before, _ = before[item["fingerprint"]]
+        cost_after, used = after[item["fingerprint"]]
+        for name in used:
+            used_by.setdefault(name, []).append((item, cost_before, cost_after))
+        workload_rows.append({
+            "fingerprint": item["fingerprint"], "sql": item["sql"], "count": item["count"],
+            "cost_before": round(cost_before, 2), "cost_after": round(cost_after, 2), "indexes_used": used,
+            "matview": created_views[item["fingerprint"]].name if item["fingerprint"] in created_views else None,
+        })
+
+    proposals = []
+    for (table, columns), fingerprints in candidates.items():
+        uses = used_by.get(index_name(table, columns), [])
+        cost_before = sum(item["count"] * before_cost for item, before_cost, _ in uses)
+        cost_after = sum(item["count"] * after_cost for item, _, after_cost in uses)
+        gain = 1 - cost_after / cost_before if cost_before else 0.0
+        proposals.append({
+            "name": index_name(table, columns), "table": table, "columns": list(columns),
+            "sql": index_sql(table, columns, concurrently=True), "queries": sorted({item["fingerprint"] for item, _, _ in uses}),
+            "gain": round(gain, 3), "proposed": bool(uses) and gain >= Config.ADVISOR_MIN_GAIN,
+        })
+    proposals.sort(key=lambda proposal: (not proposal["proposed"], proposal["table"], proposal["name"]))
+
+    report["indexes"] = proposals
+    report["matviews"] = [{"name": view.name, "fingerprint": fingerprint, "source": view.source,
+                           "tables": view.tables}
+                          for fingerprint, view in created_views.items()]
+    report["workload"] = sorted(workload_rows, key=lambda row: row["count"] * row["cost_before"], reverse=True)
+    report["cost_before"] = round(sum(row["count"] * row["cost_before"] for row in workload_rows), 2)
+    report["cost_after"] = round(sum(row["count"] * row["cost_after"] for row in workload_rows), 2)
+    return report
+
+
+def apply(report: Dict[str, Any]) -> List[str]:
+    """Cria os índices propostos (CONCURRENTLY, sem travar escritas) e as views; ANALYZE nas tabelas"""
+    engine = get_engine()
+    done = []
+    tables = set()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for proposal in report["indexes"]:
+            if proposal["proposed"]:
+                conn.execute(text(proposal["sql"]))
+                tables.add(proposal["table"])
+                done.append(proposal["name"])
+        for view in report["matviews"]:
+            materialized_views.create(conn, view["source"])
+            done.append(view["name"])
+        for table in sorted(tables):
+            conn.execute(text(f"ANALYZE {table}"))
+    return done
+
+
+def print_report(report: Dict[str, Any]):
+    print("📊 Tabelas (pg_stat_user_tables):")
+    for table, usage in sorted(report["tables"].items()):
+        print(f"   {table:34s} {usage['rows']:8d} linhas  seq_scan {usage['seq_scan']:6d}  "
+              f"idx_scan {usage['idx_scan']:6d}  índices {report['existing'].get(table, [])}")
+    print("📐 Índices candidatos:")
+    for proposal in report["indexes"]:
+        mark = "✅" if proposal["proposed"] else "  "
+        print(f"   {mark} {proposal['sql']}  (ganho {proposal['gain']:.0%}, {len(proposal['queries'])} formatos)")
+    for view in report["matviews"]:
+        print(f"   🧊 {view['name']}: {view['source'][:100]}")
+    print("⏱️ Carga (custo estimado do EXPLAIN × execuções):")
+    for row in report["workload"]:
+        print(f"   x{row['count']:<4d} {row['cost_before']:10.2f} → {row['cost_after']:10.2f}  "
+              f"{row['sql'][:90]}")
+    gain = 1 - report["cost_after"] / report["cost_before"] if report["cost_before"] else 0.0
+    print(f"📈 Total: {report['cost_before']:.0f} → {report['cost_after']:.0f} ({gain:.0%} menor); "
+          f"{report['skipped']} formatos sem EXPLAIN (parâmetros ou não-SELECT)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consultor de índices e views materializadas")
+    parser.add_argument("--url", help="endpoint /api/query-stats de um servidor em execução")
+    parser.add_argument("--file", help="JSON salvo do /api/query-stats")
+    parser.add_argument("--what-if", action="store_true",
+                        help="sem hypopg: constrói os candidatos e as views numa transação desfeita "
+                             "(bloqueia escritas nas tabelas durante a consultoria)")
+    parser.add_argument("--apply", action="store_true", help="cria os índices propostos e as views")
+    parser.add_argument("--no-matviews", action="store_true", help="não propõe views materializadas")
+    parser.add_argument("--refresh-views", action="store_true", help="só atualiza as views (para cron)")
+    parser.add_argument("--json", action="store_true", help="relatório em JSON")
+    args = parser.parse_args()
+
+    if args.refresh_views:
+        for name, outcome in materialized_views.refresh().items():
+            print(f"🧊 {name}: {outcome}")
+        raise SystemExit(0)
+    try:
+        report = advise(load_workload(args.url, args.file), matviews=not args.no_matviews, what_if=args.what_if)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        raise SystemExit(2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    else:
+        print_report(report)
+    if args.apply:
+        print(f"🚀 Aplicado: {', '.join(apply(report)) or 'nada a criar'}")
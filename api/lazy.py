@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Singletons inicializados no primeiro uso.
+- LazySingleton(fábrica): o objeto global existe desde o import, mas a fábrica (conexão com o banco,
+  carga do schema, dicionários...) só roda no primeiro acesso a um atributo ou em initialize()
+- Thread-safe: acessos concorrentes durante a inicialização esperam a mesma construção
+- Guarda o tempo e o erro da inicialização (usados pelo /readyz)
+"""
+from __future__ import annotations
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+_UNSET = object()
+
+
+class LazySingleton:
+    __slots__ = ("_name", "_factory", "_instance", "_lock", "_seconds", "_error")
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", _UNSET)
+        object.__setattr__(self, "_lock", threading.RLock())
+        object.__setattr__(self, "_seconds", None)
+        object.__setattr__(self, "_error", None)
+
+    def initialize(self) -> Any:
+        """Constrói a instância (uma única vez) e a devolve"""
+        instance = self._instance
+        if instance is not _UNSET:
+            return instance
+        with self._lock:
+            if self._instance is _UNSET:
+                started = time.perf_counter()
+                try:
+                    instance = self._factory()
+                except Exception as e:
+                    object.__setattr__(self, "_error", f"{type(e).__name__}: {e}")
+                    raise
+                object.__setattr__(self, "_seconds", time.perf_counter() - started)
+                object.__setattr__(self, "_error", None)
+                object.__setattr__(self, "_instance", instance)
+            return self._instance
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not _UNSET
+
+    def status(self) -> Dict[str, Optional[object]]:
+        return {
+            "initialized": self.initialized,
+            "init_seconds": round(self._seconds, 3) if self._seconds is not None else None,
+            "error": self._error,
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.initialize(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self.initialize(), name, value)
+
+    def __repr__(self) -> str:
+        state = "inicializado" if self.initialized else "pendente"
+        return f"<LazySingleton {self._name} ({state})>"
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Inicialização e prontidão do processo.
+- Os singletons pesados (schema_mapper, db_executor, nl_to_sql_pipeline) são LazySingleton:
+  importar os módulos não carrega nada; start() os inicializa (em thread ou bloqueando)
+- 🆕 Warm-up (Config.WARMUP_*), depois dos componentes:
+  modelo carregado no Ollama com keep_alive (prompt vazio), pool de conexões preenchido
+  e perguntas populares repetidas (caches do validador/planos e buffers do Postgres dos cubos)
+- status() alimenta o /readyz: pronto quando os componentes estão inicializados, o warm-up
+  terminou e o banco está conectado; enquanto isso a fase é "warming" e o /readyz responde 503
+- 🆕 Réplicas em memória dos cubos (Config.REPLICA_ENABLED) carregadas antes do warm-up, com ou sem ele,
+  junto com os DataFrames dos agregados (o import do pandas fica fora da primeira pergunta)
+- 🆕 Refresh periódico das views materializadas do index_advisor (Config.MATVIEW_REFRESH_SECONDS)
+- 🆕 start(threads=False): inicialização sem nenhuma thread (processo pai antes do fork, ver serve.py);
+  as threads de atualização ficam para start_background(), chamado em cada worker após o fork
+- 🆕 start_background() também confere o catálogo a cada SCHEMA_REFRESH_SECONDS e, se ele mudou,
+  refaz os mapeamentos de palavras-chave e o índice de exemplos (schema_mapper.refresh_schema)
+- Falha em um passo do warm-up não impede a prontidão (fica registrada em "steps")
+- O /healthz (vivo) não depende de nada disso
+"""
+from __future__ import annotations
+import importlib
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import Config, get_engine
+
+# (nome do singleton, módulo) na ordem de inicialização
+COMPONENTS = (
+    ("db_executor", "database_executor"),
+    ("schema_mapper", "schema_mapper"),
+    ("nl_to_sql_pipeline", "nl_to_sql"),
+)
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {"phase": "idle", "started_at": None, "finished_at": None, "error": None, "steps": {}}
+_process_started = time.time()
+
+
+def _singleton(name: str, module_name: str):
+    return getattr(importlib.import_module(module_name), name)
+
+
+def _phase(phase: str, **fields: Any):
+    with _lock:
+        _state["phase"] = phase
+        _state.update(fields)
+
+
+def _step(name: str, action: Callable[[], str]) -> bool:
+    """Executa um passo do warm-up registrando duração e resultado"""
+    started = time.perf_counter()
+    try:
+        detail, ok = action(), True
+    except Exception as e:
+        detail, ok = f"{type(e).__name__}: {e}", False
+    seconds = time.perf_counter() - started
+    with _lock:
+        _state["steps"][name] = {"ok": ok, "seconds": round(seconds, 3), "detail": detail}
+    print(f"{'🔥' if ok else '⚠️'} Warm-up {name} em {seconds:.2f}s: {detail}")
+    return ok
+
+
+def warm_model() -> str:
+    """Carrega o modelo no Ollama: prompt vazio + keep_alive (nenhum token é gerado)"""
+    import requests
+    response = requests.post(Config.OLLAMA_URL, json={
+        "model": Config.MODEL_NAME,
+        "prompt": "",
+        "stream": False,
+        "keep_alive": Config.OLLAMA_KEEP_ALIVE,
+    }, timeout=Config.WARMUP_MODEL_TIMEOUT)
+    response.raise_for_status()
+    return f"{Config.MODEL_NAME} carregado (keep_alive={Config.OLLAMA_KEEP_ALIVE})"
+
+
+def fill_pool(size: Optional[int] = None) -> str:
+    """Abre `size` conexões ao mesmo tempo e as devolve ao pool (ficam abertas para as próximas requisições)"""
+    from sqlalchemy import text
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("engine não configurada")
+    size = Config.WARMUP_POOL_SIZE if size is None else size
+    if hasattr(engine.pool, "size"):
+        size = min(size, engine.pool.size())
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+    return f"{len(connections)} conexões no pool"
+
+
+def replay_questions() -> str:
+    """Repete as perguntas populares pelo pipeline completo (cliente "warm-up" na admissão)"""
+    from nl_to_sql import nl_to_sql_pipeline
+    answered = 0
+    for question in Config.WARMUP_QUESTIONS:
+        success, _, _ = nl_to_sql_pipeline.natural_language_to_sql(question, client_id="warm-up")
+        answered += 1 if success else 0
+    if Config.WARMUP_QUESTIONS and not answered:
+        raise RuntimeError(f"nenhuma das {len(Config.WARMUP_QUESTIONS)} perguntas respondeu")
+    return f"{answered}/{len(Config.WARMUP_QUESTIONS)} perguntas respondidas"
+
+
+def start_background(refresh_views: bool = True):
+    """
+    Threads de atualização do processo: schema do catálogo e réplicas dos cubos (cada processo tem a
+    sua cópia) e, se refresh_views, o REFRESH das views materializadas (basta um processo)
+    """
+    database_ok = _singleton("db_executor", "database_executor").connection_status
+    if not database_ok:
+        return
+    _singleton("schema_mapper", "schema_mapper").start_refresh()
+    if Config.REPLICA_ENABLED:
+        from cube_replica import cube_replicas
+        cube_replicas.start_refresh()
+    if refresh_views:
+        from materialized_views import materialized_views
+        materialized_views.start_refresh()
+
+
+def warm_up(threads: bool = True):
+    """
+    Inicializa os componentes em ordem e aquece modelo, pool e caches; erros ficam no estado.
+    threads=False: nada roda em thread (o modelo é aquecido em sequência) e start_background fica para o chamador
+    """
+    _phase("warming", started_at=time.time(), finished_at=None, error=None, steps={})
+    started = time.perf_counter()
+    try:
+        for name, module_name in COMPONENTS:
+            _singleton(name, module_name).initialize()
+    except Exception as e:
+        print(f"❌ Falha na inicialização: {e}")
+        _phase("failed", finished_at=time.time(), error=f"{type(e).__name__}: {e}")
+        return
+    
+    database_ok = _singleton("db_executor", "database_executor").connection_status
+    if Config.REPLICA_ENABLED and database_ok:
+        from cube_replica import cube_replicas
+        if _step("replicas", cube_replicas.load_all):
+            from aggregations import build_frames
+            _step("aggregations", build_frames)
+    if threads:
+        start_background()
+    
+    if Config.WARMUP_ENABLED:
+        if Config.WARMUP_MODEL and not threads:
+            _step("model", warm_model)
+            model = None
+        elif Config.WARMUP_MODEL:
+            # Em paralelo: carregar o modelo leva segundos e não depende do banco
+            model = threading.Thread(target=_step, args=("model", warm_model), daemon=True)
+            model.start()
+        else:
+            model = None
+        if database_ok:
+            _step("pool", fill_pool)
+            _step("questions", replay_questions)
+        if model is not None:
+            model.join()
+    print(f"🚀 Inicialização concluída em {time.perf_counter() - started:.2f}s")
+    _phase("done", finished_at=time.time())
+
+
+def start(background: bool = True, threads: bool = True):
+    """Dispara a inicialização (uma vez por processo); threads=False implica bloquear até o fim"""
+    with _lock:
+        if _state["phase"] != "idle":
+            return
+        _state["phase"] = "warming"
+    if background and threads:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        warm_up(threads=threads)
+
+
+def status() -> Dict[str, Any]:
+    """Estado para /readyz; ready=False enquanto aquece, se algo falhou ou sem banco"""
+    with _lock:
+        state = dict(_state, steps=dict(_state["steps"]))
+    components = {}
+    for name, module_name in COMPONENTS:
+        components[name] = _singleton(name, module_name).status()
+    database_ok = False
+    if components["db_executor"]["initialized"]:
+        database_ok = _singleton("db_executor", "database_executor").ensure_connected()
+    ready = (state["phase"] not in ("warming", "failed") and database_ok
+             and all(component["initialized"] for component in components.values()))
+    return {
+        "ready": ready,
+        "phase": state["phase"],
+        "error": state["error"],
+        "database_connected": database_ok,
+        "components": components,
+        "steps": state["steps"],
+        "uptime_seconds": round(time.time() - _process_started, 1),
+    }
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Views materializadas dos agregados caros (propostas e criadas pelo index_advisor).
+- Cada view (prefixo mv_advisor_) guarda no COMMENT a SQL de origem e a versão dos dados
+  (db_executor.data_versions) das tabelas de origem no último REFRESH: o catálogo é o registro,
+  vale para todos os processos e sobrevive a reinícios
+- rewrite(): a mesma SQL (a menos do LIMIT final) vira um SELECT na view, só enquanto as versões
+  batem; com dados novos a consulta volta às tabelas até o próximo refresh (nunca responde defasado
+  além do DATA_VERSION_TTL)
+- refresh(): REFRESH MATERIALIZED VIEW das views cujas tabelas mudaram; uma thread repete isso a cada
+  MATVIEW_REFRESH_SECONDS (em um único worker, ver serve.py) e `python index_advisor.py --refresh-views` serve para cron
+- Cada processo relê o registro do catálogo a cada MATVIEW_REGISTRY_TTL segundos
+"""
+from __future__ import annotations
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from config import Config
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # pragma: no cover - sqlglot é opcional
+    sqlglot = None
+    exp = None
+
+PREFIX = "mv_advisor_"
+_SPACES_RE = re.compile(r"\s+")
+_LIMIT_RE = re.compile(r"\s+LIMIT\s+(\d+)$", re.IGNORECASE)
+
+
+def canonical(sql: str) -> Tuple[str, Optional[int]]:
+    """(SQL sem ; final, espaços normalizados e sem o LIMIT final, LIMIT)"""
+    text = _SPACES_RE.sub(" ", sql).strip().rstrip(";").strip()
+    match = _LIMIT_RE.search(text)
+    if match is None:
+        return text, None
+    return text[:match.start()], int(match.group(1))
+
+
+def view_name(source: str) -> str:
+    return PREFIX + hashlib.blake2b(canonical(source)[0].encode("utf-8"), digest_size=6).hexdigest()
+
+
+def view_shape(source: str) -> Tuple[List[str], str]:
+    """
+    (tabelas de origem, ORDER BY para ler a view) da SQL de origem.
+    Levanta ValueError se a ordem não puder ser refeita só com as colunas de saída.
+    """
+    if sqlglot is None:
+        raise ValueError("sqlglot não instalado")
+    tree = sqlglot.parse_one(canonical(source)[0], read="postgres")
+    if not isinstance(tree, exp.Select):
+        raise ValueError("só SELECT simples")
+    outputs = {select.alias_or_name for select in tree.expressions}
+    order = tree.args.get("order")
+    if order is None:
+        return sorted({table.name for table in tree.find_all(exp.Table)}), ""
+    for ordered in order.expressions:
+        if not isinstance(ordered.this, exp.Column) or ordered.this.name not in outputs:
+            raise ValueError(f"ORDER BY fora das colunas de saída: {ordered.sql()}")
+        ordered.this.set("table", None)
+    return sorted({table.name for table in tree.find_all(exp.Table)}), " " + order.sql(dialect="postgres")
+
+
+class MaterializedView:
+    """View do registro: de onde veio, de quais tabelas depende e a versão delas no último refresh"""
+    __slots__ = ("name", "source", "tables", "order", "versions")
+
+    def __init__(self, name: str, source: str, versions: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.source = canonical(source)[0]
+        self.tables, self.order = view_shape(source)
+        self.versions = versions or {}
+
+    def select_sql(self, limit: Optional[int] = None) -> str:
+        return f"SELECT * FROM {self.name}{self.order}" + (f" LIMIT {limit}" if limit is not None else "") + ";"
+
+    def comment(self) -> str:
+        return json.dumps({"source": self.source, "versions": self.versions}, ensure_ascii=False)
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class MaterializedViews:
+    """Registro das views mv_advisor_* (lido do catálogo) com reescrita e refresh por versão"""
+
+    def __init__(self):
+        self._views: Dict[str, MaterializedView] = {}    # SQL de origem canônica → view
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+
+    def load(self) -> Dict[str, MaterializedView]:
+        """Relê as views e seus COMMENTs do catálogo"""
+        from sqlalchemy import text
+        from config import get_engine
+        engine = get_engine()
+        if engine is None:
+            raise RuntimeError("engine não configurada")
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT matviewname, obj_description(format('%I', matviewname)::regclass, 'pg_class') "
+                "FROM pg_matviews WHERE schemaname = 'public' AND matviewname LIKE :prefix"
+            ), {"prefix": PREFIX + "%"}).fetchall()
+        views = {}
+        for name, comment in rows:
+            try:
+                info = json.loads(comment or "")
+                view = MaterializedView(name, info["source"], info.get("versions"))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"⚠️ View {name} ignorada (COMMENT inválido): {e}")
+                continue
+            views[view.source] = view
+        self._views, self._loaded_at = views, time.monotonic()
+        return views
+
+    def _registry(self) -> Dict[str, MaterializedView]:
+        expired = self._loaded_at is None or time.monotonic() - self._loaded_at > Config.MATVIEW_REGISTRY_TTL
+        if expired and self._lock.acquire(blocking=False):
+            try:
+                self.load()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._loaded_at = time.monotonic()   # tenta de novo só depois do TTL
+            finally:
+                self._lock.release()
+        return self._views
+
+    def rewrite(self, sql: str) -> str:
+        """SELECT na view quando a SQL é a origem de uma view atualizada; senão a própria SQL"""
+        if not Config.MATVIEW_REWRITE:
+            return sql
+        views = self._registry()
+        if not views:
+            return sql
+        source, limit = canonical(sql)
+        view = views.get(source)
+        if view is None:
+            return sql
+        from database_executor import db_executor
+        fresh = db_executor.data_versions(tuple(view.tables)) == view.versions
+        metrics.cache_event("matview", fresh)
+        return view.select_sql(limit) if fresh else sql
+
+    def create(self, conn, source: str) -> MaterializedView:
+        """CREATE MATERIALIZED VIEW + COMMENT na conexão dada (o chamador decide commit/rollback)"""
+        from sqlalchemy import text
+        from database_executor import db_executor
+        view = MaterializedView(view_name(source), source)
+        conn.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view.name} AS {view.source}"))
+        view.versions = db_executor.data_versions(tuple(view.tables))
+        conn.execute(text(f"COMMENT ON MATERIALIZED VIEW {view.name} IS {_quote(view.comment())}"))
+        return view
+
+    def refresh(self, force: bool = False) -> Dict[str, str]:
+        """REFRESH das views com tabelas de origem alteradas; devolve o que aconteceu com cada uma"""
+        from sqlalchemy import text
+        from config import get_engine
+        from database_executor import db_executor
+        report: Dict[str, str] = {}
+        with self._lock:
+            views = self.load()
+            engine = get_engine()
+            for view in views.values():
+                versions = db_executor.data_versions(tuple(view.tables))
+                if not force and versions == view.versions:
+                    report[view.name] = "inalterada"
+                    continue
+                started = time.perf_counter()
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text(f"REFRESH MATERIALIZED VIEW {view.name}"))
+                        view.versions = versions
+                        conn.execute(text(f"COMMENT ON MATERIALIZED VIEW {view.name} IS {_quote(view.comment())}"))
+                except Exception as e:
+                    self.last_error = f"{view.name}: {type(e).__name__}: {e}"
+                    report[view.name] = f"erro: {e}"
+                    print(f"⚠️ View {view.name} não atualizada: {e}")
+                    continue
+                report[view.name] = f"atualizada em {time.perf_counter() - started:.2f}s"
+                print(f"🧊 View {view.name}: {report[view.name]}")
+            self.refreshes += 1
+        return report
+
+    def start_refresh(self, interval: Optional[float] = None):
+        """Thread que atualiza as views periodicamente (uma por processo; use em um único worker)"""
+        interval = Config.MATVIEW_REFRESH_SECONDS if interval is None else interval
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"⚠️ Atualização das views materializadas falhou: {e}")
+
+        self._thread = threading.Thread(target=loop, name="matviews", daemon=True)
+        self._thread.start()
+
+    def stop_refresh(self):
+        self._stop.set()
+        self._thread = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "views": {view.name: {"source": view.source, "tables": view.tables, "versions": view.versions}
+                      for view in self._views.values()},
+            "rewrite": Config.MATVIEW_REWRITE,
+            "refreshes": self.refreshes,
+            "refresh_seconds": Config.MATVIEW_REFRESH_SECONDS,
+            "last_error": self.last_error,
+        }
+
+
+# Instância global
+materialized_views = MaterializedViews()
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas no formato de exposição de texto do Prometheus (/metrics), sem dependências.
+- Counter, Gauge e Histogram com rótulos; cada combinação de rótulos é um filho com lock próprio
+  (labels() uma vez e inc()/observe() no caminho quente: < 1 µs por operação, ver __main__)
+- Coletores por callback para o que já é medido em outro lugar: pool de conexões e lru_caches,
+  lidos só no scrape (módulos ainda não importados são ignorados)
+- Métricas do pipeline declaradas aqui como instâncias globais (STAGE_SECONDS, REQUESTS, ...)
+- Valores por processo: com vários workers (serve.py) cada scrape vê o worker que atendeu
+"""
+from __future__ import annotations
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latências do pipeline: de lookups de atalho (ms) a gerações da LLM (dezenas de s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ---------------------------------------------------------------------------
+# Tipos de métrica
+# ---------------------------------------------------------------------------
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # último = +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self._bounds, value)   # le: value <= limite
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def observe_since(self, started: float) -> float:
+        """Observa o tempo desde `started` (time.perf_counter()) e devolve o instante atual"""
+        now = time.perf_counter()
+        self.observe(now - started)
+        return now
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: esperados rótulos {self.labelnames}, recebidos {values}")
+            key = tuple(str(value) for value in values)
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _samples(self) -> Iterable[Tuple[str, str, float]]:
+        for values, child in list(self._children.items()):
+            yield "", _format_labels(self.labelnames, values), child.value
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {_escape(self.documentation)}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._children[()].dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != float("inf")))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _samples(self):
+        bounds = self.buckets + (float("inf"),)
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"'), cumulative
+            labels = _format_labels(self.labelnames, values)
+            yield "_sum", labels, total
+            yield "_count", labels, cumulative
+
+
+class CallbackMetric(_Metric):
+    """Valores calculados no scrape: callback() → [(valores dos rótulos, valor)]"""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 callback: Callable[[], Iterable[Tuple[Sequence[str], float]]]):
+        self.kind = kind
+        self._callback = callback
+        super().__init__(name, documentation, labelnames)
+        self._children.clear()
+
+    def _new_child(self):
+        return None
+
+    def _samples(self):
+        try:
+            samples = list(self._callback())
+        except Exception:
+            samples = []
+        for values, value in samples:
+            yield "", _format_labels(self.labelnames, [str(v) for v in values]), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 callback: Callable[[], Iterable[Tuple[Sequence[str], float]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, kind, labelnames, callback))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+# Instância global
+registry = Registry()
+
+
+# ---------------------------------------------------------------------------
+# Métricas do pipeline
+# ---------------------------------------------------------------------------
+
+STAGE_SECONDS = registry.histogram(
+    "nl2sql_stage_seconds",
+    "Latência por etapa do natural_language_to_sql (analysis, routing, llm, validation, execution, total)",
+    ["stage"],
+)
+REQUESTS = registry.counter(
+    "nl2sql_requests_total",
+    "Perguntas atendidas por caminho (nome do atalho, llm ou cursor) e resultado",
+    ["path", "status"],
+)
+FALLBACKS = registry.counter(
+    "nl2sql_fallbacks_total", "Planos que caíram no fallback por não retornar linhas", ["path"],
+)
+VALIDATION = registry.counter(
+    "nl2sql_sql_validation_total",
+    "Resultado do validate_and_fix/verificação de sintaxe (ok, warning, syntax_error)",
+    ["outcome"],
+)
+QUERY_GUARD = registry.counter(
+    "nl2sql_query_guard_total",
+    "Decisões do executor antes de rodar a SQL (not_select, fields_simplified, fields_rejected, "
+    "or_rewritten, cost_rejected)",
+    ["outcome"],
+)
+LLM_REQUESTS = registry.counter("nl2sql_llm_requests_total", "Chamadas ao Ollama por resultado", ["status"])
+LLM_IN_FLIGHT = registry.gauge("nl2sql_llm_in_flight", "Perguntas aguardando ou gerando SQL no Ollama")
+LLM_SECONDS = registry.histogram(
+    "nl2sql_llm_generation_seconds", "Tempo de geração da SQL pelo Ollama (requisição completa)",
+)
+# Exportações (/api/export): vazão = rate(rows) / rate(seconds)
+EXPORTS = registry.counter(
+    "nl2sql_exports_total", "Exportações por formato e resultado (ok, error, cancelled, rejected)", ["format", "status"],
+)
+EXPORT_ROWS = registry.counter("nl2sql_export_rows_total", "Linhas exportadas por formato", ["format"])
+EXPORT_SECONDS = registry.counter("nl2sql_export_seconds_total", "Tempo gasto nas exportações por formato", ["format"])
+# Caches sem lru_cache (contados à mão); os lru_caches entram pelo callback abaixo
+CACHE_EVENTS = Counter("nl2sql_cache_events", "", ["cache", "result"])
+
+# (nome no rótulo, módulo, função com cache_info())
+_LRU_CACHES = (
+    ("sql_validation", "sql_validator", "_validate_cached"),
+    ("keyset_pagination", "sql_validator", "keyset_paginate"),
+    ("or_rewrite", "sql_validator", "rewrite_or_equalities"),
+    ("sql_fingerprint", "query_stats", "_normalize_shape"),
+    ("sql_tables", "http_cache", "tables_in"),
+    ("stem", "text_normalizer", "stem"),
+)
+
+
+def _cache_samples():
+    for values, child in list(CACHE_EVENTS._children.items()):
+        yield values, child.value
+    for label, module_name, function_name in _LRU_CACHES:
+        module = sys.modules.get(module_name)
+        function = getattr(module, function_name, None) if module is not None else None
+        if function is None or not hasattr(function, "cache_info"):
+            continue
+        info = function.cache_info()
+        yield (label, "hit"), info.hits
+        yield (label, "miss"), info.misses
+
+
+def _pool_samples():
+    executor_module = sys.modules.get("database_executor")
+    executor = getattr(executor_module, "db_executor", None)
+    if executor is None or not getattr(executor, "initialized", True):
+        return   # o scrape não deve abrir a conexão
+    engine = getattr(executor, "engine", None)
+    pool = getattr(engine, "pool", None)
+    if pool is None:
+        return
+    for state, reader in (("size", "size"), ("checked_in", "checkedin"), ("checked_out", "checkedout"),
+                          ("overflow", "overflow")):
+        if hasattr(pool, reader):
+            yield (state,), getattr(pool, reader)()
+
+
+registry.callback(
+    "nl2sql_cache_requests_total",
+    "Consultas a caches por resultado (taxa de acerto = hit / (hit + miss))",
+    "counter", ["cache", "result"], _cache_samples,
+)
+registry.callback("nl2sql_db_pool_connections", "Estado do pool de conexões do SQLAlchemy", "gauge",
+                  ["state"], _pool_samples)
+
+
+def cache_event(cache: str, hit: bool):
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+if __name__ == "__main__":
+    # Micro-benchmark do caminho quente
+    import timeit
+
+    bench = Registry()
+    counter = bench.counter("bench_total", "bench", ["path", "status"])
+    histogram = bench.histogram("bench_seconds", "bench", ["stage"])
+    bound_counter = counter.labels("filhas_touro", "ok")
+    bound_histogram = histogram.labels("execution")
+    for i in range(50):
+        counter.labels(f"atalho{i}", "ok").inc()
+        histogram.labels(f"etapa{i}").observe(i / 100)
+
+    n = 200_000
+    for label, stmt in (
+        ("counter.inc (filho)", lambda: bound_counter.inc()),
+        ("counter.labels().inc", lambda: counter.labels("filhas_touro", "ok").inc()),
+        ("histogram.observe (filho)", lambda: bound_histogram.observe(0.0123)),
+        ("histogram.labels().observe", lambda: histogram.labels("execution").observe(0.0123)),
+        ("perf_counter + observe_since", lambda: bound_histogram.observe_since(time.perf_counter())),
+    ):
+        best = min(timeit.repeat(stmt, number=n, repeat=5)) / n
+        print(f"⏱️ {label:<30} {best * 1e9:7.0f} ns")
+
+    start = time.perf_counter()
+    text = bench.render()
+    print(f"📄 render de {len(text.splitlines())} linhas em {(time.perf_counter() - start) * 1000:.2f} ms")
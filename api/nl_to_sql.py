@@ -1,11 +1,107 @@
-import requests
 import json
 import re
-from typing import Tuple, Dict, Any
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import Tuple, Dict, Any, Callable, Iterator, List, Optional
 from config import Config
-from sql_validator import validate_and_fix
+import metrics
+from admission import AdmissionRejected, admission
+from pagination import cursor_value, decode_cursor, encode_cursor
+from sql_validator import keyset_paginate, validate_and_fix
 from schema_mapper import schema_mapper
 from database_executor import db_executor
+from cube_replica import cube_replicas
+from rankings import RankingQuery, parse_ranking, ranking_rows, ranking_sql
+from aggregations import (AggregationQuery, aggregation_available, aggregation_rows, aggregation_sql,
+                          parse_aggregation)
+from text_normalizer import TermMatcher, normalize_text
+from lazy import LazySingleton
+
+# Vocabulário do roteamento: normalizado uma vez na carga (acentos, plurais e erros de digitação)
+_ROUTING_TERMS = TermMatcher({
+    "filhas": ["filha"],
+    "descendentes": ["descendente"],
+    # Netas só contam no ranking de descendentes: "netas do FSC…" não é o atalho das filhas
+    "netas": ["neta", "filhas e netas"],
+    "ranking": ["maior média", "top", "ranking"],
+    "producao": ["produção", "leite", "305"],
+    "touro": ["touro", "reprodutor"],
+    "vaca": ["vaca"],
+    "resumo_vaca": ["lactação", "parto", "produção", "vitalícia"],
+    "vitalicia": ["vitalícia"],
+    "genealogia": ["genealogia", "geração"],
+    "primeiro_parto": ["primeiro parto", "1º parto", "primeira lactação"],
+    "lactacao": ["lactação"],
+})
+
+# 🆕 Histogramas por etapa já resolvidos (labels() fora do caminho quente)
+_STAGE = {stage: metrics.STAGE_SECONDS.labels(stage)
+          for stage in ("analysis", "routing", "llm", "validation", "execution", "total")}
+
+
+def _top_by_sample_sql(table: str, total_column: str) -> str:
+    """Maior média 305d com e sem amostra significativa (um registro por categoria)"""
+    columns = f"codigo_touro, nome_touro, media_leite_305d, {total_column}"
+    return (
+        "SELECT * FROM ("
+        f"  SELECT 'com_amostra' AS categoria, {columns} "
+        f"  FROM {table} "
+        "  WHERE tem_amostra_significativa = true "
+        "  ORDER BY media_leite_305d DESC "
+        "  LIMIT 1"
+        ") t1 "
+        "UNION ALL "
+        "SELECT * FROM ("
+        f"  SELECT 'sem_amostra' AS categoria, {columns} "
+        f"  FROM {table} "
+        "  WHERE (tem_amostra_significativa = false OR tem_amostra_significativa IS NULL) "
+        "  ORDER BY media_leite_305d DESC "
+        "  LIMIT 1"
+        ") t2;"
+    )
+
+
+def _top_by_sample_rows(table: str, total_column: str) -> Optional[List[Dict[str, Any]]]:
+    """Mesmo resultado de _top_by_sample_sql pelos rankings da réplica em memória (None sem réplica)"""
+    fields = ["codigo_touro", "nome_touro", "media_leite_305d", total_column]
+    rows = []
+    for categoria, flag in (("com_amostra", True), ("sem_amostra", False)):
+        top = cube_replicas.top(table, "media_leite_305d", fields, where="tem_amostra_significativa", flag=flag)
+        if top is None:
+            return None
+        rows += [dict(categoria=categoria, **row) for row in top]
+    return rows
+
+
+class QueryPlan:
+    """SQL escolhida para uma pergunta (atalho ou LLM) e como apresentá-la no resultado"""
+    __slots__ = ("sql", "source", "label", "tables", "fields", "fallback", "check_syntax", "replica", "path")
+
+    def __init__(self, sql: str, source: str = "shortcut", label: str = "", tables: Optional[List[str]] = None,
+                 fields: Optional[List[str]] = None, fallback: Optional["QueryPlan"] = None, check_syntax: bool = False,
+                 replica: Optional[Callable[[], Optional[List[Dict[str, Any]]]]] = None, path: Optional[str] = None):
+        self.sql = sql
+        self.source = source          # "shortcut" ou "llm"
+        self.label = label
+        self.tables = tables or []
+        self.fields = fields or []
+        self.fallback = fallback      # executado quando o plano falha ou não retorna linhas
+        self.check_syntax = check_syntax
+        self.replica = replica        # 🆕 mesma resposta pela réplica em memória (None = ir ao banco)
+        self.path = path              # 🆕 rótulo nas métricas quando o label traz dados do usuário (padrão: label)
+
+
+class RoutedQuery:
+    """🆕 Pergunta analisada e roteada uma única vez (o ETag da API e a execução usam o mesmo plano)"""
+    __slots__ = ("query", "normalized", "analysis", "plan")
+
+    def __init__(self, query: str, normalized, analysis: Dict[str, Any], plan: Optional[QueryPlan]):
+        self.query = query
+        self.normalized = normalized
+        self.analysis = analysis
+        self.plan = plan          # None = vai para a LLM
+
 
 class NLToSQLPipeline:
     def __init__(self):
@@ -17,418 +113,654 @@ class NLToSQLPipeline:
         if not schema_mapper.load_schema():
             print("❌ Não foi possível carregar o schema JSON")
     
-    def natural_language_to_sql(self, query: str) -> Tuple[bool, str, Any]:
+    def natural_language_to_sql(self, query: str, page_size: Optional[int] = None,
+                                cursor: Optional[str] = None, client_id: Optional[str] = None,
+                                routed: Optional[RoutedQuery] = None) -> Tuple[bool, str, Any]:
         """
         Pipeline completo com análise de palavras-chave
+        page_size: ativa a paginação por chave (o resultado traz um cursor para a próxima página)
+        cursor: continua uma paginação anterior sem passar de novo pelo roteamento/LLM
+        client_id: identifica o cliente na fila da faixa (rodízio e limite por cliente)
+        routed: resultado de route() para a mesma pergunta (evita analisar e rotear de novo)
+        
+        Levanta AdmissionRejected se a faixa escolhida pelo roteamento estiver sobrecarregada.
         """
-        print(f"🔍 Analisando: '{query}'")
+        started = time.perf_counter()
+        if cursor:
+            with self._admit(admission.fast, "cursor", client_id):
+                result = self.next_page(cursor)
+            self._count_request("cursor", result[0], started)
+            return result
+        
+        # Passos 1 e 2: análise e roteamento (atalho ou LLM), uma vez por pergunta
+        if routed is None:
+            routed = self.route(query)
+        plan, analysis = routed.plan, routed.analysis
         
-        # Passo 1: Análise da query para identificar componentes
-        analysis = schema_mapper.analyze_query(query)
+        # Espera a vez na faixa correspondente
+        if plan is not None:
+            with self._admit(admission.fast, self._plan_path(plan), client_id):
+                result = self.execute_plan(plan, analysis, page_size)
+        else:
+            with self._admit(admission.llm, "llm", client_id):
+                plan, error = self._plan_with_llm(query, analysis)
+                if plan is None:
+                    self._count_request("llm", False, started)
+                    return False, error, None
+                result = self.execute_plan(plan, analysis, page_size)
+        self._count_request(self._plan_path(plan), result[0], started)
+        return result
+    
+    @staticmethod
+    @contextmanager
+    def _admit(lane, path: str, client_id: Optional[str]):
+        """Entra na faixa; recusas contam como status=rejected nas métricas"""
+        try:
+            lane.acquire(client_id or "local")
+        except AdmissionRejected as e:
+            print(f"🚦 {e}")
+            metrics.REQUESTS.labels(path, "rejected").inc()
+            raise
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            lane.release(client_id or "local", time.perf_counter() - started)
+    
+    @staticmethod
+    def _plan_path(plan: QueryPlan) -> str:
+        """Rótulo do caminho nas métricas: nome do atalho, llm ou cursor"""
+        return (plan.path or plan.label) if plan.source == "shortcut" else plan.source
+    
+    @staticmethod
+    def _count_request(path: str, success: bool, started: Optional[float] = None):
+        metrics.REQUESTS.labels(path, "ok" if success else "error").inc()
+        if started is not None:
+            _STAGE["total"].observe_since(started)
+    
+    def answer_key(self, query: str, page_size: Optional[int] = None, cursor: Optional[str] = None,
+                   routed: Optional[RoutedQuery] = None) -> Optional[Tuple[str, str]]:
+        """
+        Identidade de uma resposta determinística, sem executar nada: (chave, SQL).
+        Páginas por cursor e atalhos são determinísticos; perguntas que iriam para a LLM retornam None.
+        routed: resultado de route() (o mesmo que depois vai para natural_language_to_sql)
+        """
+        if cursor:
+            try:
+                state = decode_cursor(cursor)
+            except ValueError:
+                return None
+            return f"cursor:{cursor}", state["sql"]
+        plan = (routed or self.route(query)).plan
+        if plan is None:
+            return None
+        ok, sql_query, _ = validate_and_fix(plan.sql)
+        sql_query = sql_query if ok else plan.sql
+        return f"{sql_query}|page_size={page_size or ''}", sql_query
+    
+    def route(self, query: str) -> RoutedQuery:
+        """Passo 1 (normaliza a pergunta uma única vez e identifica componentes) e passo 2 (roteamento)"""
+        started = time.perf_counter()
+        print(f"🔍 Analisando: '{query}'")
+        normalized = normalize_text(query)
+        analysis = schema_mapper.analyze_query(normalized)
+        _STAGE["analysis"].observe_since(started)
         print(f"📊 Análise: {len(analysis['tables'])} tabelas, {len(analysis['fields'])} campos identificados")
-
+        return RoutedQuery(query, normalized, analysis, self.route_query(query, normalized, analysis))
+    
+    def route_query(self, query: str, normalized, analysis: Dict[str, Any]) -> Optional[QueryPlan]:
+        """Roteia a pergunta: plano do atalho ou None (vai para a LLM)"""
+        started = time.perf_counter()
+        plan = self._plan_shortcut(query, normalized, analysis)
+        _STAGE["routing"].observe_since(started)
+        if plan is not None:
+            print(f"🧭 Atalho aplicado ({plan.label}): {plan.sql}")
+        return plan
+    
+    def _plan_shortcut(self, query: str, normalized, analysis: Dict[str, Any]) -> Optional[QueryPlan]:
+        """Atalhos determinísticos para as perguntas mais comuns (a ordem importa)"""
+        terms = _ROUTING_TERMS.match(normalized)
+        codes = re.findall(r"FSC\d+", query.upper())
+        
+        # 🆕 Rankings com N explícito ou posição de um touro (os atalhos fixos abaixo respondem só o top 1)
+        ranking = parse_ranking(query, normalized)
+        if ranking is not None and ranking.explicit:
+            return self._ranking_plan(ranking)
+        
         # Atalho inteligente: consultas sobre "filhas do touro <FSCxxxx>"
-        qlower = query.lower()
-        import re as _re
-        codes = _re.findall(r"FSC\d+", query.upper())
-        if codes and any(w in qlower for w in ["filhas", "filha", "descendentes"]):
-            code = codes[0]
-            sql_query = f"SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = '{code}' LIMIT 10;"
-            print(f"🧭 Atalho aplicado (filhas_touro): {sql_query}")
-            # Validação e normalização
-            ok, fixed_sql, val_msg = validate_and_fix(sql_query)
-            if ok:
-                sql_query = fixed_sql
-            else:
-                print(f"⚠️ Validação avisou: {val_msg}")
-            # Executa diretamente
-            success, data, db_message = db_executor.execute_query(sql_query)
-            if success:
-                result_info = {
-                    "message": db_message,
-                    "query": sql_query,
-                    "data": data,
-                    "analysis": {
-                        "tables_identified": list(analysis["tables"]),
-                        "fields_identified": list(analysis["fields"]),
-                        "keywords_detected": analysis["detected_keywords"][:5]
-                    }
-                }
-                return True, sql_query, result_info
-            else:
-                return False, sql_query, f"SQL gerado mas erro na execução: {db_message}"
-
+        if codes and terms & {"filhas", "descendentes"}:
+            return QueryPlan(
+                f"SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = '{codes[0]}' LIMIT 10;",
+                label="filhas_touro",
+                tables=list(analysis["tables"]),
+                fields=list(analysis["fields"]),
+                replica=partial(cube_replicas.lookup, "filhas_touro", "codigo_touro", codes[0],
+                                ["codigo_filha", "nome_filha"], 10),
+            )
+        
         # 🆕 Atalho inteligente: "touro com filhas com maior média de produção" (cubo_producao_touro_filhas)
-        wants_top_bull_daughters_avg = (
-            any(term in qlower for term in ["maior média", "maior media", "top", "ranking"]) and
-            any(term in qlower for term in ["filhas", "filha"]) and
-            any(term in qlower for term in ["produção", "producao", "leite", "305"]) and
-            any(term in qlower for term in ["touro", "reprodutor"]) and
-            not codes  # evita conflito com perguntas sobre um FSC específico
-        )
-        if wants_top_bull_daughters_avg:
+        # (sem FSC para evitar conflito com perguntas sobre um código específico)
+        if {"ranking", "filhas", "producao", "touro"} <= terms and not codes:
             # Retorna dois registros: com e sem amostra significativa
-            union_sql = (
-                "SELECT * FROM ("
-                "  SELECT 'com_amostra' AS categoria, codigo_touro, nome_touro, media_leite_305d, total_filhas "
-                "  FROM cubo_producao_touro_filhas "
-                "  WHERE tem_amostra_significativa = true "
-                "  ORDER BY media_leite_305d DESC "
-                "  LIMIT 1"
-                ") t1 "
-                "UNION ALL "
-                "SELECT * FROM ("
-                "  SELECT 'sem_amostra' AS categoria, codigo_touro, nome_touro, media_leite_305d, total_filhas "
-                "  FROM cubo_producao_touro_filhas "
-                "  WHERE (tem_amostra_significativa = false OR tem_amostra_significativa IS NULL) "
-                "  ORDER BY media_leite_305d DESC "
-                "  LIMIT 1"
-                ") t2;"
+            return QueryPlan(
+                _top_by_sample_sql("cubo_producao_touro_filhas", "total_filhas"),
+                label="cubo_producao_touro_filhas - top média 305d, 2 categorias",
+                tables=["cubo_producao_touro_filhas"],
+                fields=["categoria", "codigo_touro", "nome_touro", "media_leite_305d", "total_filhas"],
+                replica=partial(_top_by_sample_rows, "cubo_producao_touro_filhas", "total_filhas"),
             )
-            print(f"🧭 Atalho aplicado (cubo_producao_touro_filhas - top média 305d, 2 categorias): {union_sql}")
-            ok, fixed_sql, val_msg = validate_and_fix(union_sql)
-            if ok:
-                union_sql = fixed_sql
-            else:
-                print(f"⚠️ Validação avisou: {val_msg}")
-            success, data, db_message = db_executor.execute_query(union_sql)
-            if success:
-                result_info = {
-                    "message": db_message,
-                    "query": union_sql,
-                    "data": data,
-                    "analysis": {
-                        "tables_identified": ["cubo_producao_touro_filhas"],
-                        "fields_identified": ["categoria", "codigo_touro", "nome_touro", "media_leite_305d", "total_filhas"],
-                        "keywords_detected": analysis["detected_keywords"][:5]
-                    }
-                }
-                return True, union_sql, result_info
-            else:
-                return False, union_sql, f"SQL gerado mas erro na execução: {db_message}"
-
+        
         # Atalho inteligente: resumo de vaca (cubo_resumo_vaca)
         # Detecta consultas com termos de lactação/parto/produção e referência a vaca por nome (Vaca123) ou código (FSC123)
-        name_matches = _re.findall(r"Vaca\d+", query)
-        wants_resumo = ("vaca" in qlower) and any(term in qlower for term in ["lacta", "parto", "produc", "vital"])  # cobre lactações, partos, produção vitalícia
-        if wants_resumo and (name_matches or codes):
-            filtro = None
-            if name_matches:
-                filtro = f"nome_vaca = '{name_matches[0]}'"
-            elif codes:
-                filtro = f"codigo_bovino = '{codes[0]}'"
-
-            sql_query = (
-                "SELECT nome_vaca, codigo_bovino, lactacoes_encerradas, numero_partos, producao_vitalicia_leite "
-                "FROM cubo_resumo_vaca "
-                f"WHERE {filtro} LIMIT 1;"
+        name_matches = re.findall(r"Vaca\d+", query)
+        if {"vaca", "resumo_vaca"} <= terms and (name_matches or codes):
+            key, value = ("nome_vaca", name_matches[0]) if name_matches else ("codigo_bovino", codes[0])
+            fields = ["nome_vaca", "codigo_bovino", "lactacoes_encerradas", "numero_partos", "producao_vitalicia_leite"]
+            return QueryPlan(
+                f"SELECT {', '.join(fields)} FROM cubo_resumo_vaca WHERE {key} = '{value}' LIMIT 1;",
+                label="cubo_resumo_vaca",
+                tables=["cubo_resumo_vaca"],
+                fields=fields,
+                replica=partial(cube_replicas.lookup, "cubo_resumo_vaca", key, value, fields, 1),
             )
-            print(f"🧭 Atalho aplicado (cubo_resumo_vaca): {sql_query}")
-            ok, fixed_sql, val_msg = validate_and_fix(sql_query)
-            if ok:
-                sql_query = fixed_sql
-            else:
-                print(f"⚠️ Validação avisou: {val_msg}")
-            success, data, db_message = db_executor.execute_query(sql_query)
-            if success:
-                result_info = {
-                    "message": db_message,
-                    "query": sql_query,
-                    "data": data,
-                    "analysis": {
-                        "tables_identified": ["cubo_resumo_vaca"],
-                        "fields_identified": [
-                            "nome_vaca", "codigo_bovino", "lactacoes_encerradas", "numero_partos", "producao_vitalicia_leite"
-                        ],
-                        "keywords_detected": analysis["detected_keywords"][:5]
-                    }
-                }
-                return True, sql_query, result_info
-            else:
-                return False, sql_query, f"SQL gerado mas erro na execução: {db_message}"
-
+        
         # 🆕 Atalho inteligente: média da produção vitalícia das filhas de um touro específico
         # Exemplos de detecção: "produção vitalícia", "producao vitalicia", "vitalícia", "vitalicia"
-        bull_name_matches = _re.findall(r"Touro\d+", query)
-        wants_vitalicia_filhas = (
-            any(term in qlower for term in ["vitalícia", "vitalicia"]) and
-            any(term in qlower for term in ["filhas", "filha"]) and
-            any(term in qlower for term in ["touro", "reprodutor"]) and
-            (bull_name_matches or codes)
-        )
-        if wants_vitalicia_filhas:
-            if bull_name_matches:
-                filtro = f"nome_touro = '{bull_name_matches[0]}'"
-            else:
-                filtro = f"codigo_touro = '{codes[0]}'"
-            sql_query = (
-                "SELECT nome_touro, codigo_touro, media_producao_vitalicia, total_filhas "
-                "FROM cubo_producao_touro_filhas "
-                f"WHERE {filtro} LIMIT 1;"
+        bull_name_matches = re.findall(r"Touro\d+", query)
+        if {"vitalicia", "filhas", "touro"} <= terms and (bull_name_matches or codes):
+            key, value = ("nome_touro", bull_name_matches[0]) if bull_name_matches else ("codigo_touro", codes[0])
+            fields = ["nome_touro", "codigo_touro", "media_producao_vitalicia", "total_filhas"]
+            return QueryPlan(
+                f"SELECT {', '.join(fields)} FROM cubo_producao_touro_filhas WHERE {key} = '{value}' LIMIT 1;",
+                label="cubo_producao_touro_filhas - média vitalícia filhas",
+                tables=["cubo_producao_touro_filhas"],
+                fields=fields,
+                replica=partial(cube_replicas.lookup, "cubo_producao_touro_filhas", key, value, fields, 1),
             )
-            print(f"🧭 Atalho aplicado (cubo_producao_touro_filhas - média vitalícia filhas): {sql_query}")
-            ok, fixed_sql, val_msg = validate_and_fix(sql_query)
-            if ok:
-                sql_query = fixed_sql
-            else:
-                print(f"⚠️ Validação avisou: {val_msg}")
-            success, data, db_message = db_executor.execute_query(sql_query)
-            if success:
-                result_info = {
-                    "message": db_message,
-                    "query": sql_query,
-                    "data": data,
-                    "analysis": {
-                        "tables_identified": ["cubo_producao_touro_filhas"],
-                        "fields_identified": ["nome_touro", "codigo_touro", "media_producao_vitalicia", "total_filhas"],
-                        "keywords_detected": analysis["detected_keywords"][:5]
-                    }
-                }
-                return True, sql_query, result_info
-            else:
-                return False, sql_query, f"SQL gerado mas erro na execução: {db_message}"
-
+        
         # 🆕 Atalho simples: mapeamento de raça01 → Raça Holandesa
         # Responde perguntas do tipo: "o que é a raça01?" ou "raça 01"
-        if _re.search(r"\bra[cç]a\s*0*1\b", qlower):
-            sql_query = "SELECT 'raça01' AS raca_codigo, 'Holandesa' AS raca_nome, 'Raça Holandesa' AS descricao;"
-            print(f"🧭 Atalho aplicado (mapeamento raça01): {sql_query}")
-            ok, fixed_sql, val_msg = validate_and_fix(sql_query)
-            if ok:
-                sql_query = fixed_sql
-            else:
-                print(f"⚠️ Validação avisou: {val_msg}")
-            success, data, db_message = db_executor.execute_query(sql_query)
-            if success:
-                result_info = {
-                    "message": db_message,
-                    "query": sql_query,
-                    "data": data,
-                    "analysis": {
-                        "tables_identified": [],
-                        "fields_identified": ["raca_codigo", "raca_nome", "descricao"],
-                        "keywords_detected": analysis["detected_keywords"][:5]
-                    }
-                }
-                return True, sql_query, result_info
-            else:
-                return False, sql_query, f"SQL gerado mas erro na execução: {db_message}"
-
+        if re.search(r"\braca\s*0*1\b", normalized.folded):
+            return QueryPlan(
+                "SELECT 'raça01' AS raca_codigo, 'Holandesa' AS raca_nome, 'Raça Holandesa' AS descricao;",
+                label="mapeamento raça01",
+                fields=["raca_codigo", "raca_nome", "descricao"],
+            )
+        
         # Atalho inteligente: genealogia até a terceira geração (cubo_genealogia)
-        wants_genealogy = any(term in qlower for term in ["genealogia", "geração", "geracoes", "geraçao", "geracões"]) and bool(codes)
-        if wants_genealogy and codes:
-            code = codes[0]
-            sql_query = (
+        if "genealogia" in terms and codes:
+            fields = [
+                "animal_codigo", "animal_nome", "pai_codigo", "pai_nome", "mae_codigo", "mae_nome",
+                "avo_paterno_codigo", "avo_paterno_nome", "avo_paterna_codigo", "avo_paterna_nome",
+                "avo_materno_codigo", "avo_materno_nome", "avo_materna_codigo", "avo_materna_nome",
+            ]
+            return QueryPlan(
                 "SELECT "
                 "animal_codigo, animal_nome, animal_sexo, animal_raca, "
                 "pai_codigo, pai_nome, mae_codigo, mae_nome, "
                 "avo_paterno_codigo, avo_paterno_nome, avo_paterna_codigo, avo_paterna_nome, "
                 "avo_materno_codigo, avo_materno_nome, avo_materna_codigo, avo_materna_nome "
                 "FROM cubo_genealogia "
-                f"WHERE animal_codigo = '{code}' LIMIT 1;"
+                f"WHERE animal_codigo = '{codes[0]}' LIMIT 1;",
+                label="cubo_genealogia 3ª geração",
+                tables=["cubo_genealogia"],
+                fields=fields,
             )
-            print(f"🧭 Atalho aplicado (cubo_genealogia 3ª geração): {sql_query}")
-            ok, fixed_sql, val_msg = validate_and_fix(sql_query)
-            if ok:
-                sql_query = fixed_sql
-            else:
-                print(f"⚠️ Validação avisou: {val_msg}")
-            success, data, db_message = db_executor.execute_query(sql_query)
-            if success:
-                result_info = {
-                    "message": db_message,
-                    "query": sql_query,
-                    "data": data,
-                    "analysis": {
-                        "tables_identified": ["cubo_genealogia"],
-                        "fields_identified": [
-                            "animal_codigo","animal_nome","pai_codigo","pai_nome","mae_codigo","mae_nome",
-                            "avo_paterno_codigo","avo_paterno_nome","avo_paterna_codigo","avo_paterna_nome",
-                            "avo_materno_codigo","avo_materno_nome","avo_materna_codigo","avo_materna_nome"
-                        ],
-                        "keywords_detected": analysis["detected_keywords"][:5]
-                    }
-                }
-                return True, sql_query, result_info
-            else:
-                return False, sql_query, f"SQL gerado mas erro na execução: {db_message}"
-
+        
         # 🆕 Atalho inteligente: descendentes (filhas + netas) com maior média
-        wants_top_bull_descendants_avg = (
-            any(term in qlower for term in ["descendente", "descendentes", "netas", "filhas e netas"]) and
-            any(term in qlower for term in ["maior média", "maior media", "top", "ranking"]) and
-            any(term in qlower for term in ["produção", "producao", "leite", "305"]) and
-            any(term in qlower for term in ["touro", "reprodutor"]) and
-            not codes
-        )
-        if wants_top_bull_descendants_avg:
-            union_sql = (
-                "SELECT * FROM ("
-                "  SELECT 'com_amostra' AS categoria, codigo_touro, nome_touro, media_leite_305d, total_descendentes "
-                "  FROM cubo_producao_touro_descendentes "
-                "  WHERE tem_amostra_significativa = true "
-                "  ORDER BY media_leite_305d DESC "
-                "  LIMIT 1"
-                ") t1 "
-                "UNION ALL "
-                "SELECT * FROM ("
-                "  SELECT 'sem_amostra' AS categoria, codigo_touro, nome_touro, media_leite_305d, total_descendentes "
-                "  FROM cubo_producao_touro_descendentes "
-                "  WHERE (tem_amostra_significativa = false OR tem_amostra_significativa IS NULL) "
-                "  ORDER BY media_leite_305d DESC "
-                "  LIMIT 1"
-                ") t2;"
+        if {"ranking", "producao", "touro"} <= terms and terms & {"descendentes", "netas"} and not codes:
+            return QueryPlan(
+                _top_by_sample_sql("cubo_producao_touro_descendentes", "total_descendentes"),
+                label="cubo_producao_touro_descendentes - top média",
+                tables=["cubo_producao_touro_descendentes"],
+                fields=["categoria", "codigo_touro", "nome_touro", "media_leite_305d", "total_descendentes"],
+                replica=partial(_top_by_sample_rows, "cubo_producao_touro_descendentes", "total_descendentes"),
             )
-            print(f"🧭 Atalho aplicado (cubo_producao_touro_descendentes - top média): {union_sql}")
-            ok, fixed_sql, val_msg = validate_and_fix(union_sql)
-            if ok:
-                union_sql = fixed_sql
-            else:
-                print(f"⚠️ Validação avisou: {val_msg}")
-            success, data, db_message = db_executor.execute_query(union_sql)
-            if success:
-                result_info = {
-                    "message": db_message,
-                    "query": union_sql,
-                    "data": data,
-                    "analysis": {
-                        "tables_identified": ["cubo_producao_touro_descendentes"],
-                        "fields_identified": ["categoria", "codigo_touro", "nome_touro", "media_leite_305d", "total_descendentes"],
-                        "keywords_detected": analysis["detected_keywords"][:5]
-                    }
-                }
-                return True, union_sql, result_info
-            else:
-                return False, union_sql, f"SQL gerado mas erro na execução: {db_message}"
-
+        
         # 🆕 Atalho inteligente: maior média de lactação no primeiro parto (filhas)
-        wants_first_calving_avg = (
-            any(term in qlower for term in ["primeiro parto", "1o parto", "1º parto", "primeira lactação", "primeira lactacao"]) and
-            any(term in qlower for term in ["lactação", "lactacao"]) and
-            any(term in qlower for term in ["maior média", "maior media", "top", "ranking"]) and
-            any(term in qlower for term in ["filhas", "filha"]) and
-            any(term in qlower for term in ["touro", "reprodutor"]) and
-            not codes
-        )
-        if wants_first_calving_avg:
-            base_sql = (
-                "SELECT codigo_touro, nome_touro, media_producao_primeiro_parto, total_filhas_primeiro_parto "
-                "FROM cubo_primeiro_parto_filhas "
-                "WHERE amostra_representativa = true "
-                "ORDER BY media_producao_primeiro_parto DESC "
-                "LIMIT 1;"
-            )
-            print(f"🧭 Atalho aplicado (cubo_primeiro_parto_filhas - top média 1º parto): {base_sql}")
-            ok, fixed_sql, val_msg = validate_and_fix(base_sql)
-            if ok:
-                base_sql = fixed_sql
-            else:
-                print(f"⚠️ Validação avisou: {val_msg}")
-            success, data, db_message = db_executor.execute_query(base_sql)
-            if success and data:
-                result_info = {
-                    "message": db_message,
-                    "query": base_sql,
-                    "data": data,
-                    "analysis": {
-                        "tables_identified": ["cubo_primeiro_parto_filhas"],
-                        "fields_identified": ["codigo_touro", "nome_touro", "media_producao_primeiro_parto", "total_filhas_primeiro_parto"],
-                        "keywords_detected": analysis["detected_keywords"][:5]
-                    }
-                }
-                return True, base_sql, result_info
-            else:
+        if {"primeiro_parto", "lactacao", "ranking", "filhas", "touro"} <= terms and not codes:
+            fields = ["codigo_touro", "nome_touro", "media_producao_primeiro_parto", "total_filhas_primeiro_parto"]
+            select = f"SELECT {', '.join(fields)} FROM cubo_primeiro_parto_filhas "
+            order = "ORDER BY media_producao_primeiro_parto DESC LIMIT 1;"
+            top = partial(cube_replicas.top, "cubo_primeiro_parto_filhas", "media_producao_primeiro_parto", fields)
+            return QueryPlan(
+                select + "WHERE amostra_representativa = true " + order,
+                label="cubo_primeiro_parto_filhas - top média 1º parto",
+                tables=["cubo_primeiro_parto_filhas"],
+                fields=fields,
+                replica=partial(top, where="amostra_representativa"),
                 # Fallback sem filtro de amostra
-                fallback_sql = (
-                    "SELECT codigo_touro, nome_touro, media_producao_primeiro_parto, total_filhas_primeiro_parto "
-                    "FROM cubo_primeiro_parto_filhas "
-                    "ORDER BY media_producao_primeiro_parto DESC "
-                    "LIMIT 1;"
-                )
-                print(f"↩️ Fallback sem filtro (1º parto): {fallback_sql}")
-                ok2, fixed_sql2, val_msg2 = validate_and_fix(fallback_sql)
-                if ok2:
-                    fallback_sql = fixed_sql2
-                success2, data2, db_message2 = db_executor.execute_query(fallback_sql)
-                if success2:
-                    result_info = {
-                        "message": db_message2,
-                        "query": fallback_sql,
-                        "data": data2,
-                        "analysis": {
-                            "tables_identified": ["cubo_primeiro_parto_filhas"],
-                            "fields_identified": ["codigo_touro", "nome_touro", "media_producao_primeiro_parto", "total_filhas_primeiro_parto"],
-                            "keywords_detected": analysis["detected_keywords"][:5]
-                        }
-                    }
-                    return True, fallback_sql, result_info
-                else:
-                    return False, fallback_sql, f"SQL gerado mas erro na execução: {db_message2}"
-        
-        # Passo 2: Gerar prompt baseado na análise
-        prompt = schema_mapper.generate_sql_prompt(query, analysis)
-        
-        # Passo 3: Chamar LLM para gerar SQL
-        try:
-            response = requests.post(
-                self.ollama_url,
-                json={
-                    "model": self.model_name,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.1,
-                        "num_predict": 500
-                    }
-                },
-                timeout=60
+                fallback=QueryPlan(select + order, label="Fallback sem filtro (1º parto)",
+                                   tables=["cubo_primeiro_parto_filhas"], fields=fields,
+                                   replica=top),
             )
+        
+        # 🆕 Demais rankings ("quais os melhores touros em gordura?")
+        if ranking is not None:
+            return self._ranking_plan(ranking)
+        
+        # 🆕 Agregados ("média da produção vitalícia por raça", "distribuição do número de partos"):
+        # vetorizados sobre as réplicas; agrupar por coluna de outro cubo só com a réplica carregada
+        aggregation = parse_aggregation(query, normalized)
+        if aggregation is not None and (not aggregation.joined or aggregation_available(aggregation)):
+            return self._aggregation_plan(aggregation)
+        
+        return None
+    
+    @staticmethod
+    def _ranking_plan(ranking: RankingQuery) -> QueryPlan:
+        return QueryPlan(
+            ranking_sql(ranking),
+            label=ranking.label,
+            path=ranking.path,
+            tables=[ranking.table],
+            fields=ranking.fields,
+            replica=partial(ranking_rows, ranking),
+        )
+    
+    @staticmethod
+    def _aggregation_plan(aggregation: AggregationQuery) -> QueryPlan:
+        return QueryPlan(
+            aggregation_sql(aggregation),
+            label=aggregation.label,
+            tables=[aggregation.table],
+            fields=aggregation.fields,
+            replica=partial(aggregation_rows, aggregation),
+        )
+    
+    def _plan_with_llm(self, query: str, analysis: Dict[str, Any]) -> Tuple[Optional[QueryPlan], str]:
+        """Gera a SQL com a LLM a partir do prompt montado pela análise"""
+        # Gerar prompt baseado na análise
+        prompt = schema_mapper.generate_sql_prompt(query, analysis, few_shot_k=Config.FEW_SHOT_K)
+        
+        # Chamar LLM para gerar SQL
+        import requests  # 🆕 adiado: só perguntas que vão para a LLM pagam o import
+        started = self._llm_started()
+        status = "error"
+        try:
+            response = requests.post(self.ollama_url, json=self._llm_request(prompt, stream=False), timeout=60)
             
             if response.status_code != 200:
-                return False, f"Erro Ollama: {response.status_code}", None
-            
-            sql_query = response.json()["response"]
-            sql_query = self.clean_sql_response(sql_query)
+                status = "http_error"
+                return None, f"Erro Ollama: {response.status_code}"
             
-            print(f"📊 SQL Gerado: {sql_query}")
+            raw_response = response.json()["response"]
+            status = "ok"
             
-            # Validação e normalização avançada
-            ok, fixed_sql, val_msg = validate_and_fix(sql_query)
-            if not ok:
-                # Ainda assim tenta executar a melhor versão que temos
-                print(f"⚠️ Validação avisou: {val_msg}")
-            else:
-                sql_query = fixed_sql
+        except requests.exceptions.Timeout:
+            status = "timeout"
+            return None, "Timeout: Ollama não respondeu a tempo"
+        except Exception as e:
+            return None, f"Erro: {str(e)}"
+        finally:
+            self._llm_finished(started, status)
+        
+        return self._llm_plan(raw_response, analysis), ""
+    
+    @staticmethod
+    def _llm_started() -> float:
+        metrics.LLM_IN_FLIGHT.inc()
+        return time.perf_counter()
+    
+    @staticmethod
+    def _llm_finished(started: float, status: str):
+        metrics.LLM_IN_FLIGHT.dec()
+        metrics.LLM_REQUESTS.labels(status).inc()
+        elapsed = time.perf_counter() - started
+        metrics.LLM_SECONDS.observe(elapsed)
+        _STAGE["llm"].observe(elapsed)
+    
+    def _llm_request(self, prompt: str, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": Config.OLLAMA_KEEP_ALIVE,  # 🆕 mantém o modelo carregado entre perguntas
+            "options": {
+                "temperature": 0.1,
+                "num_predict": 500
+            }
+        }
+    
+    def _llm_plan(self, raw_response: str, analysis: Dict[str, Any]) -> QueryPlan:
+        sql_query = self.clean_sql_response(raw_response)
+        print(f"📊 SQL Gerado: {sql_query}")
+        return QueryPlan(
+            sql_query,
+            source="llm",
+            tables=list(analysis["tables"]),
+            fields=list(analysis["fields"]),
+            check_syntax=True,
+        )
+    
+    def execute_plan(self, plan: QueryPlan, analysis: Dict[str, Any],
+                     page_size: Optional[int] = None) -> Tuple[bool, str, Any]:
+        """Valida, executa e monta o resultado de um plano (com paginação opcional)"""
+        sql_query, error = self._plan_sql(plan)
+        if error:
+            return False, sql_query, error
+        
+        keywords = analysis["detected_keywords"][:5]
+        started = time.perf_counter()
+        # 🆕 Atalhos com réplica em memória carregada não vão ao banco (páginas por cursor sempre vão)
+        data = plan.replica() if plan.replica is not None and not page_size else None
+        if data is not None:
+            success, db_message, page = True, self._replica_message(data), None
+        elif page_size:
+            success, data, db_message, page = self._execute_page(sql_query, page_size, source=plan.source)
+        else:
+            success, data, db_message = db_executor.execute_query(sql_query, source=plan.source)
+            page = None
+        _STAGE["execution"].observe_since(started)
+        
+        if success and (data or plan.fallback is None):
+            return True, sql_query, self._result_info(db_message, sql_query, data, plan.tables, plan.fields, keywords, page)
+        if plan.fallback is not None:
+            print(f"↩️ {plan.fallback.label}: {plan.fallback.sql}")
+            metrics.FALLBACKS.labels(self._plan_path(plan)).inc()
+            return self.execute_plan(plan.fallback, analysis, page_size)
+        return False, sql_query, f"SQL gerado mas erro na execução: {db_message}"
+    
+    @staticmethod
+    def _replica_message(data: List[Dict[str, Any]]) -> str:
+        if not data:
+            return "Réplica em memória: consulta não retornou dados"
+        return f"Réplica em memória: {len(data)} registros encontrados"
+    
+    def _plan_sql(self, plan: QueryPlan) -> Tuple[str, str]:
+        """Validação/normalização da SQL do plano: (SQL a executar, erro)"""
+        started = time.perf_counter()
+        sql_query = plan.sql
+        
+        # Validação e normalização
+        ok, fixed_sql, val_msg = validate_and_fix(sql_query)
+        if not ok:
+            # Ainda assim tenta executar a melhor versão que temos
+            print(f"⚠️ Validação avisou: {val_msg}")
+        else:
+            sql_query = fixed_sql
+            if plan.source == "llm":
                 print(f"🧹 SQL Normalizada: {sql_query}")
-            
-            # Validação básica final
-            is_valid = self._validate_sql_syntax(sql_query)
-            
-            if is_valid:
-                # 🆕 Executa a query no PostgreSQL
-                success, data, db_message = db_executor.execute_query(sql_query)
-                
-                if success:
-                    result_info = {
-                        "message": db_message,
-                        "query": sql_query,
-                        "data": data,
-                        "analysis": {
-                            "tables_identified": list(analysis["tables"]),
-                            "fields_identified": list(analysis["fields"]),
-                            "keywords_detected": analysis["detected_keywords"][:5]
-                        }
-                    }
-                    return True, sql_query, result_info
-                else:
-                    return False, sql_query, f"SQL gerado mas erro na execução: {db_message}"
-            else:
-                return False, sql_query, "SQL gerado possui sintaxe inválida"
-            
+        
+        # Validação básica final
+        error = ""
+        if plan.check_syntax and not self._validate_sql_syntax(sql_query):
+            error = "SQL gerado possui sintaxe inválida"
+        _STAGE["validation"].observe_since(started)
+        metrics.VALIDATION.labels("syntax_error" if error else "ok" if ok else "warning").inc()
+        return sql_query, error
+    
+    def next_page(self, cursor: str) -> Tuple[bool, str, Any]:
+        """Próxima página de uma paginação por chave a partir do cursor assinado"""
+        try:
+            state = decode_cursor(cursor)
+        except ValueError as e:
+            return False, f"Cursor inválido: {e}", None
+        
+        page_size = max(1, min(int(state["page_size"]), Config.MAX_PAGE_SIZE))
+        tables, fields = state["tables"], state["fields"]
+        sql_query = state["sql"]
+        print(f"📄 Próxima página ({state['key']} > {state['last']!r})")
+        success, data, db_message, page = self._execute_page(sql_query, page_size, last=state["last"],
+                                                             source=state.get("source", "direct"))
+        if not success:
+            return False, sql_query, f"SQL gerado mas erro na execução: {db_message}"
+        return True, sql_query, self._result_info(db_message, sql_query, data, tables, fields, [], page)
+    
+    def _execute_page(self, sql_query: str, page_size: int, last: Any = None,
+                      source: str = "direct") -> Tuple[bool, Any, str, Optional[Dict[str, Any]]]:
+        """
+        Executa uma página por chave (WHERE chave > :last ORDER BY chave LIMIT n + 1).
+        A linha extra só indica se há próxima página; consultas não pagináveis rodam inteiras.
+        """
+        ok, page_sql, key = keyset_paginate(sql_query, page_size, after=last is not None)
+        if not ok:
+            print(f"ℹ️ Paginação indisponível: {key}")
+            success, data, db_message = db_executor.execute_query(sql_query, source=source)
+            return success, data, db_message, None
+        
+        success, data, db_message = db_executor.execute_query(page_sql, {"last": last} if last is not None else None,
+                                                              source=source)
+        if not success:
+            return success, data, db_message, None
+        
+        has_more = len(data) > page_size
+        data = data[:page_size]
+        next_cursor = None
+        if has_more and data and data[-1].get(key) is not None:
+            next_cursor = encode_cursor({
+                "sql": sql_query,
+                "key": key,
+                "last": cursor_value(data[-1][key]),
+                "page_size": page_size,
+                "source": source,
+            })
+        page = {"page_size": page_size, "key": key, "has_more": next_cursor is not None, "next_cursor": next_cursor}
+        return True, data, f"Página com {len(data)} registros", page
+    
+    def _result_info(self, message: str, sql_query: str, data: Any, tables: List[str], fields: List[str],
+                     keywords: List[str], page: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        result_info = {
+            "message": message,
+            "query": sql_query,
+            "data": data,
+            "analysis": {
+                "tables_identified": tables,
+                "fields_identified": fields,
+                "keywords_detected": keywords
+            }
+        }
+        if page is not None:
+            result_info["pagination"] = page
+        return result_info
+    
+    # ------------------------------------------------------------------
+    # 🆕 Exportação (/api/export)
+    # ------------------------------------------------------------------
+    
+    def export_plan(self, query: str, client_id: Optional[str] = None) -> Tuple[Optional[QueryPlan], str, str]:
+        """
+        🆕 Plano e SQL validada de uma pergunta, sem executar (exportação em /api/export):
+        mesmo roteamento (atalho ou LLM, na faixa da LLM) e mesmo _plan_sql da resposta JSON.
+        Ao contrário da resposta JSON, SQL recusada pelo validate_and_fix não é executada "mesmo assim"
+        (viraria um COPY).
+        Retorna (plano, SQL, erro). Levanta AdmissionRejected se a faixa da LLM estiver sobrecarregada.
+        """
+        print(f"🔍 Analisando (exportação): '{query}'")
+        normalized = normalize_text(query)
+        analysis = schema_mapper.analyze_query(normalized)
+        plan = self.route_query(query, normalized, analysis)
+        if plan is None:
+            with self._admit(admission.llm, "llm", client_id):
+                plan, error = self._plan_with_llm(query, analysis)
+            if plan is None:
+                return None, "", error
+        sql_query, error = self._plan_sql(plan)
+        # Mesmo resultado que o _plan_sql acabou de obter (validate_and_fix tem cache por texto)
+        ok, _, val_msg = validate_and_fix(plan.sql)
+        if not ok:
+            return plan, sql_query, f"SQL recusada para exportação: {val_msg}"
+        return plan, sql_query, error
+
+    # ------------------------------------------------------------------
+    # 🆕 Pipeline em eventos (SSE)
+    # ------------------------------------------------------------------
+    
+    def stream_events(self, query: str, page_size: Optional[int] = None, cursor: Optional[str] = None,
+                      batch_rows: Optional[int] = None, client_id: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Mesmo pipeline de natural_language_to_sql, entregue etapa por etapa:
+        analysis → route → llm (tokens) → sql → executing → rows (lotes) → done, ou error.
+        Fechar o gerador (cliente desconectou) cancela o restante: aborta o stream do Ollama,
+        não executa a SQL ou fecha o cursor do banco no próximo lote.
+        Faixa sobrecarregada → evento error com status 429 e retry_after.
+        """
+        started = time.perf_counter()
+        batch_rows = batch_rows or Config.STREAM_BATCH_ROWS
+        
+        if cursor:
+            try:
+                state = decode_cursor(cursor)
+            except ValueError as e:
+                yield "error", {"error": f"Cursor inválido: {e}"}
+                return
+            plan = QueryPlan(state["sql"], source=state.get("source", "direct"), label="cursor",
+                             tables=state["tables"], fields=state["fields"])
+            yield "route", {"source": "cursor", "label": f"{state['key']} > {state['last']!r}"}
+            page_size = max(1, min(int(state["page_size"]), Config.MAX_PAGE_SIZE))
+            try:
+                with self._admit(admission.fast, "cursor", client_id):
+                    success = yield from self._stream_plan(plan, page_size, batch_rows, started, last=state["last"])
+            except AdmissionRejected as e:
+                yield "error", self._rejection(e)
+                return
+            self._count_request("cursor", success)
+            return
+        
+        print(f"🔍 Analisando (stream): '{query}'")
+        normalized = normalize_text(query)
+        analysis = schema_mapper.analyze_query(normalized)
+        _STAGE["analysis"].observe_since(started)
+        yield "analysis", {
+            "tables_identified": sorted(analysis["tables"]),
+            "fields_identified": sorted(analysis["fields"]),
+            "keywords_detected": analysis["detected_keywords"][:5],
+        }
+        
+        plan = self.route_query(query, normalized, analysis)
+        if plan is not None:
+            lane, path = admission.fast, self._plan_path(plan)
+            yield "route", {"source": "shortcut", "label": plan.label}
+        else:
+            lane, path = admission.llm, "llm"
+            yield "route", {"source": "llm", "label": self.model_name}
+        
+        try:
+            with self._admit(lane, path, client_id):
+                if plan is None:
+                    plan, error = yield from self._stream_llm(query, analysis)
+                    if plan is None:
+                        self._count_request("llm", False)
+                        yield "error", {"error": error}
+                        return
+                success = yield from self._stream_plan(plan, page_size, batch_rows, started)
+        except AdmissionRejected as e:
+            yield "error", self._rejection(e)
+            return
+        self._count_request(self._plan_path(plan), success)
+    
+    @staticmethod
+    def _rejection(error: AdmissionRejected) -> Dict[str, Any]:
+        return {"error": str(error), "status": 429, "lane": error.lane, "retry_after": error.retry_after}
+    
+    def _stream_llm(self, query: str, analysis: Dict[str, Any]):
+        """Gera a SQL com o Ollama em modo stream, repassando os tokens; retorna (plano, erro)"""
+        import requests
+        prompt = schema_mapper.generate_sql_prompt(query, analysis, few_shot_k=Config.FEW_SHOT_K)
+        started = self._llm_started()
+        status = "error"
+        try:
+            response = requests.post(self.ollama_url, json=self._llm_request(prompt, stream=True),
+                                     stream=True, timeout=60)
         except requests.exceptions.Timeout:
-            return False, "Timeout: Ollama não respondeu a tempo", None
+            self._llm_finished(started, "timeout")
+            return None, "Timeout: Ollama não respondeu a tempo"
+        except Exception as e:
+            self._llm_finished(started, status)
+            return None, f"Erro: {str(e)}"
+        
+        parts = []
+        try:
+            if response.status_code != 200:
+                status = "http_error"
+                return None, f"Erro Ollama: {response.status_code}"
+            # Uma linha JSON por trecho gerado ({"response": "...", "done": false})
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    parts.append(token)
+                    yield "llm", {"token": token}
+                if chunk.get("done"):
+                    break
+            status = "ok"
+        except GeneratorExit:
+            status = "cancelled"
+            raise
+        except requests.exceptions.Timeout:
+            status = "timeout"
+            return None, "Timeout: Ollama não respondeu a tempo"
+        except Exception as e:
+            return None, f"Erro: {str(e)}"
+        finally:
+            # Em GeneratorExit também: fechar a conexão faz o Ollama parar de gerar
+            response.close()
+            self._llm_finished(started, status)
+        return self._llm_plan("".join(parts), analysis), ""
+    
+    def _stream_plan(self, plan: QueryPlan, page_size: Optional[int], batch_rows: int, started: float,
+                     last: Any = None):
+        """Eventos sql → executing → rows → done de um plano (com fallback se não houver linhas); retorna o sucesso"""
+        sql_query, error = self._plan_sql(plan)
+        if error:
+            yield "error", {"error": error, "sql": sql_query}
+            return False
+        yield "sql", {"sql": sql_query, "source": plan.source, "label": plan.label,
+                      "tables": sorted(plan.tables), "fields": sorted(plan.fields)}
+        
+        ok, total, page, message = yield from self._stream_rows(sql_query, plan, page_size, batch_rows, last)
+        if ok and (total or plan.fallback is None):
+            done = {"message": message, "rows": total,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+            if page is not None:
+                done["pagination"] = page
+            yield "done", done
+            return True
+        if plan.fallback is not None and not total:
+            print(f"↩️ {plan.fallback.label}: {plan.fallback.sql}")
+            metrics.FALLBACKS.labels(self._plan_path(plan)).inc()
+            yield "route", {"source": plan.fallback.source, "label": plan.fallback.label}
+            return (yield from self._stream_plan(plan.fallback, page_size, batch_rows, started))
+        yield "error", {"error": f"SQL gerado mas erro na execução: {message}", "sql": sql_query}
+        return False
+    
+    def _stream_rows(self, sql_query: str, plan: QueryPlan, page_size: Optional[int], batch_rows: int,
+                     last: Any = None):
+        """Executa e repassa as linhas em lotes; retorna (sucesso, total, paginação, mensagem)"""
+        yield "executing", {"sql": sql_query}
+        data = plan.replica() if plan.replica is not None and not page_size else None
+        if data is not None:
+            for offset in range(0, len(data), batch_rows):
+                yield "rows", {"offset": offset, "rows": data[offset:offset + batch_rows]}
+            return True, len(data), None, self._replica_message(data)
+        if page_size:
+            # Página limitada a page_size linhas: executa inteira (precisa da última chave para o cursor)
+            success, data, db_message, page = self._execute_page(sql_query, page_size, last=last,
+                                                                 source=plan.source)
+            if not success:
+                return False, 0, None, db_message
+            for offset in range(0, len(data), batch_rows):
+                yield "rows", {"offset": offset, "rows": data[offset:offset + batch_rows]}
+            return True, len(data), page, db_message
+        
+        success, batches, db_message = db_executor.stream_query(sql_query, source=plan.source, batch_rows=batch_rows)
+        if not success:
+            return False, 0, None, db_message
+        total = 0
+        try:
+            for batch in batches:
+                yield "rows", {"offset": total, "rows": batch}
+                total += len(batch)
         except Exception as e:
-            return False, f"Erro: {str(e)}", None
+            print(f"❌ Erro no streaming: {e}")
+            return False, total, None, f"Erro na execução SQL: {str(e)}"
+        finally:
+            batches.close()
+        if not total:
+            return True, 0, None, "Query executada com sucesso, mas não retornou dados"
+        return True, total, None, f"Query executada com sucesso: {total} registros encontrados"
     
     def clean_sql_response(self, sql_response: str) -> str:
         """Limpa a resposta do LLM para extrair apenas o SQL"""
@@ -517,5 +849,5 @@ class NLToSQLPipeline:
         
         return True
 
-# Instância global do pipeline
-nl_to_sql_pipeline = NLToSQLPipeline()
\ No newline at end of file
+# Instância global do pipeline (inicializada no primeiro uso ou pelo warm-up do app)
+nl_to_sql_pipeline = LazySingleton("nl_to_sql_pipeline", NLToSQLPipeline)
\ No newline at end of file
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Cursores opacos para a paginação por chave (keyset) do /api/nl-to-sql.
+- O cursor carrega só a SQL base já validada, a chave, o último valor visto, o tamanho da página e a origem;
+  tabelas e campos da análise são extraídos de novo da SQL na decodificação
+- Assinado com HMAC-SHA256: o cliente não consegue alterar a SQL nem a chave
+- Páginas seguintes não passam de novo pelo roteamento/LLM, só reexecutam a SQL reescrita
+"""
+from __future__ import annotations
+import base64
+import hashlib
+import hmac
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+
+from config import Config
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # pragma: no cover - sqlglot é opcional
+    sqlglot = None
+
+_SECRET = (Config.CURSOR_SECRET or os.urandom(32).hex()).encode("utf-8")
+_SIGNATURE_BYTES = 16
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(body: bytes) -> bytes:
+    return hmac.new(_SECRET, body, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+
+
+def cursor_value(value: Any) -> Any:
+    """Converte o valor da chave para algo serializável em JSON"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+@lru_cache(maxsize=256)
+def _analysis(sql: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Tabelas e colunas projetadas pela SQL base (vazias se não der para extrair)"""
+    if sqlglot is None:
+        return (), ()
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except Exception:
+        return (), ()
+    tables = sorted({table.name for table in tree.find_all(exp.Table) if table.name})
+    fields = [column.alias_or_name for column in getattr(tree, "selects", [])
+              if column.alias_or_name and column.alias_or_name != "*"]
+    return tuple(tables), tuple(fields)
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """Serializa e assina o estado da próxima página"""
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return f"{_b64encode(body)}.{_b64encode(_sign(body))}"
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """Valida a assinatura e devolve o estado com tabelas e campos da SQL; ValueError se o cursor for inválido"""
+    try:
+        body_part, signature_part = token.split(".", 1)
+        body = _b64decode(body_part)
+        signature = _b64decode(signature_part)
+    except Exception:
+        raise ValueError("cursor malformado")
+    if not hmac.compare_digest(signature, _sign(body)):
+        raise ValueError("assinatura do cursor inválida")
+    payload = json.loads(body)
+    if not isinstance(payload, dict) or not {"sql", "key", "last", "page_size"} <= payload.keys():
+        raise ValueError("cursor incompleto")
+    tables, fields = _analysis(payload["sql"])
+    payload["tables"], payload["fields"] = list(tables), list(fields)
+    return payload
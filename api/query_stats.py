@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Fingerprint das queries executadas e agregados por formato de pergunta.
+- fingerprint(): normaliza a SQL pela árvore do sqlglot trocando literais (códigos FSC, nomes, números) por ?
+- QueryStats: tabela em memória limitada (LRU) com contagem, latência total/média/p95, linhas e origem
+- Mostra quais formatos dominam a carga e quais merecem um atalho ou um índice (/api/query-stats)
+"""
+from __future__ import annotations
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # pragma: no cover - sqlglot é opcional
+    sqlglot = None
+    exp = None
+
+# Máscara barata de literais (chave do cache e fallback sem sqlglot)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])\d+(?:\.\d+)?\b")
+_SPACES_RE = re.compile(r"\s+")
+_LATENCY_SAMPLES = 256  # janela por fingerprint usada no p95
+
+
+def _replace_literal(node):
+    if isinstance(node, exp.Literal) or (isinstance(node, exp.Neg) and isinstance(node.this, (exp.Literal, exp.Placeholder))):
+        return exp.Placeholder()
+    return node
+
+
+def _mask_literals(sql: str) -> str:
+    return _SPACES_RE.sub(" ", _NUMBER_RE.sub("?", _STRING_RE.sub("?", sql))).strip().rstrip(";")
+
+
+@lru_cache(maxsize=2048)
+def _normalize_shape(shape: str) -> Tuple[str, str]:
+    normalized = shape
+    if sqlglot is not None:
+        try:
+            tree = sqlglot.parse_one(shape, read="postgres").transform(_replace_literal)
+            # IN (?, ?, ?) e IN (?) são o mesmo formato
+            for node in tree.find_all(exp.In):
+                if node.expressions:
+                    node.set("expressions", [exp.Placeholder()])
+            normalized = tree.sql(dialect="postgres")
+        except Exception:
+            normalized = shape
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest(), normalized
+
+
+def fingerprint(sql: str) -> Tuple[str, str]:
+    """
+    Retorna (id curto, SQL normalizada) do formato da query, independente dos literais.
+    Os literais são mascarados antes por regex, então o parse do sqlglot só roda uma vez por formato.
+    """
+    return _normalize_shape(_mask_literals(sql))
+
+
+class _Entry:
+    __slots__ = ("sql", "example", "count", "errors", "total_ms", "max_ms", "rows", "sources", "latencies")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.example = ""
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.sources: Counter = Counter()
+        self.latencies: deque = deque(maxlen=_LATENCY_SAMPLES)
+
+
+class QueryStats:
+    """Agregados por fingerprint, limitados a max_fingerprints (descarta o menos recente)"""
+
+    def __init__(self, max_fingerprints: int = 500):
+        self.max_fingerprints = max_fingerprints
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def record(self, sql: str, elapsed_s: float, rows: int = 0, source: str = "direct", ok: bool = True):
+        """Registra uma execução (chamado pelo DatabaseExecutor)"""
+        key, normalized = fingerprint(sql)
+        elapsed_ms = elapsed_s * 1000.0
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(normalized)
+                if len(self._entries) > self.max_fingerprints:
+                    self._entries.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._entries.move_to_end(key)
+            entry.example = sql
+            entry.count += 1
+            entry.errors += 0 if ok else 1
+            entry.total_ms += elapsed_ms
+            entry.max_ms = max(entry.max_ms, elapsed_ms)
+            entry.rows += rows
+            entry.sources[source] += 1
+            entry.latencies.append(elapsed_ms)
+
+    def snapshot(self, limit: Optional[int] = 50, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+        """Fingerprints ordenados por total_ms, count, mean_ms, p95_ms ou rows (decrescente)"""
+        with self._lock:
+            items = [(key, entry, sorted(entry.latencies)) for key, entry in self._entries.items()]
+            result = [
+                {
+                    "fingerprint": key,
+                    "sql": entry.sql,
+                    "example": entry.example,
+                    "count": entry.count,
+                    "errors": entry.errors,
+                    "total_ms": round(entry.total_ms, 3),
+                    "mean_ms": round(entry.total_ms / entry.count, 3),
+                    "p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+                    "max_ms": round(entry.max_ms, 3),
+                    "rows": entry.rows,
+                    "sources": dict(entry.sources),
+                }
+                for key, entry, latencies in items
+            ]
+        if order_by not in ("total_ms", "count", "mean_ms", "p95_ms", "rows"):
+            order_by = "total_ms"
+        result.sort(key=lambda item: item[order_by], reverse=True)
+        return result[:limit] if limit else result
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Instância global
+query_stats = QueryStats(Config.QUERY_STATS_MAX_FINGERPRINTS)
+
+
+if __name__ == "__main__":
+    import time
+
+    queries = [f"SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = 'FSC{i:05d}' LIMIT 10;"
+               for i in range(2000)]
+    start = time.perf_counter()
+    for sql in queries:
+        query_stats.record(sql, 0.002, rows=10, source="shortcut")
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ {len(queries)} registros em {elapsed * 1000:.1f} ms "
+          f"({elapsed / len(queries) * 1e6:.0f} µs cada, um parse por formato)")
+    for item in query_stats.snapshot(limit=3):
+        print(f"📈 {item['fingerprint']} x{item['count']} p95={item['p95_ms']}ms: {item['sql']}")
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Rankings de touros nos cubos de produção: top N por métrica (qualquer N) e posição de um touro.
+- parse_ranking() reconhece a intenção na pergunta normalizada: cubo (filhas, descendentes ou
+  primeiro parto), métrica, filtro booleano (com/sem amostra significativa, elite...), N e touro
+- Com a réplica em memória (cube_replica): o top N são as N primeiras posições do array já ordenado
+  da partição (O(N), sem sort) e a posição de um touro sai por busca binária; os arrays são
+  recalculados junto com a réplica quando a versão do cubo muda
+- Sem réplica, a mesma pergunta vira a SQL equivalente no Postgres (ORDER BY ... LIMIT N / RANK() OVER)
+- Nos dois caminhos: touros com a métrica NULL ficam fora do ranking e empates dividem a posição (RANK())
+"""
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import Config
+from cube_replica import cube_replicas
+from text_normalizer import TermMatcher, normalize_terms, normalize_text
+
+# Métricas em ordem de prioridade (a última é a padrão) e filtros como (frase, valor): negações primeiro
+RANKING_CUBES: Dict[str, Dict[str, Any]] = {
+    "cubo_producao_touro_filhas": {
+        "count": "total_filhas",
+        "metrics": [
+            ("media_producao_vitalicia", ["vitalícia"]),
+            ("media_gordura_305d", ["gordura"]),
+            ("media_proteina_305d", ["proteína"]),
+            ("percentual_filhas_com_producao", ["percentual", "filhas produtivas"]),
+            ("total_filhas", ["mais filhas", "número de filhas", "quantidade de filhas"]),
+            ("media_leite_305d", ["leite", "305", "produção"]),
+        ],
+        "filters": {
+            "tem_amostra_muito_significativa": [("sem amostra muito significativa", False),
+                                                ("amostra muito significativa", True)],
+            "tem_amostra_significativa": [("sem amostra significativa", False),
+                                          ("amostra não significativa", False),
+                                          ("amostra significativa", True), ("amostra representativa", True)],
+            "producao_elite": [("não elite", False), ("elite", True)],
+        },
+    },
+    "cubo_producao_touro_descendentes": {
+        "count": "total_descendentes",
+        "metrics": [
+            ("media_producao_vitalicia", ["vitalícia"]),
+            ("media_netas_305d", ["média das netas", "produção das netas"]),
+            ("percentual_com_producao", ["percentual"]),
+            ("total_descendentes", ["mais descendentes", "número de descendentes", "quantidade de descendentes"]),
+            ("media_leite_305d", ["leite", "305", "produção"]),
+        ],
+        "filters": {
+            "tem_amostra_significativa": [("sem amostra significativa", False),
+                                          ("amostra não significativa", False),
+                                          ("amostra significativa", True), ("amostra representativa", True)],
+            "tem_netas": [("sem netas", False), ("com netas", True), ("tem netas", True)],
+            "producao_elite": [("não elite", False), ("elite", True)],
+        },
+    },
+    "cubo_primeiro_parto_filhas": {
+        "count": "total_filhas_primeiro_parto",
+        "metrics": [
+            ("media_gordura_primeiro_parto", ["gordura"]),
+            ("media_proteina_primeiro_parto", ["proteína"]),
+            ("total_filhas_primeiro_parto", ["mais filhas", "número de filhas", "quantidade de filhas"]),
+            ("media_producao_primeiro_parto", ["leite", "produção"]),
+        ],
+        "filters": {
+            "amostra_representativa": [("sem amostra representativa", False),
+                                       ("amostra não representativa", False),
+                                       ("amostra representativa", True), ("amostra significativa", True)],
+            "alta_producao_primeiro_parto": [("alta produção", True)],
+        },
+    },
+}
+
+_INTENT_TERMS = TermMatcher({
+    "touro": ["touro", "reprodutor"],
+    "ranking": ["top", "ranking", "melhores", "maiores", "maior", "melhor", "líderes"],
+    "posicao": ["posição", "colocação", "lugar", "classificação"],
+    "descendentes": ["descendente", "netas"],
+    "primeiro_parto": ["primeiro parto", "1º parto", "primeira lactação"],
+})
+_METRIC_TERMS = {table: TermMatcher({metric: terms for metric, terms in cube["metrics"]})
+                 for table, cube in RANKING_CUBES.items()}
+_FILTER_PHRASES = {
+    table: [(name, tuple(normalize_terms(phrase)), flag)
+            for name, phrases in cube["filters"].items() for phrase, flag in phrases]
+    for table, cube in RANKING_CUBES.items()
+}
+
+_NUMBER_WORDS = {"dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5, "seis": 6, "sete": 7, "oito": 8,
+                 "nove": 9, "dez": 10, "quinze": 15, "vinte": 20, "trinta": 30, "cinquenta": 50, "cem": 100}
+_NUMBER = r"(\d+|" + "|".join(_NUMBER_WORDS) + r")"
+_TOP_N_RE = re.compile(
+    rf"\btop\s*{_NUMBER}\b"
+    rf"|\b{_NUMBER}\s+(?:melhores|maiores|primeiros|principais|touros|reprodutores)\b"
+    rf"|\b(?:melhores|maiores|primeiros|principais)\s+{_NUMBER}\b"
+)
+
+
+class RankingQuery:
+    """Ranking pedido: top N (bull None) ou posição de um touro, numa partição opcional por filtro"""
+    __slots__ = ("table", "metric", "limit", "where", "flag", "bull_column", "bull", "explicit")
+
+    def __init__(self, table: str, metric: str, limit: int = 1, where: Optional[str] = None, flag: bool = True,
+                 bull_column: Optional[str] = None, bull: Optional[str] = None, explicit: bool = False):
+        self.table = table
+        self.metric = metric
+        self.limit = limit
+        self.where = where
+        self.flag = flag
+        self.bull_column = bull_column
+        self.bull = bull
+        self.explicit = explicit      # N ou touro na pergunta: tem prioridade sobre os atalhos fixos
+
+    @property
+    def fields(self) -> List[str]:
+        count = RANKING_CUBES[self.table]["count"]
+        fields = ["posicao"] + (["total_ranking"] if self.bull else [])
+        fields += ["codigo_touro", "nome_touro", self.metric]
+        return fields + ([count] if count != self.metric else [])
+
+    @property
+    def label(self) -> str:
+        partition = f", {self.where} = {str(self.flag).lower()}" if self.where else ""
+        subject = f"posição de {self.bull}" if self.bull else f"top {self.limit}"
+        return f"ranking {self.table} - {subject} por {self.metric}{partition}"
+
+    @property
+    def path(self) -> str:
+        """Rótulo fixo nas métricas (sem o N nem o código do touro, que vêm do usuário)"""
+        return f"ranking {self.table} {self.metric}"
+
+
+def _find_phrase(stems: Sequence[str], phrase: Tuple[str, ...]) -> bool:
+    size = len(phrase)
+    return any(tuple(stems[i:i + size]) == phrase for i in range(len(stems) - size + 1))
+
+
+def _top_n(folded: str) -> Optional[int]:
+    match = _TOP_N_RE.search(folded)
+    if match is None:
+        return None
+    token = next(group for group in match.groups() if group)
+    return int(token) if token.isdigit() else _NUMBER_WORDS[token]
+
+
+def parse_ranking(query: str, normalized=None) -> Optional[RankingQuery]:
+    """Intenção de ranking na pergunta (None se não for uma pergunta de ranking de touros)"""
+    normalized = normalize_text(normalized if normalized is not None else query)
+    terms = _INTENT_TERMS.match(normalized)
+    if "touro" not in terms:
+        return None
+    codes = re.findall(r"FSC\d+", query.upper())
+    names = re.findall(r"\btouro(\d+)\b", normalized.folded)
+    bull_column, bull = (("codigo_touro", codes[0]) if codes else
+                         ("nome_touro", f"Touro{names[0]}") if names else (None, None))
+    limit = _top_n(normalized.folded)
+    if bull is not None:
+        # Posição de um touro: "posição do touro FSC00611 no ranking de gordura"
+        if not terms & {"posicao"} and not ("ranking" in terms and limit is None):
+            return None
+    elif limit is None and "ranking" not in terms:
+        return None
+
+    table = ("cubo_primeiro_parto_filhas" if "primeiro_parto" in terms else
+             "cubo_producao_touro_descendentes" if "descendentes" in terms else "cubo_producao_touro_filhas")
+    cube = RANKING_CUBES[table]
+    found = _METRIC_TERMS[table].match(normalized)
+    metric = next((name for name, _ in cube["metrics"] if name in found), cube["metrics"][-1][0])
+
+    matched: Dict[str, bool] = {}
+    for name, phrase, flag in _FILTER_PHRASES[table]:
+        if name not in matched and _find_phrase(normalized.stems, phrase):
+            matched[name] = flag
+    if len(matched) > 1:
+        return None     # combinação de filtros não pré-calculada: fica com a LLM
+    where, flag = next(iter(matched.items())) if matched else (None, True)
+
+    if bull is not None:
+        return RankingQuery(table, metric, 1, where, flag, bull_column, bull, explicit=True)
+    if limit is None:
+        # "quais os melhores touros" → 10; "qual o touro com maior..." → 1
+        limit = 10 if "touros" in normalized.tokens or "reprodutores" in normalized.tokens else 1
+    limit = max(1, min(limit, Config.RANKING_MAX_N))
+    return RankingQuery(table, metric, limit, where, flag, explicit=_top_n(normalized.folded) is not None)
+
+
+def _partition_sql(ranking: RankingQuery) -> str:
+    condition = f"{ranking.metric} IS NOT NULL"
+    if ranking.where:
+        condition += (f" AND {ranking.where} = true" if ranking.flag else
+                      f" AND ({ranking.where} = false OR {ranking.where} IS NULL)")
+    return condition
+
+
+def ranking_sql(ranking: RankingQuery) -> str:
+    """SQL equivalente no Postgres (mesmas colunas e mesma regra de posição)"""
+    metric = ranking.metric
+    columns = ", ".join(name for name in ranking.fields if name not in ("posicao", "total_ranking"))
+    if ranking.bull is None:
+        return (
+            f"SELECT RANK() OVER (ORDER BY {metric} DESC) AS posicao, {columns} "
+            f"FROM {ranking.table} WHERE {_partition_sql(ranking)} "
+            f"ORDER BY {metric} DESC LIMIT {ranking.limit};"
+        )
+    return (
+        f"SELECT posicao, total_ranking, {columns} FROM ("
+        f"SELECT RANK() OVER (ORDER BY {metric} DESC) AS posicao, COUNT(*) OVER () AS total_ranking, {columns} "
+        f"FROM {ranking.table} WHERE {_partition_sql(ranking)}"
+        f") ranking WHERE {ranking.bull_column} = '{ranking.bull}' ORDER BY posicao LIMIT 1;"
+    )
+
+
+def ranking_rows(ranking: RankingQuery) -> Optional[List[Dict[str, Any]]]:
+    """Resposta pela réplica em memória; None sem réplica da tabela (o plano vai ao banco)"""
+    replica = cube_replicas.get(ranking.table)
+    partition = replica.ranking(ranking.metric, ranking.where, ranking.flag) if replica is not None else None
+    fields = [name for name in ranking.fields if name not in ("posicao", "total_ranking")]
+    if partition is None or not all(name in replica.columns for name in fields):
+        return None
+    order, nulls = partition
+
+    if ranking.bull is None:
+        positions = order[nulls:nulls + ranking.limit].tolist()
+        values = replica.columns[ranking.metric][positions].tolist()
+        rows, rank = [], 0
+        for i, row in enumerate(replica.materialize(positions, fields)):
+            if i == 0 or values[i] != values[i - 1]:
+                rank = i + 1
+            rows.append({"posicao": rank, **row})
+        return rows
+
+    index = replica.indexes.get(ranking.bull_column)
+    if index is None:
+        return None
+    candidates = index.get(ranking.bull, ())
+    candidates = candidates if isinstance(candidates, list) else [candidates] if candidates != () else []
+    ranked = [(rank, position) for position in candidates
+              if (rank := replica.rank(ranking.metric, position, ranking.where, ranking.flag)) is not None]
+    if not ranked:
+        return []
+    rank, position = min(ranked)
+    return [{"posicao": rank, "total_ranking": len(order) - nulls, **replica.materialize([position], fields)[0]}]
+
+
+if __name__ == "__main__":
+    # Benchmark: rankings pela réplica x ORDER BY / RANK() no Postgres
+    import time
+    from sqlalchemy import text
+    from config import get_engine
+    from database_executor import db_executor
+
+    if not db_executor.connection_status:
+        print("❌ Banco indisponível")
+        raise SystemExit(1)
+    cube_replicas.refresh(tables=list(RANKING_CUBES))
+    questions = [
+        "top 10 touros por gordura com amostra significativa",
+        "top 100 touros em produção de leite no primeiro parto",
+        "quais os 20 melhores touros por média das netas",
+        "qual a posição do touro FSC00611 no ranking de proteína",
+        "posição do touro FSC00611 no ranking do primeiro parto",
+    ]
+    for question in questions:
+        ranking = parse_ranking(question)
+        n = 1000
+        started = time.perf_counter()
+        for _ in range(n):
+            rows = ranking_rows(ranking)
+        replica_us = (time.perf_counter() - started) / n * 1e6
+        with get_engine().connect() as conn:
+            started = time.perf_counter()
+            for _ in range(20):
+                database_rows = conn.execute(text(ranking_sql(ranking))).fetchall()
+            database_us = (time.perf_counter() - started) / 20 * 1e6
+        same = [r["posicao"] for r in rows] == [r[0] for r in database_rows]
+        print(f"⏱️ {ranking.label[:70]:70s} réplica {replica_us:8.1f} µs  Postgres {database_us:9.1f} µs"
+              f"  {'✅' if same else '❌'}")
@@ -1,8 +1,26 @@
+import copy
 import json
 import re
+import threading
 from typing import Dict, List, Any, Optional
 from pathlib import Path
 from database_schema_loader import db_schema_loader
+from text_normalizer import TrigramIndex, normalize_terms, normalize_text
+from example_index import ExampleIndex
+from column_stats import column_stats
+from config import Config, get_engine
+from lazy import LazySingleton
+
+# Tabelas e colunas apresentadas ao LLM no prompt compacto
+PROMPT_TABLE_COLUMNS = {
+    "filhas_touro": ["codigo_touro", "nome_touro", "codigo_filha", "nome_filha"],
+    "cubo_genealogia": ["animal_codigo", "animal_nome", "pai_codigo", "mae_codigo"],
+    "eventos_vaca": ["animal_codigo", "tipo_evento", "data_evento"],
+    "cubo_resumo_vaca": ["codigo_bovino", "nome_vaca", "lactacoes_encerradas", "numero_partos", "producao_vitalicia_leite"],
+    "cubo_producao_touro_filhas": ["codigo_touro", "nome_touro", "media_leite_305d", "total_filhas", "tem_amostra_significativa"],
+    "cubo_producao_touro_descendentes": ["codigo_touro", "nome_touro", "media_leite_305d", "total_descendentes", "tem_amostra_significativa"],
+    "cubo_primeiro_parto_filhas": ["codigo_touro", "nome_touro", "media_producao_primeiro_parto", "total_filhas_primeiro_parto", "amostra_representativa"],
+}
 
 class SchemaMapper:
     def __init__(self, schema_json_path: str = "schema_descriptions.json"):
@@ -11,11 +29,60 @@ class SchemaMapper:
         self.keyword_mappings = {}
         self.use_backup = False
         self.dicts_data = {}  # 🆕 Para os dicionários
+        self.keyword_index = TrigramIndex()  # Correção de erros de digitação sobre o vocabulário
+        self.schema_refreshes = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
         
         # Carrega schema e dicionários
         self.load_schema()
         self.load_dictionaries()  # 🆕 Carrega dicionários
+        db_schema_loader.merge_descriptions(self.dicts_data)
         self.build_keyword_mappings()
+        column_stats.update(db_schema_loader.load_column_stats(get_engine(), Config.COLUMN_STATS_SOURCE))
+        self.example_index = ExampleIndex.from_sources(self.dicts_data, self.schema_json_path)
+    
+    def refresh_schema(self) -> bool:
+        """
+        🆕 Catálogo do banco mudou (db_schema_loader.refresh): refaz os mapeamentos de palavras-chave,
+        as estatísticas das colunas e o índice de exemplos. Tudo é montado numa cópia e trocado no fim
+        (requisições em andamento seguem com os índices antigos)
+        """
+        if not db_schema_loader.refresh():
+            return False
+        staging = copy.copy(self)
+        staging.keyword_mappings = {}
+        staging.build_keyword_mappings()
+        column_stats.update(db_schema_loader.load_column_stats(get_engine(), Config.COLUMN_STATS_SOURCE))
+        example_index = ExampleIndex.from_sources(self.dicts_data, self.schema_json_path)
+        self.keyword_mappings, self.keyword_index = staging.keyword_mappings, staging.keyword_index
+        self.example_index = example_index
+        self.schema_refreshes += 1
+        print(f"♻️ Mapeamentos refeitos: {len(self.keyword_mappings)} palavras-chave")
+        return True
+    
+    def start_refresh(self, interval: Optional[float] = None):
+        """🆕 Thread que confere a impressão digital do catálogo periodicamente (uma por processo)"""
+        interval = Config.SCHEMA_REFRESH_SECONDS if interval is None else interval
+        if interval <= 0 or db_schema_loader.source != "catalog":
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh_schema()
+                except Exception as e:
+                    print(f"⚠️ Atualização do schema falhou: {e}")
+        
+        self._thread = threading.Thread(target=loop, name="schema-refresh", daemon=True)
+        self._thread.start()
+    
+    def stop_refresh(self):
+        self._stop.set()
+        self._thread = None
     
     def load_dictionaries(self) -> bool:
         """🆕 Carrega dicionários da pasta dicts/"""
@@ -46,11 +113,18 @@ class SchemaMapper:
         return loaded_count > 0
     
     def load_schema(self) -> bool:
-        """Carrega schema do backup.sql ou do JSON como fallback"""
+        """Carrega schema do catálogo do banco, do backup.sql ou do JSON como fallback"""
+        
+        # 🆕 Catálogo do banco ativo (sempre igual ao banco real, não depende do dump)
+        if Config.SCHEMA_SOURCE in ("auto", "catalog"):
+            if db_schema_loader.load_catalog(get_engine()):
+                self.use_backup = True  # schema vem do db_schema_loader
+                return True
+            print("⚠️ Catálogo indisponível, tentando backup.sql/JSON...")
         
-        # 🆕 Tenta carregar do backup SQL primeiro
+        # 🆕 Tenta carregar do backup SQL
         backup_path = Path("database/backup.sql")
-        if backup_path.exists():
+        if Config.SCHEMA_SOURCE != "catalog" and backup_path.exists():
             print("🔍 Detectado backup.sql - carregando schema automático...")
             if db_schema_loader.load_schema():
                 self.use_backup = True
@@ -76,6 +150,22 @@ class SchemaMapper:
             print(f"❌ Erro ao carregar schema: {e}")
             return False
     
+    def schema_version(self) -> str:
+        """🆕 Versão do schema carregado (impressão do catálogo, hash do backup.sql ou mtime do JSON)"""
+        if self.use_backup and db_schema_loader.schema_info:
+            info = db_schema_loader.schema_info
+            return str(info.get("catalog_fingerprint") or info.get("snapshot_version") or "")
+        try:
+            return f"json:{self.schema_json_path.stat().st_mtime_ns}"
+        except OSError:
+            return ""
+    
+    def table_names(self) -> List[str]:
+        """🆕 Tabelas do schema carregado, qualquer que seja a origem"""
+        if self.use_backup and db_schema_loader.schema_info:
+            return list(db_schema_loader.schema_info.get("tables", []))
+        return [table.get("tabela") for table in self.schema_data]
+    
     def build_keyword_mappings(self):
         """Constrói mapeamento de palavras-chave com prioridade para dicionários"""
         
@@ -87,10 +177,12 @@ class SchemaMapper:
             # Prioridade 2: Schema do backup.sql
             backup_mappings = db_schema_loader.build_keyword_mappings()
             self._merge_mappings(backup_mappings)
+            self._build_keyword_index()
             return
         
         # Prioridade 3: Método original para JSON
         if not self.schema_data:
+            self._build_keyword_index()
             return
         
         for table_info in self.schema_data:
@@ -119,6 +211,12 @@ class SchemaMapper:
             # Mapeia queries de exemplo
             for query_name, query_sql in queries_exemplo.items():
                 self._add_keyword_mapping(query_name.lower(), "query_pattern", query_sql)
+        
+        self._build_keyword_index()
+    
+    def _build_keyword_index(self):
+        """Índice de trigramas sobre as palavras-chave já normalizadas"""
+        self.keyword_index = TrigramIndex(self.keyword_mappings.keys())
     
     def _build_from_dictionaries(self):
         """🆕 Constrói mapeamentos dos dicionários"""
@@ -196,8 +294,8 @@ class SchemaMapper:
         if not text:
             return
             
-        # Extrai palavras significativas
-        words = re.findall(r'\b[a-z]{3,}\b', text.lower())
+        # Extrai palavras significativas (sem acento e no singular)
+        words = [w for w in normalize_terms(text) if len(w) >= 3 and w.isalpha()]
         for word in words:
             if word not in self.keyword_mappings:
                 self.keyword_mappings[word] = []
@@ -208,9 +306,9 @@ class SchemaMapper:
                 "source": text[:50]  # Para debug
             })
     
-    def analyze_query(self, natural_language_query: str) -> Dict[str, Any]:
-        """Analisa a query em linguagem natural e retorna componentes identificados"""
-        query_lower = natural_language_query.lower()
+    def analyze_query(self, natural_language_query) -> Dict[str, Any]:
+        """Analisa a query em linguagem natural (str ou NormalizedText) e retorna componentes identificados"""
+        normalized = normalize_text(natural_language_query)
         
         analysis = {
             "tables": set(),
@@ -223,8 +321,7 @@ class SchemaMapper:
         }
         
         # 🆕 Detecta códigos de animais (padrão FSC seguido de números)
-        import re
-        animal_codes = re.findall(r'FSC\d+', query_lower.upper())
+        animal_codes = re.findall(r'FSC\d+', normalized.folded.upper())
         if animal_codes:
             analysis["detected_keywords"].append({
                 "keyword": animal_codes[0],
@@ -234,9 +331,10 @@ class SchemaMapper:
             # Se tem código de animal, prioriza genealogia
             analysis["priority_tables"].add("cubo_genealogia")
         
-        # Procura por palavras-chave no mapeamento
-        for word, mappings in self.keyword_mappings.items():
-            if word in query_lower:
+        # Procura por palavras-chave no mapeamento (tokens normalizados, uma passada)
+        for word in dict.fromkeys(normalized.corrected(self.keyword_index)):
+            mappings = self.keyword_mappings.get(word)
+            if mappings:
                 for mapping in mappings:
                     analysis["detected_keywords"].append({
                         "keyword": word,
@@ -283,7 +381,7 @@ class SchemaMapper:
                 return table_info
         return None
     
-    def generate_sql_prompt(self, natural_language_query: str, analysis: Dict) -> str:
+    def generate_sql_prompt(self, natural_language_query: str, analysis: Dict, few_shot_k: int = 4) -> str:
         """Gera o prompt para o LLM baseado na análise"""
         
         # 🆕 Prioridade para dicionários específicos
@@ -322,18 +420,26 @@ class SchemaMapper:
             analysis_context += f"CÓDIGO DE ANIMAL DETECTADO: {animal_codes[0]}\n"
             analysis_context += f"OBRIGATÓRIO: Use WHERE animal_codigo = '{animal_codes[0]}'\n\n"
 
+        # 🆕 Apenas os exemplos mais próximos da pergunta (prompt não cresce com a biblioteca)
+        examples = self.example_index.retrieve(natural_language_query, k=few_shot_k)
+        examples_block = "\n".join(example.format() for example in examples)
+
+        tables_block = "\n".join(f"{table}: {', '.join(columns)}" for table, columns in PROMPT_TABLE_COLUMNS.items())
+        
+        # 🆕 Distribuição real dos dados das tabelas identificadas (pg_stats ou dump)
+        stats_block = "".join(
+            column_stats.describe_table(table, PROMPT_TABLE_COLUMNS.get(table))
+            for table in sorted(analysis.get("tables", ()))
+        )
+        if stats_block:
+            stats_block = f"\nDADOS:\n{stats_block}"
+
         prompt = f"""
 Query: "{natural_language_query}"
 
 TABELAS E ESTRUTURAS:
-filhas_touro: codigo_touro, nome_touro, codigo_filha, nome_filha
-cubo_genealogia: animal_codigo, animal_nome, pai_codigo, mae_codigo
-eventos_vaca: animal_codigo, tipo_evento, data_evento
-cubo_resumo_vaca: codigo_bovino, nome_vaca, lactacoes_encerradas, numero_partos, producao_vitalicia_leite
-cubo_producao_touro_filhas: codigo_touro, nome_touro, media_leite_305d, total_filhas, tem_amostra_significativa
-cubo_producao_touro_descendentes: codigo_touro, nome_touro, media_leite_305d, total_descendentes, tem_amostra_significativa
-cubo_primeiro_parto_filhas: codigo_touro, nome_touro, media_producao_primeiro_parto, total_filhas_primeiro_parto, amostra_representativa
-
+{tables_block}
+{stats_block}
 REGRAS:
 - Um SELECT apenas
 - Terminar com ;
@@ -342,17 +448,7 @@ REGRAS:
 - Geral: LIMIT 10
 
 EXEMPLOS CORRETOS:
-- "filhas FSC00370": SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = 'FSC00370';
-- "genealogia FSC78202": SELECT animal_codigo, animal_nome, pai_codigo, mae_codigo FROM cubo_genealogia WHERE animal_codigo = 'FSC78202';
-- "resumo vaca Vaca33614": SELECT nome_vaca, codigo_bovino, lactacoes_encerradas, numero_partos, producao_vitalicia_leite FROM cubo_resumo_vaca WHERE nome_vaca = 'Vaca33614';
-- "resumo vaca FSC33614": SELECT nome_vaca, codigo_bovino, lactacoes_encerradas, numero_partos, producao_vitalicia_leite FROM cubo_resumo_vaca WHERE codigo_bovino = 'FSC33614';
-- "genealogia terceira geração FSC173798": SELECT animal_codigo, animal_nome, pai_nome, mae_nome, avo_paterno_nome, avo_paterna_nome, avo_materno_nome, avo_materna_nome FROM cubo_genealogia WHERE animal_codigo = 'FSC173798';
-- "touro com maior média de produção das filhas": SELECT codigo_touro, nome_touro, media_leite_305d, total_filhas FROM cubo_producao_touro_filhas WHERE tem_amostra_significativa = true ORDER BY media_leite_305d DESC LIMIT 1;
-- "touro com maior média de produção dos descendentes": SELECT codigo_touro, nome_touro, media_leite_305d, total_descendentes FROM cubo_producao_touro_descendentes WHERE tem_amostra_significativa = true ORDER BY media_leite_305d DESC LIMIT 1;
-- "maior média de lactação ao primeiro parto (filhas)": SELECT codigo_touro, nome_touro, media_producao_primeiro_parto, total_filhas_primeiro_parto FROM cubo_primeiro_parto_filhas WHERE amostra_representativa = true ORDER BY media_producao_primeiro_parto DESC LIMIT 1;
-- "média da produção vitalícia das filhas do Touro04078": SELECT nome_touro, codigo_touro, media_producao_vitalicia, total_filhas FROM cubo_producao_touro_filhas WHERE nome_touro = 'Touro04078' LIMIT 1;
-- "média da produção vitalícia das filhas do FSC04078": SELECT nome_touro, codigo_touro, media_producao_vitalicia, total_filhas FROM cubo_producao_touro_filhas WHERE codigo_touro = 'FSC04078' LIMIT 1;
-- "o que é a raça01?": SELECT 'raça01' AS raca_codigo, 'Holandesa' AS raca_nome, 'Raça Holandesa' AS descricao;
+{examples_block}
 
 SELECT"""
         return prompt
@@ -391,6 +487,7 @@ SELECT"""
         
         if diferencial:
             description += f"   Diferencial: {diferencial}\n"
+
         
         # Adiciona estatísticas gerais se disponível
         stats = dict_data.get("estatisticas_gerais", {})
@@ -459,5 +556,5 @@ SELECT"""
         description += "\n"
         return description
 
-# Instância global
-schema_mapper = SchemaMapper()
\ No newline at end of file
+# Instância global (schema, dicionários e índices carregados no primeiro uso)
+schema_mapper = LazySingleton("schema_mapper", SchemaMapper)
\ No newline at end of file
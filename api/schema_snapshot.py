@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot persistente do schema analisado a partir do backup.sql.
+- Arquivo lateral (backup.sql.schema.json) com tabelas, views, colunas, índices e offsets
+- Chave: tamanho, mtime e hash do conteúdo do dump
+- O hash usa amostras (início, meio e fim) para validar o snapshot em milissegundos
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+SNAPSHOT_FORMAT = 1
+_SAMPLE_BYTES = 1024 * 1024
+
+
+def content_hash(path: Path, sample_bytes: int = _SAMPLE_BYTES) -> str:
+    """blake2b do tamanho + amostras do início, meio e fim do arquivo"""
+    size = path.stat().st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        if size <= 3 * sample_bytes:
+            digest.update(f.read())
+        else:
+            for offset in (0, size // 2 - sample_bytes // 2, size - sample_bytes):
+                f.seek(offset)
+                digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+
+class SchemaSnapshotCache:
+    """Guarda/recupera o resultado do BackupAnalyzer ao lado do dump"""
+
+    def __init__(self, dump_path: str, snapshot_path: Optional[str] = None):
+        self.dump_path = Path(dump_path)
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else self.dump_path.with_name(self.dump_path.name + ".schema.json")
+
+    def fingerprint(self) -> Dict[str, Any]:
+        stat = self.dump_path.stat()
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "content_hash": content_hash(self.dump_path),
+        }
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Retorna o schema do snapshot se a impressão digital do dump não mudou"""
+        if not self.snapshot_path.exists() or not self.dump_path.exists():
+            return None
+        started = time.perf_counter()
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            stored = snapshot.get("fingerprint", {})
+            stat = self.dump_path.stat()
+            # Tamanho e mtime primeiro (baratos); hash só se ambos coincidirem
+            if (snapshot.get("format") != SNAPSHOT_FORMAT
+                    or stored.get("size") != stat.st_size
+                    or stored.get("mtime_ns") != stat.st_mtime_ns
+                    or stored.get("content_hash") != content_hash(self.dump_path)):
+                print("♻️ Snapshot do schema desatualizado - será refeito")
+                return None
+            schema = snapshot["schema"]
+            schema["snapshot_version"] = stored["content_hash"]
+            print(f"⚡ Schema carregado do snapshot em {(time.perf_counter() - started) * 1000:.1f} ms")
+            return schema
+        except Exception as e:
+            print(f"⚠️ Snapshot do schema ignorado: {e}")
+            return None
+
+    def save(self, schema: Dict[str, Any]) -> bool:
+        """Grava o snapshot de forma atômica (arquivo temporário + rename)"""
+        try:
+            fingerprint = self.fingerprint()
+            schema["snapshot_version"] = fingerprint["content_hash"]
+            tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"format": SNAPSHOT_FORMAT, "fingerprint": fingerprint, "schema": schema}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+            print(f"💾 Snapshot do schema salvo: {self.snapshot_path.name}")
+            return True
+        except Exception as e:
+            print(f"⚠️ Não foi possível salvar o snapshot do schema: {e}")
+            return False
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Entry point de produção: vários processos worker servindo o app Flask.
+- O processo pai importa o app uma vez (schema, dicionários, índice de palavras-chave, few-shot)
+  e congela o heap com gc.freeze(); os workers herdam tudo por fork, compartilhado copy-on-write
+- Cada worker descarta os pools herdados e abre as próprias conexões após o fork
+- Usa gunicorn (preload_app + post_fork) quando instalado; senão, um prefork embutido sobre o
+  servidor do werkzeug com o socket de escuta compartilhado e reinício de workers que morrerem
+- 🆕 Workers multi-thread (werkzeug threaded=True / gunicorn gthread com Config.WORKER_THREADS):
+  a admissão em duas faixas (admission.py) é por processo e só enfileira com várias requisições
+  simultâneas no mesmo worker; com workers síncronos um atalho esperaria atrás de uma geração
+  da LLM na fila de conexões
+- Segredo dos cursores de paginação gerado no pai: vale em todos os workers
+- Warm-up (Config.WARMUP_*) no pai antes do fork; cada worker reabre o próprio pool aquecido
+- 🆕 O pai carrega tudo sem criar nenhuma thread (fork com uma thread só: nenhum lock herdado travado);
+  as threads de atualização sobem em cada worker após o fork (lifecycle.start_background)
+- Réplicas em memória dos cubos (Config.REPLICA_*) carregadas no pai e compartilhadas por fork;
+  cada worker verifica a versão dos dados e recarrega a sua cópia quando ela muda
+- 🆕 REFRESH das views materializadas em um único worker: o que obtém o lock de arquivo do líder
+  (se ele morrer, o worker que o substitui assume)
+
+Uso:
+    python serve.py --workers 4 --port 5000
+    python serve.py --benchmark 1,2,4,8      # vazão com LLM simulada
+    python serve.py --startup-benchmark 100  # p99 das primeiras requisições, com e sem warm-up
+"""
+from __future__ import annotations
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import gunicorn.app.base as _gunicorn_base  # type: ignore
+except ImportError:  # pragma: no cover - gunicorn é opcional (não roda no Windows)
+    _gunicorn_base = None
+
+
+def load_app():
+    """Carrega o app no processo pai e congela os objetos para o fork"""
+    start = time.perf_counter()
+    from app import create_app
+    # Inicialização completa antes do fork e sem threads: os workers herdam schema, índices e réplicas prontos
+    app = create_app(background=False, threads=False)
+    if threading.active_count() > 1:
+        print(f"⚠️ {threading.active_count() - 1} thread(s) no processo pai antes do fork: "
+              f"{[thread.name for thread in threading.enumerate() if thread is not threading.main_thread()]}")
+    gc.collect()
+    # Objetos existentes saem das gerações do GC: as coletas nos workers não tocam (e não copiam) essas páginas
+    gc.freeze()
+    print(f"📦 App carregado no processo pai em {time.perf_counter() - start:.2f}s "
+          f"({gc.get_freeze_count()} objetos congelados)")
+    return app
+
+
+_leader_lock = None
+
+
+def _claim_leader(port: int) -> bool:
+    """Lock de arquivo (por porta) que elege o worker das tarefas únicas; liberado quando o processo morre"""
+    global _leader_lock
+    import fcntl
+    handle = open(os.path.join(tempfile.gettempdir(), f"nl-to-sql-{port}.leader"), "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _leader_lock = handle
+    return True
+
+
+def init_worker(port: int):
+    """Após o fork: cada worker abre seus próprios pools de conexão e sobe as threads de atualização"""
+    import lifecycle
+    from config import Config, get_engine
+    # Engine única (config.get_engine) para o executor e a carga do schema
+    engine = get_engine()
+    if engine is not None:
+        # close=False: não fecha as conexões do pai (compartilhadas pelo fork), só as abandona
+        engine.dispose(close=False)
+        if Config.WARMUP_ENABLED:
+            # O pool aquecido no pai foi descartado: cada worker abre o seu antes de aceitar conexões
+            try:
+                print(f"🔥 Worker {os.getpid()}: {lifecycle.fill_pool()}")
+            except Exception as e:
+                print(f"⚠️ Worker {os.getpid()} sem pool aquecido: {e}")
+    leader = _claim_leader(port)
+    if leader:
+        print(f"🧊 Worker {os.getpid()}: atualiza as views materializadas")
+    lifecycle.start_background(refresh_views=leader)
+
+
+def _serve_prefork(app, host: str, port: int, workers: int):
+    """Prefork embutido: um socket de escuta, N workers multi-thread, reinício automático"""
+    from werkzeug.serving import make_server
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(256)
+    listener.set_inheritable(True)
+
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            init_worker(port)
+            server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    print(f"🚀 {workers} workers multi-thread em http://{host}:{port} (prefork embutido, pid {os.getpid()})")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if not stopping and started is not None:
+            print(f"⚠️ Worker {pid} saiu (status {status}), reiniciando")
+            # Evita loop de reinício se o worker morre logo ao subir
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            spawn()
+    listener.close()
+
+
+def _serve_gunicorn(app, host: str, port: int, workers: int):
+    from config import Config
+
+    class _Application(_gunicorn_base.BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", Config.WORKER_THREADS)
+            self.cfg.set("preload_app", True)
+            self.cfg.set("post_fork", lambda server, worker: init_worker(port))
+
+        def load(self):
+            return app
+
+    print(f"🚀 {workers} workers x {Config.WORKER_THREADS} threads em http://{host}:{port} (gunicorn)")
+    _Application().run()
+
+
+def serve(host: str = "0.0.0.0", port: int = 5000, workers: int = 4):
+    app = load_app()
+    if not hasattr(os, "fork"):
+        print("⚠️ Sem fork nesta plataforma: servindo em um único processo")
+        import lifecycle
+        lifecycle.start_background()
+        app.run(host=host, port=port, debug=False, threaded=True)
+    elif _gunicorn_base is not None:
+        _serve_gunicorn(app, host, port, workers)
+    else:
+        _serve_prefork(app, host, port, workers)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark: vazão com a LLM (Ollama) simulada
+# ---------------------------------------------------------------------------
+
+_BENCH_QUESTIONS = [
+    "Quais são as filhas do touro FSC00611?",                                   # atalho
+    "genealogia do FSC00611",                                                  # atalho
+    "qual touro com filhas com maior média de produção de leite 305?",         # atalho
+    "quantos animais nasceram em 2020?",                                       # LLM
+    "liste as vacas com mais partos",                                          # LLM
+]
+
+
+def _mock_ollama(latency: float, model_load: float = 0.0):
+    """Ollama falso: responde uma SQL fixa após `latency` segundos
+    (a primeira chamada também paga `model_load` segundos, como a carga do modelo na memória)"""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    loaded = threading.Event()
+    loading = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not loaded.is_set():
+                with loading:
+                    if not loaded.is_set():
+                        time.sleep(model_load)
+                        loaded.set()
+            if not request.get("prompt"):
+                # Prompt vazio: só carrega o modelo
+                body = json.dumps({"response": "", "done": True}).encode()
+            else:
+                time.sleep(latency)
+                body = json.dumps({"response": "SELECT animal_codigo, animal_nome FROM cubo_genealogia LIMIT 10;"}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _run_load(url: str, duration: float, concurrency: int):
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], 0
+
+    def client(worker_id: int):
+        nonlocal errors
+        session = requests.Session()
+        i = worker_id
+        while time.perf_counter() < deadline:
+            question = _BENCH_QUESTIONS[i % len(_BENCH_QUESTIONS)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                ok = session.post(url, json={"query": question}, timeout=30).json().get("success")
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += 0 if ok else 1
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    latencies.sort()
+    return len(latencies), errors, latencies
+
+
+def _wait_ready(base: str, timeout: float = 120.0) -> float:
+    """Espera o /readyz responder 200; devolve os segundos até lá"""
+    import requests
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if requests.get(f"{base}/readyz", timeout=1).status_code == 200:
+                break
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return time.perf_counter() - start
+
+
+def _spawn_server(workers: int, env: dict):
+    import subprocess
+    port = _free_port()
+    proc = subprocess.Popen([sys.executable, __file__, "--workers", str(workers), "--host", "127.0.0.1",
+                             "--port", str(port)], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def benchmark(worker_counts, duration: float, concurrency: int, llm_latency: float):
+    ollama = _mock_ollama(llm_latency)
+    env = dict(os.environ, OLLAMA_URL=f"http://127.0.0.1:{ollama.server_address[1]}/api/generate")
+    print(f"⏱️ LLM simulada com {llm_latency * 1000:.0f} ms, {concurrency} clientes, {duration:.0f}s por rodada, "
+          f"{os.cpu_count()} CPU(s)")
+
+    for workers in worker_counts:
+        proc, base = _spawn_server(workers, env)
+        try:
+            _wait_ready(base)
+            _run_load(f"{base}/api/nl-to-sql", 1.0, concurrency)  # aquecimento
+            total, errors, latencies = _run_load(f"{base}/api/nl-to-sql", duration, concurrency)
+            p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+            print(f"📈 {workers} worker(s): {total / duration:7.1f} req/s  p50 {p50:6.1f} ms  p95 {p95:6.1f} ms"
+                  f"  erros {errors}")
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+    ollama.shutdown()
+
+
+def startup_benchmark(count: int, workers: int, concurrency: int, llm_latency: float, model_load: float):
+    """Latência das `count` primeiras requisições após o /readyz, sem e com warm-up"""
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    print(f"⏱️ Primeiras {count} requisições, {workers} worker(s), {concurrency} clientes, "
+          f"LLM simulada com {llm_latency * 1000:.0f} ms + {model_load:.1f}s de carga do modelo")
+    for warm_up in (False, True):
+        # Ollama novo por rodada: o modelo começa descarregado
+        ollama = _mock_ollama(llm_latency, model_load)
+        env = dict(os.environ, OLLAMA_URL=f"http://127.0.0.1:{ollama.server_address[1]}/api/generate",
+                   WARMUP_ENABLED="1" if warm_up else "0")
+        proc, base = _spawn_server(workers, env)
+        try:
+            ready = _wait_ready(base)
+            session = requests.Session()
+
+            def ask(i: int) -> float:
+                start = time.perf_counter()
+                session.post(f"{base}/api/nl-to-sql", json={"query": _BENCH_QUESTIONS[i % len(_BENCH_QUESTIONS)]},
+                             timeout=60)
+                return time.perf_counter() - start
+
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies = sorted(pool.map(ask, range(count)))
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+            print(f"📈 warm-up {'ligado   ' if warm_up else 'desligado'}: pronto em {ready:5.2f}s  "
+                  f"p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  máx {latencies[-1] * 1000:7.1f} ms")
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+            ollama.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de produção (prefork) do NL to SQL")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "4")))
+    parser.add_argument("--benchmark", help="lista de quantidades de workers, ex.: 1,2,4,8")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="latência simulada da LLM em segundos")
+    parser.add_argument("--startup-benchmark", type=int, metavar="N",
+                        help="mede as N primeiras requisições após a subida, com e sem warm-up")
+    parser.add_argument("--model-load", type=float, default=3.0, help="carga simulada do modelo em segundos")
+    args = parser.parse_args()
+
+    if args.startup_benchmark:
+        startup_benchmark(args.startup_benchmark, args.workers, min(args.concurrency, 4), args.llm_latency,
+                          args.model_load)
+    elif args.benchmark:
+        benchmark([int(n) for n in args.benchmark.split(",")], args.duration, args.concurrency, args.llm_latency)
+    else:
+        serve(args.host, args.port, args.workers)
@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+"""
+Parser de dumps SQL (formato plain do pg_dump) baseado em mmap.
+- Salta entre inícios de statement com buscas de bytes (mmap.find), sem ler linha a linha
+- Pula blocos COPY inteiros (dados) registrando apenas seus offsets
+- Extrai definições completas de CREATE TABLE / VIEW / MATERIALIZED VIEW / INDEX,
+  tipos e constraints de colunas e constraints adicionadas via ALTER TABLE
+- Dumps grandes podem ser divididos em faixas de bytes alinhadas a statements
+  e analisados em paralelo (parse_parallel), com merge determinístico
+"""
+from __future__ import annotations
+import mmap
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Inícios de statement que interessam (sempre no começo de uma linha no pg_dump)
+_CREATE = b"\nCREATE "
+_COPY = b"\nCOPY "
+_ALTER = b"\nALTER TABLE "
+_MARKERS = (_CREATE, _COPY, _ALTER)
+_COPY_END = b"\n\\.\n"
+# Cabeçalho de comentário que o pg_dump escreve entre objetos (nunca dentro de dados COPY)
+_OBJECT_BOUNDARY = b"\n\n--\n-- "
+
+_IDENT = r'(?:"[^"]+"|[\w$]+)'
+_QUALIFIED = rf"((?:{_IDENT}\.)?{_IDENT})"
+
+_TABLE_RE = re.compile(
+    rf"CREATE\s+(?:(?:GLOBAL|LOCAL)\s+)?(?:UNLOGGED\s+|TEMP(?:ORARY)?\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{_QUALIFIED}\s*(\(|PARTITION\s+OF|OF\s)",
+    re.IGNORECASE,
+)
+_VIEW_RE = re.compile(
+    rf"CREATE\s+(?:OR\s+REPLACE\s+)?(?:TEMP(?:ORARY)?\s+)?(?:RECURSIVE\s+)?(MATERIALIZED\s+)?VIEW\s+(?:IF\s+NOT\s+EXISTS\s+)?{_QUALIFIED}[\s\S]*?\bAS\b\s*([\s\S]*)",
+    re.IGNORECASE,
+)
+_INDEX_RE = re.compile(
+    rf"CREATE\s+(UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?{_QUALIFIED}\s+ON\s+(?:ONLY\s+)?{_QUALIFIED}\s*(?:USING\s+(\w+)\s*)?\(",
+    re.IGNORECASE,
+)
+_ALTER_CONSTRAINT_RE = re.compile(
+    rf"ALTER\s+TABLE\s+(?:ONLY\s+)?(?:IF\s+EXISTS\s+)?{_QUALIFIED}\s+ADD\s+CONSTRAINT\s+{_IDENT}\s+([\s\S]*)",
+    re.IGNORECASE,
+)
+_COPY_RE = re.compile(rf"COPY\s+{_QUALIFIED}\s*(?:\(([^)]*)\))?\s+FROM\s+stdin", re.IGNORECASE)
+_FUNCTION_RE = re.compile(r"CREATE\s+(?:OR\s+REPLACE\s+)?(?:FUNCTION|PROCEDURE|AGGREGATE)\b", re.IGNORECASE)
+_DOLLAR_TAG_RE = re.compile(rb"\$[A-Za-z_]*\$")
+
+_TABLE_CONSTRAINT_PREFIXES = ("CONSTRAINT", "PRIMARY KEY", "FOREIGN KEY", "UNIQUE", "CHECK", "EXCLUDE", "LIKE")
+_COLUMN_CONSTRAINT_RE = re.compile(
+    r"\s+(?=NOT\s+NULL\b|NULL\b|DEFAULT\b|PRIMARY\s+KEY\b|REFERENCES\b|CHECK\b|UNIQUE\b|COLLATE\b|GENERATED\b|CONSTRAINT\b)",
+    re.IGNORECASE,
+)
+
+
+def _unquote(name: str) -> str:
+    """Remove aspas e o schema public: 'public."Tabela"' -> 'Tabela'"""
+    parts = [p.strip('"') for p in re.findall(_IDENT, name)]
+    if len(parts) == 2 and parts[0] == "public":
+        return parts[1]
+    return ".".join(parts)
+
+
+def split_top_level(body: str, sep: str = ",") -> List[str]:
+    """Divide por separador ignorando parênteses e literais"""
+    parts, depth, quote, current = [], 0, None, []
+    for ch in body:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    tail = "".join(current).strip()
+    if tail:
+        parts.append(tail)
+    return parts
+
+
+def _matching_paren(text: str, open_pos: int) -> int:
+    depth, quote = 0, None
+    for i in range(open_pos, len(text)):
+        ch = text[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(text)
+
+
+def parse_column(definition: str) -> Dict[str, Any]:
+    """'nome varchar(50) NOT NULL DEFAULT x' -> {name, type, nullable, default, constraints}"""
+    definition = " ".join(definition.split())
+    if definition.startswith('"'):
+        close = definition.find('"', 1)
+        name, rest = definition[1:close], definition[close + 1:].strip()
+    else:
+        name, _, rest = definition.partition(" ")
+    pieces = _COLUMN_CONSTRAINT_RE.split(rest, maxsplit=1)
+    col_type = pieces[0].strip()
+    constraints = pieces[1].strip() if len(pieces) > 1 else ""
+    upper = constraints.upper()
+    default = None
+    default_match = re.search(r"\bDEFAULT\s+(.+?)(?=\s+(?:NOT\s+NULL|NULL|PRIMARY|REFERENCES|CHECK|UNIQUE|COLLATE|GENERATED|CONSTRAINT)\b|$)", constraints, re.IGNORECASE)
+    if default_match:
+        default = default_match.group(1)
+    return {
+        "name": name,
+        "type": col_type,
+        "nullable": "NOT NULL" not in upper and "PRIMARY KEY" not in upper,
+        "default": default,
+        "constraints": constraints,
+    }
+
+
+class DumpParser:
+    """Varre um dump SQL via mmap e extrai o catálogo completo de objetos"""
+
+    def __init__(self, dump_path: str = "database/backup.sql"):
+        self.dump_path = Path(dump_path)
+
+    def parse(self, start: int = 0, end: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Analisa os statements que COMEÇAM no intervalo [start, end).
+        Statements iniciados no intervalo são lidos até o fim, mesmo além de `end`.
+        """
+        result = _empty_result()
+        size = self.dump_path.stat().st_size
+        if size == 0:
+            return result
+        end = size if end is None else min(end, size)
+        with open(self.dump_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            stop = self._scan(mm, start, end, result)
+        # 🆕 Onde a varredura parou: além de `end` quando o último statement atravessa a faixa
+        result["next_start"] = max(stop, end, start)
+        result["bytes_analyzed"] = result["next_start"] - start
+        return result
+
+    def _scan(self, mm: mmap.mmap, start: int, end: int, result: Dict[str, Any]) -> int:
+        # Próxima ocorrência de cada marcador (re-buscada apenas quando ultrapassada)
+        next_pos: Dict[bytes, int] = {}
+        pos = start
+        if start == 0 and mm[:12].startswith((b"CREATE ", b"COPY ", b"ALTER TABLE ")):
+            pos = self._dispatch(mm, 0, result)
+        while pos < end:
+            candidate = end
+            for marker in _MARKERS:
+                found = next_pos.get(marker)
+                if found is None or found < pos - 1:
+                    # O '\n' do marcador precisa estar antes de end - 1 (statement começa no intervalo)
+                    found = mm.find(marker, max(pos - 1, 0), min(end - 1 + len(marker), len(mm)))
+                    found = end if found == -1 or found + 1 >= end else found
+                    next_pos[marker] = found
+                candidate = min(candidate, found)
+            if candidate >= end:
+                break
+            pos = self._dispatch(mm, candidate + 1, result)
+        return pos
+
+    def _dispatch(self, mm: mmap.mmap, stmt_start: int, result: Dict[str, Any]) -> int:
+        """Processa o statement que começa em stmt_start e retorna onde a varredura continua"""
+        head = mm[stmt_start:stmt_start + 6]
+        if head.startswith(b"COPY "):
+            return self._handle_copy(mm, stmt_start, result)
+        stmt_end = self._statement_end(mm, stmt_start)
+        text = mm[stmt_start:stmt_end].decode("utf-8", errors="replace")
+        if head.startswith(b"ALTER "):
+            self._handle_alter(text, result)
+        else:
+            self._handle_create(text, stmt_start, result)
+        return stmt_end
+
+    def _statement_end(self, mm: mmap.mmap, stmt_start: int) -> int:
+        """Fim do statement (após ';\\n'), respeitando corpos $tag$ de funções"""
+        line_end = mm.find(b"\n", stmt_start)
+        first_line = mm[stmt_start:line_end if line_end != -1 else len(mm)].decode("utf-8", errors="replace")
+        search_from = stmt_start
+        if _FUNCTION_RE.match(first_line):
+            # Procura o primeiro $tag$ e pula até seu fechamento
+            window = mm[stmt_start:min(stmt_start + 65536, len(mm))]
+            tag_match = _DOLLAR_TAG_RE.search(window)
+            if tag_match:
+                tag = tag_match.group(0)
+                close = mm.find(tag, stmt_start + tag_match.end())
+                if close != -1:
+                    search_from = close + len(tag)
+        end = mm.find(b";\n", search_from)
+        return len(mm) if end == -1 else end + 2
+
+    def _handle_copy(self, mm: mmap.mmap, stmt_start: int, result: Dict[str, Any]) -> int:
+        header_end = mm.find(b"\n", stmt_start)
+        if header_end == -1:
+            return len(mm)
+        header = mm[stmt_start:header_end].decode("utf-8", errors="replace")
+        data_start = header_end + 1
+        if mm[data_start:data_start + 3] == b"\\.\n":
+            data_end = data_start
+        else:
+            marker = mm.find(_COPY_END, header_end)
+            data_end = len(mm) if marker == -1 else marker + 1
+        match = _COPY_RE.match(header)
+        if match:
+            table = _unquote(match.group(1))
+            columns = [c.strip().strip('"') for c in match.group(2).split(",")] if match.group(2) else []
+            result["copy_blocks"][table] = {
+                "offset": stmt_start,
+                "data_offset": data_start,
+                "data_end": data_end,
+                "columns": columns,
+            }
+        return data_end + 3
+
+    def _handle_create(self, text: str, offset: int, result: Dict[str, Any]) -> None:
+        match = _TABLE_RE.match(text)
+        if match:
+            table = _unquote(match.group(1))
+            columns, constraints = [], []
+            if match.group(2) == "(":
+                open_pos = match.end() - 1
+                body = text[open_pos + 1:_matching_paren(text, open_pos)]
+                for element in split_top_level(body):
+                    if not element or element.startswith("--"):
+                        continue
+                    if element.upper().startswith(_TABLE_CONSTRAINT_PREFIXES):
+                        constraints.append(" ".join(element.split()))
+                    else:
+                        columns.append(parse_column(element))
+            result["tables"][table] = {"offset": offset, "columns": columns, "constraints": constraints}
+            return
+
+        match = _VIEW_RE.match(text)
+        if match:
+            view = _unquote(match.group(2))
+            definition = match.group(3).strip().rstrip(";").strip()
+            if definition.upper().endswith("WITH NO DATA"):
+                definition = definition[:-len("WITH NO DATA")].strip()
+            result["views"][view] = {
+                "offset": offset,
+                "materialized": bool(match.group(1)),
+                "definition": definition,
+            }
+            return
+
+        match = _INDEX_RE.match(text)
+        if match:
+            open_pos = match.end() - 1
+            key_list = text[open_pos + 1:_matching_paren(text, open_pos)]
+            result["indexes"][_unquote(match.group(2))] = {
+                "offset": offset,
+                "table": _unquote(match.group(3)),
+                "unique": bool(match.group(1)),
+                "method": (match.group(4) or "btree").lower(),
+                "columns": [" ".join(c.split()) for c in split_top_level(key_list)],
+                "definition": " ".join(text.split()).rstrip(";"),
+            }
+            return
+
+        result["other_objects"] += 1
+
+    def _handle_alter(self, text: str, result: Dict[str, Any]) -> None:
+        match = _ALTER_CONSTRAINT_RE.match(text)
+        if match:
+            table = _unquote(match.group(1))
+            constraint = " ".join(match.group(2).split()).rstrip(";").strip()
+            result["altered_constraints"].append((table, constraint))
+
+
+def _empty_result() -> Dict[str, Any]:
+    return {
+        "tables": {},
+        "views": {},
+        "indexes": {},
+        "copy_blocks": {},
+        "altered_constraints": [],
+        "other_objects": 0,
+        "bytes_analyzed": 0,
+        "next_start": 0,
+    }
+
+
+def finalize(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica constraints de ALTER TABLE às tabelas e monta o resultado no formato do BackupAnalyzer"""
+    tables = raw["tables"]
+    for table, constraint in raw["altered_constraints"]:
+        if table not in tables:
+            continue
+        tables[table]["constraints"].append(constraint)
+        if constraint.upper().startswith("PRIMARY KEY"):
+            key_list = constraint[constraint.find("(") + 1:constraint.find(")")]
+            pk_columns = {c.strip().strip('"') for c in key_list.split(",")}
+            for column in tables[table]["columns"]:
+                if column["name"] in pk_columns:
+                    column["nullable"] = False
+
+    views = raw["views"]
+    return {
+        "tables_count": len(tables),
+        "views_count": len(views),
+        "tables": sorted(tables),
+        "views": sorted(views),
+        "materialized_views": sorted(v for v, info in views.items() if info["materialized"]),
+        "tables_with_columns": {
+            table: [f"{c['name']} ({c['type']})" for c in tables[table]["columns"]]
+            for table in sorted(tables)
+        },
+        "columns": {table: tables[table]["columns"] for table in sorted(tables)},
+        "constraints": {table: tables[table]["constraints"] for table in sorted(tables)},
+        "view_definitions": {view: views[view]["definition"] for view in sorted(views)},
+        "indexes": dict(sorted(raw["indexes"].items())),
+        "copy_blocks": dict(sorted(raw["copy_blocks"].items())),
+        "offsets": {
+            "tables": {table: tables[table]["offset"] for table in sorted(tables)},
+            "views": {view: views[view]["offset"] for view in sorted(views)},
+        },
+        "other_objects": raw["other_objects"],
+        "bytes_analyzed": raw["bytes_analyzed"],
+    }
+
+
+def split_ranges(dump_path: str, chunks: int) -> List[Tuple[int, int]]:
+    """
+    Divide o dump em até `chunks` faixas [start, end) alinhadas a fronteiras entre objetos.
+    A fronteira é só textual: dentro do corpo $tag$ de uma função pode haver o mesmo cabeçalho de
+    comentário, e a faixa que começa ali é refeita por _resync a partir do fim do statement.
+    """
+    size = os.path.getsize(dump_path)
+    if chunks <= 1 or size == 0:
+        return [(0, size)]
+    boundaries = [0]
+    with open(dump_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i in range(1, chunks):
+            target = max(size * i // chunks, boundaries[-1])
+            found = mm.find(_OBJECT_BOUNDARY, target)
+            if found == -1:
+                break
+            boundary = found + 2
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def _parse_range(dump_path: str, start: int, end: int) -> Dict[str, Any]:
+    return DumpParser(dump_path).parse(start, end)
+
+
+def _resync(dump_path: str, ranges: List[Tuple[int, int]], parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    🆕 Só vale uma faixa que começou fora de corpos $tag$: se a anterior terminou um statement além do
+    seu fim (função cujo corpo contém a fronteira), a faixa é analisada de novo a partir dali
+    """
+    for i in range(1, len(parts)):
+        resume = parts[i - 1]["next_start"]
+        if resume > ranges[i][0]:
+            parts[i] = _parse_range(dump_path, resume, ranges[i][1])
+    return parts
+
+
+def merge_results(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Junta resultados parciais na ordem das faixas (mesma semântica da varredura sequencial)"""
+    merged = _empty_result()
+    for part in parts:
+        for key in ("tables", "views", "indexes", "copy_blocks"):
+            merged[key].update(part[key])
+        merged["altered_constraints"].extend(part["altered_constraints"])
+        merged["other_objects"] += part["other_objects"]
+        merged["bytes_analyzed"] += part["bytes_analyzed"]
+        merged["next_start"] = part["next_start"]
+    return merged
+
+
+def parse_parallel(dump_path: str, workers: int) -> Dict[str, Any]:
+    """Analisa faixas do dump em um pool de processos e retorna o resultado finalizado"""
+    ranges = split_ranges(dump_path, workers * 4 if workers > 1 else 1)
+    if workers <= 1 or len(ranges) == 1:
+        parts = [_parse_range(dump_path, start, end) for start, end in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_parse_range, [dump_path] * len(ranges), [r[0] for r in ranges], [r[1] for r in ranges]))
+    return finalize(merge_results(_resync(dump_path, ranges, parts)))
+
+
+def parse_dump(dump_path: str, workers: int = 1) -> Tuple[Dict[str, Any], float]:
+    """Analisa o dump inteiro e retorna (resultado, segundos)"""
+    started = time.perf_counter()
+    result = parse_parallel(dump_path, workers)
+    return result, time.perf_counter() - started
+
+
+_SYNTHETIC_HEADER = """--
+-- PostgreSQL database dump
+--
+
+SET statement_timeout = 0;
+
+CREATE TABLE public.cubo_producao_touro_filhas (
+    codigo_touro character varying(20) NOT NULL,
+    nome_touro character varying(100),
+    total_filhas integer DEFAULT 0,
+    media_leite_305d numeric(10,2),
+    media_producao_vitalicia numeric(12,2),
+    tem_amostra_significativa boolean DEFAULT false,
+    CONSTRAINT media_positiva CHECK ((media_leite_305d >= (0)::numeric))
+);
+
+CREATE VIEW public.vw_touros_elite AS
+ SELECT codigo_touro,
+    nome_touro,
+    media_leite_305d
+   FROM public.cubo_producao_touro_filhas
+  WHERE (tem_amostra_significativa = true);
+
+"""
+
+_SYNTHETIC_TABLE = """--
+-- Name: filhas_touro_{n}; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.filhas_touro_{n} (
+    codigo_touro character varying(20) NOT NULL,
+    nome_touro character varying(100),
+    codigo_filha character varying(20) NOT NULL,
+    nome_filha character varying(100),
+    codigo_mae character varying(20),
+    nome_mae character varying(100)
+);
+
+
+--
+-- Data for Name: filhas_touro_{n}; Type: TABLE DATA; Schema: public; Owner: postgres
+--
+
+COPY public.filhas_touro_{n} (codigo_touro, nome_touro, codigo_filha, nome_filha, codigo_mae, nome_mae) FROM stdin;
+"""
+
+_SYNTHETIC_FOOTER = """\\.
+
+
+--
+-- Name: idx_filhas_touro_{n}_touro; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX idx_filhas_touro_{n}_touro ON public.filhas_touro_{n} USING btree (codigo_touro);
+
+
+--
+-- Name: filhas_touro_{n} filhas_touro_{n}_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.filhas_touro_{n}
+    ADD CONSTRAINT filhas_touro_{n}_pkey PRIMARY KEY (codigo_filha);
+
+
+"""
+
+
+def generate_synthetic_dump(path: str, size_mb: int, table_mb: int = 64) -> None:
+    """Gera um dump sintético (várias tabelas com blocos COPY de ~table_mb) com aproximadamente size_mb"""
+    target = size_mb * 1024 * 1024
+    row_block = "".join(
+        f"FSC{i % 5000:05d}\tTouro{i % 5000:05d}\tFSC{i:07d}\tVaca{i:07d}\tFSC{(i * 7) % 99999:05d}\tVaca{(i * 7) % 99999:05d}\n"
+        for i in range(20000)
+    ).encode()
+    blocks_per_table = max(1, table_mb * 1024 * 1024 // len(row_block))
+    with open(path, "wb") as f:
+        f.write(_SYNTHETIC_HEADER.encode())
+        written, n = f.tell(), 0
+        while written < target:
+            f.write(_SYNTHETIC_TABLE.format(n=n).encode())
+            for _ in range(blocks_per_table):
+                f.write(row_block)
+            f.write(_SYNTHETIC_FOOTER.format(n=n).encode())
+            written, n = f.tell(), n + 1
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Parser mmap de dumps SQL")
+    parser.add_argument("dump", nargs="?", default=None, help="Caminho do dump (padrão: gera um sintético)")
+    parser.add_argument("--synthetic-mb", type=int, default=2048, help="Tamanho do dump sintético em MB")
+    parser.add_argument("--workers", default="1", help="Lista de quantidades de processos, ex.: 1,2,4,8")
+    args = parser.parse_args()
+
+    path, cleanup = args.dump, False
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), "backup_sintetico.sql")
+        print(f"🧪 Gerando dump sintético de {args.synthetic_mb} MB em {path}...")
+        generate_synthetic_dump(path, args.synthetic_mb)
+        cleanup = True
+
+    try:
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(",")]:
+            result, elapsed = parse_dump(path, workers)
+            baseline = baseline or elapsed
+            print(f"✅ [{workers} proc] {result['tables_count']} tabelas, {result['views_count']} views, "
+                  f"{len(result['indexes'])} índices, {len(result['copy_blocks'])} blocos COPY")
+            print(f"⏱️ [{workers} proc] {size_mb:.1f} MB em {elapsed:.2f}s → {size_mb / elapsed:.1f} MB/s "
+                  f"(speedup {baseline / elapsed:.2f}x)")
+    finally:
+        if cleanup:
+            os.remove(path)
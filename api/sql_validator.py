@@ -6,22 +6,63 @@ Validador e normalizador de SQL para o pipeline NL->SQL.
 - Remove aliases de tabela (c1., ft., etc.)
 - Corrige colunas comuns para tabelas conhecidas (ex.: filhas_touro)
 - Garante LIMIT (default 10)
+- Com sqlglot: um único parse, correções como transformações da árvore e uma renderização;
+  resultados em cache LRU por SQL de entrada. Sem sqlglot: cadeia de regex
 """
 from __future__ import annotations
 import re
-from typing import Tuple
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
 
 try:
     import sqlglot  # type: ignore
+    from sqlglot import exp  # type: ignore
 except Exception:  # sqlglot é opcional, regex fallback será usado
     sqlglot = None
+    exp = None
 
 
+DEFAULT_LIMIT = 10
 _SINGLE_SELECT_RE = re.compile(r"SELECT[\s\S]*?;", re.IGNORECASE)
 _ALIAS_PREFIX_RE = re.compile(r"\b([a-zA-Z_][a-zA-Z0-9_]*)\.")
 _FROM_ALIAS_RE = re.compile(r"\bFROM\s+([a-zA-Z_][a-zA-Z0-9_]*)\s+[a-zA-Z_][a-zA-Z0-9_]*\b", re.IGNORECASE)
 _JOIN_BLOCK_RE = re.compile(r"\bJOIN\b[\s\S]*?(?=\bJOIN\b|\bWHERE\b|\bGROUP\b|\bORDER\b|;|$)", re.IGNORECASE)
-_DANGEROUS = {"DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "CREATE", "TRUNCATE"}
+_DANGEROUS = ("DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "CREATE", "TRUNCATE")
+_DANGEROUS_RE = re.compile(rf"\b({'|'.join(_DANGEROUS)})\b", re.IGNORECASE)
+_JOIN_RE = re.compile(r"\bJOIN\b", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+# Renomeações de colunas por tabela (nomes que o LLM costuma trocar)
+KNOWN_TABLE_RENAMES = {
+    # filhas_touro: codigo_touro, nome_touro, codigo_filha, nome_filha, codigo_mae, nome_mae
+    "filhas_touro": {
+        "animal_codigo": "codigo_filha",
+        "pai_codigo": "codigo_touro",
+        "mae_codigo": "codigo_mae",
+        "animal_nome": "nome_filha",
+    },
+    # cubo_genealogia não tem codigo_filha/codigo_touro
+    "cubo_genealogia": {
+        "codigo_filha": "animal_codigo",
+        "codigo_touro": "pai_codigo",
+        "nome_touro": "animal_nome",
+        "nome_filha": "animal_nome",
+    },
+}
+# Chave única (e indexada) usada na paginação por chave de cada tabela
+KEYSET_KEYS = {
+    "filhas_touro": "codigo_filha",
+    "cubo_genealogia": "animal_codigo",
+    "cubo_resumo_vaca": "codigo_bovino",
+    "cubo_producao_touro_filhas": "codigo_touro",
+    "cubo_producao_touro_descendentes": "codigo_touro",
+    "cubo_primeiro_parto_filhas": "codigo_touro",
+}
+_KNOWN_TABLE_RES = {
+    table: (re.compile(rf"\bFROM\s+{table}\b", re.IGNORECASE),
+            [(re.compile(rf"\b{old}\b", re.IGNORECASE), new) for old, new in renames.items()])
+    for table, renames in KNOWN_TABLE_RENAMES.items()
+}
 
 
 def _strip_to_single_select(sql: str) -> str:
@@ -63,64 +104,386 @@ def _ensure_semicolon(sql: str) -> str:
     return sql if sql.endswith(";") else sql + ";"
 
 
-def _ensure_limit(sql: str, default_limit: int = 10) -> str:
+def _ensure_limit(sql: str, default_limit: int = DEFAULT_LIMIT) -> str:
     # Se já tem LIMIT, mantém
-    if re.search(r"\bLIMIT\b", sql, re.IGNORECASE):
+    if _LIMIT_RE.search(sql):
         return sql
     # Insere antes do ;
     return re.sub(r";\s*$", f" LIMIT {default_limit};", sql)
 
 
 def _block_dangerous(sql: str) -> None:
-    up = sql.upper()
-    for kw in _DANGEROUS:
-        if re.search(rf"\b{kw}\b", up):
-            raise ValueError(f"Comando proibido detectado: {kw}")
+    match = _DANGEROUS_RE.search(sql)
+    if match:
+        raise ValueError(f"Comando proibido detectado: {match.group(1).upper()}")
 
 
 def _rewrite_known_tables(sql: str) -> str:
-    # filhas_touro: codigo_touro, nome_touro, codigo_filha, nome_filha, codigo_mae, nome_mae
-    if re.search(r"\bFROM\s+filhas_touro\b", sql, re.IGNORECASE):
-        sql = re.sub(r"\banimal_codigo\b", "codigo_filha", sql, flags=re.IGNORECASE)
-        sql = re.sub(r"\bpai_codigo\b", "codigo_touro", sql, flags=re.IGNORECASE)
-        sql = re.sub(r"\bmae_codigo\b", "codigo_mae", sql, flags=re.IGNORECASE)
-        sql = re.sub(r"\banimal_nome\b", "nome_filha", sql, flags=re.IGNORECASE)
-    # cubo_genealogia não tem codigo_filha/codigo_touro
-    if re.search(r"\bFROM\s+cubo_genealogia\b", sql, re.IGNORECASE):
-        sql = re.sub(r"\bcodigo_filha\b", "animal_codigo", sql, flags=re.IGNORECASE)
-        sql = re.sub(r"\bcodigo_touro\b", "pai_codigo", sql, flags=re.IGNORECASE)
-        # Corrige nomes inexistentes para nomes válidos
-        sql = re.sub(r"\bnome_touro\b", "animal_nome", sql, flags=re.IGNORECASE)
-        sql = re.sub(r"\bnome_filha\b", "animal_nome", sql, flags=re.IGNORECASE)
+    for from_re, renames in _KNOWN_TABLE_RES.values():
+        if from_re.search(sql):
+            for column_re, new in renames:
+                sql = column_re.sub(new, sql)
     return sql
 
 
+def _validate_with_regex(sql: str) -> str:
+    """Cadeia de regex (usada quando o sqlglot não está instalado)"""
+    # 1) Deixa apenas o primeiro SELECT
+    sql = _strip_to_single_select(sql)
+    # 2) Bloqueia statements perigosos
+    _block_dangerous(sql)
+    # 3) Remover joins (se houver)
+    if _JOIN_RE.search(sql):
+        sql = _remove_joins(sql)
+    # 3.1) Remover aliases sempre
+    sql = _strip_aliases(sql)
+    # 4) Reescrever colunas conhecidas
+    sql = _rewrite_known_tables(sql)
+    # 5) Garantir ; e LIMIT
+    sql = _ensure_semicolon(sql)
+    return _ensure_limit(sql)
+
+
+if exp is not None:
+    # Nós que nunca podem aparecer numa consulta de leitura
+    _DANGEROUS_NODES = (exp.Drop, exp.Delete, exp.Insert, exp.Update, exp.AlterTable, exp.Create,
+                        exp.TruncateTable, exp.Merge, exp.Command, exp.Copy)
+
+
+def _transform_tree(tree) -> bool:
+    """Aplica as correções na árvore do sqlglot num único percurso.
+    Retorna se já tem LIMIT; levanta ValueError para comandos proibidos.
+    """
+    has_limit = False
+    renames_by_select = {}
+    for node in tree.walk():
+        if isinstance(node, _DANGEROUS_NODES):
+            raise ValueError(f"Comando proibido detectado: {node.key.upper()}")
+        if isinstance(node, exp.Limit):
+            has_limit = True
+        elif isinstance(node, exp.Select):
+            # SELECT ... INTO cria tabela e FOR UPDATE/SHARE trava linhas: não são leitura
+            if node.args.get("into") or node.args.get("locks"):
+                raise ValueError("SELECT INTO / FOR UPDATE não permitidos")
+            # Sem JOINs (inclui FROM a, b)
+            if node.args.get("joins"):
+                node.set("joins", None)
+            # Renomeações conforme a tabela do FROM deste SELECT
+            from_clause = node.args.get("from")
+            source = from_clause.this if from_clause is not None else None
+            if isinstance(source, exp.Table):
+                renames_by_select[id(node)] = KNOWN_TABLE_RENAMES.get(source.name.lower())
+        elif isinstance(node, exp.Column):
+            # Prefixos de alias (c1.campo)
+            if node.args.get("table"):
+                node.set("table", None)
+            select = node.parent_select
+            renames = renames_by_select.get(id(select)) if select is not None else None
+            new = renames.get(node.name.lower()) if renames else None
+            if new:
+                node.set("this", exp.to_identifier(new))
+        elif isinstance(node, exp.Table):
+            # Alias de tabela e schema (public.tabela); aliases de subquery são obrigatórios
+            if node.args.get("alias") or node.args.get("db"):
+                node.set("alias", None)
+                node.set("db", None)
+    return has_limit
+
+
+@lru_cache(maxsize=1024)
+def _validate_cached(sql: str) -> Tuple[bool, str, str]:
+    """Um parse + transformações + uma renderização (resultado em cache pelo texto de entrada)"""
+    extracted = _strip_to_single_select(sql)
+    try:
+        statements = [s for s in sqlglot.parse(extracted, read="postgres") if s is not None]
+    except Exception as e:
+        return False, _ensure_semicolon(extracted), f"Falha de parse (sqlglot): {e}"
+    if len(statements) != 1:
+        return False, _ensure_semicolon(extracted), "Falha na validação: esperado um único SELECT"
+    tree = statements[0]
+
+    try:
+        has_limit = _transform_tree(tree)
+    except ValueError as e:
+        return False, sql, f"Falha na validação: {e}"
+    if not isinstance(tree, (exp.Select, exp.Union)):
+        return False, sql, "Falha na validação: apenas consultas SELECT são permitidas"
+
+    # LIMIT também na árvore e uma única renderização (nada é colado no texto original, que pode
+    # terminar num comentário)
+    if not has_limit:
+        tree.set("limit", exp.Limit(expression=exp.Literal.number(DEFAULT_LIMIT)))
+    return True, tree.sql(dialect="postgres", comments=False) + ";", "SQL validada e normalizada"
+
+
+@lru_cache(maxsize=256)
+def keyset_paginate(sql: str, page_size: int, after: bool = False) -> Tuple[bool, str, str]:
+    """Reescreve um SELECT validado para paginação por chave (keyset).
+    Gera `WHERE <chave> > :last ORDER BY <chave> LIMIT page_size + 1` (o :last só nas páginas seguintes),
+    de modo que toda página custa o mesmo acesso por índice, sem OFFSET.
+    Retorna (ok, sql_paginada, chave ou mensagem de erro).
+    """
+    if sqlglot is None:
+        return False, sql, "paginação requer sqlglot"
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except Exception as e:
+        return False, sql, f"Falha de parse (sqlglot): {e}"
+    if not isinstance(tree, exp.Select):
+        return False, sql, "paginação só para SELECT simples"
+    if tree.args.get("group") or tree.args.get("distinct") or tree.find(exp.AggFunc):
+        return False, sql, "consultas agregadas não são paginadas"
+    source = tree.args["from"].this if tree.args.get("from") else None
+    key = KEYSET_KEYS.get(source.name.lower()) if isinstance(source, exp.Table) else None
+    if key is None:
+        return False, sql, "tabela sem chave de paginação"
+    order = tree.args.get("order")
+    if order is not None:
+        terms = order.expressions
+        if (len(terms) != 1 or terms[0].args.get("desc") or not isinstance(terms[0].this, exp.Column)
+                or terms[0].this.name.lower() != key):
+            return False, sql, "ordenação diferente da chave de paginação"
+
+    # A chave precisa voltar no resultado para montar o próximo cursor
+    projected = {e.alias_or_name.lower() for e in tree.expressions}
+    if key not in projected and not any(isinstance(e, exp.Star) for e in tree.expressions):
+        tree = tree.select(key, copy=False)
+    if after:
+        tree = tree.where(exp.GT(this=exp.column(key), expression=exp.Placeholder(this="last")), copy=False)
+    # NULLS LAST explícito: é a ordem natural do índice btree ascendente
+    tree.set("order", exp.Order(expressions=[exp.Ordered(this=exp.column(key), nulls_first=False)]))
+    tree = tree.limit(page_size + 1, copy=False)
+    return True, tree.sql(dialect="postgres") + ";", key
+
+
+_KEEP_LIMIT = object()
+
+
+def render_select(sql: str, limit: Any = _KEEP_LIMIT) -> Tuple[bool, str, str]:
+    """Re-renderiza um único SELECT a partir da árvore do sqlglot, sem comentários, para SQL que vai dentro
+    de outro comando (COPY (...) TO STDOUT, SELECT * FROM (...)): nenhum trecho do texto original passa
+    adiante sem ter sido parseado. UNION vira SELECT * FROM (...) AS export.
+    limit: None remove o LIMIT final, um inteiro o substitui (padrão: mantém).
+    Retorna (ok, sql sem ;, mensagem).
+    """
+    if sqlglot is None:
+        return False, sql, "requer sqlglot"
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="postgres") if s is not None]
+    except Exception as e:
+        return False, sql, f"Falha de parse (sqlglot): {e}"
+    if len(statements) != 1 or not isinstance(statements[0], (exp.Select, exp.Union)):
+        return False, sql, "esperado um único SELECT"
+    tree = statements[0]
+    for node in tree.walk():
+        if isinstance(node, _DANGEROUS_NODES):
+            return False, sql, f"Comando proibido detectado: {node.key.upper()}"
+        if isinstance(node, exp.Select) and (node.args.get("into") or node.args.get("locks")):
+            return False, sql, "SELECT INTO / FOR UPDATE não permitidos"
+    if limit is not _KEEP_LIMIT:
+        tree.set("limit", None)
+    if isinstance(tree, exp.Union):
+        tree = exp.select("*").from_(tree.subquery("export"))
+    if limit is not _KEEP_LIMIT and limit is not None:
+        tree = tree.limit(int(limit), copy=False)
+    return True, tree.sql(dialect="postgres", comments=False), "SELECT re-renderizado"
+
+
+def _or_terms(node):
+    """Achata OR aninhados/parentizados em uma lista de termos"""
+    node = node.unnest()
+    if isinstance(node, exp.Or):
+        return _or_terms(node.this) + _or_terms(node.expression)
+    return [node]
+
+
+def _equality_key(node):
+    """(coluna, literal) de um termo `coluna = literal`, ou None"""
+    node = node.unnest()
+    if not isinstance(node, exp.EQ):
+        return None
+    column, value = node.this, node.expression
+    if isinstance(column, exp.Literal):
+        column, value = value, column
+    if not isinstance(column, exp.Column) or not isinstance(value, exp.Literal):
+        return None
+    return column.name.lower(), value.sql(dialect="postgres")
+
+
+def _static_truth(node, known):
+    """Avalia uma condição só com os termos de valor conhecido no ramo (True/False/None = indecidível)"""
+    node = node.unnest()
+    if isinstance(node, exp.Or):
+        left, right = _static_truth(node.this, known), _static_truth(node.expression, known)
+        return True if True in (left, right) else (None if None in (left, right) else False)
+    if isinstance(node, exp.And):
+        left, right = _static_truth(node.this, known), _static_truth(node.expression, known)
+        return False if False in (left, right) else (None if None in (left, right) else True)
+    return known.get(_equality_key(node))
+
+
+def _static_rank(case, known):
+    """Valor do CASE do ORDER BY num ramo do UNION, se decidível só pelos termos do ramo"""
+    for when in case.args.get("ifs") or []:
+        truth = _static_truth(when.this, known)
+        if truth is None:
+            return None
+        if truth:
+            return when.args["true"]
+    return case.args.get("default")
+
+
+def _output_identifiers(expressions) -> Optional[List[exp.Identifier]]:
+    """Nome de cada coluna da resposta (coluna ou apelido); None se houver *, expressão sem nome ou repetição"""
+    identifiers = []
+    for expression in expressions:
+        if isinstance(expression, exp.Alias):
+            identifier = expression.args.get("alias")
+        elif isinstance(expression, exp.Column) and isinstance(expression.this, exp.Identifier):
+            identifier = expression.this
+        else:
+            return None
+        identifiers.append(identifier)
+    names = [identifier.name for identifier in identifiers]
+    if len(set(names)) != len(names) or "match_rank" in names:
+        return None
+    return identifiers
+
+
+@lru_cache(maxsize=512)
+def rewrite_or_equalities(sql: str) -> Tuple[bool, str]:
+    """
+    Reescreve `WHERE a = x OR b = y OR ...` (colunas diferentes) em UNION ALL de buscas por coluna,
+    cada uma atendida pelo índice da sua coluna, com a coluna auxiliar match_rank.
+    O ramo i exclui as linhas dos ramos anteriores com IS DISTINCT FROM (cada linha aparece uma vez,
+    como no OR). Um ORDER BY CASE sobre os mesmos termos vira o match_rank constante de cada ramo,
+    e o LIMIT é empurrado para dentro dos ramos. O SELECT externo projeta só as colunas originais
+    (a resposta mantém o formato; match_rank serve apenas para ordenar). Retorna (alterou, sql).
+    """
+    if sqlglot is None:
+        return False, sql
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except Exception:
+        return False, sql
+    if not isinstance(tree, exp.Select) or not tree.args.get("where") or not tree.args.get("from"):
+        return False, sql
+    if any(tree.args.get(arg) for arg in ("joins", "group", "having", "distinct", "with", "offset")):
+        return False, sql
+    if tree.find(exp.AggFunc) or tree.find(exp.Window) or not isinstance(tree.args["from"].this, exp.Table):
+        return False, sql
+    outputs = _output_identifiers(tree.expressions)
+    if outputs is None:
+        return False, sql
+
+    terms = [term.unnest() for term in _or_terms(tree.args["where"].this)]
+    keys = [_equality_key(term) for term in terms]
+    if len(terms) < 2 or None in keys or len({column for column, _ in keys}) < 2:
+        return False, sql
+
+    # Rank de cada ramo: posição no OR, ou o valor do CASE do ORDER BY avaliado no ramo
+    ranks = [exp.Literal.number(i + 1) for i in range(len(terms))]
+    order = tree.args.get("order")
+    if order is not None:
+        ordered = order.expressions
+        if len(ordered) != 1 or ordered[0].args.get("desc") or not isinstance(ordered[0].this, exp.Case):
+            return False, sql
+        ranks = []
+        for i, key in enumerate(keys):
+            known = {previous: False for previous in keys[:i]}
+            known[key] = True
+            rank = _static_rank(ordered[0].this, known)
+            if not isinstance(rank, exp.Literal):
+                return False, sql
+            ranks.append(rank.copy())
+
+    limit = tree.args.get("limit")
+    table = tree.args["from"].this
+    union = None
+    for i, term in enumerate(terms):
+        condition = exp.and_(term.copy(), *[
+            exp.NullSafeNEQ(this=previous.this.copy(), expression=previous.expression.copy()) for previous in terms[:i]
+        ])
+        branch = exp.Select(expressions=[e.copy() for e in tree.expressions] + [exp.alias_(ranks[i], "match_rank")])
+        branch = branch.from_(table.copy()).where(condition)
+        if limit is not None:
+            branch = branch.limit(limit.expression.copy())
+        union = branch.subquery() if union is None else exp.union(union, branch.subquery(), distinct=False)
+
+    outer = exp.select(*[exp.Column(this=identifier.copy(), table=exp.to_identifier("ranked"))
+                         for identifier in outputs]).from_(union.subquery("ranked"))
+    outer.set("order", exp.Order(expressions=[exp.Ordered(this=exp.column("match_rank"), nulls_first=False)]))
+    if limit is not None:
+        outer = outer.limit(limit.expression.copy())
+    return True, outer.sql(dialect="postgres") + ";"
+
+
 def validate_and_fix(sql: str) -> Tuple[bool, str, str]:
     """Valida e corrige SQL.
     Retorna (ok, sql_corrigida, mensagem).
     """
+    if sqlglot is not None:
+        return _validate_cached(sql)
     original = sql
     try:
-        # 1) Deixa apenas o primeiro SELECT
-        sql = _strip_to_single_select(sql)
-        # 2) Bloqueia statements perigosos
-        _block_dangerous(sql)
-        # 3) Remover joins (se houver)
-        if re.search(r"\bJOIN\b", sql, re.IGNORECASE):
-            sql = _remove_joins(sql)
-        # 3.1) Remover aliases sempre
-        sql = _strip_aliases(sql)
-        # 4) Reescrever colunas conhecidas
-        sql = _rewrite_known_tables(sql)
-        # 5) Garantir ; e LIMIT
-        sql = _ensure_semicolon(sql)
-        sql = _ensure_limit(sql)
-        # 6) Validação sintática básica via sqlglot (opcional)
-        if sqlglot is not None:
-            try:
-                sqlglot.parse_one(sql, read="postgres")
-            except Exception as e:
-                return False, sql, f"Falha de parse (sqlglot): {e}"
-        return True, sql, "SQL validada e normalizada"
+        return True, _validate_with_regex(sql), "SQL validada e normalizada"
     except Exception as e:
         return False, original, f"Falha na validação: {e}"
+
+
+if __name__ == "__main__":
+    import json
+    import time
+    from pathlib import Path
+    from example_index import SEED_EXAMPLES, _examples_from_table
+
+    # Corpus: SQLs dos exemplos + variações típicas de saída do LLM
+    base = [sql for _, sql in SEED_EXAMPLES]
+    for dict_file in Path("dicts").glob("*.json"):
+        with open(dict_file, "r", encoding="utf-8") as f:
+            base.extend(e.sql for e in _examples_from_table("", json.load(f)) if e.sql)
+    corpus = []
+    for sql in base:
+        body = sql.strip().rstrip(";")
+        corpus.append(sql)
+        corpus.append(f"Aqui está a consulta:\n{body};\nEla retorna os dados pedidos.")
+        corpus.append(re.sub(r"\s+LIMIT\s+\d+\s*$", "", body, flags=re.IGNORECASE))
+        corpus.append(re.sub(r"\bFROM\s+(\w+)", r"FROM \1 c1 JOIN cubo_genealogia g ON g.animal_codigo = c1.codigo_touro", body, count=1))
+    rounds = 20
+
+    def bench(label, fn):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for sql in corpus:
+                fn(sql)
+        per_query_us = (time.perf_counter() - started) / (rounds * len(corpus)) * 1e6
+        print(f"⏱️ {label}: {per_query_us:.1f} µs/consulta")
+        return per_query_us
+
+    def regex_chain(sql):
+        try:
+            _validate_with_regex(sql)
+        except Exception:
+            pass
+
+    def regex_chain_and_parse(sql):
+        # Comportamento anterior: cadeia de regex seguida de um parse de verificação
+        try:
+            sqlglot.parse_one(_validate_with_regex(sql), read="postgres")
+        except Exception:
+            pass
+
+    def ast_uncached(sql):
+        _validate_cached.cache_clear()
+        _validate_cached(sql)
+
+    print(f"📚 Corpus: {len(corpus)} SQLs ({len(base)} bases)")
+    bench("cadeia de regex", regex_chain)
+    if sqlglot is not None:
+        bench("cadeia de regex + parse sqlglot (anterior)", regex_chain_and_parse)
+        bench("AST sqlglot (sem cache)", ast_uncached)
+        for sql in corpus:
+            validate_and_fix(sql)
+        bench("AST sqlglot (acerto no cache LRU)", validate_and_fix)
+        failures = sum(1 for sql in corpus if not validate_and_fix(sql)[0])
+        print(f"✅ {len(corpus) - failures}/{len(corpus)} SQLs válidas após normalização")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Teste do controle de admissão em duas faixas
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from admission import AdmissionRejected, Lane
+
+
+def _wait_queued(lane, count):
+    for _ in range(200):
+        if lane.queued == count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"fila com {lane.queued}, esperado {count}")
+
+
+def test_round_robin_between_clients():
+    print("🚦 Testando rodízio entre clientes...")
+    lane = Lane("teste", concurrency=1, max_queue=10, max_wait=5, per_client=10)
+    order = []
+    lane.acquire("ocupante")
+
+    def ask(client, tag):
+        with lane.admit(client):
+            order.append(tag)
+
+    threads = []
+    # Cliente "a" enfileira 3 pedidos antes de "b" e "c"
+    for client, tag in (("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")):
+        thread = threading.Thread(target=ask, args=(client, tag))
+        thread.start()
+        threads.append(thread)
+        _wait_queued(lane, len(threads))
+    lane.release("ocupante", 0.01)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["a1", "b1", "c1", "a2", "a3"], order
+    assert lane.active == 0 and lane.queued == 0
+    print("✅ Rodízio OK")
+
+
+def test_rejections():
+    print("🚦 Testando recusas (espera máxima, fila cheia, limite por cliente)...")
+    lane = Lane("teste", concurrency=1, max_queue=1, max_wait=0.1, per_client=1)
+    lane.acquire("a")
+
+    try:
+        lane.acquire("b")                  # fila livre, mas a vaga não abre antes de max_wait
+        assert False, "deveria expirar"
+    except AdmissionRejected as e:
+        assert e.reason == "timeout" and e.retry_after >= 1
+    assert lane.queued == 0
+
+    lane.max_wait = 5
+    waiter = threading.Thread(target=lambda: lane.release("b", lane.acquire("b")))
+    waiter.start()
+    _wait_queued(lane, 1)
+    try:
+        lane.acquire("c")
+        assert False, "fila cheia deveria recusar"
+    except AdmissionRejected as e:
+        assert e.reason == "queue_full" and e.lane == "teste"
+    try:
+        lane.acquire("a")                  # "a" já ocupa a vaga
+        assert False, "limite por cliente deveria recusar"
+    except AdmissionRejected as e:
+        assert e.reason == "client_limit"
+
+    lane.release("a", 0.01)
+    waiter.join(timeout=5)
+    assert lane.active == 0 and lane.queued == 0
+    print("✅ Recusas OK")
+
+
+def test_http_429():
+    from app import app
+    from admission import admission
+
+    lane = admission.fast
+    saved = (lane.concurrency, lane.max_queue)
+    lane.concurrency, lane.max_queue = 1, 0
+    lane.acquire("ocupante")
+    try:
+        response = app.test_client().post("/api/nl-to-sql", json={"query": "Quais são as filhas do touro FSC00611?"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.get_json()["success"] is False
+    finally:
+        lane.release("ocupante", 0.0)
+        lane.concurrency, lane.max_queue = saved
+
+
+if __name__ == "__main__":
+    test_round_robin_between_clients()
+    test_rejections()
+    test_http_429()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Teste do motor de agregados (média, percentis, contagens e distribuições por grupo) pela réplica e pelo Postgres
+"""
+
+import sys
+import os
+from decimal import Decimal
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aggregations import AggregationQuery, aggregation_rows, aggregation_sql, parse_aggregation
+from cube_replica import TableReplica, cube_replicas
+
+
+def test_parse_aggregation():
+    print("📈 Testando reconhecimento de agregados...")
+    aggregation = parse_aggregation("qual a média da produção vitalícia das vacas por raça?")
+    assert (aggregation.table, aggregation.function, aggregation.column, aggregation.group_by) == \
+        ("cubo_resumo_vaca", "mean", "producao_vitalicia_leite", "animal_raca")
+    assert aggregation.joined and aggregation.fields == ["animal_raca", "media_producao_vitalicia_leite"]
+
+    aggregation = parse_aggregation("distribuição do número de partos")
+    assert (aggregation.function, aggregation.group_by, aggregation.fields) == \
+        ("count", "numero_partos", ["numero_partos", "quantidade"])
+    aggregation = parse_aggregation("quantos touros têm amostra significativa?")
+    assert (aggregation.table, aggregation.function, aggregation.where, aggregation.flag) == \
+        ("cubo_producao_touro_filhas", "count", "tem_amostra_significativa", True)
+    assert parse_aggregation("p90 do leite 305 dos touros sem amostra significativa").fields == ["p90_media_leite_305d"]
+    # Métrica contínua: distribuição vira percentis
+    assert parse_aggregation("distribuição da produção vitalícia por classificação").fields[1:] == \
+        [f"p{q}_producao_vitalicia_leite" for q in (10, 25, 50, 75, 90)]
+
+    # Qualquer coisa fora do vocabulário fica com a LLM
+    assert parse_aggregation("Quantos animais nasceram em 2020?") is None
+    assert parse_aggregation("quantas vacas holandesas existem?") is None
+    assert parse_aggregation("qual a produção vitalícia média das filhas do touro FSC00611?") is None
+    assert parse_aggregation("quais os melhores touros em proteína?") is None
+    assert parse_aggregation("quantos existem por raça?") is None     # contagem sem sujeito
+    print("✅ Reconhecimento OK")
+
+
+def test_groups_nulls_and_joins():
+    print("📈 Testando grupos, NULLs e colunas de outro cubo...")
+    cows = ["codigo_bovino", "numero_partos", "producao_vitalicia_leite", "classificacao_geral", "boa_fertilidade"]
+    cube_replicas.install(TableReplica("cubo_resumo_vaca", {}, cows, [
+        ("V1", 1, Decimal("100"), "ELITE", True),
+        ("V2", 2, Decimal("300"), "ELITE", False),
+        ("V3", 2, None, None, None),
+        ("V4", 3, Decimal("200"), "BAIXA", True),
+    ]))
+    try:
+        by_class = AggregationQuery("cubo_resumo_vaca", "mean", "producao_vitalicia_leite", "classificacao_geral")
+        assert aggregation_rows(by_class) == [
+            {"classificacao_geral": "BAIXA", "media_producao_vitalicia_leite": 200.0},
+            {"classificacao_geral": "ELITE", "media_producao_vitalicia_leite": 200.0},
+            {"classificacao_geral": None, "media_producao_vitalicia_leite": None},   # grupo NULL por último
+        ]
+        fertile = AggregationQuery("cubo_resumo_vaca", "count", group_by="numero_partos",
+                                   where="boa_fertilidade", flag=False)
+        assert aggregation_rows(fertile) == [{"numero_partos": 2, "quantidade": 2}]
+        median = AggregationQuery("cubo_resumo_vaca", "median", "producao_vitalicia_leite")
+        assert aggregation_rows(median) == [{"mediana_producao_vitalicia_leite": 200.0}]
+        total = AggregationQuery("cubo_resumo_vaca", "sum", "producao_vitalicia_leite", where="boa_fertilidade")
+        assert aggregation_rows(total) == [{"soma_producao_vitalicia_leite": 300.0}]
+
+        # Raça vem da genealogia: sem a réplica dela, None (e o roteamento não usa o plano)
+        by_breed = AggregationQuery("cubo_resumo_vaca", "count", group_by="animal_raca")
+        assert aggregation_rows(by_breed) is None
+        cube_replicas.install(TableReplica("cubo_genealogia", {}, ["animal_codigo", "animal_raca"], [
+            ("V1", "Raça 01"), ("V2", "Raça 02"), ("V3", "Raça 01"), ("X9", "Raça 03"),
+        ]))
+        assert aggregation_rows(by_breed) == [{"animal_raca": "Raça 01", "quantidade": 2},
+                                              {"animal_raca": "Raça 02", "quantidade": 1},
+                                              {"animal_raca": None, "quantidade": 1}]
+        assert "LEFT JOIN cubo_genealogia" in aggregation_sql(by_breed)
+    finally:
+        cube_replicas._replicas.clear()
+    print("✅ Grupos, NULLs e junções OK")
+
+
+def test_replica_matches_database():
+    print("📈 Testando agregados pela réplica x Postgres...")
+    from sqlalchemy import text
+    from config import get_engine
+    from database_executor import db_executor
+
+    if not db_executor.connection_status:
+        print("⚠️ Banco indisponível - pulando")
+        return
+    questions = [
+        "média da produção vitalícia das vacas por raça",
+        "distribuição do número de partos",
+        "quantos touros têm amostra significativa?",
+        "percentil 90 da produção vitalícia por classificação",
+        "mediana do leite 305 dos touros por categoria",
+        "quantos animais por sexo",
+        "máximo de filhos dos animais sem pai",
+    ]
+    try:
+        cube_replicas.refresh(tables=["cubo_resumo_vaca", "cubo_producao_touro_filhas", "cubo_genealogia"])
+        with get_engine().connect() as conn:
+            for question in questions:
+                aggregation = parse_aggregation(question)
+                from_replica = aggregation_rows(aggregation)
+                # SQL direto (com o JOIN da raça, que o validador removeria)
+                from_database = conn.execute(text(aggregation_sql(aggregation))).mappings().fetchall()
+                assert from_replica and len(from_replica) == len(from_database), question
+                for row, database_row in zip(from_replica, from_database):
+                    for name in aggregation.fields:
+                        if name == aggregation.group_by:
+                            assert row[name] == database_row[name], question
+                        else:
+                            assert abs(row[name] - float(database_row[name])) <= 0.011, (question, name)
+        # Pelo executor (validação de campos não confunde PERCENTILE_CONT(0.9) com alias.campo)
+        percentile = parse_aggregation("percentil 90 da produção vitalícia por classificação")
+        ok, data, message = db_executor.execute_query(aggregation_sql(percentile))
+        assert ok and [row["classificacao_geral"] for row in data] == ["BAIXA", "ELITE", "MEDIA", None], message
+    finally:
+        cube_replicas._replicas.clear()
+    print("✅ Agregados pela réplica OK")
+
+
+if __name__ == "__main__":
+    test_parse_aggregation()
+    test_groups_nulls_and_joins()
+    test_replica_matches_database()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Teste do carregamento do schema a partir do catálogo do banco (pg_catalog)
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database_schema_loader import DatabaseSchemaLoader
+
+
+def test_merge_descriptions():
+    print("📝 Testando junção de descrições...")
+    loader = DatabaseSchemaLoader()
+    loader.schema_info = {
+        "tables": ["cubo_genealogia"],
+        "views": [],
+        "comments": {"cubo_genealogia": {"table": "comentário", "columns": {"pai_codigo": "do catálogo", "mae_codigo": "mãe"}}},
+    }
+    loader.merge_descriptions({
+        "cubo_genealogia": {
+            "descricao": "Cubo genealógico",
+            "campos": {"pai_codigo": {"descricao": "Código do pai"}},
+            "campos_principais": {"identificacao": {"animal_codigo": {"descricao": "Código do animal"}}},
+        }
+    })
+    merged = loader.schema_info["descriptions"]["cubo_genealogia"]
+    assert merged["table"] == "Cubo genealógico"
+    assert merged["columns"] == {"pai_codigo": "Código do pai", "mae_codigo": "mãe", "animal_codigo": "Código do animal"}
+    print("✅ Descrições OK")
+
+
+def test_catalog_introspection():
+    print("🗄️ Testando introspecção do catálogo...")
+    from config import engine
+
+    with tempfile.TemporaryDirectory() as workdir:
+        loader = DatabaseSchemaLoader(catalog_cache_path=os.path.join(workdir, "catalog.json"))
+        if not loader.load_catalog(engine):
+            print("⚠️ Banco indisponível - teste do catálogo ignorado")
+            return
+        info = loader.schema_info
+        assert info["source"] == "catalog"
+        assert info["tables_count"] == len(info["tables"])
+        for table in info["tables"]:
+            assert info["tables_with_columns"][table]
+            assert table in info["row_estimates"]
+        # Sem DDL entre as chamadas: refresh não recarrega e a próxima carga usa o cache
+        assert loader.refresh() is False
+        assert os.path.exists(loader.catalog_cache_path)
+        assert DatabaseSchemaLoader(catalog_cache_path=str(loader.catalog_cache_path)).load_catalog(engine)
+    print("✅ Catálogo OK")
+
+
+def test_catalog_refresh():
+    print("♻️ Testando atualização do schema quando o catálogo muda...")
+    from sqlalchemy import text
+    from config import engine
+    from database_schema_loader import db_schema_loader
+    from schema_mapper import schema_mapper
+    from text_normalizer import normalize_terms
+
+    schema_mapper.initialize()
+    if db_schema_loader.source != "catalog":
+        print("⚠️ Schema fora do catálogo - teste de atualização ignorado")
+        return
+    keyword = normalize_terms("quokka")[0]
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE VIEW vw_quokka AS SELECT 1 AS coluna_quokka"))
+        # Mapeamentos refeitos com a view nova
+        assert schema_mapper.refresh_schema()
+        assert keyword in schema_mapper.keyword_mappings
+        assert not schema_mapper.refresh_schema()
+        # Mesmo oid e colunas, outra definição
+        with engine.begin() as conn:
+            conn.execute(text("CREATE OR REPLACE VIEW vw_quokka AS SELECT 2 AS coluna_quokka"))
+        assert db_schema_loader.refresh()
+        # RENAME muda só o relname
+        with engine.begin() as conn:
+            conn.execute(text("ALTER VIEW vw_quokka RENAME TO vw_quokka_renomeada"))
+        assert db_schema_loader.refresh()
+        assert "vw_quokka_renomeada" in db_schema_loader.schema_info["views"]
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP VIEW IF EXISTS vw_quokka"))
+            conn.execute(text("DROP VIEW IF EXISTS vw_quokka_renomeada"))
+        schema_mapper.refresh_schema()
+    assert keyword not in schema_mapper.keyword_mappings
+    print("✅ Atualização do schema OK")
+
+
+if __name__ == "__main__":
+    test_merge_descriptions()
+    test_catalog_introspection()
+    test_catalog_refresh()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Teste das estatísticas por coluna (HyperLogLog, dump, pg_stats e estimativa de custo)
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from column_stats import ColumnStats, HyperLogLog, parse_pg_array, stats_from_dump
+from sql_dump_parser import DumpParser, finalize
+
+DUMP = """CREATE TABLE public.cubo_producao_touro_filhas (
+    codigo_touro character varying(20) NOT NULL,
+    media_leite_305d numeric(10,2),
+    tem_amostra_significativa boolean
+);
+
+COPY public.cubo_producao_touro_filhas (codigo_touro, media_leite_305d, tem_amostra_significativa) FROM stdin;
+{rows}\\.
+"""
+
+
+def test_hyperloglog_accuracy():
+    print("🔢 Testando HyperLogLog...")
+    hll = HyperLogLog()
+    hll.add(b"FSC%07d" % i for i in range(200000))
+    hll.add(b"FSC%07d" % i for i in range(1000))  # repetidos não contam
+    assert abs(hll.estimate() - 200000) / 200000 < 0.03
+    print("✅ HyperLogLog OK")
+
+
+def test_stats_from_dump_and_estimate():
+    print("📈 Testando estatísticas do dump...")
+    null = "\\N"
+    rows = "".join(
+        f"FSC{i:05d}\t{null if i % 10 == 0 else 4000 + i}\t{'t' if i % 4 == 0 else 'f'}\n"
+        for i in range(2000)
+    )
+    with tempfile.NamedTemporaryFile("w", suffix=".sql", delete=False) as f:
+        f.write(DUMP.format(rows=rows))
+    try:
+        schema = finalize(DumpParser(f.name).parse())
+        stats = stats_from_dump(f.name, schema)
+    finally:
+        os.remove(f.name)
+
+    table = stats["tables"]["cubo_producao_touro_filhas"]
+    assert table["rows"] == 2000
+    media = table["columns"]["media_leite_305d"]
+    assert media["null_frac"] == 0.1
+    assert media["min"] == 4001.0 and media["max"] == 5999.0
+    assert abs(table["columns"]["codigo_touro"]["n_distinct"] - 2000) < 60
+    assert dict(table["columns"]["tem_amostra_significativa"]["top_values"]) == {"f": 0.75, "t": 0.25}
+
+    column_stats = ColumnStats(stats)
+    estimate = column_stats.estimate_rows(
+        "SELECT codigo_touro FROM cubo_producao_touro_filhas WHERE tem_amostra_significativa = true")
+    assert estimate["rows"] == 500 and not estimate["limited"]
+    estimate = column_stats.estimate_rows(
+        "SELECT * FROM cubo_producao_touro_filhas WHERE media_leite_305d > 5000 LIMIT 10")
+    assert estimate["rows"] == 10 and estimate["limited"]
+    estimate = column_stats.estimate_rows("SELECT * FROM cubo_producao_touro_filhas a, cubo_producao_touro_filhas b")
+    assert estimate["rows"] == 2000 * 2000
+    estimate = column_stats.estimate_rows("SELECT * FROM cubo_producao_touro_filhas c WHERE c.media_leite_305d IS NULL")
+    assert estimate["rows"] == 200
+    # Coluna sem estatísticas: seletividade padrão, sem erro
+    assert column_stats.estimate_rows("SELECT * FROM cubo_producao_touro_filhas c WHERE c.xxx IS NULL")["rows"] > 0
+    assert "tem_amostra_significativa: false 75%, true 25%" in column_stats.describe_table("cubo_producao_touro_filhas")
+    print("✅ Estatísticas do dump OK")
+
+
+def test_parse_pg_array():
+    assert parse_pg_array('{FSC001,"Touro, 01",NULL}') == ["FSC001", "Touro, 01", None]
+    assert parse_pg_array("{}") == []
+
+
+if __name__ == "__main__":
+    test_hyperloglog_accuracy()
+    test_stats_from_dump_and_estimate()
+    test_parse_pg_array()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Teste do armazenamento colunar extraído dos blocos COPY
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from columnar_store import ColumnarStore
+
+DUMP = """--
+-- PostgreSQL database dump
+--
+
+CREATE TABLE public.cubo_resumo_vaca (
+    codigo_bovino character varying(20) NOT NULL,
+    nome_vaca text,
+    numero_partos integer,
+    producao_vitalicia_leite numeric(12,2),
+    elite boolean,
+    data_ultimo_parto date
+);
+
+CREATE TABLE public.outra (
+    x integer
+);
+
+COPY public.cubo_resumo_vaca (codigo_bovino, nome_vaca, numero_partos, producao_vitalicia_leite, elite, data_ultimo_parto) FROM stdin;
+FSC00001\tVaca\\tUm\t3\t25000.50\tt\t2024-05-01
+FSC00002\t\\N\t\\N\t\\N\t\\N\t\\N
+FSC00003\tConceição\t1\t8000\tf\t2023-01-15
+\\.
+
+COPY public.outra (x) FROM stdin;
+1
+\\.
+"""
+
+
+def test_extract_and_incremental():
+    print("🗃️ Testando extração colunar...")
+    workdir = tempfile.mkdtemp()
+    try:
+        dump = os.path.join(workdir, "backup.sql")
+        with open(dump, "w", encoding="utf-8") as f:
+            f.write(DUMP)
+        store = ColumnarStore(os.path.join(workdir, "columnar"), dump)
+
+        report = store.extract()
+        assert store.tables() == ["cubo_resumo_vaca"]
+        assert report["rows"] == 3
+
+        table = store.load_table("cubo_resumo_vaca")
+        assert table["codigo_bovino"].to_list() == ["FSC00001", "FSC00002", "FSC00003"]
+        assert table["nome_vaca"].to_list() == ["Vaca\tUm", None, "Conceição"]
+        assert table["numero_partos"].dtype == np.int64
+        assert store.null_mask("cubo_resumo_vaca", "numero_partos").tolist() == [False, True, False]
+        assert np.isnan(table["producao_vitalicia_leite"][1])
+        assert table["producao_vitalicia_leite"][0] == 25000.5
+        assert table["elite"].tolist() == [1, -1, 0]
+        assert str(table["data_ultimo_parto"][2]) == "2023-01-15"
+        assert np.isnat(table["data_ultimo_parto"][1])
+
+        # Sem mudanças no dump: nada é reextraído
+        report = store.extract()
+        assert report["tables"]["cubo_resumo_vaca"] == "inalterada"
+        assert report["rows"] == 0
+
+        # Bloco grande editado no meio, sem mudar o tamanho: a tabela é reextraída
+        rows = "".join(f"FSC{i:07d}\tVaca{i}\t1\t2000.50\tt\t2024-05-01\n" for i in range(150000))
+        with open(dump, "w", encoding="utf-8") as f:
+            f.write(DUMP.replace("FSC00003\t", rows + "FSC00003\t"))
+        assert store.extract()["rows"] == 150003
+        with open(dump, "w", encoding="utf-8") as f:
+            f.write(DUMP.replace("FSC00003\t", rows.replace("FSC0050000\tVaca50000\t1\t2000.50",
+                                                               "FSC0050000\tVaca50000\t1\t2000.99") + "FSC00003\t"))
+        report = store.extract()
+        assert report["tables"]["cubo_resumo_vaca"] != "inalterada", report
+        table = store.load_table("cubo_resumo_vaca")
+        assert table["producao_vitalicia_leite"][2 + 50000] == 2000.99
+        print("✅ Extração colunar OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_extract_and_incremental()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Teste das réplicas em memória dos cubos (índices hash, rankings e atalhos sem Postgres)
+"""
+
+import sys
+import os
+from decimal import Decimal
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cube_replica import CubeReplicas, TableReplica
+
+SPEC = {
+    "keys": ["codigo_touro", "nome_touro"],
+    "rankings": {"metrics": ["media_leite_305d"], "filters": ["tem_amostra_significativa"]},
+}
+NAMES = ["codigo_touro", "nome_touro", "media_leite_305d", "total_filhas", "media_producao_vitalicia",
+         "tem_amostra_significativa"]
+ROWS = [
+    ("FSC001", "Touro001", Decimal("9000.50"), 12, Decimal("20000"), True),
+    ("FSC002", "Touro002", Decimal("9500.00"), 3, None, False),
+    ("FSC003", "Touro003", None, 1, Decimal("100"), None),
+    ("FSC004", "Touro004", Decimal("9900.10"), 40, Decimal("30000"), True),
+    ("FSC001", "Touro001b", Decimal("100.00"), 2, Decimal("50"), False),
+]
+
+
+def test_indexes_and_rankings():
+    print("🧊 Testando índices e rankings da réplica...")
+    replicas = CubeReplicas(["cubo_producao_touro_filhas"])
+    fields = ["codigo_touro", "media_leite_305d", "tem_amostra_significativa"]
+    assert replicas.lookup("cubo_producao_touro_filhas", "codigo_touro", "FSC001", fields) is None
+
+    replicas.install(TableReplica("cubo_producao_touro_filhas", SPEC, NAMES, ROWS, version="v1"))
+    rows = replicas.lookup("cubo_producao_touro_filhas", "codigo_touro", "FSC001", fields)
+    assert rows == [{"codigo_touro": "FSC001", "media_leite_305d": 9000.5, "tem_amostra_significativa": True},
+                    {"codigo_touro": "FSC001", "media_leite_305d": 100.0, "tem_amostra_significativa": False}]
+    assert len(replicas.lookup("cubo_producao_touro_filhas", "codigo_touro", "FSC001", fields, 1)) == 1
+    assert replicas.lookup("cubo_producao_touro_filhas", "nome_touro", "Touro003", ["media_leite_305d"]) == \
+        [{"media_leite_305d": None}]
+    assert replicas.lookup("cubo_producao_touro_filhas", "codigo_touro", "FSC999", fields) == []
+    # Coluna sem índice ou fora da réplica: None (o atalho vai ao banco)
+    assert replicas.lookup("cubo_producao_touro_filhas", "total_filhas", 12, fields) is None
+    assert replicas.lookup("cubo_producao_touro_filhas", "codigo_touro", "FSC001", ["netas"]) is None
+
+    # DESC com NULLs primeiro, como o Postgres; "not_true" inclui false e NULL
+    top = lambda flag, limit=1: [r["codigo_touro"] for r in replicas.top(
+        "cubo_producao_touro_filhas", "media_leite_305d", ["codigo_touro"],
+        where="tem_amostra_significativa" if flag is not None else None, flag=flag, limit=limit)]
+    assert top(None, 3) == ["FSC003", "FSC004", "FSC002"]
+    assert top(True, 5) == ["FSC004", "FSC001"]
+    assert top(False, 5) == ["FSC003", "FSC002", "FSC001"]
+    assert replicas.top("cubo_producao_touro_filhas", "nome_touro", ["codigo_touro"]) is None
+
+    status = replicas.status()
+    memory = status["tables"]["cubo_producao_touro_filhas"]["bytes"]
+    assert status["rows"] == 5 and status["missing"] == [] and status["bytes"] == memory["total"] > 0
+    assert memory["columns"] and memory["indexes"] and memory["rankings"]
+    print("✅ Índices e rankings OK")
+
+
+def test_shortcuts_match_database():
+    print("🧊 Testando atalhos pela réplica x Postgres...")
+    from database_executor import db_executor
+    from cube_replica import cube_replicas
+    from nl_to_sql import nl_to_sql_pipeline
+    from schema_mapper import schema_mapper
+    from text_normalizer import normalize_text
+
+    if not db_executor.connection_status:
+        print("⚠️ Banco indisponível - pulando")
+        return
+    questions = [
+        "Quais são as filhas do touro FSC00611?",
+        "qual touro com filhas com maior média de produção de leite 305?",
+        "qual touro com descendentes com maior média de produção de leite?",
+        "qual touro tem filhas com maior média na primeira lactação (primeiro parto)?",
+        "qual a produção vitalícia média das filhas do touro FSC00611?",
+    ]
+    try:
+        report = cube_replicas.refresh(force=True)
+        assert all(not outcome.startswith("erro") for outcome in report.values()), report
+        for question in questions:
+            normalized = normalize_text(question)
+            analysis = schema_mapper.analyze_query(normalized)
+            plan = nl_to_sql_pipeline._plan_shortcut(question, normalized, analysis)
+            assert plan is not None and plan.replica is not None, question
+            ok, _, from_replica = nl_to_sql_pipeline.execute_plan(plan, analysis)
+            assert ok and from_replica["message"].startswith("Réplica em memória"), question
+            # Mesmo plano sem réplica (e sem réplica no fallback): Postgres
+            plan.replica = None
+            if plan.fallback is not None:
+                plan.fallback.replica = None
+            ok, _, from_database = nl_to_sql_pipeline.execute_plan(plan, analysis)
+            database_rows = [{k: float(v) if isinstance(v, Decimal) else v for k, v in row.items()}
+                             for row in from_database["data"]]
+            assert ok and from_replica["data"] == database_rows, question
+    finally:
+        cube_replicas._replicas.clear()
+    print("✅ Atalhos pela réplica OK")
+
+
+if __name__ == "__main__":
+    test_indexes_and_rankings()
+    test_shortcuts_match_database()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Teste do índice de exemplos few-shot (ranking TF-IDF, exemplos curados como reserva e k)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from example_index import SEED_EXAMPLES, ExampleIndex, FewShotExample
+
+
+def _index() -> ExampleIndex:
+    examples = [FewShotExample(q, sql, source="curado") for q, sql in SEED_EXAMPLES]
+    examples.append(FewShotExample("vacas com maior produção vitalícia",
+                                   "SELECT nome_vaca FROM cubo_resumo_vaca ORDER BY producao_vitalicia_leite DESC LIMIT 10",
+                                   "cubo_resumo_vaca", "queries_exemplo"))
+    return ExampleIndex(examples)
+
+
+def test_ranking():
+    print("🎯 Testando ranking dos exemplos...")
+    index = _index()
+    top = index.retrieve("quais as filhas do touro FSC00370?", k=3)
+    assert top[0].question == "filhas FSC00370"
+    top = index.retrieve("vacas com maior produção vitalícia", k=1)
+    assert top[0].source == "queries_exemplo"
+    print("✅ Ranking OK")
+
+
+def test_fallback_to_seed_examples():
+    print("🌱 Testando reserva com os exemplos curados...")
+    index = _index()
+    seeds = [q for q, _ in SEED_EXAMPLES]
+    # Nenhum termo em comum: os k primeiros curados
+    assert [e.question for e in index.retrieve("xyz abc", k=4)] == seeds[:4]
+    # Poucos termos em comum: os encontrados primeiro, completados sem repetir
+    top = index.retrieve("genealogia FSC78202", k=6)
+    assert top[0].question == "genealogia FSC78202"
+    assert len(top) == 6 and len({e.question for e in top}) == 6
+    print("✅ Reserva OK")
+
+
+def test_k():
+    print("🔢 Testando k...")
+    index = _index()
+    assert len(index.retrieve("touro com maior média de produção das filhas", k=2)) == 2
+    assert index.retrieve("xyz abc", k=0) == []
+    assert len(index.retrieve("xyz abc", k=100)) == len(SEED_EXAMPLES)
+    assert index.latency_stats()["retrievals"] == 3
+    print("✅ k OK")
+
+
+if __name__ == "__main__":
+    test_ranking()
+    test_fallback_to_seed_examples()
+    test_k()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Teste da exportação em massa (COPY TO STDOUT em CSV/Parquet, sem o LIMIT da resposta)
+"""
+
+import sys
+import os
+import csv
+import io
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from export import export_sql, parquet_available, parquet_chunks
+
+
+def _export_role_ready() -> bool:
+    """Banco conectado e papel de exportação criado (`python export.py --create-role`)"""
+    from database_executor import db_executor
+    if not db_executor.connection_status:
+        return False
+    from config import get_export_engine
+    try:
+        get_export_engine().connect().close()
+        return True
+    except Exception:
+        return False
+
+
+def test_export_sql():
+    print("📦 Testando SQL da exportação...")
+    assert export_sql("SELECT a FROM t WHERE b = 'x' LIMIT 10;") == (True, "SELECT a FROM t WHERE b = 'x';",
+                                                                    "SELECT re-renderizado")
+    assert export_sql("SELECT a FROM t ORDER BY a DESC LIMIT 10", limit=500)[1] == \
+        "SELECT a FROM t ORDER BY a DESC LIMIT 500;"
+    # LIMITs internos (subconsultas do top por categoria) ficam; o UNION vira um único SELECT
+    union = "SELECT * FROM (SELECT a FROM t ORDER BY a LIMIT 1) t1 UNION ALL SELECT * FROM (SELECT a FROM t LIMIT 1) t2 LIMIT 10;"
+    assert export_sql(union)[1] == ("SELECT * FROM (SELECT * FROM (SELECT a FROM t ORDER BY a LIMIT 1) AS t1 UNION ALL "
+                                    "SELECT * FROM (SELECT a FROM t LIMIT 1) AS t2) AS export;")
+    # Nada do texto original chega ao COPY sem passar pela árvore: comentários somem, o resto é recusado
+    assert export_sql("SELECT a FROM t -- ) TO PROGRAM 'id'\n LIMIT 10;")[1] == "SELECT a FROM t;"
+    for sql in ["SELECT codigo_filha FROM filhas_touro) TO PROGRAM 'id > /tmp/x' --;",
+                "SELECT a INTO copia FROM t", "SELECT a FROM t FOR UPDATE", "SELECT 1; SELECT 2",
+                "COPY t TO PROGRAM 'id'"]:
+        assert not export_sql(sql)[0], sql
+    print("✅ SQL da exportação OK")
+
+
+def test_parquet_chunks():
+    if not parquet_available():
+        print("⚠️ pyarrow não instalado - pulando Parquet")
+        return
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    print("📦 Testando conversão CSV do COPY → Parquet...")
+    # Como o COPY ... CSV escreve: t/f, NULL = vazio sem aspas, texto vazio = ""
+    lines = [b"codigo,total,media,ativo,nome\n"] + [
+        f"FSC{i},{i},{i / 4},{'t' if i % 2 else 'f'},Touro{i}\n".encode() for i in range(1000)
+    ] + [b'FSCX,,,,""\n']
+    # Blocos do tamanho que quiserem: o leitor junta as linhas partidas
+    body = b"".join(lines)
+    chunks = [body[start:start + 777] for start in range(0, len(body), 777)]
+    columns = [("codigo", 1043), ("total", 23), ("media", 1700), ("ativo", 16), ("nome", 1043)]
+    table = pq.read_table(pa.BufferReader(b"".join(parquet_chunks(chunks, columns))))
+    assert table.num_rows == 1001
+    assert [str(field.type) for field in table.schema] == ["string", "int64", "double", "bool", "string"]
+    assert table.slice(3, 1).to_pylist() == [{"codigo": "FSC3", "total": 3, "media": 0.75, "ativo": True, "nome": "Touro3"}]
+    assert table.slice(1000, 1).to_pylist() == [{"codigo": "FSCX", "total": None, "media": None, "ativo": None, "nome": ""}]
+    print("✅ Parquet OK")
+
+
+def test_copy_export():
+    print("📦 Testando exportação pelo COPY...")
+    from database_executor import CopyStream, db_executor
+    if not _export_role_ready():
+        print("⚠️ Banco ou papel de exportação indisponível - pulando")
+        return
+    from config import get_export_engine
+    from export import recent_exports, start_export
+
+    # Mesma resposta do atalho, mas inteira (o atalho para em 10)
+    ok, export, message = start_export("Quais são as filhas do touro FSC00611?")
+    assert ok, message
+    assert "LIMIT" not in export.sql.upper()
+    rows = list(csv.DictReader(io.StringIO(b"".join(export).decode("utf-8"))))
+    ok, data, _ = db_executor.execute_query(export.sql.rstrip(";") + " LIMIT 100000;")
+    assert len(rows) == len(data) > 10
+    assert rows == [{key: str(value) for key, value in row.items()} for row in data]
+    summary = recent_exports()[0]
+    assert (summary["status"], summary["rows"], summary["format"]) == ("ok", len(rows), "csv")
+    assert summary["rows_per_second"] > 0
+
+    ok, export, _ = start_export("Quais são as filhas do touro FSC00611?", limit=3)
+    assert ok and b"".join(export).count(b"\n") == 4      # cabeçalho + 3
+    ok, _, message = start_export("Quais são as filhas do touro FSC00611?", fmt="xlsx")
+    assert not ok and "Formato" in message
+
+    # SQL fora da árvore do sqlglot nem chega ao banco
+    ok, stream, message = db_executor.copy_query("SELECT codigo_filha FROM filhas_touro) TO PROGRAM 'id' --")
+    assert not ok and stream is None and "recusada" in message
+
+    # Erro da SQL aparece antes de a resposta começar
+    ok, stream, message = db_executor.copy_query("SELECT coluna_inexistente FROM filhas_touro")
+    assert not ok and stream is None and "coluna_inexistente" in message
+
+    # Cliente desconectou no meio: COPY abortado e conexão fora do pool
+    stream = CopyStream(get_export_engine(), "SELECT * FROM filhas_touro", chunk_bytes=1024, queue_chunks=2)
+    assert stream.ready() and next(stream)
+    stream.close()
+    stream._thread.join(5)
+    assert stream.cancelled and not stream._thread.is_alive()
+    assert get_export_engine().pool.checkedout() == 0
+    print("✅ Exportação OK")
+
+
+def test_export_endpoint():
+    if not _export_role_ready():
+        print("⚠️ Banco ou papel de exportação indisponível - teste do endpoint de exportação ignorado")
+        return
+    from app import app
+    from config import get_export_engine
+
+    print("📦 Testando /api/export...")
+    client = app.test_client()
+    response = client.get("/api/export", query_string={"query": "Quais são as filhas do touro FSC00611?"})
+    assert response.status_code == 200 and response.is_streamed
+    assert response.mimetype == "text/csv" and "attachment" in response.headers["Content-Disposition"]
+    assert response.data.splitlines()[0] == b"codigo_filha,nome_filha"
+
+    assert client.get("/api/export", query_string={"query": "filhas do FSC00611", "limit": "0"}).status_code == 400
+    assert client.post("/api/export", json={"query": ""}).status_code == 400
+
+    if parquet_available():
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        response = client.post("/api/export", json={"query": "Quais são as filhas do touro FSC00611?",
+                                                    "format": "parquet"})
+        assert response.status_code == 200 and response.mimetype == "application/vnd.apache.parquet"
+        assert pq.read_table(pa.BufferReader(response.data)).column_names == ["codigo_filha", "nome_filha"]
+
+    # Resposta abandonada: fechar o corpo encerra o COPY e libera a vaga
+    response = client.get("/api/export", query_string={"query": "qual o ranking dos touros por leite 305?"},
+                          buffered=False)
+    next(response.response)
+    response.close()
+    time.sleep(0.5)
+    assert get_export_engine().pool.checkedout() == 0
+    stats = client.get("/api/export/stats").get_json()["exports"]
+    assert stats[0]["status"] in ("ok", "cancelled")
+    print("✅ Endpoint de exportação OK")
+
+
+if __name__ == "__main__":
+    test_export_sql()
+    test_parquet_chunks()
+    test_copy_export()
+    test_export_endpoint()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Teste das ETags / If-None-Match / Cache-Control
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.http import parse_etags
+
+import http_cache
+
+
+def test_etag_matching():
+    print("🏷️ Testando comparação de ETags...")
+    etag = http_cache.make_etag("answer", "SELECT 1", ("filhas_touro", "1:2"))
+    assert etag == http_cache.make_etag("answer", "SELECT 1", ("filhas_touro", "1:2"))
+    assert etag != http_cache.make_etag("answer", "SELECT 1", ("filhas_touro", "1:3"))
+
+    assert http_cache.etag_matches(parse_etags(f'"{etag}"'), etag)
+    assert http_cache.etag_matches(parse_etags(f'"outra", "{etag}-gzip"'), etag)
+    assert http_cache.etag_matches(parse_etags("*"), etag)
+    assert not http_cache.etag_matches(parse_etags('"outra"'), etag)
+    assert not http_cache.etag_matches(parse_etags(None), etag)
+    assert not http_cache.etag_matches(parse_etags(f'"{etag}"'), None)
+
+    assert http_cache.tables_in("SELECT * FROM filhas_touro f JOIN cubo_genealogia g ON 1 = 1") == \
+        ("cubo_genealogia", "filhas_touro")
+    print("✅ ETags OK")
+
+
+def test_conditional_answers():
+    print("🔁 Testando 304 nas respostas de atalho...")
+    from database_executor import db_executor
+    if not db_executor.connection_status:
+        print("⚠️ Banco indisponível - teste de 304 ignorado")
+        return
+    from app import app
+
+    from nl_to_sql import NLToSQLPipeline
+
+    client = app.test_client()
+    question = {"query": "Quais são as filhas do touro FSC00611?"}
+    # Uma requisição analisa e roteia a pergunta uma vez só (ETag e execução usam o mesmo plano)
+    routings = []
+    route_query = NLToSQLPipeline.route_query
+    NLToSQLPipeline.route_query = lambda self, *args: routings.append(1) or route_query(self, *args)
+    try:
+        first = client.get("/api/nl-to-sql", query_string=question)
+    finally:
+        NLToSQLPipeline.route_query = route_query
+    assert len(routings) == 1
+    etag = first.headers["ETag"]
+    # Fraca: réplica ou banco, o corpo muda byte a byte com os mesmos dados
+    assert etag.startswith("W/")
+    assert first.status_code == 200 and "max-age" in first.headers["Cache-Control"]
+
+    repeat = client.get("/api/nl-to-sql", query_string=question, headers={"If-None-Match": etag})
+    assert repeat.status_code == 304 and repeat.headers["ETag"] == etag and not repeat.data
+    # Outro tamanho de página é outra resposta
+    other = client.get("/api/nl-to-sql", query_string={**question, "page_size": 5}, headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["ETag"] != etag
+
+    schema = client.get("/api/schema-info")
+    assert client.get("/api/schema-info", headers={"If-None-Match": schema.headers["ETag"]}).status_code == 304
+    print("✅ 304 OK")
+
+
+if __name__ == "__main__":
+    test_etag_matching()
+    test_conditional_answers()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Teste da inicialização preguiçosa, do warm-up e dos endpoints /healthz e /readyz
+"""
+
+import sys
+import os
+import subprocess
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from lazy import LazySingleton
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_lazy_singleton():
+    print("💤 Testando LazySingleton...")
+    calls = []
+
+    class Heavy:
+        def __init__(self):
+            calls.append(1)
+            time.sleep(0.05)
+            self.value = 42
+
+    lazy = LazySingleton("heavy", Heavy)
+    assert not lazy.initialized and lazy.status()["init_seconds"] is None
+
+    # Acessos concorrentes esperam a mesma construção
+    threads = [threading.Thread(target=lambda: lazy.value) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and lazy.initialized and lazy.value == 42
+    lazy.value = 7
+    assert lazy.initialize().value == 7
+    assert lazy.status()["init_seconds"] >= 0.05
+
+    broken = LazySingleton("quebrado", lambda: 1 / 0)
+    try:
+        broken.initialize()
+        assert False, "a falha da fábrica deveria propagar"
+    except ZeroDivisionError:
+        pass
+    assert not broken.initialized and "ZeroDivisionError" in broken.status()["error"]
+    print("✅ LazySingleton OK")
+
+
+def test_import_has_no_side_effects():
+    print("📦 Testando import sem efeitos colaterais...")
+    code = (
+        "import sys, config\n"
+        "assert 'sqlalchemy' not in sys.modules\n"
+        "import app\n"
+        "from database_executor import db_executor\n"
+        "from schema_mapper import schema_mapper\n"
+        "assert not db_executor.initialized and not schema_mapper.initialized\n"
+        "assert 'pandas' not in sys.modules and 'requests' not in sys.modules\n"
+        "assert config._engine is None\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=API_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    print("✅ Import OK")
+
+
+def test_start_without_threads():
+    print("🍴 Testando inicialização sem threads (pai antes do fork)...")
+    code = (
+        "import threading, lifecycle\n"
+        "from database_executor import db_executor\n"
+        "lifecycle.start(background=False, threads=False)\n"
+        "assert threading.active_count() == 1, [t.name for t in threading.enumerate()]\n"
+        "assert lifecycle.status()['phase'] == 'done'\n"
+        "lifecycle.start_background()\n"
+        "names = {t.name for t in threading.enumerate()}\n"
+        "assert not db_executor.connection_status or {'cube-replicas', 'matviews', 'schema-refresh'} <= names, names\n"
+    )
+    env = dict(os.environ, WARMUP_QUESTIONS="genealogia do FSC00611", REPLICA_ENABLED="1",
+               REPLICA_TABLES="filhas_touro", WARMUP_MODEL="0")
+    result = subprocess.run([sys.executable, "-c", code], cwd=API_DIR, capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
+    print("✅ Inicialização sem threads OK")
+
+
+def test_probes():
+    import lifecycle
+    from app import app
+
+    client = app.test_client()
+    assert client.get("/healthz").status_code == 200
+
+    lifecycle.start(background=False)
+    status = lifecycle.status()
+    response = client.get("/readyz")
+    assert response.headers["Cache-Control"] == "no-store"
+    assert status["phase"] == "done" and all(c["initialized"] for c in status["components"].values())
+    if status["database_connected"]:
+        assert response.status_code == 200 and response.get_json()["ready"]
+    else:
+        print("⚠️ Banco indisponível - /readyz deve responder 503")
+        assert response.status_code == 503 and response.headers["Retry-After"]
+
+
+def test_warm_up_steps():
+    print("🔥 Testando warm-up (pool e perguntas populares)...")
+    import lifecycle
+    from config import Config
+    from database_executor import db_executor
+
+    saved = (Config.WARMUP_ENABLED, Config.WARMUP_MODEL, Config.WARMUP_QUESTIONS)
+    Config.WARMUP_ENABLED, Config.WARMUP_MODEL = True, False
+    Config.WARMUP_QUESTIONS = ["genealogia do FSC00611"]
+    try:
+        # Durante o warm-up o /readyz não fica pronto
+        lifecycle._phase("warming")
+        assert not lifecycle.status()["ready"]
+        lifecycle.warm_up()
+    finally:
+        Config.WARMUP_ENABLED, Config.WARMUP_MODEL, Config.WARMUP_QUESTIONS = saved
+    status = lifecycle.status()
+    assert status["phase"] == "done" and "model" not in status["steps"]
+    if not db_executor.connection_status:
+        print("⚠️ Banco indisponível - pulando passos do banco")
+        return
+    steps = status["steps"]
+    assert steps["pool"]["ok"] and steps["questions"]["ok"], steps
+    assert steps["questions"]["detail"].startswith("1/1")
+    assert lifecycle.fill_pool(2) == "2 conexões no pool"
+    assert status["ready"]
+    print("✅ Warm-up OK")
+
+
+if __name__ == "__main__":
+    test_lazy_singleton()
+    test_import_has_no_side_effects()
+    test_start_without_threads()
+    test_probes()
+    test_warm_up_steps()
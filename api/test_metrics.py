@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Teste do exportador de métricas (formato texto do Prometheus)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+
+
+def test_exposition_format():
+    print("📈 Testando formato de exposição...")
+    registry = metrics.Registry()
+    requests = registry.counter("teste_requests_total", "Perguntas", ["path", "status"])
+    latency = registry.histogram("teste_seconds", "Latência", ["stage"], buckets=(0.1, 1.0))
+    in_flight = registry.gauge("teste_in_flight", "Em andamento")
+    registry.callback("teste_pool", "Pool", "gauge", ["state"], lambda: [(("size",), 5)])
+
+    requests.labels("filhas_touro", "ok").inc()
+    requests.labels("filhas_touro", "ok").inc(2)
+    requests.labels('com "aspas"\n', "error").inc()
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.labels("execution").observe(value)
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    lines = registry.render().splitlines()
+    assert "# TYPE teste_requests_total counter" in lines
+    assert 'teste_requests_total{path="filhas_touro",status="ok"} 3' in lines
+    assert 'teste_requests_total{path="com \\"aspas\\"\\n",status="error"} 1' in lines
+    # Buckets cumulativos (le inclusivo) + _sum e _count
+    assert 'teste_seconds_bucket{stage="execution",le="0.1"} 2' in lines
+    assert 'teste_seconds_bucket{stage="execution",le="1"} 3' in lines
+    assert 'teste_seconds_bucket{stage="execution",le="+Inf"} 4' in lines
+    assert 'teste_seconds_count{stage="execution"} 4' in lines
+    assert 'teste_seconds_sum{stage="execution"} 3.65' in lines
+    assert "teste_in_flight 1" in lines
+    assert 'teste_pool{state="size"} 5' in lines
+
+    try:
+        requests.labels("só um rótulo")
+        assert False, "quantidade de rótulos errada deveria falhar"
+    except ValueError:
+        pass
+    print("✅ Formato OK")
+
+
+def test_metrics_endpoint():
+    from app import app
+
+    metrics.cache_event("schema_info", True)
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200 and response.content_type.startswith("text/plain; version=0.0.4")
+    body = response.get_data(as_text=True)
+    for name in ("nl2sql_stage_seconds", "nl2sql_requests_total", "nl2sql_sql_validation_total",
+                 "nl2sql_llm_in_flight", "nl2sql_llm_generation_seconds", "nl2sql_cache_requests_total"):
+        assert f"# TYPE {name} " in body
+    assert 'nl2sql_cache_requests_total{cache="schema_info",result="hit"}' in body
+
+
+if __name__ == "__main__":
+    test_exposition_format()
+    test_metrics_endpoint()
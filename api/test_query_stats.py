@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Teste do fingerprint de SQL e dos agregados por formato de query
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from query_stats import QueryStats, fingerprint
+
+
+def test_fingerprint_ignores_literals():
+    print("🧬 Testando fingerprint...")
+    a = fingerprint("SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = 'FSC00370' LIMIT 10;")
+    b = fingerprint("select codigo_filha, nome_filha  from filhas_touro where codigo_touro = 'FSC1' limit 50")
+    assert a == b
+    assert a[1] == "SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = ? LIMIT ?"
+    # Listas IN de tamanhos diferentes, aspas escapadas e negativos
+    assert fingerprint("SELECT a FROM t WHERE b IN (1, 2, 3) AND c = 'O''Brien' AND d > -1.5")[1] == \
+        fingerprint("SELECT a FROM t WHERE b IN (7) AND c = 'x' AND d > 2")[1] == \
+        "SELECT a FROM t WHERE b IN (?) AND c = ? AND d > ?"
+    # Identificadores com dígitos e parâmetros nomeados ficam intactos
+    assert fingerprint("SELECT media_leite_305d FROM t1 WHERE k > :last")[1] == \
+        "SELECT media_leite_305d FROM t1 WHERE k > :last"
+    assert fingerprint("SELECT a FROM t WHERE b = 1")[0] != fingerprint("SELECT a FROM t WHERE c = 1")[0]
+    print("✅ Fingerprint OK")
+
+
+def test_aggregates_and_bound():
+    print("📊 Testando agregados...")
+    stats = QueryStats(max_fingerprints=2)
+    for i in range(20):
+        stats.record(f"SELECT * FROM cubo_genealogia WHERE animal_codigo = 'FSC{i}'", (i + 1) / 1000, rows=1,
+                     source="shortcut" if i % 2 else "llm")
+    stats.record("SELECT * FROM cubo_genealogia WHERE animal_codigo = 'x'", 0.5, source="llm", ok=False)
+
+    item, = stats.snapshot()
+    assert item["count"] == 21 and item["errors"] == 1 and item["rows"] == 20
+    assert item["sources"] == {"shortcut": 10, "llm": 11}
+    assert item["total_ms"] == 710.0 and item["max_ms"] == 500.0
+    assert item["p95_ms"] == 20.0
+
+    stats.record("SELECT 1", 0.001)
+    stats.record("SELECT nome_vaca FROM cubo_resumo_vaca", 0.001)
+    assert len(stats) == 2 and stats.evicted == 1
+    assert [i["count"] for i in stats.snapshot(order_by="count")] == [1, 1]
+    print("✅ Agregados OK")
+
+
+def test_endpoint_limit_and_cache():
+    print("🌐 Testando /api/query-stats...")
+    from app import app
+    from query_stats import query_stats
+
+    query_stats.record("SELECT nome_vaca FROM cubo_resumo_vaca WHERE codigo_bovino = 'FSC1'", 0.001)
+    query_stats.record("SELECT codigo_filha FROM filhas_touro WHERE codigo_touro = 'FSC2'", 0.001)
+    client = app.test_client()
+    response = client.get("/api/query-stats", query_string={"limit": -1})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-store"
+    assert len(response.get_json()["fingerprints"]) == 1  # limite negativo vira 1
+    response = client.get("/api/query-stats", query_string={"limit": 10 ** 6})
+    assert len(response.get_json()["fingerprints"]) == len(query_stats)
+    print("✅ Endpoint OK")
+
+
+if __name__ == "__main__":
+    test_fingerprint_ignores_literals()
+    test_aggregates_and_bound()
+    test_endpoint_limit_and_cache()
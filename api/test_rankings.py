@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Teste do motor de rankings (top N e posição de um touro) pela réplica e pelo Postgres
+"""
+
+import sys
+import os
+from decimal import Decimal
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cube_replica import TableReplica, cube_replicas
+from rankings import RankingQuery, parse_ranking, ranking_rows, ranking_sql
+
+
+def test_parse_ranking():
+    print("🏆 Testando reconhecimento de rankings...")
+    ranking = parse_ranking("top 10 touros por gordura com amostra significativa")
+    assert (ranking.table, ranking.metric, ranking.limit) == ("cubo_producao_touro_filhas", "media_gordura_305d", 10)
+    assert (ranking.where, ranking.flag, ranking.explicit) == ("tem_amostra_significativa", True, True)
+
+    ranking = parse_ranking("quais os vinte melhores touros do primeiro parto sem amostra representativa?")
+    assert (ranking.table, ranking.metric, ranking.limit) == \
+        ("cubo_primeiro_parto_filhas", "media_producao_primeiro_parto", 20)
+    assert (ranking.where, ranking.flag) == ("amostra_representativa", False)
+
+    ranking = parse_ranking("qual a posição do touro FSC00611 no ranking de proteína das descendentes?")
+    assert ranking.table == "cubo_producao_touro_descendentes" and ranking.metric == "media_leite_305d"
+    assert (ranking.bull_column, ranking.bull) == ("codigo_touro", "FSC00611") and "total_ranking" in ranking.fields
+    assert parse_ranking("colocação do Touro00611 em produção vitalícia").bull == "Touro00611"
+
+    # Sem N: plural → 10, singular → 1 (e os atalhos fixos têm prioridade)
+    assert parse_ranking("quais os melhores touros em proteína?").limit == 10
+    assert not parse_ranking("qual touro tem a maior gordura?").explicit
+    assert parse_ranking("Quais são as filhas do touro FSC00611?") is None
+    assert parse_ranking("top 10 vacas por produção") is None
+    assert parse_ranking("top 5 touros elite com amostra significativa") is None   # dois filtros
+
+    # Nas métricas o caminho não carrega N nem o código do touro (séries limitadas)
+    paths = {parse_ranking(question).path for question in (
+        "top 7 touros por leite", "top 8 touros por leite", "posição do touro FSC00611 no ranking de leite",
+        "posição do touro FSC00612 no ranking de leite")}
+    assert len(paths) == 1 and not any(char.isdigit() for char in paths.pop().replace("305", ""))
+    print("✅ Reconhecimento OK")
+
+
+def test_ties_nulls_and_partitions():
+    print("🏆 Testando empates, NULLs e partições...")
+    spec = {"keys": ["codigo_touro"],
+            "rankings": {"metrics": ["media_gordura_305d"], "filters": ["producao_elite"]}}
+    names = ["codigo_touro", "nome_touro", "media_gordura_305d", "total_filhas", "producao_elite"]
+    rows = [
+        ("FSC1", "Touro1", Decimal("10"), 5, True),
+        ("FSC2", "Touro2", None, 3, True),
+        ("FSC3", "Touro3", Decimal("30"), 7, False),
+        ("FSC4", "Touro4", Decimal("30"), 1, None),
+        ("FSC5", "Touro5", Decimal("20"), 2, True),
+    ]
+    cube_replicas.install(TableReplica("cubo_producao_touro_filhas", spec, names, rows))
+    try:
+        top = ranking_rows(RankingQuery("cubo_producao_touro_filhas", "media_gordura_305d", limit=10))
+        assert [(r["posicao"], r["codigo_touro"]) for r in top] == [(1, "FSC3"), (1, "FSC4"), (3, "FSC5"), (4, "FSC1")]
+        assert ranking_rows(RankingQuery("cubo_producao_touro_filhas", "media_gordura_305d", limit=2))[1]["posicao"] == 1
+
+        elite = RankingQuery("cubo_producao_touro_filhas", "media_gordura_305d", limit=5, where="producao_elite")
+        assert [r["codigo_touro"] for r in ranking_rows(elite)] == ["FSC5", "FSC1"]
+        not_elite = RankingQuery("cubo_producao_touro_filhas", "media_gordura_305d", limit=5,
+                                 where="producao_elite", flag=False)
+        assert [r["codigo_touro"] for r in ranking_rows(not_elite)] == ["FSC3", "FSC4"]
+
+        def position(bull, **partition):
+            return ranking_rows(RankingQuery("cubo_producao_touro_filhas", "media_gordura_305d",
+                                             bull_column="codigo_touro", bull=bull, **partition))
+        assert position("FSC4")[0]["posicao"] == 1 and position("FSC4")[0]["total_ranking"] == 4
+        assert position("FSC1", where="producao_elite")[0]["posicao"] == 2
+        assert position("FSC3", where="producao_elite") == []     # fora da partição
+        assert position("FSC2") == [] and position("FSC9") == []  # métrica NULL / touro inexistente
+        # Métrica sem ranking pré-calculado: None (vai ao banco)
+        assert ranking_rows(RankingQuery("cubo_producao_touro_filhas", "media_leite_305d")) is None
+    finally:
+        cube_replicas._replicas.clear()
+    print("✅ Empates, NULLs e partições OK")
+
+
+def test_replica_matches_database():
+    print("🏆 Testando rankings pela réplica x Postgres...")
+    from database_executor import db_executor
+
+    if not db_executor.connection_status:
+        print("⚠️ Banco indisponível - pulando")
+        return
+    questions = [
+        "top 25 touros por proteína sem amostra significativa",
+        "quais os 10 maiores touros em média das netas com netas",
+        "top 15 touros do primeiro parto em gordura",
+        "qual a posição do touro FSC00611 no ranking de gordura com amostra significativa",
+        "posição do touro FSC00611 no ranking do primeiro parto",
+    ]
+    try:
+        cube_replicas.refresh(tables=["cubo_producao_touro_filhas", "cubo_producao_touro_descendentes",
+                                      "cubo_primeiro_parto_filhas"])
+        for question in questions:
+            ranking = parse_ranking(question)
+            from_replica = ranking_rows(ranking)
+            ok, from_database, message = db_executor.execute_query(ranking_sql(ranking))
+            assert ok, message
+            # Empates podem vir em outra ordem do banco: compara posição e valor da métrica
+            key = lambda rows: [(r["posicao"], float(r[ranking.metric]), r.get("total_ranking")) for r in rows]
+            assert from_replica and key(from_replica) == key(from_database), question
+    finally:
+        cube_replicas._replicas.clear()
+    print("✅ Rankings pela réplica OK")
+
+
+if __name__ == "__main__":
+    test_parse_ranking()
+    test_ties_nulls_and_partitions()
+    test_replica_matches_database()
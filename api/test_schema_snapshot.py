@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Teste do snapshot do schema (reuso com o dump intacto, refeito quando o dump muda)
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database_schema_loader import DatabaseSchemaLoader
+
+DUMP = """CREATE TABLE public.{table} (
+    codigo_touro character varying(20) NOT NULL
+);
+
+COPY public.{table} (codigo_touro) FROM stdin;
+FSC00370
+\\.
+"""
+
+
+def _loader(dump_path: str):
+    """Loader do dump que conta quantas vezes o backup foi reanalisado"""
+    loader = DatabaseSchemaLoader(backup_path=dump_path)
+    analyze = loader.analyzer.analyze_structure
+    loader.analyses = 0
+
+    def counting():
+        loader.analyses += 1
+        return analyze()
+
+    loader.analyzer.analyze_structure = counting
+    return loader
+
+
+def test_snapshot_reuse_and_invalidation():
+    print("💾 Testando reuso e invalidação do snapshot do schema...")
+    with tempfile.TemporaryDirectory() as workdir:
+        dump_path = os.path.join(workdir, "backup.sql")
+        with open(dump_path, "w") as f:
+            f.write(DUMP.format(table="filhas_touro"))
+
+        first = _loader(dump_path)
+        assert first.load_schema() and first.analyses == 1
+        assert os.path.exists(dump_path + ".schema.json")
+        version = first.schema_info["snapshot_version"]
+
+        # Dump intacto: schema vem do snapshot, sem reanalisar
+        second = _loader(dump_path)
+        assert second.load_schema() and second.analyses == 0
+        assert second.schema_info["tables"] == ["filhas_touro"]
+        assert second.schema_info["snapshot_version"] == version
+
+        # Dump reescrito com o mesmo tamanho e o mesmo mtime: o hash do conteúdo invalida
+        stat = os.stat(dump_path)
+        with open(dump_path, "w") as f:
+            f.write(DUMP.format(table="filhas_vacas"))
+        os.utime(dump_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert os.path.getsize(dump_path) == stat.st_size
+
+        third = _loader(dump_path)
+        assert third.load_schema() and third.analyses == 1
+        assert third.schema_info["tables"] == ["filhas_vacas"]
+        assert third.schema_info["snapshot_version"] != version
+
+        # O snapshot refeito volta a ser reusado
+        fourth = _loader(dump_path)
+        assert fourth.load_schema() and fourth.analyses == 0
+        assert fourth.schema_info["tables"] == ["filhas_vacas"]
+    print("✅ Snapshot do schema OK")
+
+
+if __name__ == "__main__":
+    test_snapshot_reuse_and_invalidation()
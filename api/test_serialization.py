@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Teste da serialização JSON e da compressão negociada
+"""
+
+import sys
+import os
+import gzip
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+from flask import Flask, jsonify
+
+import serialization
+from serialization import dumps, negotiate_encoding
+
+
+def test_dumps_native_types():
+    print("🧾 Testando tipos do Postgres/NumPy...")
+    row = {
+        "media": Decimal("25000.50"),
+        "parto": date(2024, 5, 1),
+        "atualizado": datetime(2024, 5, 1, 12, 30),
+        "partos": np.int64(3),
+        "fracao": np.float32(0.5),
+        "serie": np.array([1, 2]),
+        "nulo": None,
+        "nome": "Conceição",
+    }
+    assert serialization.loads(dumps(row)) == {
+        "media": 25000.5, "parto": "2024-05-01", "atualizado": "2024-05-01T12:30:00",
+        "partos": 3, "fracao": 0.5, "serie": [1, 2], "nulo": None, "nome": "Conceição",
+    }
+    print("✅ Tipos OK")
+
+
+def test_negotiation():
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("*") == serialization._CODECS[0][0]
+    # Preferência do cliente vence a ordem do servidor
+    if len(serialization._CODECS) > 1:
+        assert negotiate_encoding("br;q=0.5, zstd;q=0.5, gzip;q=1") == "gzip"
+
+
+def test_flask_compression():
+    print("🗜️ Testando compressão no Flask...")
+    app = serialization.init_app(Flask(__name__))
+
+    @app.route("/grande")
+    def grande():
+        return jsonify({"data": [{"codigo": f"FSC{i:05d}", "media": Decimal("1.5")} for i in range(500)]})
+
+    @app.route("/pequena")
+    def pequena():
+        return jsonify({"ok": True})
+
+    client = app.test_client()
+    response = client.get("/grande", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    body = serialization.loads(gzip.decompress(response.data))
+    assert body["data"][499] == {"codigo": "FSC00499", "media": 1.5}
+
+    assert "Content-Encoding" not in client.get("/grande").headers
+    assert "Content-Encoding" not in client.get("/pequena", headers={"Accept-Encoding": "gzip"}).headers
+    print("✅ Compressão OK")
+
+
+if __name__ == "__main__":
+    test_dumps_native_types()
+    test_negotiation()
+    test_flask_compression()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Teste do validador/normalizador de SQL
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sql_validator import _validate_with_regex, rewrite_or_equalities, validate_and_fix
+
+
+def test_rewrites():
+    print("🛠️ Testando normalização de SQL...")
+    ok, sql, _ = validate_and_fix(
+        "Consulta:\nSELECT c1.animal_codigo, c1.animal_nome FROM public.filhas_touro c1 "
+        "JOIN cubo_genealogia g ON g.animal_codigo = c1.pai_codigo WHERE c1.pai_codigo = 'FSC00370';"
+    )
+    assert ok
+    assert sql == "SELECT codigo_filha, nome_filha FROM filhas_touro WHERE codigo_touro = 'FSC00370' LIMIT 10;"
+
+    ok, sql, _ = validate_and_fix("SELECT codigo_touro, nome_touro FROM cubo_genealogia WHERE codigo_touro = 'FSC1' LIMIT 3")
+    assert ok and sql == "SELECT pai_codigo, animal_nome FROM cubo_genealogia WHERE pai_codigo = 'FSC1' LIMIT 3;"
+
+    # Sem alterações na árvore: mesma SQL renderizada da árvore, com LIMIT e ;
+    ok, sql, _ = validate_and_fix("SELECT nome_vaca FROM cubo_resumo_vaca WHERE nome_vaca ILIKE 'a.b%'")
+    assert ok and sql == "SELECT nome_vaca FROM cubo_resumo_vaca WHERE nome_vaca ILIKE 'a.b%' LIMIT 10;"
+    print("✅ Normalização OK")
+
+
+def test_union_keeps_subquery_aliases():
+    union = ("SELECT * FROM (SELECT codigo_touro FROM cubo_producao_touro_filhas ORDER BY media_leite_305d DESC LIMIT 1) t1 "
+             "UNION ALL SELECT * FROM (SELECT codigo_touro FROM cubo_producao_touro_filhas LIMIT 1) t2;")
+    ok, sql, _ = validate_and_fix(union)
+    assert ok and sql == union.replace(") t1", ") AS t1").replace(") t2", ") AS t2")
+
+
+def test_limit_rendered_from_tree():
+    # Comentário no fim: o LIMIT não pode ir parar dentro dele
+    ok, sql, _ = validate_and_fix("SELECT nome_vaca FROM cubo_resumo_vaca -- comentario\n")
+    assert ok and sql == "SELECT nome_vaca FROM cubo_resumo_vaca LIMIT 10;"
+
+
+def test_dangerous_statements():
+    for sql in ("DROP TABLE filhas_touro;", "UPDATE filhas_touro SET nome_touro = 'x';",
+                "SELECT * FROM (DELETE FROM filhas_touro RETURNING *) t;",
+                "SELECT * FROM filhas_touro FOR UPDATE", "SELECT * INTO copia FROM filhas_touro"):
+        ok, _, msg = validate_and_fix(sql)
+        assert not ok, sql
+    # Só o primeiro SELECT é mantido
+    assert validate_and_fix("SELECT 1; DELETE FROM filhas_touro;")[1] == "SELECT 1 LIMIT 10;"
+    try:
+        _validate_with_regex("SELECT * FROM t; DROP TABLE t;")
+    except ValueError:
+        raise AssertionError("fallback deve manter só o primeiro SELECT")
+    assert _validate_with_regex("SELECT a FROM t") == "SELECT a FROM t LIMIT 10;"
+
+
+def test_or_equalities_to_union():
+    print("🔀 Testando reescrita OR → UNION ALL...")
+    changed, sql = rewrite_or_equalities(
+        "SELECT animal_codigo FROM cubo_genealogia WHERE animal_codigo = 'FSC1' OR pai_codigo = 'FSC1' "
+        "OR mae_codigo = 'FSC1' ORDER BY CASE WHEN animal_codigo = 'FSC1' THEN 1 "
+        "WHEN pai_codigo = 'FSC1' OR mae_codigo = 'FSC1' THEN 2 ELSE 3 END LIMIT 20;"
+    )
+    assert changed
+    assert sql == (
+        "SELECT ranked.animal_codigo FROM ("
+        "(SELECT animal_codigo, 1 AS match_rank FROM cubo_genealogia WHERE animal_codigo = 'FSC1' LIMIT 20) UNION ALL "
+        "(SELECT animal_codigo, 2 AS match_rank FROM cubo_genealogia WHERE pai_codigo = 'FSC1' "
+        "AND animal_codigo IS DISTINCT FROM 'FSC1' LIMIT 20) UNION ALL "
+        "(SELECT animal_codigo, 2 AS match_rank FROM cubo_genealogia WHERE mae_codigo = 'FSC1' "
+        "AND animal_codigo IS DISTINCT FROM 'FSC1' AND pai_codigo IS DISTINCT FROM 'FSC1' LIMIT 20)"
+        ") AS ranked ORDER BY match_rank LIMIT 20;"
+    )
+    # Fora do formato: mesma coluna (IN), termo não-igualdade, ORDER BY comum, OFFSET,
+    # e colunas da resposta que o SELECT externo não consegue reprojetar (*, expressão sem nome, repetida)
+    for sql in ("SELECT a FROM t WHERE a = 1 OR a = 2",
+                "SELECT * FROM t WHERE a = 1 OR b = 2",
+                "SELECT a + 1 FROM t WHERE a = 1 OR b = 2",
+                "SELECT a, b AS a FROM t WHERE a = 1 OR b = 2",
+                "SELECT a FROM t WHERE a = 1 OR b > 2",
+                "SELECT a FROM t WHERE a = 1 OR b = 2 ORDER BY a",
+                "SELECT a FROM t WHERE a = 1 OR b = 2 LIMIT 5 OFFSET 5"):
+        assert rewrite_or_equalities(sql) == (False, sql), sql
+    print("✅ Reescrita OR OK")
+
+
+if __name__ == "__main__":
+    test_rewrites()
+    test_union_keeps_subquery_aliases()
+    test_limit_rendered_from_tree()
+    test_dangerous_statements()
+    test_or_equalities_to_union()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Teste do pipeline em eventos (SSE)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import serialization
+
+
+def test_sse_format():
+    event = serialization.sse_event("rows", {"offset": 0, "rows": [{"nome": "linha\nquebrada"}]})
+    assert event.startswith(b"event: rows\ndata: ") and event.endswith(b"\n\n")
+    # Quebras de linha do conteúdo vêm escapadas no JSON: um único campo data
+    assert event.count(b"\n") == 3
+    assert serialization.loads(event.split(b"data: ", 1)[1]) == {"offset": 0, "rows": [{"nome": "linha\nquebrada"}]}
+
+
+def test_stream_events():
+    print("📡 Testando eventos do pipeline...")
+    from database_executor import db_executor
+    if not db_executor.connection_status:
+        print("⚠️ Banco indisponível - teste de streaming ignorado")
+        return
+    from nl_to_sql import nl_to_sql_pipeline
+    from query_stats import query_stats
+
+    events = list(nl_to_sql_pipeline.stream_events("Quais são as filhas do touro FSC00611?", batch_rows=4))
+    names = [name for name, _ in events]
+    assert names[:4] == ["analysis", "route", "sql", "executing"] and names[-1] == "done"
+    assert events[1][1]["source"] == "shortcut"
+    rows = [row for name, payload in events if name == "rows" for row in payload["rows"]]
+    assert len(rows) == events[-1][1]["rows"] and names.count("rows") == -(-len(rows) // 4)
+
+    # Cliente saiu depois da SQL: nada é executado
+    executed = query_stats.snapshot(limit=1000)
+    before = sum(entry["count"] for entry in executed)
+    stream = nl_to_sql_pipeline.stream_events("Quais são as filhas do touro FSC00611?")
+    for name, _ in stream:
+        if name == "sql":
+            stream.close()
+            break
+    assert sum(entry["count"] for entry in query_stats.snapshot(limit=1000)) == before
+
+    # Cursor do banco fechado no meio do resultado devolve a conexão ao pool
+    ok, batches, _ = db_executor.stream_query("SELECT codigo_filha FROM filhas_touro LIMIT 1000", batch_rows=10)
+    assert ok and len(next(batches)) == 10
+    batches.close()
+    assert db_executor.engine.pool.checkedout() == 0
+    print("✅ Streaming OK")
+
+
+def test_stream_endpoint():
+    from database_executor import db_executor
+    if not db_executor.connection_status:
+        print("⚠️ Banco indisponível - teste do endpoint SSE ignorado")
+        return
+    from app import app
+
+    client = app.test_client()
+    response = client.get("/api/nl-to-sql/stream", query_string={"query": "genealogia do FSC00611"},
+                          headers={"Accept-Encoding": "gzip"})
+    assert response.mimetype == "text/event-stream" and "Content-Encoding" not in response.headers
+    assert response.headers["Cache-Control"] == "no-store"
+    names = [block.split("\n", 1)[0] for block in response.get_data(as_text=True).split("\n\n") if block]
+    assert names[0] == "event: analysis" and names[-1] == "event: done"
+    assert client.get("/api/nl-to-sql/stream", query_string={"query": "x", "page_size": 0}).status_code == 400
+
+
+if __name__ == "__main__":
+    test_sse_format()
+    test_stream_events()
+    test_stream_endpoint()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Teste da normalização de termos (acentos, plurais e erros de digitação)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from text_normalizer import TermMatcher, TrigramIndex, normalize_terms
+
+
+def test_accent_and_plural_folding():
+    print("🔤 Testando dobra de acentos e plurais...")
+    assert normalize_terms("gerações") == normalize_terms("geraçao") == ["geracao"]
+    assert normalize_terms("Produção Vitalícia") == ["producao", "vitalicia"]
+    assert normalize_terms("1º parto") == normalize_terms("1o parto")
+    assert normalize_terms("filhas e netas") == ["filha", "e", "neta"]
+    assert normalize_terms("Vaca33614") == ["vaca", "33614"]
+
+
+def test_typo_correction():
+    print("⌨️ Testando correção de erros de digitação...")
+    index = TrigramIndex(["genealogia", "producao", "ranking"])
+    assert index.correct("genealogai") == "genealogia"
+    assert index.correct("rankng") == "ranking"
+    assert index.correct("touro") is None  # fora do vocabulário e curto demais
+
+    # Cache de correções limitado; termo novo invalida as correções já memoizadas
+    bounded = TrigramIndex(["genealogia", "producao"], cache_size=2)
+    for token in ("genealogai", "producoa", "xyzxyzxyz", "abcabcabc"):
+        bounded.correct(token)
+    assert bounded._cached_correct.cache_info().currsize == 2
+    assert bounded.correct("rankng") is None
+    bounded.add("ranking")
+    assert bounded.correct("rankng") == "ranking"
+
+
+def test_term_matcher_phrases():
+    print("🧭 Testando grupos de termos do roteamento...")
+    matcher = TermMatcher({
+        "ranking": ["maior média", "top"],
+        "primeiro_parto": ["primeiro parto", "1º parto"],
+        "filhas": ["filha"],
+    })
+    assert matcher.match("Touro com filhas de MAIOR MEDIA no 1o parto") == {"ranking", "primeiro_parto", "filhas"}
+    assert matcher.match("maior produção") == set()
+
+
+def test_routing_terms():
+    print("🧭 Testando os termos dos atalhos (filhas × netas)...")
+    from nl_to_sql import _ROUTING_TERMS
+    from text_normalizer import normalize_text
+    # Atalho das filhas: filha/descendente, como antes; netas não são filhas
+    assert "filhas" in _ROUTING_TERMS.match(normalize_text("Quais são as filhas do touro FSC00611?"))
+    assert "descendentes" in _ROUTING_TERMS.match(normalize_text("descendentes de FSC77898"))
+    assert not _ROUTING_TERMS.match(normalize_text("netas do FSC00611")) & {"filhas", "descendentes"}
+    # Ranking de descendentes: descendente, neta ou "filhas e netas"
+    assert {"netas", "ranking", "touro"} <= _ROUTING_TERMS.match(normalize_text("touro com netas de maior média"))
+
+
+if __name__ == "__main__":
+    test_accent_and_plural_folding()
+    test_typo_correction()
+    test_term_matcher_phrases()
+    test_routing_terms()
+    print("✅ Normalização OK")
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Normalização de termos tolerante a acentos e erros de digitação.
+- Dobra Unicode (NFKD) e remove acentos: "produção" -> "producao", "1º" -> "1o"
+- Reduz plurais do português: "gerações" -> "geracao", "filhas" -> "filha"
+- Índice de trigramas para corrigir erros com distância de edição limitada
+
+A pergunta é normalizada uma única vez (NormalizedText) e os vocabulários
+(TermMatcher, mapeamentos de palavras-chave) são normalizados no carregamento,
+de modo que todos os casamentos viram comparações de tokens já normalizados.
+"""
+from __future__ import annotations
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Letras e dígitos viram tokens separados: "Vaca33614" -> "vaca", "33614"
+_TOKEN_RE = re.compile(r"[a-z]+|[0-9]+")
+
+# Sufixos de plural (ordem importa: mais específicos primeiro)
+_PLURAL_RULES: Tuple[Tuple[str, str, int], ...] = (
+    ("oes", "ao", 5),   # gerações -> geracao, lactações -> lactacao
+    ("ais", "al", 5),   # animais -> animal
+    ("eis", "el", 5),   # reprodutíveis -> reprodutivel
+    ("ns", "m", 4),     # bons -> bom
+    ("res", "r", 5),    # reprodutores -> reprodutor
+    ("zes", "z", 5),    # vezes -> vez
+    ("s", "", 4),       # filhas -> filha, touros -> touro
+)
+_NO_STRIP_ENDINGS = ("ss", "us", "is")
+
+
+def fold(text: str) -> str:
+    """Remove acentos (NFKD) e converte para minúsculas."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+@lru_cache(maxsize=8192)
+def stem(token: str) -> str:
+    """Stemming leve para plurais do português (token já dobrado)."""
+    if token.isdigit() or len(token) < 4:
+        return token
+    for suffix, replacement, min_len in _PLURAL_RULES:
+        if len(token) >= min_len and token.endswith(suffix):
+            if suffix == "s" and token.endswith(_NO_STRIP_ENDINGS):
+                return token
+            return token[: -len(suffix)] + replacement
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Quebra o texto dobrado em tokens alfanuméricos (sem stemming)."""
+    return _TOKEN_RE.findall(fold(text))
+
+
+def normalize_terms(text: str) -> List[str]:
+    """Tokens normalizados (dobrados + stemming) de um texto de vocabulário."""
+    return [stem(tok) for tok in tokenize(text)]
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein com corte: retorna max_distance + 1 se exceder o limite."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if len(a) > len(b):
+        a, b = b, a
+    previous = list(range(len(a) + 1))
+    for i, cb in enumerate(b, 1):
+        current = [i] + [0] * len(a)
+        row_min = i
+        for j, ca in enumerate(a, 1):
+            cost = 0 if ca == cb else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def _trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_typos(token: str) -> int:
+    """Quantidade de erros tolerada conforme o tamanho do token."""
+    if len(token) >= 9:
+        return 2
+    if len(token) >= 6:
+        return 1
+    return 0
+
+
+class TrigramIndex:
+    """Índice de trigramas sobre um vocabulário para correção de erros de digitação"""
+
+    def __init__(self, terms: Iterable[str] = (), cache_size: int = 8192):
+        self.terms: Set[str] = set()
+        self._postings: Dict[str, Set[str]] = {}
+        # Correções memoizadas com limite (tokens digitados pelos usuários não crescem o cache sem fim)
+        self._cached_correct = lru_cache(maxsize=cache_size)(self._correct)
+        for term in terms:
+            self.add(term)
+
+    def add(self, term: str) -> None:
+        if not term or term in self.terms:
+            return
+        self.terms.add(term)
+        for gram in _trigrams(term):
+            self._postings.setdefault(gram, set()).add(term)
+        self._cached_correct.cache_clear()
+
+    def correct(self, token: str) -> Optional[str]:
+        """Retorna o termo do vocabulário mais próximo dentro do limite de edição."""
+        if token in self.terms:
+            return token
+        return self._cached_correct(token)
+
+    def _correct(self, token: str) -> Optional[str]:
+        best = None
+        max_distance = _max_typos(token)
+        if max_distance and not token.isdigit():
+            grams = _trigrams(token)
+            counts: Dict[str, int] = {}
+            for gram in grams:
+                for term in self._postings.get(gram, ()):
+                    counts[term] = counts.get(term, 0) + 1
+            # Cada edição destrói no máximo 3 trigramas
+            min_shared = len(grams) - 3 * max_distance
+            best_distance = max_distance + 1
+            for term, shared in counts.items():
+                if shared < min_shared:
+                    continue
+                distance = edit_distance(token, term, max_distance)
+                if distance < best_distance or (distance == best_distance and best is not None and term < best):
+                    best, best_distance = term, distance
+        return best
+
+
+class NormalizedText:
+    """Pergunta normalizada uma única vez e compartilhada entre roteamento e análise"""
+
+    __slots__ = ("original", "folded", "tokens", "stems", "stem_set", "_corrected")
+
+    def __init__(self, text: str):
+        self.original = text
+        self.folded = fold(text)
+        self.tokens = _TOKEN_RE.findall(self.folded)
+        self.stems = [stem(tok) for tok in self.tokens]
+        self.stem_set = set(self.stems)
+        self._corrected: Dict[int, List[str]] = {}
+
+    def corrected(self, index: TrigramIndex) -> List[str]:
+        """Stems corrigidos contra o vocabulário de um índice (memoizado por índice)."""
+        key = id(index)
+        if key not in self._corrected:
+            self._corrected[key] = [index.correct(s) or s for s in self.stems]
+        return self._corrected[key]
+
+
+def normalize_text(text: str) -> NormalizedText:
+    return text if isinstance(text, NormalizedText) else NormalizedText(text)
+
+
+class TermMatcher:
+    """
+    Grupos de termos normalizados no carregamento.
+    Ex.: TermMatcher({"filhas": ["filha"], "ranking": ["maior média", "top"]})
+    match() percorre a pergunta uma única vez e retorna os grupos presentes.
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self._phrases: Dict[Tuple[str, ...], Set[str]] = {}
+        self._max_len = 1
+        self.index = TrigramIndex()
+        for group, terms in groups.items():
+            for term in terms:
+                phrase = tuple(normalize_terms(term))
+                if not phrase:
+                    continue
+                self._phrases.setdefault(phrase, set()).add(group)
+                self._max_len = max(self._max_len, len(phrase))
+                for part in phrase:
+                    self.index.add(part)
+
+    def match(self, text) -> Set[str]:
+        nt = normalize_text(text)
+        stems = nt.corrected(self.index)
+        found: Set[str] = set()
+        for i in range(len(stems)):
+            for size in range(1, min(self._max_len, len(stems) - i) + 1):
+                groups = self._phrases.get(tuple(stems[i:i + size]))
+                if groups:
+                    found |= groups
+        return found